@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   View,
   Text,
@@ -30,6 +30,7 @@ const HomeScreen: React.FC = () => {
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [activeTab, setActiveTab] = useState<'sanes' | 'rifas'>('sanes');
+  const versiones = useRef<Record<string, string> | undefined>(undefined);
 
   useEffect(() => {
     loadData();
@@ -39,16 +40,13 @@ const HomeScreen: React.FC = () => {
     try {
       setLoading(true);
       
-      // Cargar SANes activos
-      const sanesResponse = await apiService.getSanes({ estado: 'activo' });
-      if (sanesResponse.success && sanesResponse.data) {
-        setSanes(sanesResponse.data.results || []);
-      }
-
-      // Cargar rifas activas
-      const rifasResponse = await apiService.getRifas({ estado: 'activa' });
-      if (rifasResponse.success && rifasResponse.data) {
-        setRifas(rifasResponse.data.results || []);
+      // SANes y rifas activos en una sola petición; solo llegan las secciones que cambiaron
+      const inicioResponse = await apiService.getInicio(['sanes', 'rifas'], versiones.current);
+      if (inicioResponse.success && inicioResponse.data) {
+        const { secciones } = inicioResponse.data;
+        if (secciones.sanes) setSanes(secciones.sanes);
+        if (secciones.rifas) setRifas(secciones.rifas);
+        versiones.current = inicioResponse.data.versiones;
       }
     } catch (error) {
       console.error('Error loading data:', error);
@@ -24,6 +24,8 @@ import {
   RifaFilters,
   ApiResponse,
   PaginatedResponse,
+  InicioResponse,
+  CambiosResponse,
 } from '../types';
 
 class ApiService {
@@ -409,6 +411,38 @@ class ApiService {
     }
   }
 
+  // Pantallas de inicio y perfil en una sola petición; `versiones` es la de la respuesta anterior
+  async getInicio(secciones?: string[], versiones?: Record<string, string>): Promise<ApiResponse<InicioResponse>> {
+    try {
+      const params = new URLSearchParams();
+      if (secciones) params.append('secciones', secciones.join(','));
+      if (versiones) {
+        params.append('versiones', Object.entries(versiones).map(([s, v]) => `${s}.${v}`).join(','));
+      }
+      const response = await this.api.get(`/api/inicio/?${params.toString()}`);
+      return { success: true, data: response.data };
+    } catch (error: any) {
+      return {
+        success: false,
+        message: 'Error al obtener los datos de inicio',
+      };
+    }
+  }
+
+  // Sincronización incremental: sin `desde` devuelve el token actual; 410 = recargar todo
+  async getCambios(desde?: number): Promise<ApiResponse<CambiosResponse>> {
+    try {
+      const params = desde !== undefined ? `?desde=${desde}` : '';
+      const response = await this.api.get(`/api/cambios/${params}`);
+      return { success: true, data: response.data };
+    } catch (error: any) {
+      return {
+        success: false,
+        message: error.response?.status === 410 ? 'resincronizar' : 'Error al obtener los cambios',
+      };
+    }
+  }
+
   // ===== ADMIN =====
   async getAdminDashboard(): Promise<ApiResponse<any>> {
     try {
@@ -262,6 +262,40 @@ export interface PaginatedResponse<T> {
   results: T[];
 }
 
+// Respuesta de /api/inicio/: solo trae las secciones que cambiaron desde `versiones`
+export interface InicioResponse {
+  versiones: Record<string, string>;
+  secciones: {
+    rifas?: Rifa[];
+    sanes?: San[];
+    notificaciones?: NotificacionMejorada[];
+    participaciones?: ParticipacionSan[];
+    facturas?: Factura[];
+    perfil?: User;
+    [seccion: string]: any;
+  };
+}
+
+// Respuesta de /api/cambios/: cambios desde el token anterior, por sección
+export interface CambiosSeccion<T> {
+  creados: T[];
+  actualizados: T[];
+  eliminados: number[];
+}
+
+export interface CambiosResponse {
+  token: number;
+  hay_mas: boolean;
+  cambios: {
+    rifas?: CambiosSeccion<Rifa>;
+    sanes?: CambiosSeccion<San>;
+    participaciones?: CambiosSeccion<ParticipacionSan>;
+    cupos?: CambiosSeccion<Cupo>;
+    facturas?: CambiosSeccion<Factura>;
+    [seccion: string]: CambiosSeccion<any> | undefined;
+  };
+}
+
 // Tipos para navegación
 export type RootStackParamList = {
   Auth: undefined;
@@ -3,10 +3,13 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from . import pasarelas, cancelaciones, metricas
 from .models import (
     CustomUser, Factura, Rifa, Ticket, San, ParticipacionSan, 
     Cupo, Comment, SystemLog, PagoSimulado, NotificacionMejorada,
-    Notificacion, Reporte, HistorialAccion, SorteoRifa, TurnoSan, Mensaje
+    Notificacion, Reporte, HistorialAccion, SorteoRifa, TurnoSan, Mensaje,
+    WebhookPago, CuentaContable, AsientoContable, ApunteContable,
+    CancelacionMasiva, Reembolso, MetricaDiaria, VentaHoraria, CierreDiario, ArchivoCierre
 )
 
 # ---------------------
@@ -42,12 +45,12 @@ class CustomUserAdmin(admin.ModelAdmin):
     
     @admin.action(description='Activar usuarios seleccionados')
     def activar_usuarios(self, request, queryset):
-        queryset.update(is_active=True)
+        metricas.actualizar(queryset, is_active=True)
         self.message_user(request, f"{queryset.count()} usuarios han sido activados.")
     
     @admin.action(description='Desactivar usuarios seleccionados')
     def desactivar_usuarios(self, request, queryset):
-        queryset.update(is_active=False)
+        metricas.actualizar(queryset, is_active=False)
         self.message_user(request, f"{queryset.count()} usuarios han sido desactivados.")
     
     @admin.action(description='Hacer administradores')
@@ -109,7 +112,7 @@ class FacturaAdmin(admin.ModelAdmin):
     def marcar_vencidas(self, request, queryset):
         for factura in queryset:
             if factura.is_vencida():
-                factura.estado_pago = 'vencida'
+                factura.estado_pago = 'vencido'
                 factura.save()
         self.message_user(request, f"{queryset.count()} facturas han sido marcadas como vencidas.")
 
@@ -143,21 +146,21 @@ class RifaAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['activar_rifas', 'pausar_rifas', 'finalizar_rifas', 'seleccionar_ganadores']
+    actions = ['activar_rifas', 'pausar_rifas', 'finalizar_rifas', 'seleccionar_ganadores', 'cancelar_rifas']
     
     @admin.action(description='Activar rifas seleccionadas')
     def activar_rifas(self, request, queryset):
-        queryset.update(estado='activa')
+        metricas.actualizar(queryset, estado='activa')
         self.message_user(request, f"{queryset.count()} rifas han sido activadas.")
     
     @admin.action(description='Pausar rifas seleccionadas')
     def pausar_rifas(self, request, queryset):
-        queryset.update(estado='pausada')
+        metricas.actualizar(queryset, estado='pausada')
         self.message_user(request, f"{queryset.count()} rifas han sido pausadas.")
     
     @admin.action(description='Finalizar rifas seleccionadas')
     def finalizar_rifas(self, request, queryset):
-        queryset.update(estado='finalizada')
+        metricas.actualizar(queryset, estado='finalizada')
         self.message_user(request, f"{queryset.count()} rifas han sido finalizadas.")
     
     @admin.action(description='Seleccionar ganadores')
@@ -166,6 +169,13 @@ class RifaAdmin(admin.ModelAdmin):
             if rifa.estado == 'activa':
                 rifa.seleccionar_ganador()
         self.message_user(request, f"Se han seleccionado ganadores para {queryset.count()} rifas.")
+    
+    @admin.action(description='Cancelar y reembolsar rifas seleccionadas')
+    def cancelar_rifas(self, request, queryset):
+        # Solo crea los trabajos; los reembolsos los hace procesar_cancelaciones
+        for rifa in queryset.exclude(estado='cancelada'):
+            cancelaciones.iniciar_cancelacion(rifa, 'Cancelada por la administración', request.user)
+        self.message_user(request, "Las rifas han sido canceladas; los reembolsos se procesarán en segundo plano.")
 
 
 # ---------------------
@@ -226,22 +236,28 @@ class SanAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['activar_sanes', 'pausar_sanes', 'finalizar_sanes']
+    actions = ['activar_sanes', 'pausar_sanes', 'finalizar_sanes', 'cancelar_sanes']
     
     @admin.action(description='Activar sanes seleccionados')
     def activar_sanes(self, request, queryset):
-        queryset.update(estado='activo')
+        metricas.actualizar(queryset, estado='activo')
         self.message_user(request, f"{queryset.count()} sanes han sido activados.")
     
     @admin.action(description='Pausar sanes seleccionados')
     def pausar_sanes(self, request, queryset):
-        queryset.update(estado='pausado')
+        metricas.actualizar(queryset, estado='pausado')
         self.message_user(request, f"{queryset.count()} sanes han sido pausados.")
     
     @admin.action(description='Finalizar sanes seleccionados')
     def finalizar_sanes(self, request, queryset):
-        queryset.update(estado='finalizado')
+        metricas.actualizar(queryset, estado='finalizado')
         self.message_user(request, f"{queryset.count()} sanes han sido finalizados.")
+    
+    @admin.action(description='Cancelar y reembolsar sanes seleccionados')
+    def cancelar_sanes(self, request, queryset):
+        for san in queryset.exclude(estado='cancelado'):
+            cancelaciones.iniciar_cancelacion(san, 'Cancelado por la administración', request.user)
+        self.message_user(request, "Los sanes han sido cancelados; los reembolsos se procesarán en segundo plano.")
 
 
 # ---------------------
@@ -397,10 +413,12 @@ class PagoSimuladoAdmin(admin.ModelAdmin):
     
     @admin.action(description='Procesar pagos seleccionados')
     def procesar_pagos(self, request, queryset):
-        for pago in queryset:
-            if pago.estado == 'pendiente':
-                pago.procesar_pago()
-        self.message_user(request, f"Se han procesado {queryset.count()} pagos.")
+        pagos = queryset.filter(
+            estado='pendiente',
+            metodo_pago__in=pasarelas.metodos_electronicos()
+        ).select_related('factura', 'usuario')
+        resultados = pasarelas.procesar_pagos(pagos)
+        self.message_user(request, f"Se han procesado {len(resultados)} pagos.")
     
     @admin.action(description='Reintentar pagos fallidos')
     def reintentar_pagos(self, request, queryset):
@@ -410,6 +428,144 @@ class PagoSimuladoAdmin(admin.ModelAdmin):
         self.message_user(request, f"Se han reintentado {queryset.count()} pagos.")
 
 
+# ---------------------
+# ADMINISTRACIÓN DE WEBHOOKS DE PAGO
+# ---------------------
+@admin.register(WebhookPago)
+class WebhookPagoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'pasarela', 'evento_id', 'tipo', 'estado', 'fecha_recepcion', 'fecha_procesamiento')
+    list_filter = ('estado', 'pasarela', 'tipo', 'fecha_recepcion')
+    search_fields = ('evento_id', 'detalle')
+    readonly_fields = ('pasarela', 'evento_id', 'tipo', 'payload', 'fecha_recepcion',
+                       'estado', 'detalle', 'fecha_procesamiento')
+    
+    actions = ['reprocesar_webhooks']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.action(description='Reprocesar webhooks seleccionados')
+    def reprocesar_webhooks(self, request, queryset):
+        total = queryset.update(estado='pendiente', detalle='', fecha_procesamiento=None)
+        self.message_user(request, f"Se han marcado {total} webhooks para reprocesar.")
+
+
+# ---------------------
+# ADMINISTRACIÓN DE CONTABILIDAD
+# ---------------------
+class ApunteContableInline(admin.TabularInline):
+    model = ApunteContable
+    fields = ('cuenta', 'monto', 'saldo_resultante', 'fecha')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(CuentaContable)
+class CuentaContableAdmin(admin.ModelAdmin):
+    list_display = ('tipo', 'object_id', 'rubro', 'saldo', 'entradas', 'salidas', 'fecha_actualizacion')
+    list_filter = ('tipo', 'rubro')
+    search_fields = ('object_id',)
+    readonly_fields = ('tipo', 'object_id', 'rubro', 'saldo', 'entradas', 'salidas', 'fecha_actualizacion')
+
+
+@admin.register(AsientoContable)
+class AsientoContableAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'clave', 'descripcion', 'fecha')
+    list_filter = ('tipo', 'fecha')
+    search_fields = ('clave', 'descripcion')
+    readonly_fields = ('tipo', 'clave', 'descripcion', 'content_type', 'object_id', 'fecha')
+    inlines = [ApunteContableInline]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# ---------------------
+# ADMINISTRACIÓN DE MÉTRICAS DIARIAS
+# ---------------------
+@admin.register(MetricaDiaria)
+class MetricaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'metrica', 'segmento', 'cantidad', 'monto')
+    list_filter = ('metrica', 'fecha')
+    search_fields = ('metrica', 'segmento')
+    readonly_fields = ('fecha', 'metrica', 'segmento', 'cantidad', 'monto')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(VentaHoraria)
+class VentaHorariaAdmin(admin.ModelAdmin):
+    list_display = ('hora', 'tipo', 'objeto_id', 'organizador', 'metodo_pago', 'unidades', 'facturas',
+                    'facturas_pagadas', 'monto_pagado')
+    list_filter = ('tipo', 'metodo_pago', 'hora')
+    search_fields = ('organizador__username', 'organizador__email')
+    list_select_related = ('organizador',)
+    readonly_fields = ('hora', 'tipo', 'objeto_id', 'organizador', 'metodo_pago', 'unidades', 'facturas',
+                       'facturas_pagadas', 'monto_pagado')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+# ---------------------
+# ADMINISTRACIÓN DE CIERRES DIARIOS
+# ---------------------
+class ArchivoCierreInline(admin.TabularInline):
+    model = ArchivoCierre
+    extra = 0
+    can_delete = False
+    readonly_fields = ('tabla', 'archivo', 'filas', 'sha256', 'bytes')
+
+
+@admin.register(CierreDiario)
+class CierreDiarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'estado', 'incremental', 'desde', 'hasta', 'fecha_finalizacion')
+    list_filter = ('estado', 'incremental')
+    readonly_fields = ('fecha', 'estado', 'anterior', 'incremental', 'desde', 'hasta', 'manifiesto', 'error',
+                       'fecha_creacion', 'fecha_finalizacion')
+    inlines = [ArchivoCierreInline]
+    
+    def has_add_permission(self, request):
+        return False
+
+
+# ---------------------
+# ADMINISTRACIÓN DE CANCELACIONES Y REEMBOLSOS
+# ---------------------
+@admin.register(CancelacionMasiva)
+class CancelacionMasivaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'content_type', 'object_id', 'estado', 'fase', 'facturas_procesadas',
+                    'reembolsos_creados', 'monto_reembolsado', 'usuarios_notificados', 'fecha_creacion')
+    list_filter = ('estado', 'fase', 'content_type')
+    search_fields = ('motivo', 'object_id')
+    readonly_fields = ('content_type', 'object_id', 'solicitado_por', 'estado', 'fase', 'ultimo_id',
+                       'facturas_procesadas', 'reembolsos_creados', 'monto_reembolsado',
+                       'usuarios_notificados', 'error', 'fecha_creacion', 'fecha_inicio', 'fecha_fin')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Reembolso)
+class ReembolsoAdmin(admin.ModelAdmin):
+    list_display = ('factura', 'usuario', 'monto', 'estado', 'cancelacion', 'fecha_creacion')
+    list_filter = ('estado', 'fecha_creacion')
+    search_fields = ('factura__codigo', 'usuario__username', 'usuario__email')
+    readonly_fields = ('factura', 'usuario', 'cancelacion', 'monto', 'fecha_creacion')
+    
+    actions = ['marcar_procesados']
+    
+    @admin.action(description='Marcar reembolsos como procesados')
+    def marcar_procesados(self, request, queryset):
+        total = queryset.filter(estado='pendiente').update(estado='procesado')
+        self.message_user(request, f"{total} reembolsos han sido marcados como procesados.")
+
+
 # ---------------------
 # ADMINISTRACIÓN DE NOTIFICACIONES MEJORADAS
 # ---------------------
@@ -485,20 +641,20 @@ class NotificacionAdmin(admin.ModelAdmin):
 # ---------------------
 @admin.register(Reporte)
 class ReporteAdmin(admin.ModelAdmin):
-    list_display = ('tipo', 'administrador', 'fecha_generacion')
-    list_filter = ('tipo', 'fecha_generacion')
+    list_display = ('tipo', 'administrador', 'estado', 'filas', 'fecha_generacion')
+    list_filter = ('tipo', 'estado', 'fecha_generacion')
     search_fields = ('tipo', 'descripcion', 'administrador__username')
-    readonly_fields = ('fecha_generacion',)
+    readonly_fields = ('fecha_generacion', 'fecha_finalizacion', 'filas', 'error')
     
     fieldsets = (
         ('Información del Reporte', {
             'fields': ('tipo', 'descripcion', 'administrador')
         }),
         ('Archivo', {
-            'fields': ('archivo',)
+            'fields': ('archivo', 'estado', 'parametros', 'filas', 'error')
         }),
         ('Fechas', {
-            'fields': ('fecha_generacion',),
+            'fields': ('fecha_generacion', 'fecha_finalizacion'),
             'classes': ('collapse',)
         }),
     )
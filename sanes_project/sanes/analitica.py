@@ -0,0 +1,308 @@
+# sanes/analitica.py
+"""
+Analítica de ventas por organizador.
+
+``VentaHoraria`` guarda un histograma por hora de cada rifa y san: tickets o
+inscripciones creados, facturas emitidas y facturas pagadas por método de
+pago. Se mantiene al crear tickets, participaciones y facturas (y al
+confirmar pagos), sumando a la fila de la hora con una UPDATE al confirmar
+la transacción, igual que las métricas diarias.
+
+``resumen_organizador`` lee solo esas filas y las rifas/sanes del
+organizador, y calcula con NumPy sobre la matriz (objeto × hora):
+
+* velocidad de venta por hora (últimas 24 h y 7 días, y por hora del día),
+* hora estimada de agotamiento con una media de ventas que pesa más las
+  horas recientes (vida media de 24 h),
+* conversión de facturas por método de pago,
+* ocupación de los sanes.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from . import metricas
+from .models import VentaHoraria, Rifa, San, Ticket, ParticipacionSan, Factura
+
+
+# Horas que se usan para proyectar el ritmo de venta y su vida media
+HORAS_PROYECCION = 24 * 7
+VIDA_MEDIA_HORAS = 24
+
+
+def _hora(momento=None):
+    return (momento or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+
+# ---------------------
+# MANTENIMIENTO DEL HISTOGRAMA
+# ---------------------
+def _aplicar(filas):
+    for (hora, tipo, objeto_id, metodo_pago), (organizador_id, incrementos) in filas.items():
+        metricas.sumar(
+            VentaHoraria,
+            {'hora': hora, 'tipo': tipo, 'objeto_id': objeto_id, 'metodo_pago': metodo_pago},
+            incrementos,
+            organizador_id=organizador_id,
+        )
+
+
+def registrar(eventos):
+    """
+    Suma eventos ``(hora, tipo, objeto_id, organizador_id, metodo_pago, {campo: incremento})``
+    al confirmar la transacción, una UPDATE por fila de hora.
+    """
+    filas = {}
+    for hora, tipo, objeto_id, organizador_id, metodo_pago, incrementos in eventos:
+        clave = (_hora(hora), tipo, objeto_id, metodo_pago or '')
+        _, acumulado = filas.setdefault(clave, (organizador_id, defaultdict(int)))
+        for campo, valor in incrementos.items():
+            acumulado[campo] += valor
+    if filas:
+        transaction.on_commit(partial(_aplicar, filas))
+
+
+def registrar_ticket(ticket):
+    metodo = ticket.factura.metodo_pago if ticket.factura_id else ''
+    registrar([(ticket.fecha_compra, 'rifa', ticket.rifa_id, ticket.rifa.organizador_id, metodo, {'unidades': 1})])
+
+
+def registrar_participacion(participacion):
+    registrar([(participacion.fecha_inscripcion, 'san', participacion.san_id,
+                participacion.san.organizador_id, '', {'unidades': 1})])
+
+
+def _objetos_de_facturas(facturas):
+    """{factura: (tipo, objeto_id, organizador_id)} de las facturas de rifas y sanes"""
+    tipos = ContentType.objects.get_for_models(Rifa, San)
+    modelos = {tipos[Rifa].id: ('rifa', Rifa), tipos[San].id: ('san', San)}
+    ids = defaultdict(set)
+    for factura in facturas:
+        if factura.content_type_id in modelos and factura.object_id:
+            ids[factura.content_type_id].add(factura.object_id)
+    organizadores = {}
+    for content_type_id, objetos in ids.items():
+        tipo, modelo = modelos[content_type_id]
+        for objeto_id, organizador_id in modelo.objects.filter(id__in=objetos).values_list('id', 'organizador_id'):
+            organizadores[(content_type_id, objeto_id)] = (tipo, objeto_id, organizador_id)
+    return {
+        factura: organizadores[(factura.content_type_id, factura.object_id)]
+        for factura in facturas
+        if (factura.content_type_id, factura.object_id) in organizadores
+    }
+
+
+def registrar_facturas(facturas):
+    """Facturas emitidas para rifas o sanes (las de cuotas no cuentan)"""
+    registrar([
+        (factura.fecha_emision, tipo, objeto_id, organizador_id, factura.metodo_pago, {'facturas': 1})
+        for factura, (tipo, objeto_id, organizador_id) in _objetos_de_facturas(facturas).items()
+    ])
+
+
+def registrar_pagos(facturas, momento=None):
+    """Facturas de rifas o sanes que pasaron a confirmadas"""
+    registrar([
+        (momento or factura.fecha_pago or timezone.now(), tipo, objeto_id, organizador_id, factura.metodo_pago,
+         {'facturas_pagadas': 1, 'monto_pagado': factura.monto_total})
+        for factura, (tipo, objeto_id, organizador_id) in _objetos_de_facturas(facturas).items()
+    ])
+
+
+def reconstruir():
+    """Rehace el histograma desde tickets, participaciones y facturas (instalación inicial)"""
+    eventos = []
+    tickets = (
+        Ticket.objects.exclude(rifa=None).order_by()
+        .annotate(h=TruncHour('fecha_compra'))
+        .values('h', 'rifa_id', 'rifa__organizador_id', 'factura__metodo_pago')
+        .annotate(n=Count('id'))
+    )
+    for t in tickets:
+        eventos.append((t['h'], 'rifa', t['rifa_id'], t['rifa__organizador_id'], t['factura__metodo_pago'],
+                        {'unidades': t['n']}))
+    participaciones = (
+        ParticipacionSan.objects.order_by()
+        .annotate(h=TruncHour('fecha_inscripcion'))
+        .values('h', 'san_id', 'san__organizador_id')
+        .annotate(n=Count('id'))
+    )
+    for p in participaciones:
+        eventos.append((p['h'], 'san', p['san_id'], p['san__organizador_id'], '', {'unidades': p['n']}))
+
+    tipos = ContentType.objects.get_for_models(Rifa, San)
+    for modelo, tipo in ((Rifa, 'rifa'), (San, 'san')):
+        organizadores = dict(modelo.objects.values_list('id', 'organizador_id'))
+        facturas = Factura.objects.filter(content_type=tipos[modelo]).order_by()
+        emitidas = (
+            facturas.annotate(h=TruncHour('fecha_emision'))
+            .values('h', 'object_id', 'metodo_pago').annotate(n=Count('id'))
+        )
+        pagadas = (
+            facturas.filter(estado_pago='confirmado')
+            .annotate(h=TruncHour('fecha_pago'))
+            .values('h', 'object_id', 'metodo_pago').annotate(n=Count('id'), m=Sum('monto_total'))
+        )
+        for f in emitidas:
+            if f['object_id'] in organizadores:
+                eventos.append((f['h'], tipo, f['object_id'], organizadores[f['object_id']], f['metodo_pago'],
+                                {'facturas': f['n']}))
+        for f in pagadas:
+            if f['object_id'] in organizadores:
+                eventos.append((f['h'] or timezone.now(), tipo, f['object_id'], organizadores[f['object_id']],
+                                f['metodo_pago'], {'facturas_pagadas': f['n'], 'monto_pagado': f['m']}))
+
+    filas = {}
+    for hora, tipo, objeto_id, organizador_id, metodo_pago, incrementos in eventos:
+        clave = (_hora(hora), tipo, objeto_id, metodo_pago or '')
+        fila = filas.setdefault(clave, VentaHoraria(
+            hora=clave[0], tipo=tipo, objeto_id=objeto_id, organizador_id=organizador_id, metodo_pago=clave[3]
+        ))
+        for campo, valor in incrementos.items():
+            setattr(fila, campo, getattr(fila, campo) + valor)
+    with transaction.atomic():
+        VentaHoraria.objects.all().delete()
+        VentaHoraria.objects.bulk_create(filas.values(), batch_size=1000)
+    return len(filas)
+
+
+# ---------------------
+# ANALÍTICA
+# ---------------------
+def _matriz(filas, claves, inicio, horas, campo):
+    """Matriz (objeto × hora) con la suma de ``campo`` de las filas del histograma"""
+    indice = {clave: i for i, clave in enumerate(claves)}
+    matriz = np.zeros((len(claves), horas))
+    if filas:
+        objetos = np.array([indice[(f['tipo'], f['objeto_id'])] for f in filas])
+        columnas = np.array([(f['hora'] - inicio) // timedelta(hours=1) for f in filas])
+        valores = np.array([float(f[campo]) for f in filas])
+        dentro = (columnas >= 0) & (columnas < horas)
+        np.add.at(matriz, (objetos[dentro], columnas[dentro]), valores[dentro])
+    return matriz
+
+
+def _ritmo(matriz):
+    """Unidades por hora de cada fila, con peso que se reduce a la mitad cada VIDA_MEDIA_HORAS"""
+    horas = matriz.shape[1]
+    pesos = 0.5 ** (np.arange(horas)[::-1] / VIDA_MEDIA_HORAS)
+    return matriz @ pesos / pesos.sum()
+
+
+def _porcentajes(valores):
+    """Altura de cada barra respecto a la mayor, para los histogramas"""
+    maximo = valores.max() if len(valores) else 0
+    if not maximo:
+        return [0] * len(valores)
+    return [int(p) for p in np.rint(valores * 100 / maximo)]
+
+
+def resumen_organizador(organizador, ahora=None):
+    """Analítica de ventas de las rifas y sanes de un organizador"""
+    ahora = ahora or timezone.now()
+    fin = _hora(ahora) + timedelta(hours=1)
+    inicio = fin - timedelta(hours=HORAS_PROYECCION)
+
+    rifas = list(
+        Rifa.objects.filter(organizador=organizador)
+        .values('id', 'titulo', 'estado', 'total_tickets', 'tickets_disponibles', 'fecha_fin')
+    )
+    sanes = list(
+        San.objects.filter(organizador=organizador)
+        .values('id', 'nombre', 'estado', 'total_participantes', 'participantes_actuales')
+    )
+    claves = [('rifa', r['id']) for r in rifas] + [('san', s['id']) for s in sanes]
+
+    recientes = list(
+        VentaHoraria.objects.filter(organizador=organizador, hora__gte=inicio)
+        .values('hora', 'tipo', 'objeto_id', 'unidades')
+    )
+    unidades = _matriz(recientes, claves, inicio, HORAS_PROYECCION, 'unidades')
+    ritmo = _ritmo(unidades)
+
+    # Ventas por hora del día (hora local), todas las rifas y sanes juntos
+    por_hora_del_dia = np.zeros(24)
+    if recientes:
+        horas_locales = np.array([timezone.localtime(f['hora']).hour for f in recientes])
+        np.add.at(por_hora_del_dia, horas_locales, np.array([f['unidades'] for f in recientes], dtype=float))
+
+    # Proyección de agotamiento: restantes / ritmo, vectorizado
+    restantes = np.array(
+        [r['tickets_disponibles'] for r in rifas]
+        + [s['total_participantes'] - s['participantes_actuales'] for s in sanes],
+        dtype=float,
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        horas_restantes = np.where(ritmo > 0, restantes / ritmo, np.inf)
+
+    def proyeccion(i):
+        if restantes[i] <= 0:
+            return 'agotado'
+        if not np.isfinite(horas_restantes[i]):
+            return None
+        return ahora + timedelta(hours=float(horas_restantes[i]))
+
+    for i, rifa in enumerate(rifas):
+        rifa.update({
+            'vendidos': rifa['total_tickets'] - rifa['tickets_disponibles'],
+            'ultimas_24h': int(unidades[i, -24:].sum()),
+            'ultimos_7d': int(unidades[i].sum()),
+            'ritmo_por_hora': round(float(ritmo[i]), 2),
+            'agotamiento_estimado': proyeccion(i),
+        })
+    for j, san in enumerate(sanes, start=len(rifas)):
+        total = san['total_participantes']
+        san.update({
+            'ocupacion': round(san['participantes_actuales'] * 100 / total, 1) if total else 0,
+            'ultimas_24h': int(unidades[j, -24:].sum()),
+            'ultimos_7d': int(unidades[j].sum()),
+            'ritmo_por_hora': round(float(ritmo[j]), 2),
+            'lleno_estimado': proyeccion(j),
+        })
+
+    # Conversión por método de pago, con todo el histórico del organizador
+    conversion = []
+    metodos = dict(Factura.METODOS_PAGO)
+    for fila in (
+        VentaHoraria.objects.filter(organizador=organizador).order_by()
+        .values('metodo_pago')
+        .annotate(emitidas=Sum('facturas'), pagadas=Sum('facturas_pagadas'), monto=Sum('monto_pagado'))
+        .filter(Q(emitidas__gt=0) | Q(pagadas__gt=0))
+        .order_by('metodo_pago')
+    ):
+        conversion.append({
+            'metodo_pago': fila['metodo_pago'],
+            'nombre': metodos.get(fila['metodo_pago'], fila['metodo_pago'] or 'Sin método'),
+            'emitidas': fila['emitidas'],
+            'pagadas': fila['pagadas'],
+            'monto': fila['monto'] or Decimal(0),
+            'conversion': round(fila['pagadas'] * 100 / fila['emitidas'], 1) if fila['emitidas'] else None,
+        })
+
+    total_unidades = unidades.sum(axis=0)
+    ultimas_48h = total_unidades[-48:]
+    return {
+        'desde': inicio,
+        'hasta': fin,
+        'ventas_por_hora': [
+            {'hora': fin - timedelta(hours=48 - h), 'unidades': int(v), 'porcentaje': p}
+            for h, (v, p) in enumerate(zip(ultimas_48h, _porcentajes(ultimas_48h)))
+        ],
+        'ventas_por_hora_del_dia': [
+            {'hora': h, 'unidades': int(v), 'porcentaje': p}
+            for h, (v, p) in enumerate(zip(por_hora_del_dia, _porcentajes(por_hora_del_dia)))
+        ],
+        'velocidad_24h': round(float(total_unidades[-24:].sum()) / 24, 2),
+        'velocidad_7d': round(float(total_unidades.sum()) / HORAS_PROYECCION, 2),
+        'rifas': rifas,
+        'sanes': sanes,
+        'conversion': conversion,
+    }
@@ -11,6 +11,19 @@ urlpatterns = [
     path('sanes/', views.api_san_list, name='api_san_list'),
     path('sanes/<int:pk>/', views.api_san_detail, name='api_san_detail'),
     
+    # API de la app: pantallas de inicio y perfil en una petición
+    path('inicio/', views.api_inicio, name='api_inicio'),
+    
+    # API de la app: sincronización incremental
+    path('cambios/', views.api_cambios, name='api_cambios'),
+    
+    # API de Búsqueda
+    path('buscar/', views.api_buscar, name='api_buscar'),
+    
+    # API de Reportes
+    path('reportes/finanzas/', views.api_reporte_finanzas, name='api_reporte_finanzas'),
+    
     # API de Usuarios
     path('usuarios/perfil/', views.user_profile, name='api_user_profile'),
+    path('usuarios/analitica/', views.api_analitica_organizador, name='api_analitica_organizador'),
 ]
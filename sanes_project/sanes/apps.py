@@ -4,3 +4,34 @@ from django.apps import AppConfig
 class SanesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sanes'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from . import busqueda, condicional, metricas, sincronizacion
+        from .models import Rifa, San
+
+        # Cada save()/delete() invalida las estadísticas en caché de su tabla
+        post_save.connect(metricas.invalidar_por_senal, dispatch_uid='sanes_estadisticas_post_save')
+        post_delete.connect(metricas.invalidar_por_senal, dispatch_uid='sanes_estadisticas_post_delete')
+
+        # Índice de búsqueda de rifas y sanes
+        for modelo in (Rifa, San):
+            post_save.connect(busqueda.indexar_por_senal, sender=modelo,
+                              dispatch_uid=f'sanes_busqueda_post_save_{modelo.__name__}')
+            post_delete.connect(busqueda.desindexar_por_senal, sender=modelo,
+                                dispatch_uid=f'sanes_busqueda_post_delete_{modelo.__name__}')
+
+        # Cada ticket o inscripción cambia la versión (y el ETag) de su rifa o san
+        for modelo in condicional.PADRES:
+            post_save.connect(condicional.tocar_por_senal, sender=modelo,
+                              dispatch_uid=f'sanes_version_post_save_{modelo.__name__}')
+            post_delete.connect(condicional.tocar_por_senal, sender=modelo,
+                                dispatch_uid=f'sanes_version_post_delete_{modelo.__name__}')
+
+        # Registro de cambios para la sincronización incremental de la app
+        for modelo in sincronizacion.TIPO_DE_MODELO:
+            post_save.connect(sincronizacion.registrar_por_senal, sender=modelo,
+                              dispatch_uid=f'sanes_sincronizacion_post_save_{modelo.__name__}')
+            post_delete.connect(sincronizacion.registrar_por_senal, sender=modelo,
+                                dispatch_uid=f'sanes_sincronizacion_post_delete_{modelo.__name__}')
@@ -0,0 +1,244 @@
+# sanes/busqueda.py
+"""
+Búsqueda de rifas y sanes.
+
+En vez de ``icontains`` sobre varias columnas de texto (un LIKE '%...%' que
+recorre la tabla completa) se consulta un índice invertido propio, la tabla
+``TerminoBusqueda``: una fila por (rifa o san, término) con un peso que
+depende del campo donde aparece (el título pesa más que la descripción) y
+de cuántas veces aparece.
+
+Los términos se normalizan igual al indexar y al buscar: minúsculas, sin
+tildes, sin palabras vacías del español y sin la marca de plural ('-s',
+'-es'). Una búsqueda exige todos sus términos; el último se busca como
+prefijo (``termino LIKE 'abc%'``, que sí usa el índice) para poder
+autocompletar mientras se escribe.
+
+El índice se actualiza con post_save/post_delete de Rifa y San (conectados
+en ``SanesConfig.ready()``); ``reconstruir`` lo rehace desde cero (lo usan
+la migración que crea la tabla y ``actualizar_metricas --reconstruir``).
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Rifa, San, TerminoBusqueda
+
+
+# Campos indexados de cada tipo y su peso; el primero es el título
+CAMPOS = {
+    'rifa': (('titulo', 3), ('premio', 2), ('descripcion', 1)),
+    'san': (('nombre', 3), ('descripcion', 1)),
+}
+
+MODELOS = {'rifa': Rifa, 'san': San}
+TIPOS = {Rifa: 'rifa', San: 'san'}
+
+# Tope del peso de un término, para que repetir una palabra no domine el orden
+MAX_PESO = 10
+
+# Términos que se consideran de una búsqueda
+MAX_TERMINOS = 6
+
+PALABRAS_VACIAS = frozenset("""
+    a al algo ante con contra cual de del desde donde e el ella ellas ellos en entre era es esa ese eso esta
+    este esto fue ha han hasta la las le les lo los mas me mi mis muy nada ni no nos o otra otro para pero
+    por que quien se ser si sin sobre su sus tambien te tu un una uno unos unas y ya yo
+""".split())
+
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+# ---------------------
+# NORMALIZACIÓN
+# ---------------------
+def normalizar(texto):
+    """Minúsculas y sin tildes ('Televisión' -> 'television')"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def _raiz(palabra):
+    """Quita la marca de plural ('premios' -> 'premio', 'televisores' -> 'televisor')"""
+    if len(palabra) > 4 and palabra.endswith('es') and palabra[-3] in 'dlnr':
+        return palabra[:-2]
+    return palabra[:-1] if len(palabra) > 3 and palabra.endswith('s') else palabra
+
+
+def terminos(texto):
+    """Términos de un texto en el orden en que aparecen"""
+    return [
+        _raiz(palabra)[:40]
+        for palabra in _PALABRA.findall(normalizar(texto))
+        if len(palabra) > 1 and palabra not in PALABRAS_VACIAS
+    ]
+
+
+def pesos(tipo, instancia):
+    """{término: peso} de una rifa o san"""
+    resultado = {}
+    for campo, peso in CAMPOS[tipo]:
+        for termino in terminos(getattr(instancia, campo)):
+            resultado[termino] = min(resultado.get(termino, 0) + peso, MAX_PESO)
+    return resultado
+
+
+# ---------------------
+# MANTENIMIENTO DEL ÍNDICE
+# ---------------------
+def indexar(instancia):
+    """Pone al día los términos de una rifa o san, escribiendo solo los que cambiaron"""
+    tipo = TIPOS[type(instancia)]
+    nuevos = pesos(tipo, instancia)
+    filas = TerminoBusqueda.objects.filter(tipo=tipo, objeto_id=instancia.pk)
+    actuales = dict(filas.values_list('termino', 'peso'))
+    if actuales == nuevos:
+        return
+
+    with transaction.atomic():
+        sobrantes = [t for t in actuales if t not in nuevos]
+        if sobrantes:
+            filas.filter(termino__in=sobrantes).delete()
+        for termino, peso in nuevos.items():
+            if termino in actuales and actuales[termino] != peso:
+                filas.filter(termino=termino).update(peso=peso)
+        TerminoBusqueda.objects.bulk_create([
+            TerminoBusqueda(tipo=tipo, objeto_id=instancia.pk, termino=termino, peso=peso)
+            for termino, peso in nuevos.items() if termino not in actuales
+        ])
+
+
+def indexar_por_senal(sender, instance, update_fields=None, **kwargs):
+    """Receptor de post_save de Rifa y San; ignora los save() que no tocan campos indexados"""
+    if update_fields is not None and not {campo for campo, _ in CAMPOS[TIPOS[sender]]} & set(update_fields):
+        return
+    indexar(instance)
+
+
+def desindexar_por_senal(sender, instance, **kwargs):
+    """Receptor de post_delete de Rifa y San"""
+    TerminoBusqueda.objects.filter(tipo=TIPOS[sender], objeto_id=instance.pk).delete()
+
+
+def reconstruir(lote=500, apps=None):
+    """
+    Rehace el índice completo y devuelve {tipo: términos}.
+
+    Con ``apps`` usa los modelos históricos (desde una migración).
+    """
+    indice = apps.get_model('sanes', 'TerminoBusqueda') if apps else TerminoBusqueda
+    totales = {}
+    with transaction.atomic():
+        indice.objects.all().delete()
+        for tipo, campos in CAMPOS.items():
+            modelo = apps.get_model('sanes', MODELOS[tipo].__name__) if apps else MODELOS[tipo]
+            totales[tipo] = 0
+            filas = []
+            for instancia in modelo.objects.only(*(campo for campo, _ in campos)).iterator(chunk_size=lote):
+                filas += [
+                    indice(tipo=tipo, objeto_id=instancia.pk, termino=termino, peso=peso)
+                    for termino, peso in pesos(tipo, instancia).items()
+                ]
+                if len(filas) >= lote:
+                    indice.objects.bulk_create(filas)
+                    totales[tipo] += len(filas)
+                    filas = []
+            indice.objects.bulk_create(filas)
+            totales[tipo] += len(filas)
+    return totales
+
+
+# ---------------------
+# CONSULTA
+# ---------------------
+def _coincidencias(tipo, texto):
+    """
+    (objeto_id, puntaje) de los objetos que contienen todos los términos
+    de ``texto``, el último como prefijo; None si el texto no tiene términos.
+    """
+    buscados = terminos(texto)[:MAX_TERMINOS]
+    if not buscados:
+        return None
+    condiciones = [Q(termino=termino) for termino in buscados[:-1]] + [Q(termino__startswith=buscados[-1])]
+    todas = Q()
+    for condicion in condiciones:
+        todas |= condicion
+
+    # Una columna por término buscado que vale 1 si el objeto lo contiene
+    presentes = {
+        f'termino_{i}': Max(Case(When(condicion, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        for i, condicion in enumerate(condiciones)
+    }
+    return (
+        TerminoBusqueda.objects.filter(todas, tipo=tipo)
+        .values('objeto_id')
+        .annotate(puntaje=Sum('peso'), **presentes)
+        .filter(**{campo: 1 for campo in presentes})
+        .order_by()
+    )
+
+
+def filtrar(queryset, texto, *alternativas):
+    """
+    Deja en ``queryset`` (de rifas o sanes) los que coinciden con ``texto``,
+    anotados con ``relevancia`` y ordenados primero por ella.
+
+    ``alternativas`` son condiciones que también cuentan como coincidencia
+    (p. ej. el usuario del organizador en el admin), con relevancia 0. Si el
+    texto solo tiene palabras vacías el queryset no se filtra.
+    """
+    coincidencias = _coincidencias(TIPOS[queryset.model], texto)
+    if coincidencias is None:
+        return queryset
+    condicion = Q(pk__in=coincidencias.values('objeto_id'))
+    for alternativa in alternativas:
+        condicion |= alternativa
+    relevancia = Subquery(coincidencias.filter(objeto_id=OuterRef('pk')).values('puntaje')[:1])
+    orden = queryset.query.order_by or queryset.model._meta.ordering
+    return (
+        queryset.filter(condicion)
+        .annotate(relevancia=Coalesce(relevancia, Value(0), output_field=IntegerField()))
+        .order_by('-relevancia', *orden)
+    )
+
+
+def sugerencias(texto, tipo=None, limite=5):
+    """Términos del índice que completan la última palabra de ``texto``, los más frecuentes primero"""
+    buscados = terminos(texto)
+    if not buscados:
+        return []
+    filas = TerminoBusqueda.objects.filter(termino__startswith=buscados[-1])
+    if tipo:
+        filas = filas.filter(tipo=tipo)
+    completados = (
+        filas.values('termino').annotate(veces=Count('id')).order_by('-veces', 'termino')
+        .values_list('termino', flat=True)[:limite]
+    )
+    inicio = ' '.join(buscados[:-1])
+    return [f'{inicio} {termino}'.strip() for termino in completados]
+
+
+def buscar(texto, tipo=None, limite=10):
+    """Rifas y sanes que coinciden con ``texto``, para el endpoint de búsqueda"""
+    if not terminos(texto):
+        return []
+    resultados = []
+    for tipo_modelo, campos in CAMPOS.items():
+        if tipo and tipo_modelo != tipo:
+            continue
+        titulo = campos[0][0]
+        encontrados = filtrar(MODELOS[tipo_modelo].objects.only('id', titulo, 'estado'), texto)
+        for objeto in encontrados[:limite]:
+            resultados.append({
+                'tipo': tipo_modelo,
+                'id': objeto.pk,
+                'titulo': getattr(objeto, titulo),
+                'estado': objeto.estado,
+                'url': objeto.get_absolute_url(),
+                'relevancia': objeto.relevancia,
+            })
+    resultados.sort(key=lambda r: -r['relevancia'])
+    return resultados[:limite]
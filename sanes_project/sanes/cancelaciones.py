@@ -0,0 +1,257 @@
+# sanes/cancelaciones.py
+"""
+Cancelación masiva de rifas y sanes con reembolso.
+
+``iniciar_cancelacion`` marca la rifa o el san como cancelado y crea un
+``CancelacionMasiva``; ``procesar_cancelacion`` lo ejecuta por fases:
+
+    facturas         reembolsa las pagadas, anula las pendientes y cancela sus pagos
+    tickets          desactiva los tickets de la rifa
+    cupos            cancela los cupos del san
+    participaciones  desactiva las participaciones del san
+    notificaciones   una notificación por usuario afectado
+
+Cada fase recorre sus filas por ID (paginación keyset) en lotes. Cada lote es
+una transacción que también guarda la fase y el último ID procesado, así que
+tras una caída el trabajo sigue donde quedó, y solo se bloquean las filas del
+lote en curso, nunca la rifa o el san completos.
+"""
+from collections import Counter, defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import condicional, contabilidad, metricas, sincronizacion
+from .models import (
+    CancelacionMasiva, Reembolso, Factura, PagoSimulado, Rifa, San, Ticket, Cupo,
+    ParticipacionSan, NotificacionMejorada, SystemLog
+)
+
+
+ESTADO_CANCELADO = {
+    'rifa': 'cancelada',
+    'san': 'cancelado',
+}
+
+FASES_RIFA = ['facturas', 'tickets', 'notificaciones', 'fin']
+FASES_SAN = ['facturas', 'cupos', 'participaciones', 'notificaciones', 'fin']
+
+
+def iniciar_cancelacion(objeto, motivo, usuario=None):
+    """
+    Cancela una rifa o san y crea el trabajo que reembolsa y notifica.
+
+    Cambiar el estado primero hace que no se vendan más tickets ni se
+    inscriban más participantes mientras el trabajo avanza.
+    """
+    modelo = objeto._meta.model_name
+    with transaction.atomic():
+        metricas.actualizar(type(objeto).objects.filter(pk=objeto.pk), estado=ESTADO_CANCELADO[modelo])
+        cancelacion, _ = CancelacionMasiva.objects.get_or_create(
+            content_type=ContentType.objects.get_for_model(objeto),
+            object_id=objeto.pk,
+            defaults={'motivo': motivo[:255], 'solicitado_por': usuario},
+        )
+        SystemLog.log_action(
+            usuario=usuario,
+            tipo_accion='admin',
+            descripcion=f'Cancelación de {modelo} {objeto.pk}: {motivo}',
+            nivel='warning',
+            content_object=objeto,
+        )
+    objeto.estado = ESTADO_CANCELADO[modelo]
+    return cancelacion
+
+
+# ---------------------
+# CONSULTAS POR FASE
+# ---------------------
+def _facturas(cancelacion):
+    """Facturas pendientes o pagadas de la rifa/san (incluye cuotas del san)"""
+    filtro = Q(content_type_id=cancelacion.content_type_id, object_id=cancelacion.object_id)
+    if cancelacion.content_type.model == 'san':
+        filtro |= Q(
+            content_type=ContentType.objects.get_for_model(Cupo),
+            object_id__in=Cupo.objects.filter(san_id=cancelacion.object_id).values('id'),
+        )
+    return Factura.objects.filter(filtro, estado_pago__in=('pendiente', 'confirmado'))
+
+
+def _usuarios_afectados(cancelacion, desde, lote):
+    """IDs de usuarios afectados mayores que ``desde``, en orden"""
+    object_id = cancelacion.object_id
+    if cancelacion.content_type.model == 'rifa':
+        participantes = Ticket.objects.filter(rifa_id=object_id)
+    else:
+        participantes = ParticipacionSan.objects.filter(san_id=object_id)
+    ids = set(
+        participantes.filter(usuario_id__gt=desde)
+        .order_by('usuario_id').values_list('usuario_id', flat=True).distinct()[:lote]
+    )
+    ids |= set(
+        Factura.objects.filter(
+            content_type_id=cancelacion.content_type_id, object_id=object_id, usuario_id__gt=desde
+        ).order_by('usuario_id').values_list('usuario_id', flat=True).distinct()[:lote]
+    )
+    ids |= set(
+        Reembolso.objects.filter(cancelacion=cancelacion, usuario_id__gt=desde)
+        .order_by('usuario_id').values_list('usuario_id', flat=True).distinct()[:lote]
+    )
+    return sorted(ids)[:lote]
+
+
+# ---------------------
+# LOTES
+# ---------------------
+def _lote_facturas(cancelacion, lote):
+    facturas = list(
+        _facturas(cancelacion).select_for_update()
+        .filter(id__gt=cancelacion.ultimo_id)
+        .order_by('id')
+        .values('id', 'usuario_id', 'monto_total', 'estado_pago')[:lote]
+    )
+    if not facturas:
+        return None
+
+    ids = [f['id'] for f in facturas]
+    pagadas = [f for f in facturas if f['estado_pago'] == 'confirmado']
+
+    Reembolso.objects.bulk_create(
+        [Reembolso(factura_id=f['id'], usuario_id=f['usuario_id'], cancelacion=cancelacion, monto=f['monto_total'])
+         for f in pagadas],
+        ignore_conflicts=True,
+    )
+    contabilidad.registrar_cancelacion_lote(
+        f'cancelacion:{cancelacion.id}:{ids[0]}',
+        facturas,
+        (cancelacion.content_type.model, cancelacion.object_id),
+        cancelacion,
+    )
+    sincronizacion.registrar(Factura.objects.filter(id__in=ids))
+    Factura.objects.filter(id__in=ids).update(**metricas.con_auto_now(Factura, estado_pago='cancelado'))
+    anteriores, montos = Counter(), Counter()
+    for factura in facturas:
+        anteriores[factura['estado_pago']] += 1
+        montos[factura['estado_pago']] += factura['monto_total']
+    metricas.mover('facturas', anteriores, 'cancelado', montos)
+    PagoSimulado.objects.filter(factura_id__in=ids, estado__in=('pendiente', 'procesando')).update(
+        **metricas.con_auto_now(PagoSimulado, estado='cancelado')
+    )
+
+    cancelacion.facturas_procesadas += len(facturas)
+    cancelacion.reembolsos_creados += len(pagadas)
+    cancelacion.monto_reembolsado += sum(f['monto_total'] for f in pagadas)
+    return ids[-1]
+
+
+def _lote_actualizacion(queryset, cancelacion, lote, **valores):
+    """Actualiza por conjuntos el siguiente lote de filas de la fase"""
+    ids = list(
+        queryset.filter(id__gt=cancelacion.ultimo_id)
+        .order_by('id').values_list('id', flat=True)[:lote]
+    )
+    if not ids:
+        return None
+    metricas.actualizar(queryset.model.objects.filter(id__in=ids), **valores)
+    return ids[-1]
+
+
+def _lote_notificaciones(cancelacion, lote):
+    usuarios = _usuarios_afectados(cancelacion, cancelacion.ultimo_id, lote)
+    if not usuarios:
+        return None
+
+    reembolsado = defaultdict(int)
+    for fila in (Reembolso.objects.filter(cancelacion=cancelacion, usuario_id__in=usuarios)
+                 .values('usuario_id').annotate(total=Sum('monto'))):
+        reembolsado[fila['usuario_id']] = fila['total']
+
+    modelo = cancelacion.content_type.model
+    objeto = cancelacion.content_object
+    nombre = getattr(objeto, 'titulo', None) or getattr(objeto, 'nombre', '')
+    notificaciones = []
+    for usuario_id in usuarios:
+        mensaje = f'{"La rifa" if modelo == "rifa" else "El san"} "{nombre}" fue cancelado: {cancelacion.motivo}.'
+        if reembolsado[usuario_id]:
+            mensaje += f' Se te reembolsarán {reembolsado[usuario_id]}.'
+        notificaciones.append(NotificacionMejorada(
+            usuario_id=usuario_id,
+            tipo=modelo,
+            titulo=f'{"Rifa" if modelo == "rifa" else "San"} cancelado',
+            mensaje=mensaje,
+            canal='interno',
+            prioridad='alta',
+            content_type_id=cancelacion.content_type_id,
+            object_id=cancelacion.object_id,
+        ))
+    inicio = timezone.now()
+    NotificacionMejorada.objects.bulk_create(notificaciones)
+    metricas.invalidar(NotificacionMejorada)
+    sincronizacion.registrar(
+        NotificacionMejorada.objects.filter(
+            content_type_id=cancelacion.content_type_id, object_id=cancelacion.object_id,
+            usuario_id__in=usuarios, fecha_creacion__gte=inicio,
+        ),
+        'crear',
+    )
+    cancelacion.usuarios_notificados += len(usuarios)
+    return usuarios[-1]
+
+
+def _procesar_lote(cancelacion_id, lote):
+    """Procesa un lote de la fase actual; retorna False al terminar"""
+    with transaction.atomic():
+        cancelacion = (
+            CancelacionMasiva.objects.select_for_update()
+            .select_related('content_type')
+            .get(id=cancelacion_id)
+        )
+        if cancelacion.fase == 'fin':
+            return False
+
+        object_id = cancelacion.object_id
+        if cancelacion.fase == 'facturas':
+            ultimo = _lote_facturas(cancelacion, lote)
+        elif cancelacion.fase == 'tickets':
+            ultimo = _lote_actualizacion(Ticket.objects.filter(rifa_id=object_id, activo=True),
+                                         cancelacion, lote, activo=False)
+        elif cancelacion.fase == 'cupos':
+            ultimo = _lote_actualizacion(Cupo.objects.filter(san_id=object_id).exclude(estado='cancelado'),
+                                         cancelacion, lote, estado='cancelado')
+        elif cancelacion.fase == 'participaciones':
+            ultimo = _lote_actualizacion(ParticipacionSan.objects.filter(san_id=object_id, activa=True),
+                                         cancelacion, lote, activa=False)
+        else:
+            ultimo = _lote_notificaciones(cancelacion, lote)
+
+        if ultimo is not None:
+            if cancelacion.fase in ('tickets', 'participaciones'):
+                condicional.tocar(Rifa if cancelacion.fase == 'tickets' else San, [object_id])
+            cancelacion.ultimo_id = ultimo
+        else:
+            # Fase terminada: pasar a la siguiente
+            fases = FASES_RIFA if cancelacion.content_type.model == 'rifa' else FASES_SAN
+            cancelacion.fase = fases[fases.index(cancelacion.fase) + 1]
+            cancelacion.ultimo_id = 0
+            if cancelacion.fase == 'fin':
+                cancelacion.estado = 'completada'
+                cancelacion.fecha_fin = timezone.now()
+        cancelacion.save()
+        return True
+
+
+def procesar_cancelacion(cancelacion, lote=1000):
+    """Ejecuta (o reanuda) una cancelación hasta completarla"""
+    trabajos = CancelacionMasiva.objects.filter(id=cancelacion.id).exclude(estado='completada')
+    trabajos.filter(fecha_inicio=None).update(fecha_inicio=timezone.now())
+    trabajos.update(estado='en_proceso', error='')
+    try:
+        while _procesar_lote(cancelacion.id, lote):
+            pass
+    except Exception as exc:
+        CancelacionMasiva.objects.filter(id=cancelacion.id).update(estado='fallida', error=str(exc))
+        raise
+    cancelacion.refresh_from_db()
+    return cancelacion
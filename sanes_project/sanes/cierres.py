@@ -0,0 +1,167 @@
+# sanes/cierres.py
+"""
+Cierre diario contable.
+
+El cierre exporta facturas, pagos, cupos y tickets desde una sola
+transacción REPEATABLE READ: todas las tablas se leen de la misma foto
+aunque sigan entrando pagos mientras se exporta. Cada tabla se escribe en
+flujo (por lotes de ID, como las exportaciones de logs) a un archivo JSONL
+comprimido con gzip, y el cierre queda registrado en ``CierreDiario`` con
+un ``ArchivoCierre`` por tabla (filas, SHA-256 y tamaño) y un
+manifiesto JSON con lo mismo junto a los archivos.
+
+Si hay un cierre anterior, el nuevo es incremental: solo exporta las filas
+con ``fecha_actualizacion`` posterior a la foto anterior (menos
+``MARGEN_INCREMENTAL``, por las transacciones que confirmaron después de
+tomarla; las filas repetidas se reconocen por su ID). Los borrados no
+aparecen en los incrementales; un cierre completo (``--completo``) vuelve a
+exportar todo.
+"""
+import gzip
+import hashlib
+import json
+import tempfile
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .exportaciones import TAMANO_LOTE
+from .models import CierreDiario, ArchivoCierre, Factura, PagoSimulado, Cupo, Ticket
+
+
+TABLAS = {
+    'facturas': Factura,
+    'pagos': PagoSimulado,
+    'cupos': Cupo,
+    'tickets': Ticket,
+}
+
+MARGEN_INCREMENTAL = timedelta(minutes=5)
+
+
+def _iniciar_lectura_consistente():
+    """Fija REPEATABLE READ para la transacción que empieza (MySQL y PostgreSQL)"""
+    if connection.vendor in ('mysql', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+
+def _lotes(filas, lote=TAMANO_LOTE):
+    """Recorre un values_list cuyo primer campo es el ID, por lotes de ID"""
+    ultimo_id = None
+    while True:
+        pagina = filas if ultimo_id is None else filas.filter(id__gt=ultimo_id)
+        bloque = list(pagina[:lote])
+        if not bloque:
+            return
+        ultimo_id = bloque[-1][0]
+        yield bloque
+
+
+def _exportar_tabla(cierre, tabla, modelo, desde):
+    """Escribe la tabla en JSONL.gz y devuelve su ArchivoCierre (sin guardar)"""
+    campos = [campo.attname for campo in modelo._meta.concrete_fields]
+    filas = modelo.objects.order_by('id')
+    if desde is not None:
+        filas = filas.filter(fecha_actualizacion__gte=desde)
+
+    resumen = hashlib.sha256()
+    total = 0
+    with tempfile.TemporaryFile() as temporal:
+        # mtime=0: el mismo contenido produce el mismo archivo
+        with gzip.GzipFile(fileobj=temporal, mode='wb', mtime=0) as comprimido:
+            for bloque in _lotes(filas.values_list(*campos)):
+                lineas = ''.join(
+                    json.dumps(dict(zip(campos, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                    for fila in bloque
+                ).encode()
+                resumen.update(lineas)
+                comprimido.write(lineas)
+                total += len(bloque)
+        tamano = temporal.tell()
+        temporal.seek(0)
+        archivo = ArchivoCierre(cierre=cierre, tabla=tabla, filas=total, sha256=resumen.hexdigest(), bytes=tamano)
+        archivo.archivo.save(f'{cierre.fecha}/{tabla}.jsonl.gz', File(temporal), save=False)
+    return archivo
+
+
+def _manifiesto(cierre, archivos):
+    return json.dumps({
+        'fecha': cierre.fecha,
+        'incremental': cierre.incremental,
+        'anterior': cierre.anterior.fecha if cierre.anterior else None,
+        'desde': cierre.desde,
+        'hasta': cierre.hasta,
+        'archivos': [
+            {'tabla': a.tabla, 'archivo': a.archivo.name, 'filas': a.filas, 'sha256': a.sha256, 'bytes': a.bytes}
+            for a in archivos
+        ],
+    }, cls=DjangoJSONEncoder, indent=2).encode()
+
+
+def cerrar(fecha=None, completo=False):
+    """
+    Hace el cierre de ``fecha`` (hoy por defecto) y devuelve el CierreDiario.
+
+    Es incremental respecto al último cierre listo anterior, salvo con
+    ``completo``. Repetir el cierre de una fecha lo rehace.
+    """
+    if connection.in_atomic_block:
+        raise RuntimeError('El cierre necesita su propia transacción de lectura.')
+    fecha = fecha or timezone.localdate()
+    anterior = None
+    if not completo:
+        anterior = CierreDiario.objects.filter(estado='listo', fecha__lt=fecha).order_by('-fecha').first()
+
+    cierre, _ = CierreDiario.objects.update_or_create(fecha=fecha, defaults={
+        'estado': 'procesando',
+        'anterior': anterior,
+        'incremental': anterior is not None,
+        'desde': anterior.hasta - MARGEN_INCREMENTAL if anterior else None,
+        'hasta': None,
+        'error': '',
+        'fecha_finalizacion': None,
+    })
+    for viejo in cierre.archivos.all():
+        viejo.archivo.delete(save=False)
+    cierre.archivos.all().delete()
+
+    try:
+        with transaction.atomic():
+            _iniciar_lectura_consistente()
+            cierre.hasta = timezone.now()
+            archivos = [
+                _exportar_tabla(cierre, tabla, modelo, cierre.desde)
+                for tabla, modelo in TABLAS.items()
+            ]
+    except Exception as exc:
+        CierreDiario.objects.filter(id=cierre.id).update(estado='error', error=str(exc))
+        raise
+
+    ArchivoCierre.objects.bulk_create(archivos)
+    if cierre.manifiesto:
+        cierre.manifiesto.delete(save=False)
+    cierre.manifiesto.save(f'{cierre.fecha}/manifiesto.json', ContentFile(_manifiesto(cierre, archivos)), save=False)
+    cierre.estado = 'listo'
+    cierre.fecha_finalizacion = timezone.now()
+    cierre.save()
+    return cierre
+
+
+def verificar(cierre):
+    """Vuelve a leer los archivos del cierre; devuelve las tablas cuyo checksum o filas no coinciden"""
+    errores = []
+    for archivo in cierre.archivos.all():
+        resumen = hashlib.sha256()
+        filas = 0
+        with archivo.archivo.open('rb') as crudo, gzip.GzipFile(fileobj=crudo) as contenido:
+            for linea in contenido:
+                resumen.update(linea)
+                filas += 1
+        if resumen.hexdigest() != archivo.sha256 or filas != archivo.filas:
+            errores.append(archivo.tabla)
+    return errores
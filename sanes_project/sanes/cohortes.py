@@ -0,0 +1,221 @@
+# sanes/cohortes.py
+"""
+Cohortes y retención de usuarios.
+
+Una cohorte son los usuarios que se registraron en la misma semana (o mes).
+Para cada usuario se guarda un vector de actividad compacto: un entero de
+64 bits donde el bit ``k`` indica que tuvo actividad ``k`` periodos después
+de registrarse. Hay un vector por fuente (compras de tickets, inscripciones
+a sanes y logs del sistema) y se llenan recorriendo cada tabla por lotes de
+ID, así que la memoria depende del número de usuarios y no de las filas.
+
+Las matrices de retención (cohorte × periodo) salen de esos vectores con
+NumPy. El cálculo corre como un trabajo de ``procesar_reportes`` (tipo
+``cohortes``) y el resultado se reutiliza durante ``VIGENCIA_COHORTES``.
+"""
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from . import reportes
+from .exportaciones import TAMANO_LOTE
+from .models import CustomUser, Ticket, ParticipacionSan, SystemLog
+
+
+PERIODOS = {
+    'semana': 'Semana',
+    'mes': 'Mes',
+}
+
+# Fuente -> (modelo, campo de usuario, campo de fecha)
+FUENTES = {
+    'compras': (Ticket, 'usuario_id', 'fecha_compra'),
+    'sanes': (ParticipacionSan, 'usuario_id', 'fecha_inscripcion'),
+    'actividad': (SystemLog, 'usuario_id', 'fecha_creacion'),
+}
+
+METRICAS = {
+    'recompra': 'Compra o se une a un san',
+    'compras': 'Compra tickets',
+    'sanes': 'Se une a un san',
+    'actividad': 'Cualquier actividad registrada',
+}
+
+# Un bit por periodo en un entero de 64 bits
+MAX_PERIODOS = 52
+
+# Minutos que se reutiliza una matriz ya calculada
+VIGENCIA_COHORTES = 6 * 60
+
+_EPOCA = date(1970, 1, 1)
+
+
+def parametros_cohortes(datos):
+    """Normaliza los parámetros desde un QueryDict/dict"""
+    periodo = datos.get('periodo')
+    try:
+        periodos = int(datos.get('periodos') or 12)
+    except ValueError:
+        periodos = 12
+    return {
+        'periodo': periodo if periodo in PERIODOS else 'semana',
+        'periodos': max(2, min(periodos, MAX_PERIODOS)),
+    }
+
+
+# ---------------------
+# PERIODOS
+# ---------------------
+def _dias(fechas):
+    """Días desde 1970-01-01 (fecha local) de una lista de datetimes"""
+    zona = timezone.get_current_timezone()
+    return np.fromiter(
+        ((f.astimezone(zona).date() - _EPOCA).days for f in fechas), dtype=np.int64, count=len(fechas)
+    )
+
+
+def _indice(dias, periodo):
+    """Número de semana (empezando en lunes) o de mes de cada día"""
+    if periodo == 'semana':
+        # 1970-01-01 fue jueves
+        return (dias + 3) // 7
+    return dias.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def _inicio(indice, periodo):
+    """Primer día de un periodo"""
+    if periodo == 'semana':
+        return _EPOCA + timedelta(days=int(indice) * 7 - 3)
+    return np.datetime64(int(indice), 'M').astype('datetime64[D]').item()
+
+
+# ---------------------
+# EXTRACCIÓN POR LOTES
+# ---------------------
+def _lotes(queryset, campos, lote):
+    """Recorre el queryset por ID en lotes de tuplas (``campos`` empieza por 'id')"""
+    filas = queryset.order_by('id').values_list(*campos)
+    ultimo_id = None
+    while True:
+        pagina = filas if ultimo_id is None else filas.filter(id__gt=ultimo_id)
+        bloque = list(pagina[:lote])
+        if not bloque:
+            return
+        ultimo_id = bloque[-1][0]
+        yield bloque
+
+
+def _usuarios(desde, periodo, lote):
+    """IDs ordenados de los usuarios registrados desde ``desde`` y el periodo de su cohorte"""
+    ids, cohortes = [], []
+    for bloque in _lotes(CustomUser.objects.filter(date_joined__gte=desde), ('id', 'date_joined'), lote):
+        ids.append(np.fromiter((fila[0] for fila in bloque), dtype=np.int64, count=len(bloque)))
+        cohortes.append(_indice(_dias([fila[1] for fila in bloque]), periodo))
+    if not ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(ids), np.concatenate(cohortes)
+
+
+def _vectores(fuente, usuarios, cohorte, desde, periodo, periodos, lote):
+    """Vector de actividad (bits por periodo relativo) de cada usuario en una fuente"""
+    modelo, campo_usuario, campo_fecha = FUENTES[fuente]
+    mascaras = np.zeros(len(usuarios), dtype=np.uint64)
+    if not len(usuarios):
+        return mascaras
+    filas = modelo.objects.filter(**{f'{campo_fecha}__gte': desde, f'{campo_usuario}__isnull': False})
+    for bloque in _lotes(filas, ('id', campo_usuario, campo_fecha), lote):
+        ids = np.fromiter((fila[1] for fila in bloque), dtype=np.int64, count=len(bloque))
+        posiciones = np.searchsorted(usuarios, ids)
+        conocidos = posiciones < len(usuarios)
+        conocidos[conocidos] = usuarios[posiciones[conocidos]] == ids[conocidos]
+        posiciones = posiciones[conocidos]
+        desfase = _indice(_dias([fila[2] for fila in bloque]), periodo)[conocidos] - cohorte[posiciones]
+        validos = (desfase >= 0) & (desfase < periodos)
+        np.bitwise_or.at(
+            mascaras, posiciones[validos], np.left_shift(np.uint64(1), desfase[validos].astype(np.uint64))
+        )
+    return mascaras
+
+
+# ---------------------
+# MATRICES DE RETENCIÓN
+# ---------------------
+def _retencion(mascaras, cohorte, cohortes, periodos):
+    """Usuarios de cada cohorte con actividad en cada periodo relativo (cohortes × periodos)"""
+    matriz = np.zeros((cohortes, periodos), dtype=np.int64)
+    for k in range(periodos):
+        activos = ((mascaras >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        matriz[:, k] = np.bincount(cohorte[activos], minlength=cohortes)
+    return matriz
+
+
+def calcular(periodo='semana', periodos=12, ahora=None, lote=TAMANO_LOTE, progreso=None):
+    """
+    Matrices de retención de las últimas ``periodos`` cohortes.
+
+    Returns:
+        dict con las cohortes (inicio y usuarios) y, por métrica, las filas
+        de cantidades y porcentajes; los periodos que aún no llegan son None.
+    """
+    ahora = ahora or timezone.now()
+    actual = int(_indice(_dias([ahora]), periodo)[0])
+    primera = actual - periodos + 1
+    desde = timezone.make_aware(datetime.combine(_inicio(primera, periodo), time.min))
+
+    usuarios, periodo_usuario = _usuarios(desde, periodo, lote)
+    cohorte = periodo_usuario - primera
+    vectores = {}
+    for paso, fuente in enumerate(FUENTES, start=1):
+        vectores[fuente] = _vectores(fuente, usuarios, periodo_usuario, desde, periodo, periodos, lote)
+        if progreso:
+            progreso(paso / (len(FUENTES) + 1))
+    vectores['recompra'] = vectores['compras'] | vectores['sanes']
+
+    tamanos = np.bincount(cohorte, minlength=periodos)
+    # Periodos transcurridos de cada cohorte: la más reciente solo tiene el 0
+    transcurrido = np.arange(periodos)[None, :] <= (periodos - 1 - np.arange(periodos))[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metricas = {}
+        for metrica in METRICAS:
+            matriz = _retencion(vectores[metrica], cohorte, periodos, periodos)
+            porcentajes = np.where(tamanos[:, None] > 0, matriz * 100 / tamanos[:, None], 0)
+            metricas[metrica] = [
+                [
+                    {'usuarios': int(matriz[c, k]), 'porcentaje': round(float(porcentajes[c, k]), 1)}
+                    if transcurrido[c, k] else None
+                    for k in range(periodos)
+                ]
+                for c in range(periodos)
+            ]
+
+    return {
+        'periodo': periodo,
+        'periodos': periodos,
+        'cohortes': [
+            {'inicio': _inicio(primera + c, periodo).isoformat(), 'usuarios': int(tamanos[c])}
+            for c in range(periodos)
+        ],
+        'metricas': metricas,
+    }
+
+
+# ---------------------
+# TRABAJO DE REPORTE
+# ---------------------
+def obtener_o_solicitar(usuario, parametros):
+    """Devuelve el reporte de cohortes vigente o en curso, o pide uno nuevo"""
+    descripcion = f"Cohortes por {PERIODOS[parametros['periodo']].lower()} ({parametros['periodos']} periodos)"
+    return reportes.solicitar('cohortes', usuario, {'formato': 'datos', **parametros}, descripcion)
+
+
+def generar_reporte(reporte):
+    resultado = calcular(
+        reporte.parametros['periodo'], reporte.parametros['periodos'],
+        progreso=lambda fraccion: reportes.avanzar(reporte, fraccion),
+    )
+    reporte.resultado = resultado
+    return reportes.finalizar(
+        reporte, 'resultado', filas=sum(c['usuarios'] for c in resultado['cohortes']),
+        minutos=VIGENCIA_COHORTES,
+    )
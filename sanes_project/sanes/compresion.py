@@ -0,0 +1,84 @@
+# sanes/compresion.py
+"""
+Compresión de las respuestas HTML y JSON.
+
+La app móvil y el sitio se usan mucho desde datos móviles lentos, y las
+páginas y el JSON de la API viajaban sin comprimir. ``CompresionMiddleware``
+comprime con brotli (si el cliente lo acepta y el paquete ``brotli`` está
+instalado) o gzip las respuestas de los tipos de ``TIPOS`` que superan
+``UMBRAL`` bytes; por debajo el ahorro no compensa el tiempo de CPU.
+
+Los archivos estáticos no pasan por aquí: WhiteNoise los sirve con nombre
+con hash, ``Cache-Control: immutable`` y las variantes .gz/.br generadas en
+collectstatic (``STORAGES['staticfiles']`` en settings).
+"""
+import re
+
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    # Sin el paquete brotli se usa solo gzip
+    brotli = None
+
+
+# Tipos de contenido que se comprimen
+TIPOS = frozenset({'text/html', 'application/json'})
+
+# Bytes mínimos del cuerpo para comprimirlo
+UMBRAL = 1024
+
+# Calidad de brotli: 4-5 comprime más que gzip -6 en un tiempo parecido
+CALIDAD_BROTLI = 4
+
+_ACEPTA_BR = re.compile(r'\bbr\b')
+_ACEPTA_GZIP = re.compile(r'\bgzip\b')
+
+
+def codificacion(request):
+    """'br', 'gzip' o None según Accept-Encoding"""
+    aceptadas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and _ACEPTA_BR.search(aceptadas):
+        return 'br'
+    if _ACEPTA_GZIP.search(aceptadas):
+        return 'gzip'
+    return None
+
+
+def comprimir(contenido, metodo):
+    if metodo == 'br':
+        return brotli.compress(contenido, quality=CALIDAD_BROTLI)
+    # Con bytes aleatorios en la cabecera gzip, como GZipMiddleware (mitigación de BREACH)
+    return compress_string(contenido, max_random_bytes=100)
+
+
+class CompresionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        tipo = response.get('Content-Type', '').split(';')[0].strip()
+        if response.streaming or tipo not in TIPOS or response.has_header('Content-Encoding'):
+            return response
+
+        # La respuesta depende de Accept-Encoding aunque esta vez no se comprima
+        patch_vary_headers(response, ('Accept-Encoding',))
+        metodo = codificacion(request)
+        if metodo is None or len(response.content) < UMBRAL:
+            return response
+
+        comprimido = comprimir(response.content, metodo)
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = metodo
+
+        # El cuerpo cambió: un ETag fuerte pasa a débil (If-None-Match compara en débil)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,134 @@
+# sanes/condicional.py
+"""
+GET condicionales (ETag y Last-Modified) de rifas y sanes.
+
+La app móvil consulta una y otra vez el detalle de una rifa o san para ver
+su avance. El ETag del detalle sale de ``updated_at`` y de ``version``, un
+contador de la fila que sube con cada ticket o inscripción (``tocar``); si
+el cliente ya tiene esa versión recibe un 304 con una sola consulta por
+clave primaria, sin serializar ni leer tickets o participaciones.
+
+``tocar`` también pone ``updated_at`` a ahora, así Last-Modified sirve a los
+clientes que no mandan If-None-Match. Los save()/delete() de tickets e
+inscripciones lo llaman por señal; las actualizaciones por conjuntos
+(webhooks, cancelaciones) lo llaman ellas mismas. Un checkout que crea
+varios tickets lo hace dentro de ``agrupar()``, así la rifa se toca una vez
+por compra y no una vez por ticket.
+
+Los listados usan ETags débiles construidos con las versiones de tabla de
+``metricas`` (sin consultar la base de datos) y los parámetros de la URL.
+"""
+import hashlib
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import F
+from django.views.decorators.http import condition
+
+from . import metricas, sincronizacion
+from .models import Rifa, San, Ticket, ParticipacionSan
+
+
+# Modelo hijo -> (modelo padre, campo con el ID del padre)
+PADRES = {
+    Ticket: (Rifa, 'rifa_id'),
+    ParticipacionSan: (San, 'san_id'),
+}
+
+
+def tocar(modelo, ids):
+    """Sube ``version`` y ``updated_at`` de estas rifas o sanes (``ids`` puede ser una subconsulta)"""
+    metricas.invalidar(modelo)
+    sincronizacion.registrar(modelo.objects.filter(id__in=ids))
+    return modelo.objects.filter(id__in=ids).update(**metricas.con_auto_now(modelo, version=F('version') + 1))
+
+
+# IDs pendientes de tocar dentro de agrupar() en este hilo: {modelo: set(ids)}
+_agrupados = threading.local()
+
+
+@contextmanager
+def agrupar():
+    """
+    Acumula los tickets e inscripciones guardados dentro del bloque y toca
+    cada rifa o san una sola vez al salir. Si el bloque falla no se toca nada.
+    """
+    if getattr(_agrupados, 'ids', None) is not None:
+        # Anidado: el bloque exterior toca al salir
+        yield
+        return
+    _agrupados.ids = defaultdict(set)
+    try:
+        yield
+        pendientes = _agrupados.ids
+    finally:
+        _agrupados.ids = None
+    for modelo, ids in pendientes.items():
+        tocar(modelo, sorted(ids))
+
+
+def tocar_por_senal(sender, instance, **kwargs):
+    """Receptor de post_save/post_delete de Ticket y ParticipacionSan"""
+    padre, campo = PADRES[sender]
+    objeto_id = getattr(instance, campo)
+    if objeto_id is None:
+        return
+    agrupados = getattr(_agrupados, 'ids', None)
+    if agrupados is not None:
+        agrupados[padre].add(objeto_id)
+    else:
+        tocar(padre, [objeto_id])
+
+
+# ---------------------
+# DETALLE
+# ---------------------
+def _estado(request, modelo, pk):
+    """(updated_at, version) del objeto, leído una vez por petición"""
+    estados = request.__dict__.setdefault('_estado_condicional', {})
+    if (modelo, pk) not in estados:
+        estados[(modelo, pk)] = modelo.objects.filter(pk=pk).values_list('updated_at', 'version').first()
+    return estados[(modelo, pk)]
+
+
+def detalle(modelo, por_usuario=False):
+    """
+    Decorador de vistas de detalle (con ``pk``) que responde 304 si el
+    objeto no cambió.
+
+    Con ``por_usuario`` (páginas HTML) el ETag incluye al usuario y su
+    cookie CSRF, y no se usa mientras haya mensajes pendientes de mostrar.
+    """
+    def etag(request, pk, *args, **kwargs):
+        estado = _estado(request, modelo, pk)
+        if estado is None:
+            return None
+        partes = [modelo._meta.model_name, str(pk), estado[0].isoformat(), str(estado[1]), request.META.get('QUERY_STRING', '')]
+        if por_usuario:
+            if len(messages.get_messages(request)):
+                return None
+            partes += [str(request.user.pk), request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+        return hashlib.sha1(':'.join(partes).encode()).hexdigest()
+
+    def ultima_modificacion(request, pk, *args, **kwargs):
+        if por_usuario:
+            return None
+        estado = _estado(request, modelo, pk)
+        return estado[0] if estado else None
+
+    return condition(etag_func=etag, last_modified_func=ultima_modificacion)
+
+
+# ---------------------
+# LISTADOS
+# ---------------------
+def listado(*modelos):
+    """Decorador de listados con ETag débil: versiones de las tablas y URL completa"""
+    def etag(request, *args, **kwargs):
+        firma = f'{sorted(metricas.versiones(*modelos).items())}:{request.get_full_path()}'
+        return 'W/"%s"' % hashlib.sha1(firma.encode()).hexdigest()
+
+    return condition(etag_func=etag)
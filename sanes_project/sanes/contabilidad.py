@@ -0,0 +1,400 @@
+# sanes/contabilidad.py
+"""
+Libro mayor de partida doble.
+
+Cada movimiento de dinero se registra como un ``AsientoContable`` cuyos
+``ApunteContable`` suman cero, y el saldo de cada ``CuentaContable`` se
+actualiza en la misma transacción. Así "cuánto ha recaudado este san" es la
+lectura de una fila en vez de un ``Sum`` sobre facturas, pagos y cupos.
+
+Cuentas de cada titular (usuario, san, rifa, plataforma):
+    - disponible: dinero efectivamente movido
+    - por_cobrar: deudas abiertas por facturas emitidas y no pagadas
+
+Asientos:
+    factura_emitida   usuario.por_cobrar -m   destino.por_cobrar +m
+    factura_anulada   inverso de factura_emitida
+    pago_recibido /
+    cuota_pagada      cancela el por_cobrar y mueve usuario.disponible -m
+                      a destino.disponible +m
+    pago_turno        san.disponible -m       usuario.disponible +m
+    reembolso         destino.disponible -m   usuario.disponible +m
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, Max, Min, Sum, Value, When
+
+from .models import AsientoContable, ApunteContable, CuentaContable, Cupo
+
+
+CERO = Decimal('0.00')
+PLATAFORMA = ('plataforma', 0)
+
+
+# ---------------------
+# CUENTAS Y ASIENTOS
+# ---------------------
+def _obtener_cuentas(claves):
+    """
+    IDs de las cuentas (tipo, object_id, rubro), creando las que falten.
+
+    Se consulta una vez por (tipo, rubro), no una vez por cuenta, para que
+    los asientos de un lote con muchos usuarios sigan siendo baratos.
+    """
+    por_grupo = defaultdict(set)
+    for tipo, object_id, rubro in claves:
+        por_grupo[(tipo, rubro)].add(object_id or 0)
+
+    def consultar():
+        encontradas = {}
+        for (tipo, rubro), object_ids in por_grupo.items():
+            for cuenta_id, object_id in CuentaContable.objects.filter(
+                tipo=tipo, rubro=rubro, object_id__in=object_ids
+            ).values_list('id', 'object_id'):
+                encontradas[(tipo, object_id, rubro)] = cuenta_id
+        return encontradas
+
+    ids = consultar()
+    faltantes = [(t, o or 0, r) for t, o, r in claves if (t, o or 0, r) not in ids]
+    if faltantes:
+        CuentaContable.objects.bulk_create(
+            [CuentaContable(tipo=t, object_id=o, rubro=r) for t, o, r in set(faltantes)],
+            ignore_conflicts=True,
+        )
+        ids = consultar()
+    return {(t, o, r): ids[(t, o or 0, r)] for t, o, r in claves}
+
+
+def registrar_asiento(tipo, clave, movimientos, descripcion='', origen=None):
+    """
+    Registra un asiento y actualiza los saldos de sus cuentas.
+
+    Args:
+        tipo: tipo de asiento (ver ``AsientoContable.TIPOS_ASIENTO``)
+        clave: identificador único del hecho contabilizado
+        movimientos: lista de ((tipo_cuenta, object_id, rubro), monto); los
+            movimientos de una misma cuenta se agrupan en un solo apunte
+        origen: objeto que origina el movimiento
+
+    Returns:
+        El asiento creado, o None si la clave ya estaba contabilizada
+    """
+    agrupados = defaultdict(Decimal)
+    for clave_cuenta, monto in movimientos:
+        agrupados[clave_cuenta] += Decimal(monto)
+    agrupados = {clave_cuenta: monto for clave_cuenta, monto in agrupados.items() if monto}
+    if sum(agrupados.values()) != 0:
+        raise ValueError(f'El asiento {clave} no cuadra: {movimientos}')
+
+    with transaction.atomic():
+        asiento, creado = AsientoContable.objects.get_or_create(
+            clave=clave,
+            defaults={
+                'tipo': tipo,
+                'descripcion': descripcion[:255],
+                'content_type': ContentType.objects.get_for_model(origen) if origen is not None else None,
+                'object_id': origen.pk if origen is not None else None,
+            },
+        )
+        if not creado or not agrupados:
+            return asiento if creado else None
+
+        ids = _obtener_cuentas(agrupados.keys())
+
+        # Bloquear las cuentas siempre en el mismo orden evita interbloqueos
+        cuentas = {
+            cuenta.id: cuenta
+            for cuenta in CuentaContable.objects.select_for_update().filter(id__in=ids.values()).order_by('id')
+        }
+
+        apuntes = []
+        for clave_cuenta, monto in agrupados.items():
+            cuenta = cuentas[ids[clave_cuenta]]
+            cuenta.saldo += monto
+            if monto > 0:
+                cuenta.entradas += monto
+            else:
+                cuenta.salidas -= monto
+            apuntes.append(ApunteContable(asiento=asiento, cuenta=cuenta, monto=monto, saldo_resultante=cuenta.saldo))
+
+        CuentaContable.objects.bulk_update(cuentas.values(), ['saldo', 'entradas', 'salidas', 'fecha_actualizacion'])
+        ApunteContable.objects.bulk_create(apuntes)
+    return asiento
+
+
+# ---------------------
+# MOVIMIENTOS DE FACTURAS Y TURNOS
+# ---------------------
+def destino_factura(factura):
+    """Titular (tipo, id) que cobra la factura"""
+    modelo = factura.content_type.model if factura.content_type_id else None
+    if modelo in ('rifa', 'san'):
+        return modelo, factura.object_id
+    if modelo == 'cupo':
+        san_id = Cupo.objects.filter(id=factura.object_id).values_list('san_id', flat=True).first()
+        if san_id:
+            return 'san', san_id
+    return PLATAFORMA
+
+
+def _movimientos_deuda(factura, monto):
+    tipo, object_id = destino_factura(factura)
+    return [
+        (('usuario', factura.usuario_id, 'por_cobrar'), -monto),
+        ((tipo, object_id, 'por_cobrar'), monto),
+    ]
+
+
+def _deuda_abierta(factura_id):
+    """
+    True si la deuda de la factura sigue en por_cobrar: se contabilizó la
+    emisión y todavía no se canceló con una anulación ni con un pago.
+
+    Una factura puede pasar por varios estados (pendiente -> vencido ->
+    confirmado); la deuda se cancela una sola vez.
+    """
+    claves = set(AsientoContable.objects.filter(
+        clave__in=[f'{prefijo}:factura:{factura_id}' for prefijo in ('emision', 'anulacion', 'pago')]
+    ).values_list('clave', flat=True))
+    return claves == {f'emision:factura:{factura_id}'}
+
+
+def registrar_factura_emitida(factura):
+    return registrar_asiento(
+        'factura_emitida',
+        f'emision:factura:{factura.id}',
+        _movimientos_deuda(factura, factura.monto_total),
+        descripcion=f'Factura {factura.codigo} emitida',
+        origen=factura,
+    )
+
+
+def registrar_anulacion_factura(factura):
+    """Cancela la deuda de una factura que no llegó a pagarse"""
+    if not _deuda_abierta(factura.id):
+        return None
+    return registrar_asiento(
+        'factura_anulada',
+        f'anulacion:factura:{factura.id}',
+        _movimientos_deuda(factura, -factura.monto_total),
+        descripcion=f'Factura {factura.codigo} anulada ({factura.estado_pago})',
+        origen=factura,
+    )
+
+
+def registrar_pago_factura(factura):
+    """Contabiliza el cobro de una factura (pago de rifa/san o cuota)"""
+    monto = factura.monto_total
+    tipo, object_id = destino_factura(factura)
+    movimientos = [
+        (('usuario', factura.usuario_id, 'disponible'), -monto),
+        ((tipo, object_id, 'disponible'), monto),
+    ]
+    # Solo se cancela la deuda si se contabilizó al emitirse y no se anuló después
+    if _deuda_abierta(factura.id):
+        movimientos += _movimientos_deuda(factura, -monto)
+
+    es_cuota = factura.content_type_id and factura.content_type.model == 'cupo'
+    return registrar_asiento(
+        'cuota_pagada' if es_cuota else 'pago_recibido',
+        f'pago:factura:{factura.id}',
+        movimientos,
+        descripcion=f'Pago de la factura {factura.codigo}',
+        origen=factura,
+    )
+
+
+def registrar_reembolso(factura, monto=None):
+    """Devuelve al usuario el dinero de una factura pagada"""
+    if not AsientoContable.objects.filter(clave=f'pago:factura:{factura.id}').exists():
+        return None
+    monto = factura.monto_total if monto is None else monto
+    tipo, object_id = destino_factura(factura)
+    return registrar_asiento(
+        'reembolso',
+        f'reembolso:factura:{factura.id}',
+        [
+            ((tipo, object_id, 'disponible'), -monto),
+            (('usuario', factura.usuario_id, 'disponible'), monto),
+        ],
+        descripcion=f'Reembolso de la factura {factura.codigo}',
+        origen=factura,
+    )
+
+
+def registrar_cambio_estado(factura, estado_anterior):
+    """Contabiliza la transición de ``estado_pago`` de una factura"""
+    estado_anterior = estado_anterior or 'pendiente'
+    if factura.estado_pago == estado_anterior:
+        return None
+    if factura.estado_pago == 'confirmado':
+        return registrar_pago_factura(factura)
+    if estado_anterior == 'confirmado' and factura.estado_pago in ('cancelado', 'rechazado'):
+        return registrar_reembolso(factura)
+    if estado_anterior == 'pendiente' and factura.estado_pago in ('cancelado', 'rechazado', 'vencido'):
+        return registrar_anulacion_factura(factura)
+    return None
+
+
+def registrar_cancelacion_lote(clave, facturas, destino, origen):
+    """
+    Contabiliza en dos asientos un lote de facturas canceladas.
+
+    Las pagadas se reembolsan y las pendientes se anulan. Solo entran las
+    facturas cuyo pago ya estaba contabilizado o cuya deuda sigue abierta.
+
+    Args:
+        clave: prefijo único del lote (p. ej. "cancelacion:3:1500")
+        facturas: diccionarios con id, usuario_id, monto_total y estado_pago
+        destino: titular (tipo, id) de la rifa o san cancelado
+    """
+    contabilizadas = set(
+        AsientoContable.objects.filter(
+            clave__in=[f"{prefijo}:factura:{f['id']}" for f in facturas for prefijo in ('pago', 'emision', 'anulacion')]
+        ).values_list('clave', flat=True)
+    )
+
+    reembolsos = []
+    anulaciones = []
+    for factura in facturas:
+        monto = factura['monto_total']
+        if factura['estado_pago'] == 'confirmado' and f"pago:factura:{factura['id']}" in contabilizadas:
+            reembolsos += [
+                ((*destino, 'disponible'), -monto),
+                (('usuario', factura['usuario_id'], 'disponible'), monto),
+            ]
+        elif (factura['estado_pago'] == 'pendiente'
+              and f"emision:factura:{factura['id']}" in contabilizadas
+              and f"anulacion:factura:{factura['id']}" not in contabilizadas
+              and f"pago:factura:{factura['id']}" not in contabilizadas):
+            anulaciones += [
+                ((*destino, 'por_cobrar'), -monto),
+                (('usuario', factura['usuario_id'], 'por_cobrar'), monto),
+            ]
+
+    if reembolsos:
+        registrar_asiento('reembolso', f'{clave}:reembolsos', reembolsos,
+                          descripcion=f'Reembolsos por cancelación ({len(reembolsos) // 2} facturas)', origen=origen)
+    if anulaciones:
+        registrar_asiento('factura_anulada', f'{clave}:anulaciones', anulaciones,
+                          descripcion=f'Facturas anuladas por cancelación ({len(anulaciones) // 2})', origen=origen)
+
+
+def registrar_pago_turno(turno):
+    """El san paga el turno al participante"""
+    return registrar_asiento(
+        'pago_turno',
+        f'turno:{turno.id}',
+        [
+            (('san', turno.san_id, 'disponible'), -turno.monto_turno),
+            (('usuario', turno.participante.usuario_id, 'disponible'), turno.monto_turno),
+        ],
+        descripcion=f'Pago del turno {turno.numero_turno} del san {turno.san_id}',
+        origen=turno,
+    )
+
+
+# ---------------------
+# CONSULTAS
+# ---------------------
+def saldo(tipo, object_id=0, rubro='disponible'):
+    """Saldo actual de una cuenta (una sola fila)"""
+    return CuentaContable.objects.filter(
+        tipo=tipo, object_id=object_id, rubro=rubro
+    ).values_list('saldo', flat=True).first() or CERO
+
+
+def recaudado(tipo, object_id=None):
+    """
+    Total cobrado por un titular, o por todos los de un tipo si no se da ID,
+    descontados los reembolsos (también los de facturas pagadas y anuladas
+    después). Equivale a sumar sus facturas confirmadas; los turnos que paga
+    un san no lo reducen.
+
+    Las entradas son una fila por titular; los reembolsos, sus apuntes.
+    """
+    cuentas = CuentaContable.objects.filter(tipo=tipo, rubro='disponible')
+    if object_id is not None:
+        cuentas = cuentas.filter(object_id=object_id)
+    entradas = cuentas.aggregate(total=Sum('entradas'))['total'] or CERO
+    reembolsos = ApunteContable.objects.filter(
+        cuenta__in=cuentas, asiento__tipo='reembolso'
+    ).aggregate(total=Sum('monto'))['total'] or CERO
+    return entradas + reembolsos
+
+
+# ---------------------
+# VERIFICACIÓN
+# ---------------------
+def _rangos(modelo, campo, lote):
+    limites = modelo.objects.aggregate(minimo=Min(campo), maximo=Max(campo))
+    if limites['minimo'] is None:
+        return []
+    return [(inicio, inicio + lote) for inicio in range(limites['minimo'], limites['maximo'] + 1, lote)]
+
+
+def _verificar_cuentas(desde, hasta):
+    """Recalcula desde los apuntes los saldos de las cuentas del rango"""
+    decimal = DecimalField(max_digits=14, decimal_places=2)
+    try:
+        calculados = {
+            fila['cuenta_id']: fila
+            for fila in ApunteContable.objects.filter(cuenta_id__gte=desde, cuenta_id__lt=hasta)
+            .values('cuenta_id')
+            .annotate(
+                saldo=Sum('monto'),
+                entradas=Sum(Case(When(monto__gt=0, then='monto'), default=Value(0), output_field=decimal)),
+                salidas=Sum(Case(When(monto__lt=0, then='monto'), default=Value(0), output_field=decimal)),
+            )
+        }
+        diferencias = []
+        for cuenta in CuentaContable.objects.filter(id__gte=desde, id__lt=hasta):
+            fila = calculados.get(cuenta.id, {})
+            esperado = {
+                'saldo': fila.get('saldo') or CERO,
+                'entradas': fila.get('entradas') or CERO,
+                'salidas': -(fila.get('salidas') or CERO),
+            }
+            actual = {campo: getattr(cuenta, campo) for campo in esperado}
+            if actual != esperado:
+                diferencias.append({'cuenta': cuenta, 'actual': actual, 'esperado': esperado})
+        return diferencias
+    finally:
+        connection.close()
+
+
+def _verificar_asientos(desde, hasta):
+    """Asientos del rango cuyos apuntes no suman cero"""
+    try:
+        return list(
+            ApunteContable.objects.filter(asiento_id__gte=desde, asiento_id__lt=hasta)
+            .values('asiento_id')
+            .annotate(total=Sum('monto'))
+            .exclude(total=0)
+        )
+    finally:
+        connection.close()
+
+
+def verificar(procesos=4, lote=1000, corregir=False):
+    """
+    Reconstruye los saldos desde los apuntes en rangos paralelos.
+
+    Returns:
+        (diferencias, asientos_descuadrados). Con ``corregir`` se
+        sobrescriben los saldos de las cuentas con diferencias.
+    """
+    with ThreadPoolExecutor(max_workers=procesos) as ejecutor:
+        trabajos_cuentas = [ejecutor.submit(_verificar_cuentas, *r) for r in _rangos(CuentaContable, 'id', lote)]
+        trabajos_asientos = [ejecutor.submit(_verificar_asientos, *r) for r in _rangos(AsientoContable, 'id', lote)]
+        diferencias = [d for t in trabajos_cuentas for d in t.result()]
+        descuadrados = [a for t in trabajos_asientos for a in t.result()]
+
+    if corregir:
+        for diferencia in diferencias:
+            CuentaContable.objects.filter(id=diferencia['cuenta'].id).update(**diferencia['esperado'])
+    return diferencias, descuadrados
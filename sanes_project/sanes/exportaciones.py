@@ -0,0 +1,418 @@
+# sanes/exportaciones.py
+"""
+Exportación de logs del sistema a CSV con memoria constante.
+
+Las filas se leen en lotes por ID (paginación keyset: ``id < último``), así
+que cada consulta usa la clave primaria y nunca hay más de un lote en
+memoria, sin importar cuántos millones de filas tenga la tabla. El CSV se
+genera como un flujo de bytes (opcionalmente comprimido con gzip) que sirve
+tanto para un ``StreamingHttpResponse`` como para escribir un archivo en
+segundo plano con ``procesar_reportes``.
+
+``csv_flujo`` y ``xlsx_flujo`` sirven para cualquier secuencia de lotes de
+filas; el XLSX se escribe como ZIP en flujo (sin posicionarse en el archivo)
+con cadenas en línea, así que tampoco necesita tener la hoja en memoria.
+"""
+import csv
+import re
+import tempfile
+import zipfile
+import zlib
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.core.files import File
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+
+from . import metricas, reportes
+from .models import SystemLog, Factura, Ticket, ParticipacionSan, Cupo, PagoSimulado
+
+
+COLUMNAS_LOGS = ['Usuario', 'Acción', 'Nivel', 'Descripción', 'IP', 'Fecha']
+
+# Filtros de admin_logs (parámetro GET -> lookup). Las fechas se convierten
+# en límites de día para comparar la columna directamente y usar su índice.
+FILTROS_LOGS = {
+    'tipo_accion': 'tipo_accion',
+    'nivel': 'nivel',
+    'usuario': 'usuario_id',
+    'fecha_inicio': 'fecha_creacion__gte',
+    'fecha_fin': 'fecha_creacion__lt',
+}
+
+# Nombres anteriores de los filtros (enlaces y reportes ya solicitados)
+ALIAS_FILTROS_LOGS = {
+    'action_type': 'tipo_accion',
+    'level': 'nivel',
+    'user': 'usuario',
+    'date_from': 'fecha_inicio',
+    'date_to': 'fecha_fin',
+}
+
+# Tope del conteo de logs filtrados; por encima se muestra "más de"
+LIMITE_CONTEO_LOGS = 10000
+
+TAMANO_LOTE = 5000
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla"""
+    def write(self, valor):
+        return valor
+
+
+def parametros_logs(datos):
+    """Extrae de un QueryDict/dict solo los filtros de logs con valor"""
+    parametros = {}
+    for clave in [*ALIAS_FILTROS_LOGS, *FILTROS_LOGS]:
+        if datos.get(clave):
+            parametros[ALIAS_FILTROS_LOGS.get(clave, clave)] = datos.get(clave)
+    return parametros
+
+
+def _limite_dia(valor, siguiente=False):
+    """Inicio del día (o del siguiente) de una fecha ISO, en la zona local"""
+    dia = date.fromisoformat(str(valor)[:10]) + timedelta(days=1 if siguiente else 0)
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def filtrar_logs(parametros, queryset=None):
+    """Aplica a los logs los mismos filtros que la vista admin_logs"""
+    logs = SystemLog.objects.all() if queryset is None else queryset
+    parametros = parametros_logs(parametros)
+    for clave, lookup in FILTROS_LOGS.items():
+        valor = parametros.get(clave)
+        if not valor:
+            continue
+        if clave in ('fecha_inicio', 'fecha_fin'):
+            try:
+                valor = _limite_dia(valor, siguiente=clave == 'fecha_fin')
+            except (ValueError, OverflowError):
+                continue
+        elif clave == 'usuario':
+            # Un ID no numérico se ignora, como las fechas inválidas
+            try:
+                valor = int(valor)
+            except (TypeError, ValueError):
+                continue
+        logs = logs.filter(**{lookup: valor})
+    return logs
+
+
+# ---------------------
+# LISTADO PAGINADO POR CURSOR
+# ---------------------
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def cursor_log(log):
+    """Cursor opaco ``<microsegundos>.<id>`` de la posición de un log"""
+    return f'{(log.fecha_creacion - _EPOCA) // timedelta(microseconds=1)}.{log.id}'
+
+
+def _leer_cursor(cursor):
+    microsegundos, log_id = cursor.split('.')
+    return _EPOCA + timedelta(microseconds=int(microsegundos)), int(log_id)
+
+
+class PaginaLogs:
+    """Página del listado de logs con los cursores para moverse"""
+
+    def __init__(self, logs, siguiente=None, anterior=None):
+        self.logs = logs
+        self.siguiente = siguiente
+        self.anterior = anterior
+
+    def __iter__(self):
+        return iter(self.logs)
+
+    def __len__(self):
+        return len(self.logs)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.siguiente or self.anterior)
+
+
+def pagina_logs(logs, despues=None, antes=None, ultima=False, tamano=50):
+    """
+    Página de logs del más nuevo al más viejo, paginada por (fecha_creacion, id).
+
+    Con ``despues`` devuelve los logs más viejos que el cursor y con ``antes``
+    los más nuevos; ``ultima`` da la página más vieja. Cada página es un
+    rango sobre el índice de fecha_creacion (que en InnoDB incluye el id), así
+    que cuesta lo mismo en la primera página que en la milésima.
+    """
+    try:
+        posicion = _leer_cursor(despues or antes) if (despues or antes) else None
+    except (ValueError, OverflowError):
+        posicion, despues, antes = None, None, None
+
+    hacia_atras = bool(antes) or ultima
+    if hacia_atras:
+        logs = logs.order_by('fecha_creacion', 'id')
+        if posicion and not ultima:
+            fecha, log_id = posicion
+            logs = logs.filter(Q(fecha_creacion__gt=fecha) | Q(fecha_creacion=fecha, id__gt=log_id))
+    else:
+        logs = logs.order_by('-fecha_creacion', '-id')
+        if posicion:
+            fecha, log_id = posicion
+            logs = logs.filter(Q(fecha_creacion__lt=fecha) | Q(fecha_creacion=fecha, id__lt=log_id))
+
+    filas = list(logs[:tamano + 1])
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if hacia_atras:
+        filas.reverse()
+        hay_anterior, hay_siguiente = hay_mas, not ultima
+    else:
+        hay_anterior, hay_siguiente = bool(despues), hay_mas
+    if not filas:
+        return PaginaLogs([])
+    return PaginaLogs(
+        filas,
+        siguiente=cursor_log(filas[-1]) if hay_siguiente else None,
+        anterior=cursor_log(filas[0]) if hay_anterior else None,
+    )
+
+
+# Relaciones que usa el __str__ de los objetos de los logs
+RELACIONES_OBJETO_LOG = {
+    Factura: ['usuario'],
+    Ticket: ['rifa'],
+    ParticipacionSan: ['usuario', 'san'],
+    Cupo: ['san'],
+    PagoSimulado: ['usuario'],
+}
+
+
+def precargar_objetos(logs):
+    """Carga el objeto relacionado de cada log con una consulta por tipo"""
+    prefetch_related_objects(list(logs), GenericPrefetch('content_object', [
+        modelo.objects.select_related(*relaciones) for modelo, relaciones in RELACIONES_OBJETO_LOG.items()
+    ]))
+
+
+def conteo_logs(parametros, resumen=None):
+    """
+    Total aproximado de logs con los filtros: (cantidad, es_tope).
+
+    Sin filtros sale de la tabla de métricas diarias. Con filtros se cuenta
+    hasta LIMITE_CONTEO_LOGS filas y se guarda en caché hasta que se creen
+    o borren logs.
+    """
+    if not parametros_logs(parametros):
+        return (resumen or metricas.resumen()).total('logs'), False
+    logs = filtrar_logs(parametros).order_by()
+    cantidad = metricas.en_cache(logs, lambda: logs[:LIMITE_CONTEO_LOGS].count(), 'conteo')
+    return cantidad, cantidad >= LIMITE_CONTEO_LOGS
+
+
+def lotes_logs(parametros, lote=TAMANO_LOTE):
+    """Genera lotes de filas (tuplas) de los logs filtrados, del más nuevo al más viejo"""
+    logs = filtrar_logs(parametros).order_by('-id').values_list(
+        'id', 'usuario__username', 'tipo_accion', 'nivel', 'descripcion', 'ip_address', 'fecha_creacion'
+    )
+    tipos = dict(SystemLog.TIPOS_ACCION)
+    niveles = dict(SystemLog.NIVELES)
+    ultimo_id = None
+    while True:
+        pagina = logs if ultimo_id is None else logs.filter(id__lt=ultimo_id)
+        filas = list(pagina[:lote])
+        if not filas:
+            return
+        ultimo_id = filas[-1][0]
+        yield [
+            (
+                usuario or 'Sistema',
+                tipos.get(tipo, tipo),
+                niveles.get(nivel, nivel),
+                descripcion,
+                ip or '',
+                timezone.localtime(fecha).strftime('%Y-%m-%d %H:%M:%S') if fecha else '',
+            )
+            for _, usuario, tipo, nivel, descripcion, ip, fecha in filas
+        ]
+
+
+def csv_logs(parametros, comprimir=False, lote=TAMANO_LOTE, progreso=None):
+    """Genera el CSV de logs como bloques de bytes, uno por lote"""
+    return csv_flujo(COLUMNAS_LOGS, lotes_logs(parametros, lote), comprimir, progreso)
+
+
+def nombre_archivo_logs(comprimir):
+    return f"logs_sistema_{timezone.localtime():%Y%m%d_%H%M%S}.csv{'.gz' if comprimir else ''}"
+
+
+# ---------------------
+# FORMATOS EN FLUJO
+# ---------------------
+def csv_flujo(columnas, lotes, comprimir=False, progreso=None):
+    """
+    Genera un CSV como bloques de bytes, uno por lote de filas.
+
+    Args:
+        comprimir: si True, el flujo es un archivo gzip
+        progreso: función opcional que recibe el total de filas escritas
+    """
+    escritor = csv.writer(_Eco())
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    total = 0
+
+    def bloque(texto):
+        datos = texto.encode('utf-8')
+        return compresor.compress(datos) if compresor else datos
+
+    yield bloque(escritor.writerow(columnas))
+    for filas in lotes:
+        total += len(filas)
+        datos = bloque(''.join(escritor.writerow(fila) for fila in filas))
+        if progreso:
+            progreso(total)
+        if datos:
+            yield datos
+    if compresor:
+        yield compresor.flush()
+
+
+class _SalidaZip:
+    """
+    Pseudo-archivo de solo escritura para zipfile.
+
+    No tiene ``seek``, así que zipfile escribe cada entrada con descriptor de
+    datos al final y nunca vuelve atrás; ``vaciar`` entrega lo acumulado.
+    """
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+_CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_PARTES_XLSX = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda_xlsx(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, datetime):
+        valor = timezone.localtime(valor).strftime('%Y-%m-%d %H:%M:%S') if timezone.is_aware(valor) else valor
+    elif isinstance(valor, date):
+        valor = valor.isoformat()
+    texto = escape(_CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(valores):
+    return ('<row>' + ''.join(_celda_xlsx(v) for v in valores) + '</row>').encode('utf-8')
+
+
+def xlsx_flujo(columnas, lotes, hoja='Datos', progreso=None):
+    """Genera un libro XLSX de una hoja como bloques de bytes, uno por lote de filas"""
+    salida = _SalidaZip()
+    total = 0
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _PARTES_XLSX.items():
+            libro.writestr(nombre, contenido)
+        libro.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(hoja[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        with libro.open('xl/worksheets/sheet1.xml', 'w') as hoja_xml:
+            hoja_xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja_xml.write(_fila_xlsx(columnas))
+            for filas in lotes:
+                total += len(filas)
+                hoja_xml.write(b''.join(_fila_xlsx(fila) for fila in filas))
+                if progreso:
+                    progreso(total)
+                datos = salida.vaciar()
+                if datos:
+                    yield datos
+            hoja_xml.write(b'</sheetData></worksheet>')
+    yield salida.vaciar()
+
+
+# ---------------------
+# REPORTES EN SEGUNDO PLANO
+# ---------------------
+def solicitar_exportacion_logs(usuario, parametros, comprimir=False):
+    """Devuelve la exportación vigente o en curso con estos filtros, o pide una nueva"""
+    return reportes.solicitar(
+        'logs', usuario, {'formato': 'csv', 'filtros': parametros, 'gzip': comprimir},
+        'Exportación de logs del sistema',
+    )
+
+
+def generar_reporte(reporte):
+    """Escribe el archivo de un reporte pendiente; el CSV pasa por un temporal en disco"""
+    parametros = reporte.parametros or {}
+    comprimir = bool(parametros.get('gzip'))
+    estimado, _ = conteo_logs(parametros.get('filtros', {}))
+    filas = 0
+
+    def progreso(total):
+        nonlocal filas
+        filas = total
+        if estimado:
+            reportes.avanzar(reporte, total / estimado)
+
+    with tempfile.TemporaryFile() as temporal:
+        for bloque in csv_logs(parametros.get('filtros', {}), comprimir, progreso=progreso):
+            temporal.write(bloque)
+        temporal.seek(0)
+        reporte.archivo.save(nombre_archivo_logs(comprimir), File(temporal), save=False)
+    return reportes.finalizar(reporte, 'archivo', filas=filas)
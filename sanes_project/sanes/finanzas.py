@@ -0,0 +1,243 @@
+# sanes/finanzas.py
+"""
+Reporte financiero por periodos.
+
+Las facturas del periodo se agregan en la base de datos por día, semana o
+mes, por tipo (rifa o san) y por método de pago, con lo cobrado, lo
+pendiente y lo vencido de cada grupo, en una sola consulta GROUP BY. La
+serie se guarda en caché con ``metricas.en_cache``: la reutilizan todas las
+peticiones con los mismos filtros hasta que cambie alguna factura.
+
+El detalle se pagina por ID (keyset), igual que la exportación de logs, y
+se exporta en flujo a CSV o XLSX.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When, CharField
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import exportaciones, metricas
+from .models import Factura, Rifa, San, Cupo
+from .reportes_pdf import periodo
+
+
+AGRUPACIONES = {
+    'dia': TruncDay,
+    'semana': TruncWeek,
+    'mes': TruncMonth,
+}
+
+TIPOS = {
+    'rifas': 'rifa',
+    'sanes': 'san',
+}
+
+COLUMNAS_DETALLE = [
+    'Código', 'Emisión', 'Tipo', 'Usuario', 'Método de pago', 'Estado',
+    'Total', 'Pagado', 'Vencimiento',
+]
+
+TAMANO_PAGINA = 50
+
+# Vencido/pendiente se evalúan a la hora en punto para que la serie sea reutilizable
+SEGUNDOS_SERIE = 3600
+
+
+def parametros_finanzas(datos):
+    """Normaliza los filtros del reporte desde un QueryDict/dict"""
+    try:
+        desde, hasta = periodo(datos.get('fecha_desde'), datos.get('fecha_hasta'))
+    except ValueError:
+        desde, hasta = periodo()
+    agrupacion = datos.get('agrupacion')
+    tipo = datos.get('tipo')
+    metodo = datos.get('metodo')
+    return {
+        'fecha_desde': desde.isoformat(),
+        'fecha_hasta': hasta.isoformat(),
+        'agrupacion': agrupacion if agrupacion in AGRUPACIONES else 'dia',
+        'tipo': tipo if tipo in TIPOS else 'general',
+        'metodo': metodo if metodo in dict(Factura.METODOS_PAGO) else '',
+    }
+
+
+def _tipos_contenido():
+    """{content_type_id: 'rifa' | 'san'}; las cuotas cuentan como san"""
+    tipos = ContentType.objects.get_for_models(Rifa, San, Cupo)
+    return {
+        tipos[Rifa].id: 'rifa',
+        tipos[San].id: 'san',
+        tipos[Cupo].id: 'san',
+    }
+
+
+def filtrar_facturas(parametros):
+    """Facturas emitidas en el periodo con los filtros del reporte"""
+    inicio = timezone.make_aware(datetime.combine(datetime.fromisoformat(parametros['fecha_desde']), time.min))
+    fin = timezone.make_aware(datetime.combine(datetime.fromisoformat(parametros['fecha_hasta']), time.min))
+    facturas = Factura.objects.filter(fecha_emision__gte=inicio, fecha_emision__lt=fin + timedelta(days=1))
+    if parametros['tipo'] != 'general':
+        tipo = TIPOS[parametros['tipo']]
+        facturas = facturas.filter(
+            content_type_id__in=[ct for ct, nombre in _tipos_contenido().items() if nombre == tipo]
+        )
+    if parametros['metodo']:
+        facturas = facturas.filter(metodo_pago=parametros['metodo'])
+    return facturas
+
+
+# ---------------------
+# SERIE POR PERIODOS
+# ---------------------
+def _calcular_serie(facturas, agrupacion, ahora):
+    tipo = Case(
+        *[When(content_type_id=ct, then=Value(nombre)) for ct, nombre in _tipos_contenido().items()],
+        default=Value('otro'),
+        output_field=CharField(),
+    )
+    saldo = F('monto_total') - F('monto_pagado')
+    por_vencer = Q(estado_pago='pendiente') & (Q(fecha_vencimiento=None) | Q(fecha_vencimiento__gte=ahora))
+    vencido = Q(estado_pago='vencido') | Q(estado_pago='pendiente', fecha_vencimiento__lt=ahora)
+    dinero = DecimalField(max_digits=16, decimal_places=2)
+    filas = (
+        facturas.order_by()
+        .annotate(periodo=AGRUPACIONES[agrupacion]('fecha_emision'), tipo_contenido=tipo)
+        .values('periodo', 'tipo_contenido', 'metodo_pago')
+        .annotate(
+            facturas=Count('id'),
+            facturado=Sum('monto_total'),
+            cobrado=Sum('monto_pagado', filter=Q(estado_pago='confirmado')),
+            pendiente=Sum(saldo, filter=por_vencer, output_field=dinero),
+            vencido=Sum(saldo, filter=vencido, output_field=dinero),
+        )
+        .order_by('periodo', 'tipo_contenido', 'metodo_pago')
+    )
+    return [
+        {
+            'periodo': timezone.localtime(f['periodo']).date() if isinstance(f['periodo'], datetime) else f['periodo'],
+            'tipo': f['tipo_contenido'],
+            'metodo_pago': f['metodo_pago'] or '',
+            'facturas': f['facturas'],
+            'facturado': f['facturado'] or Decimal(0),
+            'cobrado': f['cobrado'] or Decimal(0),
+            'pendiente': f['pendiente'] or Decimal(0),
+            'vencido': f['vencido'] or Decimal(0),
+        }
+        for f in filas
+    ]
+
+
+def serie(parametros):
+    """
+    Grupos (periodo, tipo, método de pago) del reporte con sus montos.
+
+    Se reutiliza desde la caché mientras no cambie ninguna factura.
+    """
+    facturas = filtrar_facturas(parametros)
+    ahora = timezone.now().replace(minute=0, second=0, microsecond=0)
+    return metricas.en_cache(
+        facturas,
+        partial(_calcular_serie, facturas, parametros['agrupacion'], ahora),
+        parametros['agrupacion'], ahora,
+        segundos=SEGUNDOS_SERIE,
+    )
+
+
+def totales(filas, campo=None):
+    """Suma los montos de la serie; con ``campo`` los agrupa por ese campo"""
+    montos = ('facturas', 'facturado', 'cobrado', 'pendiente', 'vencido')
+    grupos = defaultdict(lambda: dict.fromkeys(montos, 0))
+    for fila in filas:
+        grupo = grupos[fila[campo] if campo else None]
+        for monto in montos:
+            grupo[monto] += fila[monto]
+    if campo is None:
+        return grupos[None]
+    return dict(grupos)
+
+
+def por_periodo(filas):
+    """Une los grupos de tipo y método de cada periodo, para tablas y gráficos"""
+    periodos = defaultdict(lambda: {'rifa': Decimal(0), 'san': Decimal(0)})
+    resumen = totales(filas, 'periodo')
+    for fila in filas:
+        if fila['tipo'] in ('rifa', 'san'):
+            periodos[fila['periodo']][fila['tipo']] += fila['cobrado']
+    return [
+        {'periodo': clave, **resumen[clave], 'cobrado_rifas': periodos[clave]['rifa'],
+         'cobrado_sanes': periodos[clave]['san']}
+        for clave in sorted(resumen)
+    ]
+
+
+# ---------------------
+# DETALLE PAGINADO Y EXPORTACIÓN
+# ---------------------
+def _detalle(facturas):
+    return facturas.order_by('-id').values_list(
+        'id', 'codigo', 'fecha_emision', 'content_type_id', 'usuario__username', 'metodo_pago',
+        'estado_pago', 'monto_total', 'monto_pagado', 'fecha_vencimiento',
+    )
+
+
+def _filas_detalle(filas):
+    tipos = _tipos_contenido()
+    metodos = dict(Factura.METODOS_PAGO)
+    estados = dict(Factura.ESTADOS_PAGO)
+    return [
+        (codigo or '', emision, tipos.get(tipo, 'otro'), usuario, metodos.get(metodo, metodo or ''),
+         estados.get(estado, estado), total, pagado, vencimiento)
+        for _, codigo, emision, tipo, usuario, metodo, estado, total, pagado, vencimiento in filas
+    ]
+
+
+def pagina_detalle(parametros, antes_de=None, tamano=TAMANO_PAGINA):
+    """
+    Una página del detalle, de la factura más nueva a la más vieja.
+
+    Returns:
+        (filas, id para pedir la página siguiente o None)
+    """
+    facturas = _detalle(filtrar_facturas(parametros))
+    if antes_de:
+        facturas = facturas.filter(id__lt=antes_de)
+    filas = list(facturas[:tamano + 1])
+    siguiente = filas[tamano - 1][0] if len(filas) > tamano else None
+    return _filas_detalle(filas[:tamano]), siguiente
+
+
+def lotes_detalle(parametros, lote=exportaciones.TAMANO_LOTE):
+    """Genera lotes de filas del detalle para la exportación"""
+    facturas = _detalle(filtrar_facturas(parametros))
+    ultimo_id = None
+    while True:
+        pagina = facturas if ultimo_id is None else facturas.filter(id__lt=ultimo_id)
+        filas = list(pagina[:lote])
+        if not filas:
+            return
+        ultimo_id = filas[-1][0]
+        yield _filas_detalle(filas)
+
+
+def _texto_fechas(lotes):
+    for filas in lotes:
+        yield [
+            tuple(timezone.localtime(v).strftime('%Y-%m-%d %H:%M:%S') if isinstance(v, datetime) else v for v in fila)
+            for fila in filas
+        ]
+
+
+def exportar(parametros, formato):
+    """Flujo de bytes del detalle en ``csv`` o ``xlsx``"""
+    if formato == 'xlsx':
+        return exportaciones.xlsx_flujo(COLUMNAS_DETALLE, lotes_detalle(parametros), hoja='Facturas')
+    return exportaciones.csv_flujo(COLUMNAS_DETALLE, _texto_fechas(lotes_detalle(parametros)))
+
+
+def nombre_archivo(parametros, formato):
+    return f"finanzas_{parametros['fecha_desde']}_{parametros['fecha_hasta']}.{formato}"
@@ -4,6 +4,8 @@ from django.contrib.auth import authenticate
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
+
+from . import limites
 from .models import (
     CustomUser, Rifa, San, ParticipacionSan, Cupo, 
     Factura, PagoSimulado, Comment, SystemLog, NotificacionMejorada,
@@ -14,7 +16,13 @@ from .models import (
 # FORMULARIOS DE AUTENTICACIÓN
 # ---------------------
 class CustomLoginForm(forms.Form):
-    """Formulario personalizado de login"""
+    """
+    Formulario personalizado de login.
+
+    Limita los intentos fallidos por cuenta e IP y, si recibe ``request``,
+    todos los intentos por IP antes de verificar la contraseña. Un inicio de
+    sesión correcto no cuenta para la cuenta.
+    """
     email = forms.EmailField(
         widget=forms.EmailInput(attrs={
             'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-primary focus:border-transparent',
@@ -34,14 +42,28 @@ class CustomLoginForm(forms.Form):
         })
     )
 
+    def __init__(self, *args, request=None, **kwargs):
+        self.request = request
+        super().__init__(*args, **kwargs)
+
     def clean(self):
         cleaned_data = super().clean()
         email = cleaned_data.get('email')
         password = cleaned_data.get('password')
         
         if email and password:
-            user = authenticate(username=email, password=password)
+            ip = limites.ip(self.request) if self.request is not None else ''
+            cuenta = f'{email.lower()}|{ip}'
+            espera = limites.LOGIN_CUENTA.espera(cuenta)
+            if not espera and self.request is not None:
+                espera = limites.LOGIN_IP.tomar(ip)
+            if espera:
+                raise ValidationError(
+                    f'Demasiados intentos de inicio de sesión. Intenta de nuevo en {max(1, round(espera))} segundos.'
+                )
+            user = authenticate(self.request, username=email, password=password)
             if user is None:
+                limites.LOGIN_CUENTA.tomar(cuenta)
                 raise ValidationError('Credenciales inválidas. Por favor, verifica tu correo y contraseña.')
             cleaned_data['user'] = user
         return cleaned_data
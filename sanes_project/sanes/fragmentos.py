@@ -0,0 +1,44 @@
+# sanes/fragmentos.py
+"""
+Caché de las tarjetas de rifas y sanes de los listados y la portada.
+
+Cada tarjeta (imagen, precio, barra de progreso, organizador) se guarda ya
+renderizada con una clave que lleva el ID del objeto, su ``version`` (sube con
+cada ticket vendido o inscripción, ver ``condicional.tocar``) y su
+``updated_at`` (cualquier save()). Un cambio genera una clave nueva y la
+tarjeta vieja simplemente caduca; no hace falta borrar nada.
+
+``tarjetas`` pide todas las claves de una página con un solo ``get_many``,
+renderiza solo las que faltan y las guarda con un solo ``set_many``. Las
+plantillas de tarjeta no pueden depender del usuario ni de la petición.
+"""
+from django.core.cache import cache
+from django.template.loader import get_template
+
+
+# Segundos que se guarda una tarjeta (acota cuánto tarda en verse un cambio del organizador)
+CACHE_TARJETA = 10 * 60
+
+
+def clave(plantilla, objeto):
+    marca = objeto.updated_at.timestamp() if objeto.updated_at else ''
+    return f'tarjeta:{plantilla}:{objeto._meta.model_name}:{objeto.pk}:{objeto.version}:{marca}'
+
+
+def renderizar(plantilla, objetos):
+    """HTML de cada tarjeta, sin caché; la variable de la plantilla es el nombre del modelo"""
+    template = get_template(plantilla)
+    return [template.render({objeto._meta.model_name: objeto}) for objeto in objetos]
+
+
+def tarjetas(plantilla, objetos):
+    """HTML de las tarjetas de ``objetos`` en orden, con una lectura y una escritura de caché"""
+    objetos = list(objetos)
+    claves = [clave(plantilla, objeto) for objeto in objetos]
+    guardadas = cache.get_many(claves)
+    faltantes = [(c, objeto) for c, objeto in zip(claves, objetos) if c not in guardadas]
+    if faltantes:
+        nuevas = dict(zip([c for c, _ in faltantes], renderizar(plantilla, [objeto for _, objeto in faltantes])))
+        cache.set_many(nuevas, CACHE_TARJETA)
+        guardadas.update(nuevas)
+    return [guardadas[c] for c in claves]
@@ -0,0 +1,245 @@
+# sanes/limites.py
+"""
+Límites de peticiones por usuario o por IP con cubetas de tokens.
+
+Cada límite tiene una capacidad (ráfaga máxima) y una tasa de recarga, p. ej.
+'10/m': hasta 10 peticiones seguidas y una más cada 6 segundos. El estado de
+cada cubeta vive en la caché compartida (``default``) para que todos los
+workers cuenten juntos.
+
+Para no ir a la caché en cada petición, cada proceso reserva de la cubeta
+compartida un lote de tokens (``lote``) y los gasta en memoria durante
+``VIGENCIA_RESERVA`` segundos; un cliente rechazado se recuerda en memoria
+hasta que pueda volver a intentarlo. Así el camino habitual solo toca un dict
+y un lock. Con límites bajos (login, comentarios) el lote es de un token y
+cada petición consulta la caché, que es lo exacto.
+
+Las tasas se pueden cambiar o desactivar (``None``) sin tocar el código con
+``settings.LIMITES_PETICIONES = {'nombre': '20/m'}``.
+
+Uso::
+
+    @login_required
+    @limites.limitar('comentarios', '5/m')
+    def agregar_comentario(request, ...): ...
+
+    @api_view(['GET'])
+    @throttle_classes([limites.throttle('busqueda', '120/m', por='ip')])
+    def api_buscar(request): ...
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+
+# Segundos que un proceso puede gastar los tokens que reservó
+VIGENCIA_RESERVA = 1.0
+
+# Claves que se recuerdan en memoria por límite; al superarlas se descartan todas
+MAX_CLAVES = 10000
+
+# Espera máxima por el cerrojo de una cubeta antes de dejar pasar la petición
+ESPERA_CERROJO = 0.1
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def leer_tasa(tasa):
+    """'10/m' -> (10, 60)"""
+    cantidad, _, periodo = tasa.partition('/')
+    return int(cantidad), PERIODOS[periodo[0]]
+
+
+def ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# ---------------------
+# CUBETA DE TOKENS
+# ---------------------
+class Limite:
+    """Cubeta de tokens compartida entre procesos, con reservas en memoria"""
+
+    def __init__(self, nombre, tasa, por='usuario', metodos=None):
+        self.nombre = nombre
+        self.tasa_por_defecto = tasa
+        self.por = por
+        self.metodos = metodos
+        self._reservas = {}
+        self._bloqueos = {}
+        self._lock = threading.Lock()
+        self._config = None
+
+    def config(self):
+        """(capacidad, tokens por segundo, lote) vigentes, o None si está desactivado"""
+        tasa = getattr(settings, 'LIMITES_PETICIONES', {}).get(self.nombre, self.tasa_por_defecto)
+        if self._config is None or self._config[0] != tasa:
+            if tasa is None:
+                self._config = (tasa, None)
+            else:
+                capacidad, periodo = leer_tasa(tasa)
+                por_segundo = capacidad / periodo
+                lote = max(1, min(capacidad // 10, int(por_segundo * VIGENCIA_RESERVA)))
+                self._config = (tasa, (capacidad, por_segundo, lote))
+        return self._config[1]
+
+    def clave(self, request):
+        """Usuario autenticado o IP del cliente"""
+        usuario = getattr(request, 'user', None)
+        if self.por == 'usuario' and usuario is not None and usuario.is_authenticated:
+            return f'u{usuario.pk}'
+        return f'ip{ip(request)}'
+
+    def tomar(self, clave):
+        """Consume un token de ``clave``; devuelve 0 si hay, o los segundos a esperar"""
+        config = self.config()
+        if config is None:
+            return 0.0
+        ahora = time.monotonic()
+        with self._lock:
+            reserva = self._reservas.get(clave)
+            if reserva is not None and reserva[0] >= 1 and reserva[1] > ahora:
+                reserva[0] -= 1
+                return 0.0
+            bloqueado_hasta = self._bloqueos.get(clave)
+            if bloqueado_hasta is not None and bloqueado_hasta > ahora:
+                return bloqueado_hasta - ahora
+
+        obtenidos, espera = self._reservar(clave, *config)
+        with self._lock:
+            if obtenidos:
+                if len(self._reservas) >= MAX_CLAVES:
+                    self._reservas.clear()
+                self._reservas[clave] = [obtenidos - 1, ahora + VIGENCIA_RESERVA]
+                self._bloqueos.pop(clave, None)
+                return 0.0
+            if len(self._bloqueos) >= MAX_CLAVES:
+                self._bloqueos.clear()
+            self._bloqueos[clave] = ahora + espera
+            return espera
+
+    def espera(self, clave):
+        """Segundos a esperar para ``clave`` sin consumir un token (0 si hay)"""
+        config = self.config()
+        if config is None:
+            return 0.0
+        ahora = time.monotonic()
+        with self._lock:
+            reserva = self._reservas.get(clave)
+            if reserva is not None and reserva[0] >= 1 and reserva[1] > ahora:
+                return 0.0
+            bloqueado_hasta = self._bloqueos.get(clave)
+            if bloqueado_hasta is not None and bloqueado_hasta > ahora:
+                return bloqueado_hasta - ahora
+
+        capacidad, por_segundo, _ = config
+        ahora = time.time()
+        tokens, marca = cache.get(f'limite:{self.nombre}:{clave}') or (capacidad, ahora)
+        tokens = min(capacidad, tokens + (ahora - marca) * por_segundo)
+        return 0.0 if tokens >= 1 else (1 - tokens) / por_segundo
+
+    def _reservar(self, clave, capacidad, por_segundo, lote):
+        """Saca hasta ``lote`` tokens de la cubeta compartida: (obtenidos, espera)"""
+        clave_cache = f'limite:{self.nombre}:{clave}'
+        cerrojo = f'{clave_cache}:cerrojo'
+        limite_espera = time.monotonic() + ESPERA_CERROJO
+        while not cache.add(cerrojo, 1, timeout=1):
+            if time.monotonic() > limite_espera:
+                # La caché no responde a tiempo: mejor dejar pasar que bloquear el sitio
+                return 1, 0.0
+            time.sleep(0.001)
+        try:
+            ahora = time.time()
+            tokens, marca = cache.get(clave_cache) or (capacidad, ahora)
+            tokens = min(capacidad, tokens + (ahora - marca) * por_segundo)
+            obtenidos = min(lote, int(tokens))
+            tokens -= obtenidos
+            # Pasado el tiempo de recarga completa la cubeta vuelve a estar llena: no hace falta guardarla
+            cache.set(clave_cache, (tokens, ahora), timeout=math.ceil((capacidad - tokens) / por_segundo) + 1)
+        finally:
+            cache.delete(cerrojo)
+        return obtenidos, 0.0 if obtenidos else (1 - tokens) / por_segundo
+
+    def reiniciar(self):
+        """Olvida las reservas y bloqueos en memoria de este proceso"""
+        with self._lock:
+            self._reservas.clear()
+            self._bloqueos.clear()
+
+
+# Un límite por nombre y proceso, compartido por las vistas que lo usan
+LIMITES = {}
+_limites_lock = threading.Lock()
+
+
+def obtener(nombre, tasa, por='usuario', metodos=None):
+    with _limites_lock:
+        if nombre not in LIMITES:
+            LIMITES[nombre] = Limite(nombre, tasa, por, metodos)
+        return LIMITES[nombre]
+
+
+# Login (CustomLoginForm): intentos fallidos por cuenta e IP, así nadie puede
+# bloquear una cuenta ajena desde su IP, e intentos totales por IP
+LOGIN_CUENTA = obtener('login_cuenta', '20/h')
+LOGIN_IP = obtener('login_ip', '30/m', por='ip')
+
+
+# ---------------------
+# VISTAS
+# ---------------------
+def respuesta_limite(request, espera):
+    """429 con Retry-After; JSON para peticiones AJAX"""
+    segundos = max(1, math.ceil(espera))
+    mensaje = f'Demasiadas peticiones. Intenta de nuevo en {segundos} segundos.'
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'application/json' in request.headers.get('accept', ''):
+        respuesta = JsonResponse({'success': False, 'error': mensaje}, status=429)
+    else:
+        respuesta = HttpResponse(mensaje, status=429, content_type='text/plain; charset=utf-8')
+    respuesta['Retry-After'] = str(segundos)
+    return respuesta
+
+
+def limitar(nombre, tasa, por='usuario', metodos=('POST',)):
+    """
+    Decorador de vistas de Django: responde 429 cuando el usuario (o la IP
+    si no hay sesión o ``por='ip'``) agota el límite ``nombre``. Solo cuenta
+    las peticiones con los ``metodos`` indicados (None: todos).
+    """
+    limite = obtener(nombre, tasa, por, metodos)
+
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if metodos is None or request.method in metodos:
+                espera = limite.tomar(limite.clave(request))
+                if espera:
+                    return respuesta_limite(request, espera)
+            return vista(request, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+class LimiteThrottle(BaseThrottle):
+    """Throttle de DRF sobre un ``Limite``; DRF añade Retry-After con ``wait()``"""
+    limite = None
+
+    def allow_request(self, request, view):
+        if self.limite.metodos is not None and request.method not in self.limite.metodos:
+            return True
+        self.espera = self.limite.tomar(self.limite.clave(request))
+        return not self.espera
+
+    def wait(self):
+        return max(1, math.ceil(self.espera))
+
+
+def throttle(nombre, tasa, por='usuario', metodos=None):
+    """Clase de throttle para ``throttle_classes`` de un endpoint de DRF"""
+    return type(f'LimiteThrottle_{nombre}', (LimiteThrottle,), {'limite': obtener(nombre, tasa, por, metodos)})
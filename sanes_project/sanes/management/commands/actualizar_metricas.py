@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from sanes import analitica, busqueda, metricas, sincronizacion
+from sanes.models import UsuarioConLogs
+
+
+class Command(BaseCommand):
+    help = 'Concilia las métricas diarias y los usuarios con logs con las tablas reales (ejecutar cada noche)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconstruir', action='store_true',
+                            help='Rehacer todo el historial desde las tablas (instalación inicial)')
+        parser.add_argument('--metricas', nargs='+', help='Reconstruir solo estas métricas')
+
+    def handle(self, *args, **options):
+        if options['reconstruir']:
+            modelos = [m for m in metricas.MODELOS if not options['metricas'] or m.METRICA in options['metricas']]
+            metricas.reconstruir(modelos)
+            self.stdout.write(f"Reconstruidas: {', '.join(m.METRICA for m in modelos)}")
+            if not options['metricas']:
+                self.stdout.write(f'Ventas por hora: {analitica.reconstruir()} filas')
+                terminos = busqueda.reconstruir()
+                self.stdout.write(f"Índice de búsqueda: {', '.join(f'{t} {n}' for t, n in terminos.items())} términos")
+
+        correcciones = metricas.conciliar()
+        for metrica, segmento, cantidad, monto in correcciones:
+            self.stdout.write(f'{metrica}/{segmento or "-"}: {cantidad:+d} ({monto:+})')
+        self.stdout.write(self.style.SUCCESS(f'Métricas conciliadas: {len(correcciones)} correcciones'))
+
+        anadidos, quitados = UsuarioConLogs.sincronizar()
+        self.stdout.write(f'Usuarios con logs: {anadidos} añadidos, {quitados} quitados')
+
+        podados = sincronizacion.podar()
+        self.stdout.write(f'Registro de cambios: {podados} registros de más de {sincronizacion.DIAS_CONSERVADOS} días borrados')
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sanes import cierres
+from sanes.models import CierreDiario
+
+
+class Command(BaseCommand):
+    help = 'Exporta el cierre diario de facturas, pagos, cupos y tickets desde una foto consistente (ejecutar cada noche)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', type=date.fromisoformat, help='Fecha del cierre (AAAA-MM-DD), hoy por defecto')
+        parser.add_argument('--completo', action='store_true',
+                            help='Exportar todas las filas, no solo las cambiadas desde el cierre anterior')
+        parser.add_argument('--verificar', action='store_true',
+                            help='Comprobar filas y checksums de un cierre ya hecho en vez de cerrar')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            cierre = CierreDiario.objects.filter(estado='listo', **(
+                {'fecha': options['fecha']} if options['fecha'] else {}
+            )).order_by('-fecha').first()
+            if cierre is None:
+                raise CommandError('No hay un cierre listo para verificar.')
+            errores = cierres.verificar(cierre)
+            if errores:
+                raise CommandError(f"Cierre {cierre.fecha}: no coinciden {', '.join(errores)}")
+            self.stdout.write(self.style.SUCCESS(f'Cierre {cierre.fecha} verificado'))
+            return
+
+        cierre = cierres.cerrar(options['fecha'], completo=options['completo'])
+        for archivo in cierre.archivos.all():
+            self.stdout.write(f'{archivo.tabla}: {archivo.filas} filas, {archivo.bytes} bytes, sha256 {archivo.sha256}')
+        tipo = f'incremental desde {cierre.desde:%Y-%m-%d %H:%M}' if cierre.incremental else 'completo'
+        self.stdout.write(self.style.SUCCESS(f'Cierre {cierre.fecha} ({tipo}) listo'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sanes import contabilidad
+from sanes.models import Factura, TurnoSan
+
+
+class Command(BaseCommand):
+    help = 'Contabiliza las facturas y turnos existentes antes de activar el libro mayor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Facturas por transacción')
+
+    def handle(self, *args, **options):
+        # Las claves de los asientos hacen que volver a ejecutarlo no duplique nada
+        ultimo_id = 0
+        total = 0
+        while True:
+            facturas = list(
+                Factura.objects.filter(id__gt=ultimo_id)
+                .select_related('content_type')
+                .order_by('id')[:options['lote']]
+            )
+            if not facturas:
+                break
+            with transaction.atomic():
+                for factura in facturas:
+                    contabilidad.registrar_factura_emitida(factura)
+                    contabilidad.registrar_cambio_estado(factura, 'pendiente')
+            ultimo_id = facturas[-1].id
+            total += len(facturas)
+            self.stdout.write(f'{total} facturas contabilizadas')
+
+        turnos = TurnoSan.objects.filter(estado='cumplido').select_related('participante')
+        for turno in turnos.iterator():
+            contabilidad.registrar_pago_turno(turno)
+
+        self.stdout.write(self.style.SUCCESS(f'Facturas: {total}, turnos pagados: {turnos.count()}'))
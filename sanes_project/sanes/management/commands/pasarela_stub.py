@@ -0,0 +1,28 @@
+from aiohttp import web
+from django.core.management.base import BaseCommand
+
+from sanes.pasarela_stub import crear_app
+
+
+class Command(BaseCommand):
+    help = 'Levanta una pasarela de pago local que simula latencia y fallos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--latencia', type=float, default=150, help='Latencia media en ms')
+        parser.add_argument('--variacion', type=float, default=50, help='Desviación de la latencia en ms')
+        parser.add_argument('--rechazo', type=float, default=0.1, help='Proporción de cobros rechazados')
+        parser.add_argument('--errores', type=float, default=0.0, help='Proporción de respuestas 503')
+
+    def handle(self, *args, **options):
+        app = crear_app(
+            latencia_ms=options['latencia'],
+            variacion_ms=options['variacion'],
+            tasa_rechazo=options['rechazo'],
+            tasa_error=options['errores'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Pasarela simulada en http://{options['host']}:{options['puerto']}/<pasarela>/cobros"
+        ))
+        web.run_app(app, host=options['host'], port=options['puerto'], print=None)
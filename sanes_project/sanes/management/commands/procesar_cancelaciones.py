@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sanes import cancelaciones
+from sanes.models import CancelacionMasiva
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta (o reanuda) las cancelaciones masivas de rifas y sanes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Filas procesadas por transacción')
+        parser.add_argument('--continuo', action='store_true', help='Seguir esperando nuevas cancelaciones')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera sin trabajo')
+        parser.add_argument('--reintentar', action='store_true', help='Reintentar también las cancelaciones fallidas')
+
+    def handle(self, *args, **options):
+        estados = ['pendiente', 'en_proceso'] + (['fallida'] if options['reintentar'] else [])
+        while True:
+            trabajos = list(CancelacionMasiva.objects.filter(estado__in=estados).order_by('id'))
+            for cancelacion in trabajos:
+                inicio = time.monotonic()
+                try:
+                    cancelacion = cancelaciones.procesar_cancelacion(cancelacion, lote=options['lote'])
+                except Exception as exc:
+                    self.stderr.write(self.style.ERROR(f'{cancelacion}: {exc}'))
+                    continue
+                self.stdout.write(
+                    f'{cancelacion} en {time.monotonic() - inicio:.2f}s - '
+                    f'{cancelacion.facturas_procesadas} facturas, {cancelacion.reembolsos_creados} reembolsos '
+                    f'({cancelacion.monto_reembolsado}), {cancelacion.usuarios_notificados} usuarios notificados'
+                )
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS('Cancelaciones procesadas'))
@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from sanes import metricas
+from sanes.models import PagoSimulado
+from sanes.pasarelas import metodos_electronicos, procesar_pagos
+
+# Segundos tras los que un pago 'procesando' se da por abandonado (su worker o
+# su petición de checkout murió) y se vuelve a cobrar; el código de transacción
+# viaja como clave de idempotencia, así que la pasarela no cobra dos veces
+VENCIMIENTO_PROCESANDO = 5 * 60
+
+
+class Command(BaseCommand):
+    help = 'Procesa concurrentemente los pagos electrónicos pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Pagos reclamados por iteración')
+        parser.add_argument('--concurrencia', type=int, default=100, help='Cobros en vuelo a la vez')
+        parser.add_argument('--continuo', action='store_true', help='Seguir esperando nuevos pagos')
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos de espera sin trabajo')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            pagos = self.reclamar_pagos(options['lote'])
+            if pagos:
+                inicio = time.monotonic()
+                resultados = procesar_pagos(pagos, concurrencia=options['concurrencia'])
+                duracion = time.monotonic() - inicio
+                total += len(pagos)
+
+                resumen = {}
+                for resultado in resultados:
+                    resumen[resultado['estado']] = resumen.get(resultado['estado'], 0) + 1
+                self.stdout.write(
+                    f"{len(pagos)} pagos en {duracion:.2f}s "
+                    f"({len(pagos) / duracion:.0f} pagos/s) - {resumen}"
+                )
+                continue
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f'Pagos procesados: {total}'))
+
+    def reclamar_pagos(self, lote):
+        """
+        Marca como 'procesando' un lote de pagos pendientes, o abandonados en
+        'procesando', sin bloquear a otros workers
+        """
+        vencidos = timezone.now() - timedelta(seconds=VENCIMIENTO_PROCESANDO)
+        with transaction.atomic():
+            ids = list(
+                PagoSimulado.objects.select_for_update(skip_locked=True)
+                .filter(Q(estado='pendiente') | Q(estado='procesando', fecha_actualizacion__lt=vencidos))
+                .filter(metodo_pago__in=metodos_electronicos())
+                .order_by('id')
+                .values_list('id', flat=True)[:lote]
+            )
+            PagoSimulado.objects.filter(id__in=ids).update(**metricas.con_auto_now(PagoSimulado, estado='procesando'))
+        return list(PagoSimulado.objects.filter(id__in=ids).select_related('factura', 'usuario').order_by('id'))
@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from sanes import reportes
+
+
+def iniciar_proceso():
+    """Cada proceso del pool abre sus propias conexiones a la base de datos"""
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Genera los reportes (PDF, CSV y datos de pantalla) solicitados desde el panel de administración'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Seguir esperando nuevos reportes')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera sin trabajo')
+        parser.add_argument('--procesos', type=int, default=1,
+                            help='Reportes que se generan a la vez, cada uno en su proceso')
+
+    def informar(self, resultado):
+        reporte_id, tipo, filas, segundos, error = resultado
+        if error:
+            self.stderr.write(self.style.ERROR(f'Reporte {reporte_id}: {error}'))
+            return False
+        self.stdout.write(f'Reporte {reporte_id} ({tipo}): {filas} filas en {segundos:.2f}s')
+        return True
+
+    def handle(self, *args, **options):
+        if options['procesos'] > 1:
+            generados = self.con_pool(options)
+        else:
+            generados = self.en_serie(options)
+        self.stdout.write(self.style.SUCCESS(f'Reportes generados: {generados}'))
+
+    def en_serie(self, options):
+        generados = 0
+        while True:
+            reporte = reportes.reclamar()
+            if reporte is None:
+                if not options['continuo']:
+                    return generados
+                time.sleep(options['intervalo'])
+                continue
+            generados += self.informar(reportes.procesar(reporte.id))
+
+    def crear_pool(self, options):
+        connections.close_all()
+        return ProcessPoolExecutor(max_workers=options['procesos'], initializer=iniciar_proceso)
+
+    def reiniciar_pool(self, pool, en_curso, options, error):
+        """
+        Un proceso del pool murió (memoria, señal): el pool queda roto y todos
+        sus trabajos fallan. Se marcan con error y se crea un pool nuevo.
+        """
+        self.stderr.write(self.style.ERROR(f'Pool de procesos roto: {error}'))
+        for reporte_id in en_curso.values():
+            reportes.fallar(reporte_id, f'El proceso que lo generaba terminó de forma inesperada: {error}')
+        en_curso.clear()
+        pool.shutdown(wait=False, cancel_futures=True)
+        return self.crear_pool(options)
+
+    def con_pool(self, options):
+        """Reclama reportes mientras haya procesos libres y los genera en el pool"""
+        generados = 0
+        pool = self.crear_pool(options)
+        # Futuro -> ID del reporte
+        en_curso = {}
+        try:
+            while True:
+                while len(en_curso) < options['procesos']:
+                    reporte = reportes.reclamar()
+                    if reporte is None:
+                        break
+                    try:
+                        en_curso[pool.submit(reportes.procesar, reporte.id)] = reporte.id
+                    except BrokenProcessPool as exc:
+                        en_curso[None] = reporte.id
+                        pool = self.reiniciar_pool(pool, en_curso, options, exc)
+                if not en_curso:
+                    if not options['continuo']:
+                        return generados
+                    time.sleep(options['intervalo'])
+                    continue
+                terminados, _ = wait(en_curso, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    reporte_id = en_curso.pop(futuro)
+                    try:
+                        generados += self.informar(futuro.result())
+                    except BrokenProcessPool as exc:
+                        en_curso[futuro] = reporte_id
+                        pool = self.reiniciar_pool(pool, en_curso, options, exc)
+                        break
+                # Los procesos del pool siguen vivos: renovar el latido de sus reportes
+                reportes.latir(en_curso.values())
+        finally:
+            pool.shutdown(cancel_futures=True)
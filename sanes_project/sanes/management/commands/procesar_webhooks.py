@@ -0,0 +1,52 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from sanes import webhooks
+
+
+class Command(BaseCommand):
+    help = 'Aplica por lotes los webhooks de pasarelas guardados en la bandeja'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Eventos aplicados por transacción')
+        parser.add_argument('--continuo', action='store_true', help='Seguir esperando nuevos eventos')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos de espera sin trabajo')
+        parser.add_argument('--reprocesar', action='store_true',
+                            help='Volver a aplicar los eventos de la bandeja antes de empezar')
+        parser.add_argument('--desde', help='Reprocesar eventos recibidos desde esta fecha (ISO 8601)')
+        parser.add_argument('--hasta', help='Reprocesar eventos recibidos antes de esta fecha (ISO 8601)')
+        parser.add_argument('--pasarela', help='Reprocesar solo eventos de esta pasarela')
+        parser.add_argument('--estados', nargs='+', help='Reprocesar solo eventos en estos estados')
+
+    def handle(self, *args, **options):
+        if options['reprocesar']:
+            reiniciados = webhooks.reprocesar(
+                desde=parse_datetime(options['desde']) if options['desde'] else None,
+                hasta=parse_datetime(options['hasta']) if options['hasta'] else None,
+                pasarela=options['pasarela'],
+                estados=options['estados'],
+            )
+            self.stdout.write(f'Eventos marcados para reprocesar: {reiniciados}')
+
+        total = Counter()
+        while True:
+            inicio = time.monotonic()
+            resumen = webhooks.aplicar_lote(options['lote'])
+            if resumen:
+                cantidad = sum(resumen.values())
+                duracion = time.monotonic() - inicio
+                total.update(resumen)
+                self.stdout.write(
+                    f"{cantidad} eventos en {duracion:.2f}s "
+                    f"({cantidad / duracion:.0f} eventos/s) - {dict(resumen)}"
+                )
+                continue
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f'Eventos procesados: {sum(total.values())} - {dict(total)}'))
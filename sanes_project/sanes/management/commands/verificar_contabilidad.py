@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sanes import contabilidad
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los saldos contables desde los apuntes y reporta diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=4, help='Rangos verificados en paralelo')
+        parser.add_argument('--lote', type=int, default=1000, help='Cuentas/asientos por rango')
+        parser.add_argument('--corregir', action='store_true', help='Sobrescribir los saldos con diferencias')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        diferencias, descuadrados = contabilidad.verificar(
+            procesos=options['procesos'],
+            lote=options['lote'],
+            corregir=options['corregir'],
+        )
+        duracion = time.monotonic() - inicio
+
+        for diferencia in diferencias:
+            self.stdout.write(self.style.WARNING(
+                f"{diferencia['cuenta']}: actual {diferencia['actual']} - esperado {diferencia['esperado']}"
+            ))
+        for asiento in descuadrados:
+            self.stdout.write(self.style.ERROR(
+                f"Asiento {asiento['asiento_id']} descuadrado por {asiento['total']}"
+            ))
+
+        if diferencias or descuadrados:
+            accion = 'corregidas' if options['corregir'] else 'encontradas'
+            self.stdout.write(self.style.WARNING(
+                f'{len(diferencias)} cuentas con diferencias {accion}, '
+                f'{len(descuadrados)} asientos descuadrados ({duracion:.2f}s)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Contabilidad cuadrada ({duracion:.2f}s)'))
@@ -0,0 +1,429 @@
+# sanes/metricas.py
+"""
+Tabla de métricas diarias para los dashboards.
+
+Cada evento (alta, cambio de estado, baja) suma su variación a la fila
+(fecha, métrica, segmento) del día, y los dashboards obtienen todos sus
+totales con ``resumen()``: una sola consulta agrupada sobre una tabla que
+crece con los días, no con el número de rifas, facturas o logs.
+
+Los modelos con ``MetricasMixin`` registran solos sus eventos de save() y
+delete(). Las actualizaciones por conjuntos (webhooks, cancelaciones,
+acciones del admin) llaman a ``registrar`` o ``mover`` con sus conteos, y lo
+que se escape (p. ej. un borrado en cascada) lo corrige ``conciliar``, que
+ejecuta cada noche el comando actualizar_metricas.
+
+Para estadísticas de un subconjunto (las cuotas de un usuario, los turnos de
+un san) ``por_segmento`` cuenta todos los segmentos en un solo GROUP BY y
+guarda el resultado un rato en caché; la clave lleva la versión de cada
+tabla consultada y ``invalidar`` la incrementa en cada evento.
+
+``USUARIOS_PUBLICOS`` es una versión sin tabla para las cachés que solo
+muestran lo público de los usuarios (organizadores, total de usuarios): sube
+con las altas, las bajas y los cambios de esos campos, no con el last_login
+de cada inicio de sesión.
+"""
+import hashlib
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    MetricaDiaria, CustomUser, Rifa, San, Ticket, ParticipacionSan, Factura, SystemLog
+)
+
+
+MODELOS = [CustomUser, Rifa, San, Ticket, ParticipacionSan, Factura, SystemLog]
+METRICAS = {modelo.METRICA: modelo for modelo in MODELOS}
+
+# Segundos que se reutilizan las estadísticas de por_segmento si nada las invalida
+CACHE_ESTADISTICAS = 60
+
+# Versión de lo que se ve de un usuario fuera de su perfil (CustomUserSerializer)
+USUARIOS_PUBLICOS = 'sanes_customuser:publico'
+CAMPOS_PUBLICOS_USUARIO = frozenset({'username', 'email', 'first_name', 'last_name', 'rol', 'foto_perfil'})
+
+
+def segmento_de(valor):
+    if isinstance(valor, bool):
+        return 'activo' if valor else 'inactivo'
+    return '' if valor is None else str(valor)
+
+
+def valores(instancia):
+    """(segmento, monto) actuales de una instancia, sin cargar campos diferidos"""
+    campo = instancia.CAMPO_SEGMENTO_METRICA
+    monto = instancia.__dict__.get(instancia.CAMPO_MONTO_METRICA) if instancia.CAMPO_MONTO_METRICA else 0
+    return (
+        segmento_de(instancia.__dict__.get(campo)) if campo else '',
+        Decimal(monto or 0),
+    )
+
+
+# ---------------------
+# ESCRITURA
+# ---------------------
+def _aplicar(fecha, deltas):
+    """Suma las variaciones a las filas del día, creándolas si no existen"""
+    por_clave = defaultdict(lambda: [0, Decimal(0)])
+    for metrica, segmento, cantidad, monto in deltas:
+        por_clave[(metrica, segmento)][0] += cantidad
+        por_clave[(metrica, segmento)][1] += Decimal(monto or 0)
+
+    for (metrica, segmento), (cantidad, monto) in por_clave.items():
+        if cantidad or monto:
+            sumar(MetricaDiaria, {'fecha': fecha, 'metrica': metrica, 'segmento': segmento},
+                  {'cantidad': cantidad, 'monto': monto})
+
+
+def sumar(modelo, filtro, incrementos, **valores):
+    """
+    Suma ``incrementos`` a la fila única de ``modelo`` que cumple ``filtro``.
+
+    Intenta primero la UPDATE con F() (el caso habitual) y, si la fila no
+    existe, la crea con ``valores`` extra; si otro proceso la creó entre
+    medias, repite la UPDATE.
+    """
+    cambios = {campo: F(campo) + valor for campo, valor in incrementos.items()}
+    if modelo.objects.filter(**filtro).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**filtro, **incrementos, **valores)
+    except IntegrityError:
+        modelo.objects.filter(**filtro).update(**cambios)
+
+
+def registrar(deltas, fecha=None):
+    """
+    Registra variaciones ``(métrica, segmento, cantidad, monto)`` del día.
+
+    Dentro de una transacción se aplican al confirmarla: así no se cuentan
+    eventos deshechos y las filas del día (muy disputadas) solo quedan
+    bloqueadas lo que dura su UPDATE, no toda la transacción del evento.
+    """
+    deltas = list(deltas)
+    if deltas:
+        transaction.on_commit(partial(_aplicar, fecha or timezone.localdate(), deltas))
+        invalidar(*{METRICAS[metrica] for metrica, *_ in deltas})
+
+
+def mover(metrica, conteo, nuevo, montos=None):
+    """
+    Registra que filas pasaron de varios segmentos a ``nuevo``.
+
+    Args:
+        conteo: {segmento anterior: cantidad}
+        montos: {segmento anterior: monto} opcional
+    """
+    montos = montos or {}
+    deltas = []
+    for anterior, cantidad in conteo.items():
+        anterior = segmento_de(anterior)
+        if anterior == segmento_de(nuevo) or not cantidad:
+            continue
+        monto = montos.get(anterior, 0) or 0
+        deltas += [(metrica, anterior, -cantidad, -monto), (metrica, segmento_de(nuevo), cantidad, monto)]
+    registrar(deltas)
+
+
+def con_auto_now(modelo, **valores):
+    """
+    Valores para QuerySet.update() con los campos auto_now puestos a ahora,
+    como haría save(); de ellos dependen los cierres incrementales.
+    """
+    ahora = timezone.now()
+    return {**{f.name: ahora for f in modelo._meta.concrete_fields if getattr(f, 'auto_now', False)}, **valores}
+
+
+def actualizar(queryset, **valores):
+    """
+    QuerySet.update() que registra en las métricas los cambios de segmento
+    y deja las filas en el registro de cambios de la sincronización.
+    """
+    from . import sincronizacion
+
+    modelo = queryset.model
+    sincronizacion.registrar(queryset)
+    valores = con_auto_now(modelo, **valores)
+    campo = getattr(modelo, 'CAMPO_SEGMENTO_METRICA', None)
+    if campo is None or campo not in valores:
+        invalidar(modelo)
+        return queryset.update(**valores)
+    cantidades, montos = conteo_por_segmento(queryset)
+    filas = queryset.update(**valores)
+    mover(modelo.METRICA, cantidades, valores[campo], montos)
+    return filas
+
+
+def borrar(queryset):
+    """QuerySet.delete() que descuenta de las métricas las filas borradas"""
+    from . import sincronizacion
+
+    modelo = queryset.model
+    sincronizacion.registrar(queryset, 'eliminar')
+    if modelo.CAMPO_SEGMENTO_METRICA:
+        cantidades, montos = conteo_por_segmento(queryset)
+    else:
+        cantidades, montos = {'': queryset.count()}, {}
+    resultado = queryset.delete()
+    registrar([(modelo.METRICA, segmento, -cantidad, -(montos.get(segmento) or 0))
+               for segmento, cantidad in cantidades.items()])
+    return resultado
+
+
+def conteo_por_segmento(queryset, campo=None, monto=None):
+    """
+    ({segmento: cantidad}, {segmento: monto}) de un queryset en un solo GROUP BY.
+
+    Sin ``campo`` ni ``monto`` usa los del modelo con métricas.
+    """
+    modelo = queryset.model
+    campo = campo or modelo.CAMPO_SEGMENTO_METRICA
+    monto = monto or getattr(modelo, 'CAMPO_MONTO_METRICA', None)
+    anotaciones = {'n': Count('pk')}
+    if monto:
+        anotaciones['m'] = Sum(monto)
+    filas = queryset.order_by().values(campo).annotate(**anotaciones)
+    return (
+        {segmento_de(f[campo]): f['n'] for f in filas},
+        {segmento_de(f[campo]): f.get('m') or 0 for f in filas},
+    )
+
+
+# ---------------------
+# ESTADÍSTICAS POR SEGMENTO CON CACHÉ
+# ---------------------
+def _clave_version(tabla):
+    return f'estadisticas:version:{tabla}'
+
+
+def nombre_version(modelo):
+    """db_table del modelo, o el nombre tal cual para las versiones sin tabla"""
+    return modelo if isinstance(modelo, str) else modelo._meta.db_table
+
+
+def _version_inicial():
+    # Si la caché pierde una versión (reinicio, purga por MAX_ENTRIES) la nueva
+    # no repite un valor ya usado, así un ETag viejo no vuelve a coincidir
+    return time.time_ns() // 1000
+
+
+def _incrementar_versiones(tablas):
+    for tabla in tablas:
+        try:
+            cache.incr(_clave_version(tabla))
+        except ValueError:
+            cache.set(_clave_version(tabla), _version_inicial(), None)
+
+
+def invalidar(*modelos):
+    """Descarta (al confirmar la transacción) las estadísticas que consultan estos modelos"""
+    tablas = {nombre_version(modelo) for modelo in modelos}
+    if tablas:
+        transaction.on_commit(partial(_incrementar_versiones, tablas))
+
+
+def versiones(*modelos):
+    """{tabla: versión} de los modelos; cambia cada vez que se invalidan"""
+    tablas = sorted({nombre_version(modelo) for modelo in modelos})
+    claves = [_clave_version(tabla) for tabla in tablas]
+    actuales = cache.get_many(claves)
+    faltantes = [clave for clave in claves if clave not in actuales]
+    if faltantes:
+        for clave in faltantes:
+            cache.add(clave, _version_inicial(), None)
+        actuales.update(cache.get_many(faltantes))
+    return {tabla: actuales.get(clave, 0) for tabla, clave in zip(tablas, claves)}
+
+
+def invalidar_por_senal(sender, created=None, update_fields=None, **kwargs):
+    """Receptor de post_save/post_delete conectado en SanesConfig.ready()"""
+    if sender._meta.app_label != 'sanes':
+        return
+    invalidar(sender)
+    # Altas, bajas y save() sin update_fields pueden cambiar lo público; el
+    # save(update_fields=['last_login']) de cada inicio de sesión no
+    if sender is CustomUser and (created is not False or update_fields is None
+                                 or CAMPOS_PUBLICOS_USUARIO & set(update_fields)):
+        invalidar(USUARIOS_PUBLICOS)
+
+
+class Estadisticas:
+    """Cantidades y montos por segmento; se obtiene con ``por_segmento()``"""
+
+    def __init__(self, cantidades, montos):
+        self._cantidades = cantidades
+        self._montos = montos
+
+    def total(self, *segmentos):
+        """Cantidad de filas; sin segmentos cuenta todas"""
+        return sum(n for s, n in self._cantidades.items() if not segmentos or s in segmentos)
+
+    def monto(self, *segmentos):
+        return sum((m or 0 for s, m in self._montos.items() if not segmentos or s in segmentos), Decimal(0))
+
+
+def en_cache(queryset, calcular, *extra, segundos=CACHE_ESTADISTICAS):
+    """
+    Devuelve ``calcular()`` guardado ``segundos`` en caché.
+
+    La clave incluye la SQL de ``queryset``, los valores de ``extra`` y la
+    versión de cada tabla que toca la consulta, así que cualquier
+    save()/delete() o actualización registrada en esas tablas la invalida.
+    """
+    consulta = queryset.order_by().query
+    tablas = sorted({queryset.model._meta.db_table} | {j.table_name for j in consulta.alias_map.values()})
+    versiones = cache.get_many([_clave_version(tabla) for tabla in tablas])
+    sql, parametros = consulta.sql_with_params()
+    huella = hashlib.sha256(repr((sql, parametros, extra, sorted(versiones.items()))).encode()).hexdigest()
+    clave = f'estadisticas:{huella}'
+
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = calcular()
+        cache.set(clave, resultado, segundos)
+    return resultado
+
+
+def por_segmento(queryset, campo, monto=None, segundos=CACHE_ESTADISTICAS):
+    """
+    Cuenta (y suma ``monto``) por cada valor de ``campo`` en una sola consulta,
+    guardando el resultado en caché con ``en_cache``.
+
+    Ejemplo::
+
+        cuotas = metricas.por_segmento(participacion.cupos.all(), 'estado', 'monto_cuota')
+        cuotas.total('pagado'), cuotas.monto('asignado')
+    """
+    resultado = en_cache(
+        queryset, partial(conteo_por_segmento, queryset, campo, monto), campo, monto, segundos=segundos
+    )
+    return Estadisticas(*resultado)
+
+
+# ---------------------
+# LECTURA
+# ---------------------
+class Resumen:
+    """Totales de todas las métricas; se obtiene con ``resumen()``"""
+
+    def __init__(self, filas):
+        self._filas = {(f['metrica'], f['segmento']): f for f in filas}
+
+    def _suma(self, metrica, segmentos, columna):
+        total = 0
+        for (nombre, segmento), fila in self._filas.items():
+            if nombre == metrica and (segmentos is None or segmento in segmentos):
+                total += fila[columna] or 0
+        return total
+
+    def total(self, metrica, *segmentos):
+        """Cantidad actual; sin segmentos suma todos"""
+        return self._suma(metrica, segmentos or None, 'total')
+
+    def monto(self, metrica, *segmentos):
+        return self._suma(metrica, segmentos or None, 'total_monto')
+
+    def hoy(self, metrica, *segmentos):
+        """Variación neta de hoy"""
+        return self._suma(metrica, segmentos or None, 'hoy')
+
+    def semana(self, metrica, *segmentos):
+        return self._suma(metrica, segmentos or None, 'semana')
+
+    def mes(self, metrica, *segmentos):
+        return self._suma(metrica, segmentos or None, 'mes')
+
+
+def resumen():
+    """Todas las métricas con totales y variaciones de hoy, 7 y 30 días, en una consulta"""
+    hoy = timezone.localdate()
+    filas = (
+        MetricaDiaria.objects.order_by()
+        .values('metrica', 'segmento')
+        .annotate(
+            total=Sum('cantidad'),
+            total_monto=Sum('monto'),
+            hoy=Sum('cantidad', filter=Q(fecha=hoy)),
+            semana=Sum('cantidad', filter=Q(fecha__gt=hoy - timedelta(days=7))),
+            mes=Sum('cantidad', filter=Q(fecha__gt=hoy - timedelta(days=30))),
+        )
+    )
+    return Resumen(filas)
+
+
+# ---------------------
+# CONCILIACIÓN Y RECONSTRUCCIÓN
+# ---------------------
+def conciliar():
+    """
+    Compara los totales de la tabla con los reales y registra hoy la diferencia.
+
+    Cubre los cambios que no pasaron por save()/registrar (borrados en
+    cascada, update() sin registrar, ediciones manuales en la base de datos).
+
+    Returns:
+        lista de (métrica, segmento, diferencia de cantidad, diferencia de monto)
+    """
+    acumulado = {
+        (f['metrica'], f['segmento']): (f['total'] or 0, f['total_monto'] or 0)
+        for f in MetricaDiaria.objects.order_by().values('metrica', 'segmento')
+        .annotate(total=Sum('cantidad'), total_monto=Sum('monto'))
+    }
+    correcciones = []
+    for modelo in MODELOS:
+        if modelo.CAMPO_SEGMENTO_METRICA:
+            cantidades, montos = conteo_por_segmento(modelo.objects.all())
+        else:
+            cantidades, montos = {'': modelo.objects.count()}, {}
+        segmentos = set(cantidades) | {s for (m, s) in acumulado if m == modelo.METRICA}
+        for segmento in segmentos:
+            cantidad, monto = acumulado.get((modelo.METRICA, segmento), (0, 0))
+            diferencia = (cantidades.get(segmento, 0) - cantidad, Decimal(montos.get(segmento, 0) or 0) - monto)
+            if diferencia[0] or diferencia[1]:
+                correcciones.append((modelo.METRICA, segmento, *diferencia))
+    if correcciones:
+        _aplicar(timezone.localdate(), correcciones)
+    return correcciones
+
+
+def reconstruir(modelos=None):
+    """
+    Rehace desde cero el historial de las métricas a partir de las tablas.
+
+    Cada fila cuenta en la fecha de creación del objeto y en su segmento
+    actual (los cambios de estado pasados no se conocen).
+    """
+    for modelo in modelos or MODELOS:
+        campo = modelo.CAMPO_SEGMENTO_METRICA
+        valores_agrupados = ['dia'] + ([campo] if campo else [])
+        anotaciones = {'n': Count('pk')}
+        if modelo.CAMPO_MONTO_METRICA:
+            anotaciones['m'] = Sum(modelo.CAMPO_MONTO_METRICA)
+        filas = (
+            modelo.objects.order_by()
+            .annotate(dia=TruncDate(modelo.CAMPO_FECHA_METRICA))
+            .values(*valores_agrupados)
+            .annotate(**anotaciones)
+        )
+        hoy = timezone.localdate()
+        por_dia = defaultdict(lambda: [0, Decimal(0)])
+        for f in filas:
+            clave = (f['dia'] or hoy, segmento_de(f[campo]) if campo else '')
+            por_dia[clave][0] += f['n']
+            por_dia[clave][1] += Decimal(f.get('m') or 0)
+        with transaction.atomic():
+            MetricaDiaria.objects.filter(metrica=modelo.METRICA).delete()
+            MetricaDiaria.objects.bulk_create([
+                MetricaDiaria(fecha=fecha, metrica=modelo.METRICA, segmento=segmento, cantidad=cantidad, monto=monto)
+                for (fecha, segmento), (cantidad, monto) in por_dia.items()
+            ], batch_size=1000)
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0006_alter_turnosan_options_comment_comentario_padre_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pasarela', models.CharField(max_length=20, verbose_name='Pasarela')),
+                ('evento_id', models.CharField(max_length=100, verbose_name='ID del Evento')),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo de Evento')),
+                ('payload', models.JSONField(verbose_name='Payload')),
+                ('fecha_recepcion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Recepción')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('aplicado', 'Aplicado'), ('duplicado', 'Duplicado'), ('ignorado', 'Ignorado')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('detalle', models.CharField(blank=True, default='', max_length=255, verbose_name='Detalle')),
+                ('fecha_procesamiento', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Procesamiento')),
+            ],
+            options={
+                'verbose_name': 'Webhook de Pago',
+                'verbose_name_plural': 'Webhooks de Pago',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'id'], name='sanes_webho_estado_539fab_idx'), models.Index(fields=['pasarela', 'evento_id'], name='sanes_webho_pasarel_de81ee_idx'), models.Index(fields=['fecha_recepcion'], name='sanes_webho_fecha_r_870b09_idx')],
+            },
+        ),
+    ]
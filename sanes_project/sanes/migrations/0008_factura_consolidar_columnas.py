@@ -0,0 +1,106 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:22
+
+from django.db import migrations, models, transaction
+from django.db.models import F
+
+TAMANO_LOTE = 1000
+
+ESTADO_PAGO_POR_ESTADO = {
+    'pagada': 'confirmado',
+    'vencida': 'vencido',
+    'cancelada': 'cancelado',
+}
+
+
+def _cupo_de_cuota(Cupo, db, factura_id, usuario_id, monto, usados):
+    """
+    Cupo que paga una factura antigua de tipo 'cuota_san': el que la apunta
+    por su FK o, si ninguno, el que elegía factura_pagar al pagarla (primer
+    cupo asignado del usuario con ese monto y sin factura, que no se haya
+    dado ya a otra). None si no hay ninguno.
+    """
+    cupos = Cupo.objects.using(db)
+    cupo_id = cupos.filter(factura_id=factura_id).values_list('id', flat=True).first()
+    if cupo_id is None:
+        cupo_id = (
+            cupos.filter(participacion__usuario_id=usuario_id, monto_cuota=monto, estado='asignado', factura=None)
+            .exclude(id__in=usados)
+            .order_by('fecha_vencimiento', 'id').values_list('id', flat=True).first()
+        )
+    if cupo_id is not None:
+        usados.add(cupo_id)
+    return cupo_id
+
+
+def rellenar_columnas_canonicas(apps, schema_editor):
+    """
+    Copia monto, estado, rifa y san a las columnas canónicas.
+
+    Las facturas de tipo 'cuota_san' pasan al tipo de contenido Cupo (así
+    ``Factura.tipo`` sigue devolviendo 'cuota_san' cuando se borre la
+    columna), aunque no se encuentre su cupo.
+
+    Se recorre la tabla por rangos de ID y cada lote se confirma en su propia
+    transacción, así ninguna UPDATE bloquea la tabla entera.
+    """
+    Factura = apps.get_model('sanes', 'Factura')
+    Cupo = apps.get_model('sanes', 'Cupo')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    db = schema_editor.connection.alias
+
+    rifa_ct, _ = ContentType.objects.using(db).get_or_create(app_label='sanes', model='rifa')
+    san_ct, _ = ContentType.objects.using(db).get_or_create(app_label='sanes', model='san')
+    cupo_ct, _ = ContentType.objects.using(db).get_or_create(app_label='sanes', model='cupo')
+
+    facturas = Factura.objects.using(db)
+    usados = set()
+    ultimo_id = facturas.order_by('-id').values_list('id', flat=True).first() or 0
+    for inicio in range(0, ultimo_id + 1, TAMANO_LOTE):
+        with transaction.atomic(using=db):
+            lote = facturas.filter(id__gte=inicio, id__lt=inicio + TAMANO_LOTE)
+
+            lote.filter(monto_total=0).exclude(monto=0).update(monto_total=F('monto'))
+
+            for estado, estado_pago in ESTADO_PAGO_POR_ESTADO.items():
+                lote.filter(estado=estado, estado_pago='pendiente').update(estado_pago=estado_pago)
+            lote.filter(estado='pagada', monto_pagado=0).update(monto_pagado=F('monto_total'))
+
+            cuotas = lote.filter(tipo='cuota_san').exclude(content_type=cupo_ct)
+            for factura_id, usuario_id, monto in cuotas.order_by('id').values_list('id', 'usuario_id', 'monto_total'):
+                facturas.filter(id=factura_id).update(
+                    content_type=cupo_ct, object_id=_cupo_de_cuota(Cupo, db, factura_id, usuario_id, monto, usados)
+                )
+
+            lote.filter(content_type__isnull=True, rifa__isnull=False).update(
+                content_type=rifa_ct, object_id=F('rifa_id')
+            )
+            lote.filter(content_type__isnull=True, san__isnull=False).update(
+                content_type=san_ct, object_id=F('san_id')
+            )
+
+
+class Migration(migrations.Migration):
+    # Cada lote del relleno se confirma por separado
+    atomic = False
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('sanes', '0007_webhookpago'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='factura',
+            name='estado_pago',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('confirmado', 'Confirmado'), ('rechazado', 'Rechazado'), ('cancelado', 'Cancelado'), ('vencido', 'Vencido')], default='pendiente', max_length=20, verbose_name='Estado del Pago'),
+        ),
+        migrations.RunPython(rellenar_columnas_canonicas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', 'estado_pago', 'fecha_emision'], name='factura_usuario_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['content_type', 'object_id', 'estado_pago'], name='factura_objeto_estado_idx'),
+        ),
+    ]
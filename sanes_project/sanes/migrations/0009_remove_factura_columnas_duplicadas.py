@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0008_factura_consolidar_columnas'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='factura',
+            name='estado',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='monto',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='rifa',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='san',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='tipo',
+        ),
+    ]
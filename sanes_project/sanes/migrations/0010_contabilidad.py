@@ -0,0 +1,79 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('sanes', '0009_remove_factura_columnas_duplicadas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsientoContable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('factura_emitida', 'Factura Emitida'), ('factura_anulada', 'Factura Anulada'), ('pago_recibido', 'Pago Recibido'), ('cuota_pagada', 'Cuota Pagada'), ('pago_turno', 'Pago de Turno'), ('reembolso', 'Reembolso')], max_length=20, verbose_name='Tipo')),
+                ('clave', models.CharField(max_length=100, unique=True, verbose_name='Clave')),
+                ('descripcion', models.CharField(blank=True, default='', max_length=255, verbose_name='Descripción')),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='ID del Origen')),
+                ('fecha', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='contenttypes.contenttype', verbose_name='Tipo de Origen')),
+            ],
+            options={
+                'verbose_name': 'Asiento Contable',
+                'verbose_name_plural': 'Asientos Contables',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CuentaContable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('usuario', 'Usuario'), ('san', 'San'), ('rifa', 'Rifa'), ('plataforma', 'Plataforma')], max_length=20, verbose_name='Tipo de Cuenta')),
+                ('object_id', models.PositiveIntegerField(default=0, verbose_name='ID del Titular')),
+                ('rubro', models.CharField(choices=[('disponible', 'Disponible'), ('por_cobrar', 'Por Cobrar')], default='disponible', max_length=20, verbose_name='Rubro')),
+                ('saldo', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Saldo')),
+                ('entradas', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Entradas')),
+                ('salidas', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Salidas')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última Actualización')),
+            ],
+            options={
+                'verbose_name': 'Cuenta Contable',
+                'verbose_name_plural': 'Cuentas Contables',
+                'ordering': ['tipo', 'object_id', 'rubro'],
+                'unique_together': {('tipo', 'object_id', 'rubro')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ApunteContable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Monto')),
+                ('saldo_resultante', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Saldo Resultante')),
+                ('fecha', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('asiento', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='apuntes', to='sanes.asientocontable', verbose_name='Asiento')),
+                ('cuenta', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='apuntes', to='sanes.cuentacontable', verbose_name='Cuenta')),
+            ],
+            options={
+                'verbose_name': 'Apunte Contable',
+                'verbose_name_plural': 'Apuntes Contables',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='asientocontable',
+            index=models.Index(fields=['content_type', 'object_id'], name='sanes_asien_content_cabc72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asientocontable',
+            index=models.Index(fields=['tipo', 'fecha'], name='sanes_asien_tipo_3e09c1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apuntecontable',
+            index=models.Index(fields=['cuenta', 'id'], name='sanes_apunt_cuenta__879426_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('sanes', '0010_contabilidad'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cupo',
+            name='estado',
+            field=models.CharField(choices=[('disponible', 'Disponible'), ('asignado', 'Asignado'), ('pagado', 'Pagado'), ('vencido', 'Vencido'), ('cancelado', 'Cancelado')], default='disponible', max_length=20, verbose_name='Estado'),
+        ),
+        migrations.CreateModel(
+            name='CancelacionMasiva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID del Objeto')),
+                ('motivo', models.CharField(max_length=255, verbose_name='Motivo')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En Proceso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('fase', models.CharField(choices=[('facturas', 'Facturas y Reembolsos'), ('tickets', 'Tickets'), ('cupos', 'Cupos'), ('participaciones', 'Participaciones'), ('notificaciones', 'Notificaciones'), ('fin', 'Fin')], default='facturas', max_length=20, verbose_name='Fase')),
+                ('ultimo_id', models.PositiveBigIntegerField(default=0, verbose_name='Último ID Procesado')),
+                ('facturas_procesadas', models.PositiveIntegerField(default=0, verbose_name='Facturas Procesadas')),
+                ('reembolsos_creados', models.PositiveIntegerField(default=0, verbose_name='Reembolsos Creados')),
+                ('monto_reembolsado', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto Reembolsado')),
+                ('usuarios_notificados', models.PositiveIntegerField(default=0, verbose_name='Usuarios Notificados')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Inicio')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Finalización')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Tipo de Contenido')),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cancelaciones_solicitadas', to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Cancelación Masiva',
+                'verbose_name_plural': 'Cancelaciones Masivas',
+                'ordering': ['-fecha_creacion'],
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Reembolso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Monto')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesado', 'Procesado')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('cancelacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reembolsos', to='sanes.cancelacionmasiva', verbose_name='Cancelación')),
+                ('factura', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reembolso', to='sanes.factura', verbose_name='Factura')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reembolsos', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Reembolso',
+                'verbose_name_plural': 'Reembolsos',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['cancelacion', 'usuario'], name='sanes_reemb_cancela_855bce_idx')],
+            },
+        ),
+    ]
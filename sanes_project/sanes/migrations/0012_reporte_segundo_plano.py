@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0011_cancelaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('listo', 'Listo'), ('error', 'Error')], default='listo', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='fecha_finalizacion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='filas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='parametros',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='tipo',
+            field=models.CharField(choices=[('rifa', 'Rifa'), ('san', 'San'), ('usuario', 'Usuario'), ('finanzas', 'Finanzas'), ('logs', 'Logs del Sistema')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0012_reporte_segundo_plano'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='clave',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='tipo',
+            field=models.CharField(choices=[('rifa', 'Rifa'), ('san', 'San'), ('usuario', 'Usuario'), ('finanzas', 'Finanzas'), ('facturas', 'Facturas'), ('logs', 'Logs del Sistema')], max_length=20),
+        ),
+    ]
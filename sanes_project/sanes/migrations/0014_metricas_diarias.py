@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0013_reporte_clave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('metrica', models.CharField(max_length=30, verbose_name='Métrica')),
+                ('segmento', models.CharField(blank=True, default='', max_length=30, verbose_name='Segmento')),
+                ('cantidad', models.BigIntegerField(default=0, verbose_name='Cantidad')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Monto')),
+            ],
+            options={
+                'verbose_name': 'Métrica Diaria',
+                'verbose_name_plural': 'Métricas Diarias',
+                'ordering': ['-fecha', 'metrica', 'segmento'],
+                'unique_together': {('fecha', 'metrica', 'segmento')},
+            },
+        ),
+    ]
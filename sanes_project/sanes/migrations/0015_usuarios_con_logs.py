@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0014_metricas_diarias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsuarioConLogs',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Primer Log')),
+            ],
+            options={
+                'verbose_name': 'Usuario con Logs',
+                'verbose_name_plural': 'Usuarios con Logs',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0015_usuarios_con_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaHoraria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField(verbose_name='Hora')),
+                ('tipo', models.CharField(choices=[('rifa', 'Rifa'), ('san', 'San')], max_length=10, verbose_name='Tipo')),
+                ('objeto_id', models.PositiveIntegerField(verbose_name='ID de la Rifa o San')),
+                ('metodo_pago', models.CharField(blank=True, default='', max_length=20, verbose_name='Método de Pago')),
+                ('unidades', models.PositiveIntegerField(default=0, verbose_name='Tickets o Inscripciones')),
+                ('facturas', models.PositiveIntegerField(default=0, verbose_name='Facturas Emitidas')),
+                ('facturas_pagadas', models.PositiveIntegerField(default=0, verbose_name='Facturas Pagadas')),
+                ('monto_pagado', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto Pagado')),
+                ('organizador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Organizador')),
+            ],
+            options={
+                'verbose_name': 'Venta por Hora',
+                'verbose_name_plural': 'Ventas por Hora',
+                'ordering': ['-hora'],
+                'indexes': [models.Index(fields=['organizador', 'hora'], name='venta_horaria_org_hora_idx')],
+                'unique_together': {('hora', 'tipo', 'objeto_id', 'metodo_pago')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0016_ventas_horarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='clave_activa',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='fecha_expiracion',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='progreso',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='resultado',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='versiones',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0017_trabajos_reportes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cupo',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Actualización'),
+        ),
+        migrations.AddField(
+            model_name='factura',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Actualización'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Actualización'),
+        ),
+        migrations.AlterField(
+            model_name='pagosimulado',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Actualización'),
+        ),
+        migrations.CreateModel(
+            name='CierreDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True, verbose_name='Fecha del Cierre')),
+                ('estado', models.CharField(choices=[('procesando', 'Procesando'), ('listo', 'Listo'), ('error', 'Error')], default='procesando', max_length=20, verbose_name='Estado')),
+                ('incremental', models.BooleanField(default=False, verbose_name='Incremental')),
+                ('desde', models.DateTimeField(blank=True, null=True, verbose_name='Cambios Desde')),
+                ('hasta', models.DateTimeField(blank=True, null=True, verbose_name='Foto Tomada')),
+                ('manifiesto', models.FileField(blank=True, null=True, upload_to='cierres/', verbose_name='Manifiesto')),
+                ('error', models.TextField(blank=True, default='')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('fecha_finalizacion', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Finalización')),
+                ('anterior', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='siguientes', to='sanes.cierrediario', verbose_name='Cierre Anterior')),
+            ],
+            options={
+                'verbose_name': 'Cierre Diario',
+                'verbose_name_plural': 'Cierres Diarios',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivoCierre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabla', models.CharField(max_length=30, verbose_name='Tabla')),
+                ('archivo', models.FileField(upload_to='cierres/', verbose_name='Archivo')),
+                ('filas', models.PositiveIntegerField(default=0, verbose_name='Filas')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('bytes', models.PositiveBigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archivos', to='sanes.cierrediario', verbose_name='Cierre')),
+            ],
+            options={
+                'verbose_name': 'Archivo de Cierre',
+                'verbose_name_plural': 'Archivos de Cierre',
+                'unique_together': {('cierre', 'tabla')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0018_cierres_diarios'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reporte',
+            name='tipo',
+            field=models.CharField(choices=[('rifa', 'Rifa'), ('san', 'San'), ('usuario', 'Usuario'), ('finanzas', 'Finanzas'), ('facturas', 'Facturas'), ('logs', 'Logs del Sistema'), ('cohortes', 'Cohortes y Retención')], max_length=20),
+        ),
+    ]
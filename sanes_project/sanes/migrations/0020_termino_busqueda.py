@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:09
+
+from django.db import migrations, models
+
+
+def indexar_existentes(apps, schema_editor):
+    """Llena el índice con las rifas y sanes que ya existen"""
+    from sanes import busqueda
+
+    busqueda.reconstruir(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0019_reporte_cohortes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('rifa', 'Rifa'), ('san', 'San')], max_length=10, verbose_name='Tipo')),
+                ('objeto_id', models.PositiveIntegerField(verbose_name='ID de la Rifa o San')),
+                ('termino', models.CharField(max_length=40, verbose_name='Término')),
+                ('peso', models.PositiveIntegerField(default=1, verbose_name='Peso')),
+            ],
+            options={
+                'verbose_name': 'Término de Búsqueda',
+                'verbose_name_plural': 'Términos de Búsqueda',
+                'indexes': [models.Index(fields=['tipo', 'termino'], name='termino_busqueda_idx')],
+                'unique_together': {('tipo', 'objeto_id', 'termino')},
+            },
+        ),
+        migrations.RunPython(indexar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0020_termino_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rifa',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Versión'),
+        ),
+        migrations.AddField(
+            model_name='san',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Versión'),
+        ),
+    ]
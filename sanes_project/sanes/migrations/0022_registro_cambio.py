@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0021_version_rifa_san'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('rifa', 'Rifa'), ('san', 'San'), ('ticket', 'Ticket'), ('participacion', 'Participación'), ('cupo', 'Cupo'), ('factura', 'Factura'), ('notificacion', 'Notificación')], max_length=15, verbose_name='Tipo')),
+                ('objeto_id', models.PositiveBigIntegerField(verbose_name='ID del Objeto')),
+                ('accion', models.CharField(choices=[('crear', 'Crear'), ('actualizar', 'Actualizar'), ('eliminar', 'Eliminar')], max_length=10, verbose_name='Acción')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')),
+                ('usuario', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Registro de Cambio',
+                'verbose_name_plural': 'Registro de Cambios',
+                'indexes': [models.Index(fields=['usuario', 'id'], name='registro_cambio_usuario_idx')],
+            },
+        ),
+    ]
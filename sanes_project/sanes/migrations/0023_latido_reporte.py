@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sanes', '0022_registro_cambio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
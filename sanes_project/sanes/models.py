@@ -1,7 +1,8 @@
 # sanes/models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.utils import timezone
 from django.urls import reverse
@@ -15,11 +16,64 @@ from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+# ---------------------
+# MÉTRICAS DIARIAS
+# ---------------------
+class MetricasMixin:
+    """
+    Mantiene la tabla ``MetricaDiaria`` al crear, borrar o cambiar de
+    segmento (estado, activo...) una fila con save()/delete().
+
+    Los cambios hechos con QuerySet.update(), bulk_create() o delete() de
+    queryset no pasan por aquí: quien los hace los registra con
+    ``metricas.registrar`` y, si no, los corrige la conciliación nocturna.
+    """
+    METRICA = None
+    CAMPO_SEGMENTO_METRICA = None
+    CAMPO_MONTO_METRICA = None
+    CAMPO_FECHA_METRICA = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from . import metricas
+
+        instancia = super().from_db(db, field_names, values)
+        instancia._metrica_original = metricas.valores(instancia)
+        return instancia
+
+    def save(self, *args, **kwargs):
+        from . import metricas
+
+        nueva = self._state.adding
+        super().save(*args, **kwargs)
+        actual = metricas.valores(self)
+        original = getattr(self, '_metrica_original', None)
+        if nueva:
+            metricas.registrar([(self.METRICA, actual[0], 1, actual[1])])
+        elif original is not None and original != actual:
+            metricas.registrar([
+                (self.METRICA, original[0], -1, -original[1]),
+                (self.METRICA, actual[0], 1, actual[1]),
+            ])
+        self._metrica_original = actual
+
+    def delete(self, *args, **kwargs):
+        from . import metricas
+
+        segmento, monto = getattr(self, '_metrica_original', None) or metricas.valores(self)
+        resultado = super().delete(*args, **kwargs)
+        metricas.registrar([(self.METRICA, segmento, -1, -monto)])
+        return resultado
+
+
 # ---------------------
 # MODELO DE USUARIO UNIFICADO MEJORADO
 # ---------------------
-class CustomUser(AbstractUser):
+class CustomUser(MetricasMixin, AbstractUser):
     """Usuario personalizado con roles, permisos y sistema de reputación"""
+    METRICA = 'usuarios'
+    CAMPO_SEGMENTO_METRICA = 'is_active'
+    CAMPO_FECHA_METRICA = 'date_joined'
     email = models.EmailField(unique=True, verbose_name="Correo Electrónico")
     phone_number = models.CharField(max_length=15, blank=True, null=True, verbose_name="Número de Teléfono")
     address = models.CharField(max_length=255, blank=True, null=True, verbose_name="Dirección")
@@ -207,13 +261,19 @@ class CustomUser(AbstractUser):
 # ---------------------
 # MODELO DE FACTURA UNIFICADO
 # ---------------------
-class Factura(models.Model):
+class Factura(MetricasMixin, models.Model):
     """Factura digital que funciona tanto para rifas como para sanes"""
+    METRICA = 'facturas'
+    CAMPO_SEGMENTO_METRICA = 'estado_pago'
+    CAMPO_MONTO_METRICA = 'monto_total'
+    CAMPO_FECHA_METRICA = 'fecha_emision'
+
     ESTADOS_PAGO = [
         ('pendiente', 'Pendiente'),
         ('confirmado', 'Confirmado'),
         ('rechazado', 'Rechazado'),
         ('cancelado', 'Cancelado'),
+        ('vencido', 'Vencido'),
     ]
     
     METODOS_PAGO = [
@@ -223,7 +283,8 @@ class Factura(models.Model):
         ('otro', 'Otro'),
     ]
     
-    # Campos para compatibilidad con código existente
+    # Valores antiguos de ``tipo`` y ``estado``; ahora se derivan de
+    # content_type y estado_pago (ver propiedades de compatibilidad)
     TIPOS_CHOICES = [
         ('rifa', 'Rifa'),
         ('san', 'San'),
@@ -240,6 +301,26 @@ class Factura(models.Model):
         ('cancelada', 'Cancelada'),
     ]
 
+    TIPO_POR_MODELO = {
+        'rifa': 'ticket_rifa',
+        'san': 'inscripcion_san',
+        'cupo': 'cuota_san',
+    }
+    MODELO_POR_TIPO = {
+        'rifa': 'rifa',
+        'ticket_rifa': 'rifa',
+        'san': 'san',
+        'inscripcion_san': 'san',
+        'cuota_san': 'cupo',
+    }
+    ESTADO_PAGO_POR_ESTADO = {
+        'pendiente': 'pendiente',
+        'pagada': 'confirmado',
+        'vencida': 'vencido',
+        'cancelada': 'cancelado',
+    }
+    ESTADO_POR_ESTADO_PAGO = {v: k for k, v in ESTADO_PAGO_POR_ESTADO.items()}
+
     # Identificación única
     codigo = models.CharField(max_length=20, unique=True, editable=False, null=True, blank=True, verbose_name="Código de Factura")
     
@@ -251,16 +332,12 @@ class Factura(models.Model):
         related_name='facturas'
     )
     
-    # Contenido genérico (Rifa o San)
+    # Contenido genérico (Rifa, San o Cupo)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Tipo de Contenido")
     object_id = models.PositiveIntegerField(null=True, blank=True, verbose_name="ID del Objeto")
     content_object = GenericForeignKey('content_type', 'object_id')
     
-    # Campos para compatibilidad con código existente
     concepto = models.CharField(max_length=255, blank=True, null=True, verbose_name="Concepto")
-    monto = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, verbose_name="Monto")
-    tipo = models.CharField(max_length=20, choices=TIPOS_CHOICES, default='otro', verbose_name="Tipo")
-    estado = models.CharField(max_length=20, choices=ESTADOS_CHOICES, default='pendiente', verbose_name="Estado")
     
     # Información de la factura
     fecha_emision = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Emisión")
@@ -298,18 +375,33 @@ class Factura(models.Model):
     # Notas adicionales
     notas = models.TextField(blank=True, null=True, verbose_name="Notas Adicionales")
     
-    # Campos adicionales para compatibilidad
     fecha_pago = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Pago")
-    rifa = models.ForeignKey('Rifa', null=True, blank=True, on_delete=models.SET_NULL, verbose_name="Rifa")
-    san = models.ForeignKey('San', null=True, blank=True, on_delete=models.SET_NULL, verbose_name="San")
     archivo = models.FileField(upload_to='facturas/', null=True, blank=True, verbose_name="Archivo")
+    # Los cierres diarios exportan solo lo modificado desde el cierre anterior
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Última Actualización")
 
     class Meta:
         verbose_name = 'Factura'
         verbose_name_plural = 'Facturas'
         ordering = ['-fecha_emision']
+        indexes = [
+            models.Index(fields=['usuario', 'estado_pago', 'fecha_emision'], name='factura_usuario_estado_idx'),
+            models.Index(fields=['content_type', 'object_id', 'estado_pago'], name='factura_objeto_estado_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        factura = super().from_db(db, field_names, values)
+        # Estado al cargar, para contabilizar las transiciones al guardar
+        factura._estado_pago_original = factura.__dict__.get('estado_pago')
+        return factura
 
     def save(self, *args, **kwargs):
+        from . import analitica, contabilidad
+
+        nueva = self._state.adding
+        estado_anterior = getattr(self, '_estado_pago_original', None)
+
         if not self.codigo:
             # Generar código único basado en el tipo de contenido
             if self.content_type and self.content_type.model == 'rifa':
@@ -324,8 +416,25 @@ class Factura(models.Model):
         # Establecer fecha de vencimiento por defecto (30 días)
         if not self.fecha_vencimiento:
             self.fecha_vencimiento = timezone.now() + timedelta(days=30)
-            
-        super().save(*args, **kwargs)
+        
+        # La factura y sus asientos contables se guardan juntos
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if nueva:
+                contabilidad.registrar_factura_emitida(self)
+                analitica.registrar_facturas([self])
+            contabilidad.registrar_cambio_estado(self, estado_anterior)
+            if self.estado_pago == 'confirmado' and estado_anterior != 'confirmado':
+                analitica.registrar_pagos([self])
+        self._estado_pago_original = self.estado_pago
+
+    def delete(self, *args, **kwargs):
+        from . import contabilidad
+
+        with transaction.atomic():
+            if self.estado_pago == 'pendiente':
+                contabilidad.registrar_anulacion_factura(self)
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"Factura {self.codigo} - {self.usuario.get_full_name_or_username()}"
@@ -358,6 +467,68 @@ class Factura(models.Model):
         """Retorna el estado para compatibilidad"""
         return self.get_estado_pago_display()
 
+    @property
+    def monto(self):
+        """Alias de monto_total"""
+        return self.monto_total
+
+    @monto.setter
+    def monto(self, valor):
+        self.monto_total = valor
+
+    @property
+    def estado(self):
+        """Estado con los valores antiguos (pagada, vencida, cancelada)"""
+        return self.ESTADO_POR_ESTADO_PAGO.get(self.estado_pago, self.estado_pago)
+
+    @estado.setter
+    def estado(self, valor):
+        self.estado_pago = self.ESTADO_PAGO_POR_ESTADO.get(valor, valor)
+
+    @property
+    def tipo(self):
+        """Tipo antiguo derivado del tipo de contenido"""
+        if self.content_type_id is None:
+            return 'otro'
+        return self.TIPO_POR_MODELO.get(self.content_type.model, 'otro')
+
+    def get_tipo_display(self):
+        return dict(self.TIPOS_CHOICES).get(self.tipo, self.tipo)
+
+    @property
+    def rifa(self):
+        """Rifa facturada, si la factura es de una rifa"""
+        if self.content_type_id and self.content_type.model == 'rifa':
+            return self.content_object
+        return None
+
+    @rifa.setter
+    def rifa(self, rifa):
+        self.content_object = rifa
+
+    @property
+    def san(self):
+        """San facturado, directamente o a través de una cuota"""
+        if self.content_type_id is None:
+            return None
+        if self.content_type.model == 'san':
+            return self.content_object
+        if self.content_type.model == 'cupo' and self.content_object:
+            return self.content_object.san
+        return None
+
+    @san.setter
+    def san(self, san):
+        self.content_object = san
+
+    @classmethod
+    def content_type_de_tipo(cls, tipo):
+        """ContentType que corresponde a un tipo antiguo de factura"""
+        modelo = cls.MODELO_POR_TIPO.get(tipo)
+        if modelo is None:
+            return None
+        return ContentType.objects.get_by_natural_key('sanes', modelo)
+
     def confirmar_pago(self, monto=None):
         """Confirma el pago de la factura"""
         if monto:
@@ -375,8 +546,12 @@ class Factura(models.Model):
 # ---------------------
 # MODELO DE RIFA UNIFICADO
 # ---------------------
-class Rifa(models.Model):
+class Rifa(MetricasMixin, models.Model):
     """Modelo unificado para rifas"""
+    METRICA = 'rifas'
+    CAMPO_SEGMENTO_METRICA = 'estado'
+    CAMPO_FECHA_METRICA = 'created_at'
+
     ESTADOS_RIFA = [
         ('borrador', 'Borrador'),
         ('activa', 'Activa'),
@@ -436,6 +611,8 @@ class Rifa(models.Model):
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+    # Sube con cada ticket o inscripción; forma parte del ETag del detalle (ver sanes.condicional)
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Versión")
 
     class Meta:
         verbose_name = 'Rifa'
@@ -495,8 +672,13 @@ class Rifa(models.Model):
 # ---------------------
 # MODELO DE TICKET UNIFICADO
 # ---------------------
-class Ticket(models.Model):
+class Ticket(MetricasMixin, models.Model):
     """Modelo unificado para tickets de rifas"""
+    METRICA = 'tickets'
+    CAMPO_SEGMENTO_METRICA = 'activo'
+    CAMPO_MONTO_METRICA = 'precio_pagado'
+    CAMPO_FECHA_METRICA = 'fecha_compra'
+
     # Identificación
     codigo = models.CharField(max_length=20, unique=True, editable=False, null=True, blank=True, verbose_name="Código del Ticket")
     numero = models.PositiveIntegerField(default=1, verbose_name="Número de Ticket")
@@ -530,6 +712,7 @@ class Ticket(models.Model):
     
     # Estado del ticket
     activo = models.BooleanField(default=True, verbose_name="Ticket Activo")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Última Actualización")
     
     # Factura asociada
     factura = models.ForeignKey(
@@ -565,7 +748,11 @@ class Ticket(models.Model):
                 
                 self.numero = siguiente_numero
         
+        nuevo = self._state.adding
         super().save(*args, **kwargs)
+        if nuevo and self.rifa_id:
+            from . import analitica
+            analitica.registrar_ticket(self)
 
     def __str__(self):
         return f"Ticket {self.numero} - {self.rifa.titulo if self.rifa else 'Sin Rifa'}"
@@ -578,8 +765,12 @@ class Ticket(models.Model):
 # ---------------------
 # MODELO DE SAN UNIFICADO
 # ---------------------
-class San(models.Model):
+class San(MetricasMixin, models.Model):
     """Modelo unificado para sanes"""
+    METRICA = 'sanes'
+    CAMPO_SEGMENTO_METRICA = 'estado'
+    CAMPO_FECHA_METRICA = 'created_at'
+
     FRECUENCIAS_PAGO = [
         ('semanal', 'Semanal'),
         ('quincenal', 'Quincenal'),
@@ -658,6 +849,8 @@ class San(models.Model):
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+    # Sube con cada ticket o inscripción; forma parte del ETag del detalle (ver sanes.condicional)
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Versión")
 
     class Meta:
         verbose_name = 'San'
@@ -717,8 +910,12 @@ class San(models.Model):
 # ---------------------
 # MODELO DE PARTICIPACIÓN EN SAN
 # ---------------------
-class ParticipacionSan(models.Model):
+class ParticipacionSan(MetricasMixin, models.Model):
     """Modelo para la participación de usuarios en sanes"""
+    METRICA = 'participaciones'
+    CAMPO_SEGMENTO_METRICA = 'activa'
+    CAMPO_FECHA_METRICA = 'fecha_inscripcion'
+
     # Relaciones
     san = models.ForeignKey(
         San, 
@@ -753,6 +950,14 @@ class ParticipacionSan(models.Model):
     def __str__(self):
         return f"{self.usuario.get_full_name_or_username()} - {self.san.nombre}"
 
+    def save(self, *args, **kwargs):
+        from . import analitica
+
+        nueva = self._state.adding
+        super().save(*args, **kwargs)
+        if nueva:
+            analitica.registrar_participacion(self)
+
     def cuotas_pendientes(self):
         """Retorna la cantidad de cuotas pendientes"""
         return self.san.numero_cuotas - self.cuotas_pagadas
@@ -807,6 +1012,7 @@ class Cupo(models.Model):
         ('asignado', 'Asignado'),
         ('pagado', 'Pagado'),
         ('vencido', 'Vencido'),
+        ('cancelado', 'Cancelado'),
     ]
 
     # Relaciones
@@ -855,6 +1061,7 @@ class Cupo(models.Model):
             raise ValidationError("El monto de la cuota debe ser mayor a 0.")
 
     fecha_pago = models.DateField(null=True, blank=True, verbose_name="Fecha de Pago")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Última Actualización")
     
     # Factura asociada
     factura = models.ForeignKey(
@@ -1114,8 +1321,11 @@ class Comment(models.Model):
 # ---------------------
 # MODELO DE LOGS DEL SISTEMA
 # ---------------------
-class SystemLog(models.Model):
+class SystemLog(MetricasMixin, models.Model):
     """Logs de acciones del sistema"""
+    METRICA = 'logs'
+    CAMPO_FECHA_METRICA = 'fecha_creacion'
+
     TIPOS_ACCION = [
         ('crear', 'Crear'),
         ('editar', 'Editar'),
@@ -1179,6 +1389,12 @@ class SystemLog(models.Model):
     
     def __str__(self):
         return f"{self.tipo_accion} - {self.usuario.username if self.usuario else 'Sistema'} - {self.fecha_creacion.strftime('%d/%m/%Y %H:%M')}"
+
+    def save(self, *args, **kwargs):
+        nuevo = self._state.adding
+        super().save(*args, **kwargs)
+        if nuevo and self.usuario_id:
+            UsuarioConLogs.registrar([self.usuario_id])
     
     @classmethod
     def log_action(cls, usuario, tipo_accion, descripcion, nivel='info', content_object=None, ip_address=None, user_agent=None, datos_adicionales=None):
@@ -1195,6 +1411,47 @@ class SystemLog(models.Model):
         )
 
 
+class UsuarioConLogs(models.Model):
+    """
+    Usuarios que tienen al menos un log, para el filtro de admin_logs.
+
+    Evita el ``DISTINCT`` sobre todos los logs en cada visita. Se mantiene al
+    crear logs y ``sincronizar`` (comando actualizar_metricas) quita los
+    usuarios cuyos logs se borraron.
+    """
+    usuario = models.OneToOneField(
+        CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='+', verbose_name="Usuario"
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Primer Log")
+
+    class Meta:
+        verbose_name = 'Usuario con Logs'
+        verbose_name_plural = 'Usuarios con Logs'
+
+    def __str__(self):
+        return str(self.usuario_id)
+
+    @classmethod
+    def registrar(cls, usuario_ids):
+        """Añade los usuarios que faltan; la caché evita repetir el INSERT con cada log"""
+        nuevos = [i for i in set(usuario_ids) if i and cache.add(f'usuario_con_logs:{i}', True, 3600)]
+        if nuevos:
+            cls.objects.bulk_create([cls(usuario_id=i) for i in nuevos], ignore_conflicts=True)
+
+    @classmethod
+    def sincronizar(cls):
+        """Rehace la tabla desde SystemLog; devuelve (añadidos, quitados)"""
+        con_logs = SystemLog.objects.filter(usuario_id=models.OuterRef('pk'))
+        faltantes = CustomUser.objects.filter(
+            models.Exists(con_logs), ~models.Exists(cls.objects.filter(usuario_id=models.OuterRef('pk')))
+        ).values_list('id', flat=True)
+        anadidos = cls.objects.bulk_create([cls(usuario_id=i) for i in faltantes], ignore_conflicts=True)
+        quitados, _ = cls.objects.filter(
+            ~models.Exists(SystemLog.objects.filter(usuario_id=models.OuterRef('usuario_id')))
+        ).delete()
+        return len(anadidos), quitados
+
+
 # ---------------------
 # MODELO DE PAGOS SIMULADOS
 # ---------------------
@@ -1241,7 +1498,7 @@ class PagoSimulado(models.Model):
     
     # Timestamps
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
-    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Última Actualización")
 
     class Meta:
         verbose_name = 'Pago Simulado'
@@ -1256,51 +1513,88 @@ class PagoSimulado(models.Model):
     def __str__(self):
         return f"Pago Simulado {self.codigo_transaccion} - {self.usuario.username}"
     
+    def datos_cobro(self):
+        """Datos que se envían a la pasarela de pago"""
+        return {
+            'codigo': self.codigo_transaccion,
+            'monto': str(self.monto),
+            'moneda': self.moneda,
+            'metodo': self.metodo_pago,
+            'factura': self.factura.codigo,
+        }
+
     def procesar_pago(self):
-        """Simula el procesamiento del pago"""
-        import time
-        import random
-        
-        self.estado = 'procesando'
-        self.save()
+        """
+        Envía el cobro a la pasarela configurada para el método de pago.
 
-        # Simular tiempo de procesamiento (1-5 segundos)
-        tiempo_procesamiento = random.randint(1, 5)
-        time.sleep(tiempo_procesamiento)
-        
-        # Simular éxito o fallo (90% éxito)
-        if random.random() < 0.9:
+        Llamar fuera de transacciones: la espera a la pasarela no debe retener
+        bloqueos. Solo la aplicación del resultado es atómica.
+        """
+        from .pasarelas import cobrar
+
+        if self.estado != 'procesando':
+            self.estado = 'procesando'
+            self.save()
+        resultado = cobrar(self.metodo_pago, self.datos_cobro())
+        with transaction.atomic():
+            return self.aplicar_resultado(resultado)
+
+    def aplicar_resultado(self, resultado):
+        """
+        Actualiza el pago y la factura con la respuesta de la pasarela.
+
+        Un cobro fallido rechaza la factura y libera lo reservado
+        (``webhooks.liberar_reservas``), ya lo aplique el checkout o el worker.
+        """
+        self.tiempo_procesamiento = resultado['latencia_ms'] // 1000
+
+        if resultado['estado'] == 'exitoso':
             self.estado = 'exitoso'
             self.fecha_procesamiento = timezone.now()
-            self.tiempo_procesamiento = tiempo_procesamiento
-            
+            self.referencia_externa = resultado['referencia']
+
             # Actualizar la factura
             self.factura.estado_pago = 'confirmado'
             self.factura.monto_pagado = self.monto
             self.factura.fecha_pago = timezone.now()
             self.factura.save()
-            
+
             # Crear log del sistema
             SystemLog.log_action(
                 usuario=self.usuario,
                 tipo_accion='pagar',
-                descripcion=f'Pago simulado exitoso de {self.monto} {self.moneda}',
+                descripcion=f'Pago exitoso de {self.monto} {self.moneda} vía {self.get_metodo_pago_display()}',
                 nivel='success',
                 content_object=self.factura
             )
-        else:
+        elif resultado['estado'] == 'fallido':
+            from .webhooks import liberar_reservas
+
             self.estado = 'fallido'
-            self.tiempo_procesamiento = tiempo_procesamiento
-            
+
+            # Rechazar la factura y devolver los tickets o la plaza en el san
+            liberar_reservas([self.factura])
+
             # Crear log del sistema
             SystemLog.log_action(
                 usuario=self.usuario,
                 tipo_accion='pagar',
-                descripcion=f'Pago simulado fallido de {self.monto} {self.moneda}',
+                descripcion=f'Pago fallido de {self.monto} {self.moneda}: {resultado["error"]}',
                 nivel='error',
                 content_object=self.factura
             )
-        
+        else:
+            # La pasarela no respondió a tiempo: queda pendiente para el worker
+            self.estado = 'pendiente'
+
+            SystemLog.log_action(
+                usuario=self.usuario,
+                tipo_accion='pagar',
+                descripcion=f'Pasarela {self.metodo_pago} no disponible: {resultado["error"]}',
+                nivel='warning',
+                content_object=self.factura
+            )
+
         self.save()
         return self.estado == 'exitoso'
     
@@ -1314,6 +1608,446 @@ class PagoSimulado(models.Model):
         return False
 
 
+# ---------------------
+# BANDEJA DE WEBHOOKS DE PASARELAS
+# ---------------------
+class WebhookPago(models.Model):
+    """Evento recibido de una pasarela de pago, tal como llegó"""
+    ESTADOS_WEBHOOK = [
+        ('pendiente', 'Pendiente'),
+        ('aplicado', 'Aplicado'),
+        ('duplicado', 'Duplicado'),
+        ('ignorado', 'Ignorado'),
+    ]
+
+    # Identificación del evento en la pasarela
+    pasarela = models.CharField(max_length=20, verbose_name="Pasarela")
+    evento_id = models.CharField(max_length=100, verbose_name="ID del Evento")
+    tipo = models.CharField(max_length=50, verbose_name="Tipo de Evento")
+
+    # Cuerpo original del webhook (no se modifica nunca)
+    payload = models.JSONField(verbose_name="Payload")
+    fecha_recepcion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Recepción")
+
+    # Resultado de la aplicación
+    estado = models.CharField(max_length=20, choices=ESTADOS_WEBHOOK, default='pendiente', verbose_name="Estado")
+    detalle = models.CharField(max_length=255, blank=True, default='', verbose_name="Detalle")
+    fecha_procesamiento = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Procesamiento")
+
+    class Meta:
+        verbose_name = 'Webhook de Pago'
+        verbose_name_plural = 'Webhooks de Pago'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'id']),
+            models.Index(fields=['pasarela', 'evento_id']),
+            models.Index(fields=['fecha_recepcion']),
+        ]
+
+    def __str__(self):
+        return f"{self.pasarela} {self.evento_id} ({self.tipo}) - {self.estado}"
+
+
+# ---------------------
+# CONTABILIDAD DE PARTIDA DOBLE
+# ---------------------
+class CuentaContable(models.Model):
+    """Cuenta del libro mayor con su saldo acumulado"""
+    TIPOS_CUENTA = [
+        ('usuario', 'Usuario'),
+        ('san', 'San'),
+        ('rifa', 'Rifa'),
+        ('plataforma', 'Plataforma'),
+    ]
+
+    RUBROS = [
+        ('disponible', 'Disponible'),
+        ('por_cobrar', 'Por Cobrar'),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=TIPOS_CUENTA, verbose_name="Tipo de Cuenta")
+    object_id = models.PositiveIntegerField(default=0, verbose_name="ID del Titular")
+    rubro = models.CharField(max_length=20, choices=RUBROS, default='disponible', verbose_name="Rubro")
+
+    # Saldos acumulados, actualizados en la misma transacción que los apuntes
+    saldo = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Saldo")
+    entradas = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Entradas")
+    salidas = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Salidas")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+
+    class Meta:
+        verbose_name = 'Cuenta Contable'
+        verbose_name_plural = 'Cuentas Contables'
+        ordering = ['tipo', 'object_id', 'rubro']
+        unique_together = ['tipo', 'object_id', 'rubro']
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.object_id} ({self.get_rubro_display()}): {self.saldo}"
+
+
+class AsientoContable(models.Model):
+    """Movimiento de dinero; sus apuntes siempre suman cero"""
+    TIPOS_ASIENTO = [
+        ('factura_emitida', 'Factura Emitida'),
+        ('factura_anulada', 'Factura Anulada'),
+        ('pago_recibido', 'Pago Recibido'),
+        ('cuota_pagada', 'Cuota Pagada'),
+        ('pago_turno', 'Pago de Turno'),
+        ('reembolso', 'Reembolso'),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=TIPOS_ASIENTO, verbose_name="Tipo")
+    # Evita contabilizar dos veces el mismo hecho (p. ej. "pago:factura:15")
+    clave = models.CharField(max_length=100, unique=True, verbose_name="Clave")
+    descripcion = models.CharField(max_length=255, blank=True, default='', verbose_name="Descripción")
+
+    # Origen del movimiento (Factura, TurnoSan...)
+    content_type = models.ForeignKey(ContentType, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Tipo de Origen")
+    object_id = models.PositiveIntegerField(null=True, blank=True, verbose_name="ID del Origen")
+    origen = GenericForeignKey('content_type', 'object_id')
+
+    fecha = models.DateTimeField(auto_now_add=True, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = 'Asiento Contable'
+        verbose_name_plural = 'Asientos Contables'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['tipo', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.clave}"
+
+
+class ApunteContable(models.Model):
+    """Línea de un asiento; nunca se modifica ni se borra"""
+    asiento = models.ForeignKey(AsientoContable, on_delete=models.PROTECT, related_name='apuntes', verbose_name="Asiento")
+    cuenta = models.ForeignKey(CuentaContable, on_delete=models.PROTECT, related_name='apuntes', verbose_name="Cuenta")
+    monto = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Monto")
+    saldo_resultante = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Saldo Resultante")
+    fecha = models.DateTimeField(auto_now_add=True, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = 'Apunte Contable'
+        verbose_name_plural = 'Apuntes Contables'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['cuenta', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.cuenta} {self.monto:+}"
+
+
+# ---------------------
+# MÉTRICAS DIARIAS (TABLA DE AGREGADOS)
+# ---------------------
+class MetricaDiaria(models.Model):
+    """
+    Variación neta diaria de una métrica por segmento.
+
+    Cada fila guarda cuánto cambió ese día el número de filas (y su monto)
+    de un modelo en un segmento: una factura confirmada suma 1 a
+    ``facturas/confirmado`` y resta 1 a ``facturas/pendiente``. El total
+    actual es la suma de todos los días, así los dashboards leen unas pocas
+    filas por día en vez de contar las tablas completas.
+    """
+    fecha = models.DateField(verbose_name="Fecha")
+    metrica = models.CharField(max_length=30, verbose_name="Métrica")
+    segmento = models.CharField(max_length=30, blank=True, default='', verbose_name="Segmento")
+    cantidad = models.BigIntegerField(default=0, verbose_name="Cantidad")
+    monto = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name="Monto")
+
+    class Meta:
+        verbose_name = 'Métrica Diaria'
+        verbose_name_plural = 'Métricas Diarias'
+        ordering = ['-fecha', 'metrica', 'segmento']
+        unique_together = ['fecha', 'metrica', 'segmento']
+
+    def __str__(self):
+        return f"{self.fecha} {self.metrica}/{self.segmento or '-'}: {self.cantidad}"
+
+
+class VentaHoraria(models.Model):
+    """
+    Histograma por hora de las ventas de cada rifa y san.
+
+    Una fila por (hora, rifa o san, método de pago) con los tickets o
+    inscripciones creados, las facturas emitidas y las pagadas. La analítica
+    de organizadores lee estas filas en vez de recorrer tickets y
+    participaciones; ver ``sanes.analitica``.
+    """
+    TIPOS = [
+        ('rifa', 'Rifa'),
+        ('san', 'San'),
+    ]
+
+    hora = models.DateTimeField(verbose_name="Hora")
+    tipo = models.CharField(max_length=10, choices=TIPOS, verbose_name="Tipo")
+    objeto_id = models.PositiveIntegerField(verbose_name="ID de la Rifa o San")
+    organizador = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='+', verbose_name="Organizador"
+    )
+    metodo_pago = models.CharField(max_length=20, blank=True, default='', verbose_name="Método de Pago")
+    unidades = models.PositiveIntegerField(default=0, verbose_name="Tickets o Inscripciones")
+    facturas = models.PositiveIntegerField(default=0, verbose_name="Facturas Emitidas")
+    facturas_pagadas = models.PositiveIntegerField(default=0, verbose_name="Facturas Pagadas")
+    monto_pagado = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Monto Pagado")
+
+    class Meta:
+        verbose_name = 'Venta por Hora'
+        verbose_name_plural = 'Ventas por Hora'
+        ordering = ['-hora']
+        unique_together = ['hora', 'tipo', 'objeto_id', 'metodo_pago']
+        indexes = [
+            models.Index(fields=['organizador', 'hora'], name='venta_horaria_org_hora_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.hora:%Y-%m-%d %H}h {self.tipo} {self.objeto_id}: {self.unidades}"
+
+
+# ---------------------
+# ÍNDICE DE BÚSQUEDA
+# ---------------------
+class TerminoBusqueda(models.Model):
+    """
+    Índice invertido de la búsqueda de rifas y sanes.
+
+    Una fila por (rifa o san, término normalizado) con el peso del término
+    según el campo y las veces que aparece; se mantiene al guardar y borrar
+    rifas y sanes, ver ``sanes.busqueda``.
+    """
+    TIPOS = [
+        ('rifa', 'Rifa'),
+        ('san', 'San'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPOS, verbose_name="Tipo")
+    objeto_id = models.PositiveIntegerField(verbose_name="ID de la Rifa o San")
+    termino = models.CharField(max_length=40, verbose_name="Término")
+    peso = models.PositiveIntegerField(default=1, verbose_name="Peso")
+
+    class Meta:
+        verbose_name = 'Término de Búsqueda'
+        verbose_name_plural = 'Términos de Búsqueda'
+        unique_together = ['tipo', 'objeto_id', 'termino']
+        indexes = [
+            models.Index(fields=['tipo', 'termino'], name='termino_busqueda_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.objeto_id}: {self.termino} ({self.peso})"
+
+
+# ---------------------
+# REGISTRO DE CAMBIOS (SINCRONIZACIÓN)
+# ---------------------
+class RegistroCambio(models.Model):
+    """
+    Registro de cambios para la sincronización incremental de la app.
+
+    Una fila por alta, cambio o baja de una rifa, san, ticket, participación,
+    cupo, factura o notificación, escrita al confirmar la transacción del
+    cambio; el ID es el token de sincronización. ``usuario`` es el dueño de
+    los objetos privados (vacío en rifas y sanes). Ver ``sanes.sincronizacion``.
+    """
+    TIPOS = [
+        ('rifa', 'Rifa'),
+        ('san', 'San'),
+        ('ticket', 'Ticket'),
+        ('participacion', 'Participación'),
+        ('cupo', 'Cupo'),
+        ('factura', 'Factura'),
+        ('notificacion', 'Notificación'),
+    ]
+    ACCIONES = [
+        ('crear', 'Crear'),
+        ('actualizar', 'Actualizar'),
+        ('eliminar', 'Eliminar'),
+    ]
+
+    tipo = models.CharField(max_length=15, choices=TIPOS, verbose_name="Tipo")
+    objeto_id = models.PositiveBigIntegerField(verbose_name="ID del Objeto")
+    accion = models.CharField(max_length=10, choices=ACCIONES, verbose_name="Acción")
+    usuario = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True,
+        db_constraint=False,
+        verbose_name="Usuario"
+    )
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = 'Registro de Cambio'
+        verbose_name_plural = 'Registro de Cambios'
+        indexes = [
+            models.Index(fields=['usuario', 'id'], name='registro_cambio_usuario_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.accion} {self.tipo} {self.objeto_id}"
+
+
+# ---------------------
+# CIERRES DIARIOS CONTABLES
+# ---------------------
+class CierreDiario(models.Model):
+    """
+    Manifiesto de un cierre diario: la foto consistente de facturas, pagos,
+    cupos y tickets exportada a archivos JSONL comprimidos (ver sanes.cierres).
+
+    Un cierre incremental solo exporta las filas modificadas desde el cierre
+    anterior (``desde``); ``hasta`` es el momento de la foto.
+    """
+    ESTADOS = [
+        ('procesando', 'Procesando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+
+    fecha = models.DateField(unique=True, verbose_name="Fecha del Cierre")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='procesando', verbose_name="Estado")
+    anterior = models.ForeignKey(
+        'self', on_delete=models.PROTECT, null=True, blank=True, related_name='siguientes',
+        verbose_name="Cierre Anterior"
+    )
+    incremental = models.BooleanField(default=False, verbose_name="Incremental")
+    desde = models.DateTimeField(null=True, blank=True, verbose_name="Cambios Desde")
+    hasta = models.DateTimeField(null=True, blank=True, verbose_name="Foto Tomada")
+    manifiesto = models.FileField(upload_to='cierres/', null=True, blank=True, verbose_name="Manifiesto")
+    error = models.TextField(blank=True, default='')
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    fecha_finalizacion = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Finalización")
+
+    class Meta:
+        verbose_name = 'Cierre Diario'
+        verbose_name_plural = 'Cierres Diarios'
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"Cierre {self.fecha} ({'incremental' if self.incremental else 'completo'})"
+
+
+class ArchivoCierre(models.Model):
+    """Un archivo exportado por un cierre, con su número de filas y su checksum"""
+    cierre = models.ForeignKey(CierreDiario, on_delete=models.CASCADE, related_name='archivos', verbose_name="Cierre")
+    tabla = models.CharField(max_length=30, verbose_name="Tabla")
+    archivo = models.FileField(upload_to='cierres/', verbose_name="Archivo")
+    filas = models.PositiveIntegerField(default=0, verbose_name="Filas")
+    # SHA-256 del JSONL sin comprimir y tamaño del archivo comprimido
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+    bytes = models.PositiveBigIntegerField(default=0, verbose_name="Tamaño (bytes)")
+
+    class Meta:
+        verbose_name = 'Archivo de Cierre'
+        verbose_name_plural = 'Archivos de Cierre'
+        unique_together = ['cierre', 'tabla']
+
+    def __str__(self):
+        return f"{self.cierre.fecha} {self.tabla}: {self.filas} filas"
+
+
+# ---------------------
+# CANCELACIONES MASIVAS Y REEMBOLSOS
+# ---------------------
+class CancelacionMasiva(models.Model):
+    """Trabajo de cancelación de una rifa o san completo, reanudable"""
+    ESTADOS_CANCELACION = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En Proceso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    FASES = [
+        ('facturas', 'Facturas y Reembolsos'),
+        ('tickets', 'Tickets'),
+        ('cupos', 'Cupos'),
+        ('participaciones', 'Participaciones'),
+        ('notificaciones', 'Notificaciones'),
+        ('fin', 'Fin'),
+    ]
+
+    # Rifa o San cancelado
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, verbose_name="Tipo de Contenido")
+    object_id = models.PositiveIntegerField(verbose_name="ID del Objeto")
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    motivo = models.CharField(max_length=255, verbose_name="Motivo")
+    solicitado_por = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='cancelaciones_solicitadas',
+        verbose_name="Solicitado por"
+    )
+
+    # Progreso: fase actual y último ID procesado dentro de la fase
+    estado = models.CharField(max_length=20, choices=ESTADOS_CANCELACION, default='pendiente', verbose_name="Estado")
+    fase = models.CharField(max_length=20, choices=FASES, default='facturas', verbose_name="Fase")
+    ultimo_id = models.PositiveBigIntegerField(default=0, verbose_name="Último ID Procesado")
+
+    facturas_procesadas = models.PositiveIntegerField(default=0, verbose_name="Facturas Procesadas")
+    reembolsos_creados = models.PositiveIntegerField(default=0, verbose_name="Reembolsos Creados")
+    monto_reembolsado = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Monto Reembolsado")
+    usuarios_notificados = models.PositiveIntegerField(default=0, verbose_name="Usuarios Notificados")
+    error = models.TextField(blank=True, default='', verbose_name="Error")
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Inicio")
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Finalización")
+
+    class Meta:
+        verbose_name = 'Cancelación Masiva'
+        verbose_name_plural = 'Cancelaciones Masivas'
+        ordering = ['-fecha_creacion']
+        unique_together = ['content_type', 'object_id']
+
+    def __str__(self):
+        return f"Cancelación de {self.content_type.model} {self.object_id} - {self.get_estado_display()}"
+
+
+class Reembolso(models.Model):
+    """Devolución del importe de una factura pagada"""
+    ESTADOS_REEMBOLSO = [
+        ('pendiente', 'Pendiente'),
+        ('procesado', 'Procesado'),
+    ]
+
+    # Una factura solo se reembolsa una vez
+    factura = models.OneToOneField(Factura, on_delete=models.CASCADE, related_name='reembolso', verbose_name="Factura")
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='reembolsos', verbose_name="Usuario")
+    cancelacion = models.ForeignKey(
+        CancelacionMasiva,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reembolsos',
+        verbose_name="Cancelación"
+    )
+    monto = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Monto")
+    estado = models.CharField(max_length=20, choices=ESTADOS_REEMBOLSO, default='pendiente', verbose_name="Estado")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+
+    class Meta:
+        verbose_name = 'Reembolso'
+        verbose_name_plural = 'Reembolsos'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['cancelacion', 'usuario']),
+        ]
+
+    def __str__(self):
+        return f"Reembolso {self.monto} - {self.factura.codigo}"
+
+
 # ---------------------
 # MODELO DE NOTIFICACIONES MEJORADO
 # ---------------------
@@ -1457,6 +2191,16 @@ class Reporte(models.Model):
         ('san', 'San'),
         ('usuario', 'Usuario'),
         ('finanzas', 'Finanzas'),
+        ('facturas', 'Facturas'),
+        ('logs', 'Logs del Sistema'),
+        ('cohortes', 'Cohortes y Retención'),
+    ]
+
+    ESTADOS_REPORTE = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
     ]
 
     administrador = models.ForeignKey(
@@ -1471,6 +2215,28 @@ class Reporte(models.Model):
     archivo = models.FileField(upload_to="reportes/", null=True, blank=True)
     fecha_generacion = models.DateTimeField(auto_now_add=True)
 
+    # Generación en segundo plano (procesar_reportes)
+    estado = models.CharField(max_length=20, choices=ESTADOS_REPORTE, default='listo')
+    parametros = models.JSONField(default=dict, blank=True)
+    # Hash de tipo + parámetros: identifica reportes reutilizables
+    clave = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # La misma clave mientras el reporte es el vigente o el que está en curso;
+    # el índice único hace que peticiones iguales compartan un solo trabajo
+    clave_activa = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    # Versiones de las tablas consultadas (metricas.versiones) al pedirlo
+    versiones = models.JSONField(default=dict, blank=True)
+    progreso = models.PositiveSmallIntegerField(default=0)
+    # Datos de los reportes que se muestran en pantalla (formato 'datos')
+    resultado = models.JSONField(null=True, blank=True)
+    filas = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    fecha_finalizacion = models.DateTimeField(null=True, blank=True)
+    fecha_expiracion = models.DateTimeField(null=True, blank=True)
+    # Último latido del worker que lo genera; sin latidos se da por abandonado
+    fecha_latido = models.DateTimeField(null=True, blank=True)
+    # Veces que un worker lo tomó (sube al retomar uno abandonado)
+    intentos = models.PositiveSmallIntegerField(default=0)
+
     class Meta:
         ordering = ['-fecha_generacion']
 
@@ -1635,10 +2401,14 @@ class TurnoSan(models.Model):
     def cumplir_turno(self):
         """Marca el turno como cumplido"""
         if self.estado == 'activo':
+            from . import contabilidad
+
             self.estado = 'cumplido'
             self.cumplido = True
             self.fecha_cumplimiento = timezone.now()
-            self.save()
+            with transaction.atomic():
+                self.save()
+                contabilidad.registrar_pago_turno(self)
             
             # Crear log del sistema
             SystemLog.log_action(
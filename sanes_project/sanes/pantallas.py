@@ -0,0 +1,146 @@
+# sanes/pantallas.py
+"""
+Datos de las pantallas de inicio y perfil de la app en una sola respuesta.
+
+La app pedía rifas, sanes, notificaciones, participaciones, facturas,
+tickets y perfil en siete peticiones seguidas. ``datos`` arma todas las
+secciones pedidas de una vez: cada sección es una sola consulta (con
+select_related) y su resultado se guarda en caché, compartido entre todos
+los usuarios para las secciones públicas y por usuario para las demás.
+
+Cada sección tiene una versión corta derivada de las versiones de tabla de
+``metricas`` que consulta. El cliente devuelve las versiones que ya tiene y
+solo recibe las secciones que cambiaron desde entonces. De los usuarios solo
+cuenta ``metricas.USUARIOS_PUBLICOS``; el perfil no depende de ninguna tabla:
+se arma con el usuario de la petición, ya cargado, y su versión sale de los
+propios datos, así el inicio de sesión de otro usuario no lo invalida.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from . import metricas
+from .models import (
+    Rifa, San, Ticket, ParticipacionSan, Cupo, Factura, NotificacionMejorada
+)
+from .serializers import (
+    CustomUserDetailSerializer, FacturaSerializer, ParticipacionSanSerializer, RifaSerializer, SanSerializer
+)
+
+
+# Segundos que se guarda una sección en caché si nada la invalida
+CACHE_SECCION = 5 * 60
+
+# Filas de cada listado
+LIMITE = 20
+
+# Columnas de las notificaciones y tickets, que se envían sin serializer
+CAMPOS_NOTIFICACION = ('id', 'tipo', 'titulo', 'mensaje', 'prioridad', 'leido', 'fecha_creacion', 'fecha_lectura')
+CAMPOS_TICKET = ('id', 'codigo', 'numero', 'rifa_id', 'rifa__titulo', 'activo', 'fecha_compra')
+
+
+def _rifas(usuario):
+    rifas = Rifa.objects.filter(estado='activa').select_related('organizador', 'ganador').order_by('-created_at')
+    return RifaSerializer(rifas[:LIMITE], many=True).data
+
+
+def _sanes(usuario):
+    sanes = San.objects.filter(estado='activo').select_related('organizador').order_by('-created_at')
+    return SanSerializer(sanes[:LIMITE], many=True).data
+
+
+def _notificaciones(usuario):
+    return list(
+        NotificacionMejorada.objects.filter(usuario=usuario).order_by('-fecha_creacion')
+        .values(*CAMPOS_NOTIFICACION)[:LIMITE]
+    )
+
+
+def _participaciones(usuario):
+    participaciones = (
+        ParticipacionSan.objects.filter(usuario=usuario)
+        .select_related('san__organizador', 'usuario').order_by('-fecha_inscripcion')
+    )
+    return ParticipacionSanSerializer(participaciones[:LIMITE], many=True).data
+
+
+def _facturas(usuario):
+    facturas = Factura.objects.filter(usuario=usuario).select_related('usuario', 'content_type').order_by('-fecha_emision')
+    return FacturaSerializer(facturas[:LIMITE], many=True).data
+
+
+def _tickets(usuario):
+    return list(
+        Ticket.objects.filter(usuario=usuario).order_by('-fecha_compra')
+        .values(*CAMPOS_TICKET)[:LIMITE * 5]
+    )
+
+
+def _perfil(usuario):
+    return CustomUserDetailSerializer(usuario).data
+
+
+# Sección -> (función, tablas que consulta, es por usuario); sin tablas no se guarda en caché
+SECCIONES = {
+    'rifas': (_rifas, [Rifa, metricas.USUARIOS_PUBLICOS], False),
+    'sanes': (_sanes, [San, metricas.USUARIOS_PUBLICOS], False),
+    'notificaciones': (_notificaciones, [NotificacionMejorada], True),
+    'participaciones': (_participaciones, [ParticipacionSan, San, Cupo, metricas.USUARIOS_PUBLICOS], True),
+    'facturas': (_facturas, [Factura], True),
+    'tickets': (_tickets, [Ticket, Rifa], True),
+    'perfil': (_perfil, [], True),
+}
+
+
+def leer_versiones(texto):
+    """'rifas.ab12,sanes.cd34' -> {'rifas': 'ab12', 'sanes': 'cd34'}"""
+    versiones = {}
+    for parte in (texto or '').split(','):
+        seccion, _, version = parte.partition('.')
+        if seccion in SECCIONES and version:
+            versiones[seccion] = version
+    return versiones
+
+
+def datos(usuario, secciones=None, conocidas=None):
+    """
+    Secciones pedidas que cambiaron respecto a ``conocidas`` ({sección: versión}).
+
+    Returns:
+        dict con ``versiones`` (todas las pedidas) y ``secciones`` (solo las
+        que el cliente no tiene al día).
+    """
+    secciones = [s for s in (secciones or SECCIONES) if s in SECCIONES]
+    conocidas = conocidas or {}
+
+    # Todas las versiones de tabla en una sola lectura de la caché
+    tablas = metricas.versiones(*{modelo for s in secciones for modelo in SECCIONES[s][1]})
+    versiones, claves, resultado = {}, {}, {}
+    for seccion in secciones:
+        funcion, modelos, por_usuario = SECCIONES[seccion]
+        if modelos:
+            firma = repr([tablas[metricas.nombre_version(modelo)] for modelo in modelos])
+        else:
+            propios = funcion(usuario)
+            firma = json.dumps(propios, sort_keys=True, default=str)
+        if por_usuario:
+            firma += f':{usuario.pk}'
+        versiones[seccion] = hashlib.sha1(f'{seccion}:{firma}'.encode()).hexdigest()[:12]
+        if conocidas.get(seccion) == versiones[seccion]:
+            continue
+        if modelos:
+            claves[seccion] = f'pantalla:{seccion}:{usuario.pk if por_usuario else ""}:{versiones[seccion]}'
+        else:
+            resultado[seccion] = propios
+
+    guardadas = cache.get_many(list(claves.values()))
+    nuevas = {}
+    for seccion, clave in claves.items():
+        if clave in guardadas:
+            resultado[seccion] = guardadas[clave]
+        else:
+            resultado[seccion] = nuevas[clave] = SECCIONES[seccion][0](usuario)
+    if nuevas:
+        cache.set_many(nuevas, CACHE_SECCION)
+    return {'versiones': versiones, 'secciones': resultado}
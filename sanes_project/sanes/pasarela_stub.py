@@ -0,0 +1,81 @@
+# sanes/pasarela_stub.py
+"""
+Pasarela de pago local para desarrollo y benchmarks.
+
+Expone ``POST /<pasarela>/cobros`` igual que las pasarelas reales y simula
+latencia, rechazos de pago y caídas del servicio.
+
+Como las reales, respeta ``Idempotency-Key``: un cobro repetido con la misma
+clave devuelve el resultado del primero sin volver a cobrar, aunque el
+cliente haya dejado de esperarlo por timeout. Una respuesta 503 no se guarda
+(el cobro no llegó a hacerse) y el reintento se procesa de nuevo.
+"""
+import asyncio
+import random
+import uuid
+
+from aiohttp import web
+
+
+async def _procesar(config, pasarela, datos):
+    """Simula el cobro y devuelve (status, cuerpo)"""
+    latencia = random.gauss(config['latencia_ms'], config['variacion_ms'])
+    await asyncio.sleep(max(0.0, latencia) / 1000)
+
+    if random.random() < config['tasa_error']:
+        return 503, {'error': 'Servicio no disponible'}
+
+    if random.random() < config['tasa_rechazo']:
+        return 402, {
+            'estado': 'rechazado',
+            'motivo': 'Fondos insuficientes',
+            'codigo': datos.get('codigo'),
+        }
+
+    return 200, {
+        'estado': 'aprobado',
+        'referencia': f"{pasarela.upper()}-{uuid.uuid4().hex[:12].upper()}",
+        'codigo': datos.get('codigo'),
+    }
+
+
+async def cobrar(request):
+    """Simula el cobro de un pago"""
+    config = request.app['config']
+    cobros = request.app['cobros']
+    pasarela = request.match_info['pasarela']
+
+    try:
+        datos = await request.json()
+    except ValueError:
+        return web.json_response({'error': 'JSON inválido'}, status=400)
+
+    clave = request.headers.get('Idempotency-Key')
+    if not clave:
+        status, cuerpo = await _procesar(config, pasarela, datos)
+        return web.json_response(cuerpo, status=status)
+
+    # El cobro corre en su propia tarea: termina aunque el cliente se vaya, y
+    # los reintentos con la misma clave esperan a esa tarea en vez de cobrar
+    tarea = cobros.get((pasarela, clave))
+    if tarea is None:
+        tarea = cobros[(pasarela, clave)] = asyncio.ensure_future(_procesar(config, pasarela, datos))
+    status, cuerpo = await asyncio.shield(tarea)
+    if status >= 500 and cobros.get((pasarela, clave)) is tarea:
+        del cobros[(pasarela, clave)]
+    return web.json_response(cuerpo, status=status)
+
+
+def crear_app(latencia_ms=150, variacion_ms=50, tasa_rechazo=0.1, tasa_error=0.0):
+    """Crea la aplicación aiohttp de la pasarela simulada"""
+    app = web.Application()
+    app['config'] = {
+        'latencia_ms': latencia_ms,
+        'variacion_ms': variacion_ms,
+        'tasa_rechazo': tasa_rechazo,
+        'tasa_error': tasa_error,
+    }
+    # (pasarela, Idempotency-Key) -> tarea con el resultado del cobro
+    app['cobros'] = {}
+    app.router.add_post('/{pasarela}/cobros', cobrar)
+    return app
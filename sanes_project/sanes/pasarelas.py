@@ -0,0 +1,370 @@
+# sanes/pasarelas.py
+"""
+Capa de pasarelas de pago.
+
+Cada método de pago electrónico (PayPal, Stripe, Nequi...) se configura en
+``settings.PASARELAS_PAGO`` y se atiende con un cliente aiohttp que mantiene
+un pool de conexiones propio, un timeout por pasarela y un circuit breaker.
+Los cobros de un lote se envían concurrentemente desde un único proceso.
+
+Desde código síncrono (vistas de checkout, procesar_pagos) los cobros corren
+en un bucle asyncio de larga vida, uno por proceso en un hilo propio, con una
+``ClientSession`` por pasarela que se reutiliza entre peticiones: las
+conexiones abiertas y la caché de DNS sirven a todos los checkouts del worker.
+"""
+import asyncio
+import atexit
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+import aiohttp
+from django.conf import settings
+
+
+# ---------------------
+# ERRORES Y RESULTADOS
+# ---------------------
+class PasarelaError(Exception):
+    """Error de configuración o de comunicación con una pasarela"""
+
+
+# Estados posibles de un cobro:
+# - exitoso: la pasarela aprobó el cobro
+# - fallido: la pasarela rechazó el cobro (fondos, datos inválidos...)
+# - no_disponible: la pasarela no respondió a tiempo o el circuito está abierto;
+#   el pago queda pendiente para que el worker lo reintente
+COBRO_EXITOSO = 'exitoso'
+COBRO_FALLIDO = 'fallido'
+COBRO_NO_DISPONIBLE = 'no_disponible'
+
+
+def _resultado(estado, referencia=None, latencia_ms=0, error=None):
+    return {
+        'estado': estado,
+        'referencia': referencia,
+        'latencia_ms': latencia_ms,
+        'error': error,
+    }
+
+
+# ---------------------
+# CIRCUIT BREAKER
+# ---------------------
+class CircuitBreaker:
+    """Deja de llamar a una pasarela tras varios fallos consecutivos"""
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, umbral_fallos=5, tiempo_reapertura=30.0):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_reapertura = tiempo_reapertura
+        self._estado = self.CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if (self._estado == self.ABIERTO and
+                time.monotonic() - self._abierto_desde >= self.tiempo_reapertura):
+            return self.SEMIABIERTO
+        return self._estado
+
+    def permitir(self):
+        """Indica si se puede enviar una llamada a la pasarela"""
+        with self._lock:
+            estado = self.estado
+            if estado == self.CERRADO:
+                return True
+            if estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                # Solo una llamada de prueba mientras el circuito está semiabierto
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            self._estado = self.CERRADO
+            self._fallos = 0
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._prueba_en_curso or self._fallos >= self.umbral_fallos:
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+            self._prueba_en_curso = False
+
+
+# ---------------------
+# PASARELA HTTP
+# ---------------------
+class PasarelaHTTP:
+    """Cliente asíncrono de una pasarela que expone ``POST <url>/cobros``"""
+
+    def __init__(self, nombre, url, timeout=3.0, max_conexiones=100,
+                 umbral_fallos=5, tiempo_reapertura=30.0, secreto=''):
+        self.nombre = nombre
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.max_conexiones = max_conexiones
+        self.secreto = secreto
+        self.breaker = CircuitBreaker(umbral_fallos, tiempo_reapertura)
+
+    def crear_sesion(self):
+        """Crea una sesión con su propio pool de conexiones"""
+        conector = aiohttp.TCPConnector(
+            limit=self.max_conexiones,
+            limit_per_host=self.max_conexiones,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(
+            connector=conector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def cobrar(self, sesion, datos):
+        """Envía un cobro y traduce la respuesta a un resultado"""
+        if not self.breaker.permitir():
+            return _resultado(COBRO_NO_DISPONIBLE, error=f'Circuito abierto para {self.nombre}')
+
+        inicio = time.monotonic()
+        try:
+            async with sesion.post(
+                f'{self.url}/cobros',
+                json=datos,
+                headers={'Idempotency-Key': datos['codigo']},
+            ) as respuesta:
+                cuerpo = await respuesta.json(content_type=None)
+                status = respuesta.status
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as exc:
+            self.breaker.registrar_fallo()
+            return _resultado(
+                COBRO_NO_DISPONIBLE,
+                latencia_ms=int((time.monotonic() - inicio) * 1000),
+                error=f'{type(exc).__name__}: {exc}' if str(exc) else type(exc).__name__,
+            )
+
+        latencia_ms = int((time.monotonic() - inicio) * 1000)
+        if status >= 500:
+            self.breaker.registrar_fallo()
+            return _resultado(COBRO_NO_DISPONIBLE, latencia_ms=latencia_ms, error=f'HTTP {status}')
+
+        self.breaker.registrar_exito()
+        cuerpo = cuerpo if isinstance(cuerpo, dict) else {}
+        estado = COBRO_EXITOSO if cuerpo.get('estado') == 'aprobado' else COBRO_FALLIDO
+        return _resultado(
+            estado,
+            referencia=cuerpo.get('referencia'),
+            latencia_ms=latencia_ms,
+            error=None if estado == COBRO_EXITOSO else cuerpo.get('motivo', f'HTTP {status}'),
+        )
+
+
+# ---------------------
+# REGISTRO DE PASARELAS
+# ---------------------
+# Una instancia por proceso y pasarela, para que el circuit breaker
+# recuerde los fallos entre peticiones del mismo worker.
+_pasarelas = {}
+_pasarelas_lock = threading.Lock()
+
+
+def metodos_electronicos():
+    """Métodos de pago que se cobran a través de una pasarela"""
+    return list(getattr(settings, 'PASARELAS_PAGO', {}).keys())
+
+
+def es_pago_electronico(metodo_pago):
+    """Verifica si el método de pago tiene una pasarela configurada"""
+    return metodo_pago in getattr(settings, 'PASARELAS_PAGO', {})
+
+
+def obtener_pasarela(metodo_pago):
+    """Retorna la pasarela configurada para el método de pago"""
+    configuracion = getattr(settings, 'PASARELAS_PAGO', {}).get(metodo_pago)
+    if configuracion is None:
+        raise PasarelaError(f'No hay pasarela configurada para "{metodo_pago}"')
+
+    with _pasarelas_lock:
+        if metodo_pago not in _pasarelas:
+            _pasarelas[metodo_pago] = PasarelaHTTP(
+                metodo_pago,
+                configuracion['URL'],
+                timeout=configuracion.get('TIMEOUT', 3.0),
+                max_conexiones=configuracion.get('MAX_CONEXIONES', 100),
+                umbral_fallos=configuracion.get('UMBRAL_FALLOS', 5),
+                tiempo_reapertura=configuracion.get('REAPERTURA', 30.0),
+                secreto=configuracion.get('SECRETO', ''),
+            )
+        return _pasarelas[metodo_pago]
+
+
+# ---------------------
+# BUCLE DEL PROCESO
+# ---------------------
+_bucle = None
+_bucle_pid = None
+_bucle_lock = threading.Lock()
+
+# (pasarela, sesión abierta) por nombre; solo se usa desde el hilo del bucle
+_sesiones = {}
+
+
+def _bucle_del_proceso():
+    """Bucle asyncio del proceso; se crea al primer cobro (y de nuevo tras un fork)"""
+    global _bucle, _bucle_pid
+    with _bucle_lock:
+        if _bucle is None or _bucle_pid != os.getpid():
+            # Tras un fork el hilo del bucle no existe en el hijo: empezar de cero
+            _sesiones.clear()
+            _bucle = asyncio.new_event_loop()
+            _bucle_pid = os.getpid()
+            threading.Thread(target=_bucle.run_forever, name='pasarelas', daemon=True).start()
+            atexit.register(_cerrar_bucle, _bucle)
+        return _bucle
+
+
+def _cerrar_bucle(bucle):
+    """Cierra las sesiones abiertas y detiene el bucle al salir del proceso"""
+    if bucle is not _bucle or _bucle_pid != os.getpid():
+        return
+
+    async def cerrar():
+        for _, sesion in _sesiones.values():
+            await sesion.close()
+
+    try:
+        asyncio.run_coroutine_threadsafe(cerrar(), bucle).result(timeout=5)
+    except Exception:
+        pass
+    bucle.call_soon_threadsafe(bucle.stop)
+
+
+async def _sesion(pasarela):
+    """Sesión abierta de ``pasarela``; otra instancia con el mismo nombre (otra configuración) abre una nueva"""
+    duena, sesion = _sesiones.get(pasarela.nombre, (None, None))
+    if duena is not pasarela or sesion.closed:
+        if sesion is not None:
+            await sesion.close()
+        sesion = pasarela.crear_sesion()
+        _sesiones[pasarela.nombre] = (pasarela, sesion)
+    return sesion
+
+
+async def _cobrar_con_sesiones_abiertas(solicitudes, concurrencia):
+    sesiones = {pasarela.nombre: await _sesion(pasarela) for pasarela, _ in solicitudes}
+    return await cobrar_lote_async(solicitudes, concurrencia, sesiones=sesiones)
+
+
+# ---------------------
+# COBROS
+# ---------------------
+async def cobrar_lote_async(solicitudes, concurrencia=100, sesiones=None):
+    """
+    Envía concurrentemente una lista de cobros.
+
+    Args:
+        solicitudes: lista de tuplas (pasarela, datos) con ``PasarelaHTTP``
+        concurrencia: máximo de cobros en vuelo a la vez
+        sesiones: {nombre de pasarela: ClientSession} ya abiertas; sin ellas
+            se abre una por pasarela y se cierra al terminar
+
+    Returns:
+        Lista de resultados en el mismo orden que las solicitudes
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+    propias = {}
+    if sesiones is None:
+        for pasarela, _ in solicitudes:
+            if pasarela.nombre not in propias:
+                propias[pasarela.nombre] = pasarela.crear_sesion()
+        sesiones = propias
+
+    async def enviar(pasarela, datos):
+        async with semaforo:
+            return await pasarela.cobrar(sesiones[pasarela.nombre], datos)
+
+    try:
+        return await asyncio.gather(*(enviar(p, d) for p, d in solicitudes))
+    finally:
+        for sesion in propias.values():
+            await sesion.close()
+
+
+def cobrar_lote(solicitudes, concurrencia=100):
+    """
+    Cobra una lista de (metodo_pago, datos) desde código síncrono.
+
+    Los métodos sin pasarela configurada se devuelven como fallidos.
+    """
+    resultados = [None] * len(solicitudes)
+    pendientes = []
+    for indice, (metodo_pago, datos) in enumerate(solicitudes):
+        try:
+            pendientes.append((indice, obtener_pasarela(metodo_pago), datos))
+        except PasarelaError as exc:
+            resultados[indice] = _resultado(COBRO_FALLIDO, error=str(exc))
+
+    if pendientes:
+        respuestas = asyncio.run_coroutine_threadsafe(
+            _cobrar_con_sesiones_abiertas([(pasarela, datos) for _, pasarela, datos in pendientes], concurrencia),
+            _bucle_del_proceso(),
+        ).result()
+        for (indice, _, _), respuesta in zip(pendientes, respuestas):
+            resultados[indice] = respuesta
+    return resultados
+
+
+def cobrar(metodo_pago, datos):
+    """Cobra un único pago; pensado para las vistas de checkout"""
+    return cobrar_lote([(metodo_pago, datos)])[0]
+
+
+def procesar_pagos(pagos, concurrencia=100):
+    """
+    Procesa concurrentemente una lista de ``PagoSimulado``.
+
+    Las llamadas HTTP se hacen en paralelo y después se aplican los
+    resultados a la base de datos de forma síncrona.
+    """
+    pagos = list(pagos)
+    resultados = cobrar_lote(
+        [(pago.metodo_pago, pago.datos_cobro()) for pago in pagos],
+        concurrencia=concurrencia,
+    )
+    for pago, resultado in zip(pagos, resultados):
+        pago.aplicar_resultado(resultado)
+    return resultados
+
+
+# ---------------------
+# FIRMA DE WEBHOOKS
+# ---------------------
+def firmar(secreto, cuerpo):
+    """Firma HMAC-SHA256 (hex) del cuerpo de un webhook"""
+    return hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+
+
+def verificar_firma(pasarela, cuerpo, firma):
+    """
+    Verifica la firma de un webhook entrante.
+
+    Sin secreto configurado se rechazan todos, salvo que
+    ``settings.PASARELAS_SIN_FIRMA`` lo permita explícitamente para probar
+    con la pasarela simulada.
+    """
+    configuracion = getattr(settings, 'PASARELAS_PAGO', {}).get(pasarela)
+    if configuracion is None:
+        return False
+
+    secreto = configuracion.get('SECRETO', '')
+    if not secreto:
+        return getattr(settings, 'PASARELAS_SIN_FIRMA', False)
+    return hmac.compare_digest(firmar(secreto, cuerpo), firma or '')
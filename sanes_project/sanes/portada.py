@@ -0,0 +1,79 @@
+# sanes/portada.py
+"""
+Contexto de la página de inicio en caché.
+
+La portada es la página más pedida y sus datos (rifas y sanes activos y los
+totales) solo cambian cuando cambia alguna de sus tablas. Se guarda una sola
+copia junto con las versiones de ``metricas`` de esas tablas, que suben con
+cada post_save/post_delete (y con las UPDATE por conjuntos que llaman a
+``metricas.invalidar``); si no coinciden con las actuales, la copia está
+vencida. De los usuarios solo cuenta ``metricas.USUARIOS_PUBLICOS``: un
+inicio de sesión no vence la portada.
+
+Al vencer, un solo proceso la recalcula: el que consigue el candado con
+``cache.add`` (atómico en la caché local, de archivos y de base de datos).
+Los demás siguen sirviendo la copia vencida mientras tanto; si no hay
+ninguna, esperan un momento a que aparezca antes de calcularla ellos.
+"""
+import time
+
+from django.core.cache import cache
+
+from . import metricas
+from .models import CustomUser, Rifa, San
+
+
+MODELOS = [Rifa, San, metricas.USUARIOS_PUBLICOS]
+
+CLAVE_PORTADA = 'portada'
+CLAVE_CANDADO = 'portada:calculando'
+
+# Segundos que se conserva la copia aunque nadie la invalide (y que se puede servir vencida)
+VIGENCIA_PORTADA = 10 * 60
+
+# Segundos que dura el candado si el proceso que recalcula se cae
+DURACION_CANDADO = 30
+
+# Segundos que espera un proceso sin copia a que otro termine de calcularla
+ESPERA_SIN_COPIA = 2
+
+
+def calcular():
+    return {
+        'rifas_activas': list(Rifa.objects.filter(estado='activa').order_by('-created_at')[:6]),
+        'sanes_activos': list(San.objects.filter(estado='activo').order_by('-created_at')[:6]),
+        'total_rifas': Rifa.objects.count(),
+        'total_sanes': San.objects.count(),
+        'total_usuarios': CustomUser.objects.count(),
+    }
+
+
+def _recalcular(versiones):
+    datos = calcular()
+    cache.set(CLAVE_PORTADA, {'versiones': versiones, 'datos': datos}, VIGENCIA_PORTADA)
+    return datos
+
+
+def contexto():
+    """Datos de la portada; como mucho un proceso a la vez los recalcula"""
+    versiones = metricas.versiones(*MODELOS)
+    copia = cache.get(CLAVE_PORTADA)
+    if copia is not None and copia['versiones'] == versiones:
+        return copia['datos']
+
+    if cache.add(CLAVE_CANDADO, True, DURACION_CANDADO):
+        try:
+            return _recalcular(versiones)
+        finally:
+            cache.delete(CLAVE_CANDADO)
+
+    if copia is not None:
+        # Otro proceso la está recalculando
+        return copia['datos']
+    limite = time.monotonic() + ESPERA_SIN_COPIA
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        copia = cache.get(CLAVE_PORTADA)
+        if copia is not None:
+            return copia['datos']
+    return calcular()
@@ -0,0 +1,209 @@
+# sanes/reportes.py
+"""
+Trabajos de reportes.
+
+Todo reporte pedido desde el panel (los PDF, el CSV de logs y los datos de
+las páginas de reportes) es una fila ``Reporte`` pendiente identificada por
+su clave: el hash del tipo y los parámetros. ``clave_activa`` es única, así
+que peticiones iguales al mismo tiempo comparten un solo trabajo, y mientras
+el resultado siga vigente se sirve sin volver a calcularlo.
+
+Un reporte listo deja de estar vigente cuando cambia alguna de las tablas
+que consulta (las versiones de ``metricas.invalidar``) o, si su periodo
+incluye el día de hoy, al pasar ``VIGENCIA_PERIODO_ABIERTO`` minutos.
+
+``procesar_reportes`` reclama los pendientes con SKIP LOCKED y los genera en
+un pool de procesos; cada generador informa su avance con ``avanzar`` y el
+panel lo consulta en la vista ``estado_reporte``.
+
+Un reporte en curso lleva ``fecha_latido``: la renuevan ``avanzar`` y, con
+pool, el proceso principal del comando en cada vuelta. Si un worker muere, su
+reporte deja de latir y a los ``VENCIMIENTO_LATIDO`` segundos ``reclamar`` lo
+vuelve a tomar; tras ``MAX_INTENTOS`` queda con error y libera su clave.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metricas
+from .models import Reporte, Rifa, San, Ticket, ParticipacionSan, Cupo, Factura, SystemLog
+
+
+# Minutos que se reutiliza un reporte cuyo periodo incluye el día de hoy
+# (los periodos cerrados solo caducan si cambian sus tablas)
+VIGENCIA_PERIODO_ABIERTO = 15
+
+# Segundos sin latido tras los que un reporte en curso se da por abandonado
+VENCIMIENTO_LATIDO = 10 * 60
+
+# Segundos mínimos entre latidos que escribe ``avanzar``
+INTERVALO_LATIDO = 30
+
+# Veces que se toma un reporte antes de marcarlo con error
+MAX_INTENTOS = 3
+
+# Tablas que consulta cada tipo de reporte; cualquier cambio en ellas lo invalida
+TABLAS = {
+    'rifa': [Rifa, Ticket],
+    'san': [San, ParticipacionSan, Cupo],
+    'facturas': [Factura],
+    'finanzas': [Factura],
+    'logs': [SystemLog],
+    # Las cohortes cambian con cada compra o log; solo caducan por tiempo
+    'cohortes': [],
+}
+
+
+def clave_reporte(tipo, parametros):
+    contenido = json.dumps({'tipo': tipo, **parametros}, sort_keys=True)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def formato(reporte):
+    """Formato del reporte; las exportaciones de logs antiguas no lo guardaban"""
+    return (reporte.parametros or {}).get('formato', 'csv')
+
+
+def _generador(reporte):
+    from . import cohortes, exportaciones, reportes_pdf
+
+    if reporte.tipo == 'cohortes':
+        return cohortes.generar_reporte
+    return {
+        'csv': exportaciones.generar_reporte,
+        'pdf': reportes_pdf.generar_reporte,
+        'datos': reportes_pdf.generar_datos,
+    }[formato(reporte)]
+
+
+# ---------------------
+# SOLICITUD Y VIGENCIA
+# ---------------------
+def vigente(reporte, versiones=None):
+    """Un reporte listo sirve mientras no caduque ni cambien las tablas que consulta"""
+    if reporte.estado != 'listo' or (not reporte.archivo and reporte.resultado is None):
+        return False
+    if reporte.fecha_expiracion is not None and reporte.fecha_expiracion <= timezone.now():
+        return False
+    if versiones is None:
+        versiones = metricas.versiones(*TABLAS[reporte.tipo])
+    return reporte.versiones == versiones
+
+
+def solicitar(tipo, usuario, parametros, descripcion):
+    """
+    Devuelve el reporte de ``tipo`` con ``parametros``.
+
+    Si hay uno vigente o en curso se devuelve ese (uno abandonado lo retoma
+    procesar_reportes); si no, se crea uno pendiente.
+    """
+    clave = clave_reporte(tipo, parametros)
+    versiones = metricas.versiones(*TABLAS[tipo])
+    actual = Reporte.objects.filter(clave_activa=clave).first()
+    if actual:
+        if actual.estado in ('pendiente', 'procesando') or vigente(actual, versiones):
+            return actual
+        Reporte.objects.filter(id=actual.id, clave_activa=clave).update(clave_activa=None)
+    try:
+        with transaction.atomic():
+            return Reporte.objects.create(
+                administrador=usuario,
+                tipo=tipo,
+                descripcion=descripcion,
+                estado='pendiente',
+                parametros=parametros,
+                clave=clave,
+                clave_activa=clave,
+                versiones=versiones,
+            )
+    except IntegrityError:
+        # Una petición igual lo creó al mismo tiempo
+        return Reporte.objects.get(clave_activa=clave)
+
+
+# ---------------------
+# GENERACIÓN
+# ---------------------
+def avanzar(reporte, fraccion):
+    """Guarda el avance (de 0 a 1) cuando sube al menos un 5 %; de paso renueva el latido"""
+    progreso = min(int(fraccion * 100), 99)
+    ahora = timezone.now()
+    latido_viejo = reporte.fecha_latido is None or ahora - reporte.fecha_latido >= timedelta(seconds=INTERVALO_LATIDO)
+    if progreso >= reporte.progreso + 5 or latido_viejo:
+        reporte.progreso = max(progreso, reporte.progreso)
+        reporte.fecha_latido = ahora
+        Reporte.objects.filter(id=reporte.id).update(progreso=reporte.progreso, fecha_latido=ahora)
+
+
+def latir(ids):
+    """Renueva el latido de los reportes en curso ``ids``"""
+    Reporte.objects.filter(id__in=list(ids), estado='procesando').update(fecha_latido=timezone.now())
+
+
+def fallar(reporte_id, error):
+    """Marca el reporte con error y libera su clave para que se pueda volver a pedir"""
+    Reporte.objects.filter(id=reporte_id).update(
+        estado='error', error=error, clave_activa=None, fecha_finalizacion=timezone.now()
+    )
+
+
+def finalizar(reporte, *campos, filas=0, periodo_abierto=True, minutos=VIGENCIA_PERIODO_ABIERTO):
+    """
+    Marca el reporte como listo; ``campos`` son los que escribió el generador.
+
+    Si su periodo incluye hoy, caduca a los ``minutos``.
+    """
+    ahora = timezone.now()
+    reporte.filas = filas
+    reporte.estado = 'listo'
+    reporte.progreso = 100
+    reporte.fecha_finalizacion = ahora
+    reporte.fecha_expiracion = ahora + timedelta(minutes=minutos) if periodo_abierto else None
+    reporte.save(update_fields=[*campos, 'filas', 'estado', 'progreso', 'fecha_finalizacion', 'fecha_expiracion'])
+    return reporte
+
+
+def reclamar():
+    """Toma un reporte pendiente o abandonado; SKIP LOCKED permite varios workers"""
+    while True:
+        abandonado = timezone.now() - timedelta(seconds=VENCIMIENTO_LATIDO)
+        with transaction.atomic():
+            reporte = (
+                Reporte.objects.select_for_update(skip_locked=True)
+                .filter(Q(estado='pendiente') | Q(estado='procesando', fecha_latido__lt=abandonado))
+                .order_by('id')
+                .first()
+            )
+            if reporte is None:
+                return None
+            if reporte.intentos >= MAX_INTENTOS:
+                fallar(reporte.id, f'Abandonado tras {reporte.intentos} intentos: el worker dejó de responder')
+                continue
+            reporte.estado = 'procesando'
+            reporte.intentos += 1
+            reporte.fecha_latido = timezone.now()
+            reporte.save(update_fields=['estado', 'intentos', 'fecha_latido'])
+        return reporte
+
+
+def procesar(reporte_id):
+    """
+    Genera un reporte ya reclamado.
+
+    Corre dentro de los procesos del pool, por eso recibe el ID y devuelve
+    una tupla simple: (id, tipo, filas, segundos, error).
+    """
+    close_old_connections()
+    reporte = Reporte.objects.get(id=reporte_id)
+    inicio = time.monotonic()
+    try:
+        _generador(reporte)(reporte)
+    except Exception as exc:
+        fallar(reporte.id, str(exc))
+        return reporte.id, reporte.tipo, 0, time.monotonic() - inicio, str(exc)
+    return reporte.id, reporte.tipo, reporte.filas, time.monotonic() - inicio, None
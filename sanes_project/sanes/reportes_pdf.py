@@ -0,0 +1,370 @@
+# sanes/reportes_pdf.py
+"""
+Motor de reportes PDF (rifas, sanes, facturas y finanzas).
+
+Cada reporte se define con una función que obtiene sus datos con una sola
+consulta anotada (sin consultas por fila) y devuelve un ``Informe``; el
+motor lo dibuja con platypus, que pagina las tablas solo (repitiendo la
+cabecera en cada página) y admite gráficos.
+
+Los reportes no se generan en la petición: la vista pide un trabajo con
+``reportes.solicitar`` y lo genera ``procesar_reportes``. El PDF queda
+guardado como archivo y los datos para las páginas de reportes (formato
+``datos``) en el propio ``Reporte``; las peticiones repetidas del mismo
+reporte y periodo los reutilizan mientras sigan vigentes.
+"""
+import tempfile
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.core.files import File
+from django.db.models import Count, Sum, Q, OuterRef, Subquery, DecimalField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.legends import Legend
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+from . import reportes
+from .models import Rifa, San, Cupo, Factura, Reporte
+
+# Filas por tabla; platypus parte tablas grandes mucho más lento que varias pequeñas
+FILAS_POR_TABLA = 200
+
+COLORES_GRAFICO = [colors.HexColor(c) for c in ('#2563eb', '#16a34a', '#f59e0b', '#dc2626', '#7c3aed', '#6b7280')]
+
+
+@dataclass
+class Informe:
+    titulo: str
+    columnas: list
+    filas: list
+    resumen: list = field(default_factory=list)
+    grafico: Drawing | None = None
+    horizontal: bool = False
+
+
+# ---------------------
+# UTILIDADES
+# ---------------------
+def _dinero(valor):
+    return f'{valor or 0:,.2f}'
+
+
+def _texto(valor, largo=40):
+    valor = '' if valor is None else str(valor)
+    return valor if len(valor) <= largo else valor[:largo - 1] + '…'
+
+
+def _grafico_barras(etiquetas, series, nombres=None):
+    """Gráfico de barras verticales; ``series`` es una lista de listas de valores"""
+    dibujo = Drawing(16 * cm, 7 * cm)
+    grafico = VerticalBarChart()
+    grafico.x, grafico.y = 1.5 * cm, 1.5 * cm
+    grafico.width, grafico.height = 14 * cm, 5 * cm
+    grafico.data = [[float(v or 0) for v in serie] for serie in series]
+    grafico.categoryAxis.categoryNames = [_texto(e, 12) for e in etiquetas]
+    grafico.categoryAxis.labels.angle = 30
+    grafico.categoryAxis.labels.boxAnchor = 'ne'
+    grafico.categoryAxis.labels.fontSize = 7
+    grafico.valueAxis.valueMin = 0
+    grafico.valueAxis.labels.fontSize = 7
+    for i in range(len(series)):
+        grafico.bars[i].fillColor = COLORES_GRAFICO[i % len(COLORES_GRAFICO)]
+    dibujo.add(grafico)
+    if nombres:
+        leyenda = Legend()
+        leyenda.x, leyenda.y = 12 * cm, 6.8 * cm
+        leyenda.fontSize = 7
+        leyenda.colorNamePairs = [(COLORES_GRAFICO[i], n) for i, n in enumerate(nombres)]
+        dibujo.add(leyenda)
+    return dibujo
+
+
+def _grafico_torta(etiquetas, valores):
+    dibujo = Drawing(16 * cm, 6 * cm)
+    torta = Pie()
+    torta.x, torta.y = 5 * cm, 0.5 * cm
+    torta.width = torta.height = 5 * cm
+    torta.data = [float(v) for v in valores]
+    torta.labels = [f'{e} ({v})' for e, v in zip(etiquetas, valores)]
+    torta.slices.fontSize = 7
+    for i in range(len(valores)):
+        torta.slices[i].fillColor = COLORES_GRAFICO[i % len(COLORES_GRAFICO)]
+    dibujo.add(torta)
+    return dibujo
+
+
+# ---------------------
+# DEFINICIÓN DE REPORTES
+# ---------------------
+def informe_rifas(desde, hasta, estado=None):
+    rifas = Rifa.objects.filter(created_at__date__range=(desde, hasta))
+    if estado:
+        rifas = rifas.filter(estado=estado)
+    rifas = list(
+        rifas
+        .annotate(
+            vendidos=Count('tickets', filter=Q(tickets__activo=True)),
+            recaudado=Sum('tickets__precio_pagado', filter=Q(tickets__activo=True)),
+        )
+        .order_by('-created_at')
+        .values_list('titulo', 'organizador__username', 'estado', 'precio_ticket',
+                     'total_tickets', 'vendidos', 'recaudado', 'created_at')
+    )
+    estados = dict(Rifa.ESTADOS_RIFA)
+    filas = [
+        [_texto(titulo), _texto(organizador, 20), estados.get(estado, estado), _dinero(precio),
+         total, vendidos, f'{vendidos * 100 / total:.0f}%' if total else '-', _dinero(recaudado),
+         timezone.localtime(creada).strftime('%Y-%m-%d')]
+        for titulo, organizador, estado, precio, total, vendidos, recaudado, creada in rifas
+    ]
+    top = sorted(rifas, key=lambda r: r[5], reverse=True)[:10]
+    return Informe(
+        titulo='Reporte de Rifas',
+        columnas=['Rifa', 'Organizador', 'Estado', 'Precio', 'Tickets', 'Vendidos', '%', 'Recaudado', 'Creada'],
+        filas=filas,
+        resumen=[
+            ('Rifas', len(rifas)),
+            ('Tickets vendidos', sum(r[5] for r in rifas)),
+            ('Recaudado', _dinero(sum(r[6] or 0 for r in rifas))),
+        ],
+        grafico=_grafico_barras([r[0] for r in top], [[r[5] for r in top]]) if top else None,
+        horizontal=True,
+    )
+
+
+def informe_sanes(desde, hasta, estado=None):
+    pagado = (
+        Cupo.objects.filter(san=OuterRef('pk'), estado='pagado')
+        .values('san').annotate(total=Sum('monto_cuota')).values('total')
+    )
+    sanes = San.objects.filter(created_at__date__range=(desde, hasta))
+    if estado:
+        sanes = sanes.filter(estado=estado)
+    sanes = list(
+        sanes
+        .annotate(
+            participantes=Count('participaciones', filter=Q(participaciones__activa=True), distinct=True),
+            pagado=Subquery(pagado, output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .order_by('-created_at')
+        .values_list('nombre', 'organizador__username', 'estado', 'precio_total', 'numero_cuotas',
+                     'total_participantes', 'participantes', 'pagado', 'created_at')
+    )
+    estados = dict(San.ESTADOS_SAN)
+    filas = [
+        [_texto(nombre), _texto(organizador, 20), estados.get(estado, estado), _dinero(precio), cuotas,
+         f'{participantes}/{cupo}', _dinero(pagado), timezone.localtime(creado).strftime('%Y-%m-%d')]
+        for nombre, organizador, estado, precio, cuotas, cupo, participantes, pagado, creado in sanes
+    ]
+    top = sorted(sanes, key=lambda s: s[7] or 0, reverse=True)[:10]
+    return Informe(
+        titulo='Reporte de Sanes',
+        columnas=['San', 'Organizador', 'Estado', 'Precio total', 'Cuotas', 'Participantes', 'Pagado', 'Creado'],
+        filas=filas,
+        resumen=[
+            ('Sanes', len(sanes)),
+            ('Participantes activos', sum(s[6] for s in sanes)),
+            ('Cuotas pagadas', _dinero(sum(s[7] or 0 for s in sanes))),
+        ],
+        grafico=_grafico_barras([s[0] for s in top], [[s[7] for s in top]]) if top else None,
+        horizontal=True,
+    )
+
+
+def informe_facturas(desde, hasta):
+    facturas = list(
+        Factura.objects.filter(fecha_emision__date__range=(desde, hasta))
+        .order_by('-fecha_emision')
+        .values_list('codigo', 'usuario__username', 'concepto', 'monto_total', 'monto_pagado',
+                     'estado_pago', 'fecha_emision')
+    )
+    estados = dict(Factura.ESTADOS_PAGO)
+    por_estado = {}
+    for factura in facturas:
+        por_estado[factura[5]] = por_estado.get(factura[5], 0) + 1
+    filas = [
+        [codigo, _texto(usuario, 20), _texto(concepto), _dinero(total), _dinero(pagado),
+         estados.get(estado, estado), timezone.localtime(emision).strftime('%Y-%m-%d %H:%M')]
+        for codigo, usuario, concepto, total, pagado, estado, emision in facturas
+    ]
+    return Informe(
+        titulo='Reporte de Facturas',
+        columnas=['Código', 'Usuario', 'Concepto', 'Total', 'Pagado', 'Estado', 'Emisión'],
+        filas=filas,
+        resumen=[('Facturas', len(facturas)), ('Facturado', _dinero(sum(f[3] for f in facturas))),
+                 ('Pagado', _dinero(sum(f[4] for f in facturas)))]
+                + [(estados.get(e, e), n) for e, n in sorted(por_estado.items())],
+        grafico=_grafico_torta([estados.get(e, e) for e in por_estado], list(por_estado.values())) if por_estado else None,
+        horizontal=True,
+    )
+
+
+def informe_finanzas(desde, hasta):
+    meses = list(
+        Factura.objects.filter(fecha_emision__date__range=(desde, hasta))
+        .annotate(mes=TruncMonth('fecha_emision'))
+        .values('mes')
+        .annotate(
+            facturas=Count('id'),
+            facturado=Sum('monto_total'),
+            pagado=Sum('monto_total', filter=Q(estado_pago='confirmado')),
+            pendiente=Sum('monto_total', filter=Q(estado_pago='pendiente')),
+            anulado=Sum('monto_total', filter=Q(estado_pago__in=('cancelado', 'rechazado', 'vencido'))),
+        )
+        .order_by('mes')
+    )
+    filas = [
+        [m['mes'].strftime('%Y-%m'), m['facturas'], _dinero(m['facturado']), _dinero(m['pagado']),
+         _dinero(m['pendiente']), _dinero(m['anulado'])]
+        for m in meses
+    ]
+    return Informe(
+        titulo='Reporte Financiero',
+        columnas=['Mes', 'Facturas', 'Facturado', 'Pagado', 'Pendiente', 'Anulado'],
+        filas=filas,
+        resumen=[
+            ('Facturado', _dinero(sum(m['facturado'] or 0 for m in meses))),
+            ('Pagado', _dinero(sum(m['pagado'] or 0 for m in meses))),
+            ('Pendiente', _dinero(sum(m['pendiente'] or 0 for m in meses))),
+        ],
+        grafico=_grafico_barras(
+            [m['mes'].strftime('%Y-%m') for m in meses],
+            [[m['facturado'] for m in meses], [m['pagado'] for m in meses]],
+            nombres=['Facturado', 'Pagado'],
+        ) if meses else None,
+    )
+
+
+INFORMES = {
+    'rifa': informe_rifas,
+    'san': informe_sanes,
+    'facturas': informe_facturas,
+    'finanzas': informe_finanzas,
+}
+
+
+# ---------------------
+# RENDERIZADO
+# ---------------------
+def renderizar(informe, destino, desde, hasta):
+    """Dibuja el informe en ``destino`` (ruta o archivo binario)"""
+    estilos = getSampleStyleSheet()
+    tamano = landscape(A4) if informe.horizontal else A4
+    documento = SimpleDocTemplate(
+        destino, pagesize=tamano, title=informe.titulo,
+        leftMargin=1.5 * cm, rightMargin=1.5 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm,
+    )
+    generado = timezone.localtime().strftime('%Y-%m-%d %H:%M')
+
+    def pie_de_pagina(lienzo, doc):
+        lienzo.saveState()
+        lienzo.setFont('Helvetica', 8)
+        lienzo.drawString(doc.leftMargin, 0.8 * cm, f'{informe.titulo} · {desde} a {hasta} · generado {generado}')
+        lienzo.drawRightString(tamano[0] - doc.rightMargin, 0.8 * cm, f'Página {doc.page}')
+        lienzo.restoreState()
+
+    historia = [
+        Paragraph(informe.titulo, estilos['Title']),
+        Paragraph(f'Periodo: {desde} a {hasta}', estilos['Normal']),
+        Spacer(1, 0.4 * cm),
+    ]
+    if informe.resumen:
+        resumen = Table([[etiqueta, str(valor)] for etiqueta, valor in informe.resumen], hAlign='LEFT')
+        resumen.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+        ]))
+        historia += [resumen, Spacer(1, 0.4 * cm)]
+    if informe.grafico is not None:
+        historia += [informe.grafico, Spacer(1, 0.4 * cm)]
+
+    if not informe.filas:
+        historia.append(Paragraph('No hay datos en el periodo seleccionado.', estilos['Italic']))
+    estilo_tabla = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f2937')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')]),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ])
+    for inicio in range(0, len(informe.filas), FILAS_POR_TABLA):
+        tabla = Table([informe.columnas] + informe.filas[inicio:inicio + FILAS_POR_TABLA],
+                      repeatRows=1, hAlign='LEFT')
+        tabla.setStyle(estilo_tabla)
+        historia.append(tabla)
+
+    documento.build(historia, onFirstPage=pie_de_pagina, onLaterPages=pie_de_pagina)
+
+
+# ---------------------
+# REPORTES ALMACENADOS
+# ---------------------
+def periodo(desde=None, hasta=None):
+    """Normaliza el periodo; por defecto el mes en curso"""
+    hoy = timezone.localdate()
+    desde = date.fromisoformat(desde) if isinstance(desde, str) and desde else desde
+    hasta = date.fromisoformat(hasta) if isinstance(hasta, str) and hasta else hasta
+    desde = desde or hoy.replace(day=1)
+    hasta = min(hasta or hoy, hoy)
+    return desde, hasta
+
+
+def obtener_o_solicitar(tipo, usuario, desde=None, hasta=None, formato='pdf', estado=None):
+    """
+    Devuelve el reporte del tipo y periodo pedidos, en PDF o como ``datos``
+    para mostrarlo en pantalla.
+
+    Si ya hay uno vigente o en curso se devuelve ese; si no, se crea uno
+    pendiente para procesar_reportes.
+    """
+    desde, hasta = periodo(desde, hasta)
+    parametros = {'formato': formato, 'desde': desde.isoformat(), 'hasta': hasta.isoformat()}
+    if estado:
+        parametros['estado'] = estado
+    nombre = dict(Reporte.TIPO_REPORTE)[tipo]
+    descripcion = f'{nombre} en PDF del {desde} al {hasta}' if formato == 'pdf' else f'{nombre} del {desde} al {hasta}'
+    return reportes.solicitar(tipo, usuario, parametros, descripcion)
+
+
+def _informe(reporte):
+    desde, hasta = periodo(reporte.parametros.get('desde'), reporte.parametros.get('hasta'))
+    filtros = {'estado': reporte.parametros['estado']} if reporte.parametros.get('estado') else {}
+    informe = INFORMES[reporte.tipo](desde, hasta, **filtros)
+    reportes.avanzar(reporte, 0.4)
+    return informe, desde, hasta
+
+
+def generar_reporte(reporte):
+    """Genera y guarda el PDF de un reporte pendiente"""
+    informe, desde, hasta = _informe(reporte)
+    with tempfile.TemporaryFile() as temporal:
+        renderizar(informe, temporal, desde, hasta)
+        temporal.seek(0)
+        reporte.archivo.save(f'reporte_{reporte.tipo}_{desde}_{hasta}.pdf', File(temporal), save=False)
+    return reportes.finalizar(reporte, 'archivo', filas=len(informe.filas),
+                              periodo_abierto=hasta >= timezone.localdate())
+
+
+def generar_datos(reporte):
+    """Guarda en el reporte las tablas del informe para las páginas de reportes"""
+    informe, desde, hasta = _informe(reporte)
+    reporte.resultado = {
+        'titulo': informe.titulo,
+        'columnas': informe.columnas,
+        'filas': informe.filas,
+        'resumen': [[etiqueta, str(valor)] for etiqueta, valor in informe.resumen],
+    }
+    return reportes.finalizar(reporte, 'resultado', filas=len(informe.filas),
+                              periodo_abierto=hasta >= timezone.localdate())
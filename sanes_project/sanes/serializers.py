@@ -7,6 +7,21 @@ from .models import (
     Notificacion, Reporte, HistorialAccion, SorteoRifa, TurnoSan, Mensaje
 )
 
+# ---------------------
+# CAMPOS PARCIALES
+# ---------------------
+class CamposParcialesMixin:
+    """
+    Permite pedir solo algunos campos: ``RifaSerializer(rifas, many=True,
+    campos=['id', 'titulo'])``. Los demás no se calculan ni se envían.
+    """
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+
 # ---------------------
 # SERIALIZERS DE USUARIO
 # ---------------------
@@ -33,7 +48,7 @@ class CustomUserDetailSerializer(serializers.ModelSerializer):
 # ---------------------
 # SERIALIZERS DE RIFA
 # ---------------------
-class RifaSerializer(serializers.ModelSerializer):
+class RifaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     """Serializer para rifas"""
     organizador = CustomUserSerializer(read_only=True)
     ganador = CustomUserSerializer(read_only=True)
@@ -62,12 +77,28 @@ class RifaCreateSerializer(serializers.ModelSerializer):
 
 
 class RifaDetailSerializer(RifaSerializer):
-    """Serializer detallado para rifas con tickets"""
+    """
+    Serializer detallado para rifas con sus tickets en columnas
+    (ver ``TicketColumnasSerializer``); los compradores van una sola vez en
+    ``usuarios``.
+    """
     tickets = serializers.SerializerMethodField()
-    
+    usuarios = serializers.SerializerMethodField()
+
+    class Meta(RifaSerializer.Meta):
+        fields = RifaSerializer.Meta.fields + ['tickets', 'usuarios']
+
     def get_tickets(self, obj):
-        tickets = obj.tickets.filter(activo=True)
-        return TicketSerializer(tickets, many=True, read_only=True).data
+        return self._columnas(obj)['tickets']
+
+    def get_usuarios(self, obj):
+        return self._columnas(obj)['usuarios']
+
+    def _columnas(self, obj):
+        if getattr(self, '_tickets_de', None) != obj.pk:
+            self._tickets_de = obj.pk
+            self._tickets = TicketColumnasSerializer(obj.tickets.all()).data
+        return self._tickets
 
 
 # ---------------------
@@ -88,6 +119,28 @@ class TicketSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'codigo', 'fecha_compra']
 
 
+class TicketColumnasSerializer(serializers.BaseSerializer):
+    """
+    Tickets de una rifa en columnas: ``{"tickets": {"id": [...], "numero":
+    [...], "usuario": [...], "activo": [...]}, "usuarios": {id: {...}}}``.
+
+    La posición i de cada lista es el ticket i. Cada comprador aparece una
+    vez en ``usuarios`` aunque tenga cientos de tickets, y todo sale de dos
+    consultas sin crear instancias de modelo.
+    """
+    COLUMNAS = ['id', 'numero', 'usuario', 'activo']
+    CAMPOS_USUARIO = ['username', 'first_name', 'last_name']
+
+    def to_representation(self, tickets):
+        filas = list(tickets.order_by('numero', 'id').values_list('id', 'numero', 'usuario_id', 'activo'))
+        columnas = dict(zip(self.COLUMNAS, map(list, zip(*filas)))) if filas else {c: [] for c in self.COLUMNAS}
+        usuarios = CustomUser.objects.filter(id__in=set(columnas['usuario'])).values('id', *self.CAMPOS_USUARIO)
+        return {
+            'tickets': columnas,
+            'usuarios': {str(u.pop('id')): u for u in usuarios},
+        }
+
+
 class TicketCreateSerializer(serializers.ModelSerializer):
     """Serializer para crear tickets"""
     class Meta:
@@ -98,7 +151,7 @@ class TicketCreateSerializer(serializers.ModelSerializer):
 # ---------------------
 # SERIALIZERS DE SAN
 # ---------------------
-class SanSerializer(serializers.ModelSerializer):
+class SanSerializer(CamposParcialesMixin, serializers.ModelSerializer):
     """Serializer para sanes"""
     organizador = CustomUserSerializer(read_only=True)
     cupos_disponibles = serializers.ReadOnlyField()
@@ -0,0 +1,228 @@
+# sanes/sincronizacion.py
+"""
+Sincronización incremental de la app ("cambios desde <token>").
+
+La app recargaba las listas completas cada vez que se enfocaba una pantalla.
+Ahora cada alta, cambio o baja de rifas, sanes, tickets, participaciones,
+cupos, facturas y notificaciones deja una fila en ``RegistroCambio``, y
+``cambios`` devuelve lo ocurrido desde el último token del cliente en lotes
+acotados: el costo depende de cuántos cambios hubo, no del tamaño de las
+tablas.
+
+Los save()/delete() se registran por señal (conectadas en
+``SanesConfig.ready()``); las actualizaciones por conjuntos llaman a
+``registrar`` con el queryset antes de modificarlo (``metricas.actualizar`` y
+``metricas.borrar`` ya lo hacen).
+
+El token es el ID del registro, y los IDs se asignan al insertar, no al
+confirmar. Si los registros se escribieran dentro de la transacción que hace
+el cambio (un checkout con la llamada a la pasarela, una cancelación masiva),
+un ID bajo podría confirmarse después de que un cliente ya hubiera avanzado
+su token más allá, y ese cambio se perdería para siempre. Por eso las filas
+se leen dentro de la transacción pero se insertan al confirmarla
+(``transaction.on_commit``), cada lote en su propia sentencia corta, y solo
+se entregan registros con más de ``MARGEN`` segundos: basta con que cubra lo
+que tarda esa inserción. Un cambio revertido no deja registro; si el proceso
+muere justo entre la confirmación y la inserción el cambio no se sincroniza
+hasta que el cliente recargue todo.
+"""
+from datetime import timedelta
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import pantallas
+from .models import Rifa, San, Ticket, ParticipacionSan, Cupo, Factura, NotificacionMejorada, RegistroCambio
+from .serializers import FacturaSerializer, ParticipacionSanSerializer, RifaSerializer, SanSerializer, CupoSerializer
+
+
+# Registros que se entregan como máximo por respuesta
+LOTE = 500
+
+# Segundos que se espera antes de entregar un registro (cubre la inserción en on_commit)
+MARGEN = 5
+
+# Días que se conservan los registros; un cliente más atrasado debe recargar todo
+DIAS_CONSERVADOS = 30
+
+
+def _rifas(ids, usuario):
+    return RifaSerializer(Rifa.objects.filter(id__in=ids).select_related('organizador', 'ganador'), many=True).data
+
+
+def _sanes(ids, usuario):
+    return SanSerializer(San.objects.filter(id__in=ids).select_related('organizador'), many=True).data
+
+
+def _tickets(ids, usuario):
+    return list(Ticket.objects.filter(id__in=ids, usuario=usuario).values(*pantallas.CAMPOS_TICKET))
+
+
+def _participaciones(ids, usuario):
+    participaciones = ParticipacionSan.objects.filter(id__in=ids, usuario=usuario).select_related('san__organizador', 'usuario')
+    return ParticipacionSanSerializer(participaciones, many=True).data
+
+
+def _cupos(ids, usuario):
+    cupos = (
+        Cupo.objects.filter(id__in=ids, participacion__usuario=usuario)
+        .select_related('san__organizador', 'participacion__san__organizador', 'participacion__usuario')
+    )
+    return CupoSerializer(cupos, many=True).data
+
+
+def _facturas(ids, usuario):
+    facturas = Factura.objects.filter(id__in=ids, usuario=usuario).select_related('usuario', 'content_type')
+    return FacturaSerializer(facturas, many=True).data
+
+
+def _notificaciones(ids, usuario):
+    return list(NotificacionMejorada.objects.filter(id__in=ids, usuario=usuario).values(*pantallas.CAMPOS_NOTIFICACION))
+
+
+# Tipo -> (modelo, campo con el dueño o None si es público, sección de la respuesta, función que lee las filas)
+TIPOS = {
+    'rifa': (Rifa, None, 'rifas', _rifas),
+    'san': (San, None, 'sanes', _sanes),
+    'ticket': (Ticket, 'usuario_id', 'tickets', _tickets),
+    'participacion': (ParticipacionSan, 'usuario_id', 'participaciones', _participaciones),
+    'cupo': (Cupo, 'participacion__usuario_id', 'cupos', _cupos),
+    'factura': (Factura, 'usuario_id', 'facturas', _facturas),
+    'notificacion': (NotificacionMejorada, 'usuario_id', 'notificaciones', _notificaciones),
+}
+TIPO_DE_MODELO = {modelo: tipo for tipo, (modelo, *_) in TIPOS.items()}
+
+
+# ---------------------
+# ESCRITURA
+# ---------------------
+def _escribir(registros):
+    RegistroCambio.objects.bulk_create(registros, batch_size=LOTE)
+
+
+def _escribir_al_confirmar(registros):
+    # bulk_create no envía señales (el registro no invalida cachés)
+    if registros:
+        transaction.on_commit(partial(_escribir, registros))
+
+
+def registrar(queryset, accion='actualizar'):
+    """
+    Registra ``accion`` para las filas de ``queryset``; llamar antes de
+    actualizarlas o borrarlas. Las filas se leen ahora y se escriben al
+    confirmar la transacción. Los modelos que no se sincronizan se ignoran.
+    """
+    tipo = TIPO_DE_MODELO.get(queryset.model)
+    if tipo is None:
+        return 0
+    dueno = TIPOS[tipo][1]
+    if dueno:
+        filas = queryset.order_by().exclude(**{dueno: None}).values_list('id', dueno)
+    else:
+        filas = ((objeto_id, None) for objeto_id in queryset.order_by().values_list('id', flat=True))
+    registros = [
+        RegistroCambio(tipo=tipo, objeto_id=objeto_id, accion=accion, usuario_id=usuario_id)
+        for objeto_id, usuario_id in filas
+    ]
+    _escribir_al_confirmar(registros)
+    return len(registros)
+
+
+def _dueno(tipo, instancia):
+    """ID del dueño de un objeto privado (el de la participación en los cupos)"""
+    if tipo != 'cupo':
+        return instancia.usuario_id
+    if instancia.participacion_id is None:
+        return None
+    return ParticipacionSan.objects.filter(id=instancia.participacion_id).values_list('usuario_id', flat=True).first()
+
+
+def registrar_por_senal(sender, instance, created=None, **kwargs):
+    """Receptor de post_save/post_delete de los modelos sincronizados"""
+    tipo = TIPO_DE_MODELO[sender]
+    usuario_id = _dueno(tipo, instance) if TIPOS[tipo][1] else None
+    if TIPOS[tipo][1] and usuario_id is None:
+        return
+    accion = 'eliminar' if created is None else ('crear' if created else 'actualizar')
+    _escribir_al_confirmar([RegistroCambio(tipo=tipo, objeto_id=instance.pk, accion=accion, usuario_id=usuario_id)])
+
+
+def podar(dias=DIAS_CONSERVADOS, lote=5000):
+    """Borra por lotes los registros de más de ``dias`` días y devuelve cuántos"""
+    limite = timezone.now() - timedelta(days=dias)
+    total = 0
+    while True:
+        ids = list(RegistroCambio.objects.filter(fecha__lt=limite).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            return total
+        total += RegistroCambio.objects.filter(id__in=ids).delete()[0]
+
+
+# ---------------------
+# LECTURA
+# ---------------------
+def token_actual():
+    """Token desde el que sincroniza un cliente que acaba de cargar todo"""
+    limite = timezone.now() - timedelta(seconds=MARGEN)
+    return RegistroCambio.objects.filter(fecha__lte=limite).aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+
+def vigente(desde):
+    """False si ya se podaron registros posteriores a ``desde`` y el cliente debe recargar todo"""
+    primero = RegistroCambio.objects.aggregate(primero=Min('id'))['primero']
+    return primero is None or desde >= primero - 1
+
+
+def cambios(usuario, desde, lote=LOTE):
+    """
+    Cambios visibles para ``usuario`` con token mayor que ``desde``.
+
+    Returns:
+        dict con ``token`` (el del último registro leído), ``hay_mas`` y
+        ``cambios``: {sección: {creados, actualizados, eliminados}}, una
+        entrada por objeto con su estado actual (o solo el ID si se borró).
+    """
+    limite = timezone.now() - timedelta(seconds=MARGEN)
+    registros = list(
+        RegistroCambio.objects.filter(Q(usuario=None) | Q(usuario=usuario), id__gt=desde, fecha__lte=limite)
+        .order_by('id').values_list('id', 'tipo', 'objeto_id', 'accion')[:lote + 1]
+    )
+    hay_mas = len(registros) > lote
+    registros = registros[:lote]
+
+    # Primera y última acción de cada objeto dentro del lote
+    acciones = {}
+    for _, tipo, objeto_id, accion in registros:
+        primera, _ = acciones.get((tipo, objeto_id), (accion, None))
+        acciones[(tipo, objeto_id)] = (primera, accion)
+
+    por_tipo = {}
+    for (tipo, objeto_id), (primera, ultima) in acciones.items():
+        if ultima == 'eliminar':
+            if primera != 'crear':
+                por_tipo.setdefault(tipo, {}).setdefault('eliminados', []).append(objeto_id)
+        else:
+            destino = 'creados' if primera == 'crear' else 'actualizados'
+            por_tipo.setdefault(tipo, {}).setdefault(destino, set()).add(objeto_id)
+
+    resultado = {}
+    for tipo, grupos in por_tipo.items():
+        _, _, seccion, leer = TIPOS[tipo]
+        eliminados = set(grupos.get('eliminados', []))
+        vivos = grupos.get('creados', set()) | grupos.get('actualizados', set())
+        filas = leer(vivos, usuario) if vivos else []
+        encontrados = {fila['id'] for fila in filas}
+        # Lo que ya no existe (o ya no es del usuario) se informa como borrado
+        eliminados |= vivos - encontrados
+        resultado[seccion] = {
+            'creados': [f for f in filas if f['id'] in grupos.get('creados', ())],
+            'actualizados': [f for f in filas if f['id'] not in grupos.get('creados', ())],
+            'eliminados': sorted(eliminados),
+        }
+    return {
+        'token': registros[-1][0] if registros else desde,
+        'hay_mas': hay_mas,
+        'cambios': resultado,
+    }
@@ -1,4 +1,5 @@
 from django import template
+from django.utils.safestring import mark_safe
 
 register = template.Library()
 
@@ -9,3 +10,11 @@ def multiply(value, arg):
         return float(value) * float(arg)
     except (ValueError, TypeError):
         return 0
+
+
+@register.simple_tag
+def tarjetas(objetos, plantilla):
+    """Tarjetas de rifas o sanes renderizadas con caché por objeto y versión, ver sanes.fragmentos"""
+    from sanes import fragmentos
+
+    return mark_safe(''.join(fragmentos.tarjetas(plantilla, objetos)))
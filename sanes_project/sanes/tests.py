@@ -1,3 +1,601 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from aiohttp import web
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cancelaciones, contabilidad, limites, pasarela_stub, pasarelas, sincronizacion, webhooks
+from .forms import CustomLoginForm
+from .models import (
+    AsientoContable, CancelacionMasiva, CuentaContable, Cupo, CustomUser, Factura, NotificacionMejorada, PagoSimulado,
+    ParticipacionSan, Reembolso, RegistroCambio, Rifa, San, Ticket, WebhookPago
+)
+
+
+class RelojFijo:
+    """Sustituto del módulo time de sanes.limites con el reloj detenido"""
+
+    def __init__(self, ahora=1_000_000.0):
+        self.ahora = ahora
+
+    def time(self):
+        return self.ahora
+
+    def monotonic(self):
+        return self.ahora
+
+    def sleep(self, segundos):
+        time.sleep(segundos)
+
+
+def _reiniciar_limites():
+    cache.clear()
+    for limite in limites.LIMITES.values():
+        limite.reiniciar()
+
+
+# ---------------------
+# CUBETA DE TOKENS
+# ---------------------
+# Sin base de datos: la cubeta sobre la caché local (en settings la caché es la de base de datos)
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LimiteTests(SimpleTestCase):
+    def setUp(self):
+        _reiniciar_limites()
+
+    def test_leer_tasa(self):
+        self.assertEqual(limites.leer_tasa('10/m'), (10, 60))
+        self.assertEqual(limites.leer_tasa('5/hora'), (5, 3600))
+
+    def test_rafaga_y_recarga(self):
+        reloj = RelojFijo()
+        limite = limites.Limite('prueba_recarga', '3/m')
+        with mock.patch.object(limites, 'time', reloj):
+            self.assertEqual([limite.tomar('a') for _ in range(3)], [0, 0, 0])
+            self.assertAlmostEqual(limite.tomar('a'), 20.0)
+            # Otra clave tiene su propia cubeta
+            self.assertEqual(limite.tomar('b'), 0)
+
+            reloj.ahora += 20
+            self.assertEqual(limite.tomar('a'), 0)
+            self.assertGreater(limite.tomar('a'), 0)
+
+    def test_desactivado_por_settings(self):
+        limite = limites.Limite('prueba_desactivado', '1/h')
+        with override_settings(LIMITES_PETICIONES={'prueba_desactivado': None}):
+            self.assertEqual([limite.tomar('a') for _ in range(5)], [0] * 5)
+
+    def test_concurrencia_no_supera_la_capacidad(self):
+        limite = limites.Limite('prueba_concurrencia', '100/h')
+        permitidas = []
+
+        def cliente():
+            permitidas.append(sum(1 for _ in range(20) if not limite.tomar('a')))
+
+        with mock.patch.object(limites, 'time', RelojFijo()), mock.patch.object(limites, 'ESPERA_CERROJO', 10):
+            hilos = [threading.Thread(target=cliente) for _ in range(16)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual(sum(permitidas), 100)
+
+    def test_reservas_de_varios_procesos_comparten_la_cubeta(self):
+        # Cada Limite hace de un worker distinto: reservan lotes de 10 tokens de la misma cubeta
+        procesos = [limites.Limite('prueba_procesos', '600/m') for _ in range(4)]
+        self.assertEqual(procesos[0].config()[2], 10)
+        permitidas = []
+
+        def cliente(limite):
+            permitidas.append(sum(1 for _ in range(200) if not limite.tomar('a')))
+
+        with mock.patch.object(limites, 'time', RelojFijo()), mock.patch.object(limites, 'ESPERA_CERROJO', 10):
+            hilos = [threading.Thread(target=cliente, args=(p,)) for p in procesos for _ in range(4)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        # Como mucho quedan sin usar las reservas de cada proceso
+        self.assertLessEqual(sum(permitidas), 600)
+        self.assertGreaterEqual(sum(permitidas), 600 - 4 * 9)
+
+    def test_sobrecosto_por_peticion(self):
+        vista = lambda request: HttpResponse()  # noqa: E731
+        limitada = limites.limitar('prueba_sobrecosto', '1000000/m', metodos=None)(vista)
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        n = 20000
+
+        def medir(funcion):
+            inicio = time.perf_counter()
+            for _ in range(n):
+                funcion(request)
+            return (time.perf_counter() - inicio) / n
+
+        medir(limitada)
+        self.assertLess(medir(limitada) - medir(vista), 100e-6)
+
+
+# ---------------------
+# VISTAS Y FORMULARIOS
+# ---------------------
+@override_settings(LIMITES_PETICIONES={'notificaciones': '2/m', 'busqueda': '2/m', 'login_cuenta': '2/h'})
+class LimitesVistasTests(TestCase):
+    def setUp(self):
+        _reiniciar_limites()
+        self.usuario = CustomUser.objects.create_user(username='ana', email='ana@example.com', password='clave-segura-1')
+
+    def test_vista_django_responde_429_con_retry_after(self):
+        self.client.force_login(self.usuario)
+        url = reverse('obtener_notificaciones_ajax')
+        cabeceras = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        self.assertEqual([self.client.get(url, **cabeceras).status_code for _ in range(2)], [200, 200])
+        respuesta = self.client.get(url, **cabeceras)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertGreaterEqual(int(respuesta['Retry-After']), 1)
+        self.assertFalse(respuesta.json()['success'])
+
+    def test_endpoint_drf_responde_429_con_retry_after(self):
+        url = reverse('api_buscar')
+        self.assertEqual([self.client.get(url, {'q': 'moto'}).status_code for _ in range(2)], [200, 200])
+        respuesta = self.client.get(url, {'q': 'moto'})
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertGreaterEqual(int(respuesta['Retry-After']), 1)
+        # Otra IP no está limitada
+        self.assertEqual(self.client.get(url, {'q': 'moto'}, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def login(self, password, ip='10.0.0.1'):
+        request = RequestFactory().post('/login/', REMOTE_ADDR=ip)
+        return CustomLoginForm({'email': 'ana@example.com', 'password': password}, request=request)
+
+    def test_login_limita_intentos_fallidos_por_cuenta_e_ip(self):
+        for _ in range(2):
+            form = self.login('incorrecta')
+            self.assertFalse(form.is_valid())
+            self.assertIn('Credenciales inválidas', str(form.errors))
+        form = self.login('clave-segura-1')
+        self.assertFalse(form.is_valid())
+        self.assertIn('Demasiados intentos', str(form.errors))
+        # El dueño de la cuenta entra desde otra IP
+        self.assertTrue(self.login('clave-segura-1', ip='10.0.0.2').is_valid())
+
+    def test_login_correcto_no_cuenta(self):
+        for _ in range(3):
+            self.assertTrue(self.login('clave-segura-1').is_valid())
+        self.assertIn('Credenciales inválidas', str(self.login('incorrecta').errors))
+
+
+# ---------------------
+# LIBRO MAYOR
+# ---------------------
+class ContabilidadTests(TestCase):
+    def setUp(self):
+        self.usuario = CustomUser.objects.create_user(username='luis', email='luis@example.com', password='clave-segura-1')
+        self.rifa = Rifa.objects.create(titulo='Rifa', descripcion='Rifa de prueba', premio='Moto',
+                                        organizador=self.usuario, estado='activa', precio_ticket=Decimal('5.00'),
+                                        total_tickets=100, tickets_disponibles=100,
+                                        fecha_fin=timezone.now() + timedelta(days=30))
+
+    def factura(self, monto='10.00'):
+        return Factura.objects.create(usuario=self.usuario, content_type=ContentType.objects.get_for_model(Rifa),
+                                      object_id=self.rifa.pk, monto_total=Decimal(monto))
+
+    def cambiar(self, factura, *estados):
+        for estado in estados:
+            factura = Factura.objects.get(pk=factura.pk)
+            factura.estado_pago = estado
+            factura.save()
+        return factura
+
+    def saldos(self, rubro):
+        return contabilidad.saldo('rifa', self.rifa.pk, rubro), contabilidad.saldo('usuario', self.usuario.pk, rubro)
+
+    def assertLibroCuadra(self):
+        # Lo mismo que contabilidad.verificar(), sin hilos (no ven la transacción del test)
+        for cuenta in CuentaContable.objects.all():
+            apuntes = cuenta.apuntes.aggregate(total=Sum('monto'))['total'] or 0
+            self.assertEqual(cuenta.saldo, apuntes, cuenta)
+        for asiento in AsientoContable.objects.all():
+            self.assertEqual(asiento.apuntes.aggregate(total=Sum('monto'))['total'] or 0, 0, asiento.clave)
+
+    def test_emision_y_pago(self):
+        factura = self.factura()
+        self.assertEqual(self.saldos('por_cobrar'), (Decimal('10.00'), Decimal('-10.00')))
+        self.cambiar(factura, 'confirmado')
+        self.assertEqual(self.saldos('por_cobrar'), (0, 0))
+        self.assertEqual(self.saldos('disponible'), (Decimal('10.00'), Decimal('-10.00')))
+        self.assertLibroCuadra()
+
+    def test_vencida_y_pagada_despues_cancela_la_deuda_una_vez(self):
+        for estado in ('vencido', 'rechazado'):
+            with self.subTest(estado=estado):
+                self.cambiar(self.factura(), estado, 'confirmado')
+                self.assertEqual(self.saldos('por_cobrar'), (0, 0))
+        self.assertEqual(self.saldos('disponible'), (Decimal('20.00'), Decimal('-20.00')))
+        self.assertLibroCuadra()
+
+    def test_reabierta_y_pagada(self):
+        self.cambiar(self.factura(), 'vencido', 'pendiente', 'confirmado')
+        self.assertEqual(self.saldos('por_cobrar'), (0, 0))
+        self.assertEqual(self.saldos('disponible'), (Decimal('10.00'), Decimal('-10.00')))
+
+    def test_pagada_devuelta_a_pendiente_y_cancelada(self):
+        self.cambiar(self.factura(), 'confirmado', 'pendiente', 'cancelado')
+        self.assertEqual(self.saldos('por_cobrar'), (0, 0))
+        self.assertEqual(self.saldos('disponible'), (Decimal('10.00'), Decimal('-10.00')))
+        self.assertLibroCuadra()
+
+    def test_reembolso(self):
+        self.cambiar(self.factura(), 'confirmado', 'cancelado')
+        self.assertEqual(self.saldos('disponible'), (0, 0))
+        self.assertEqual(self.saldos('por_cobrar'), (0, 0))
+        self.assertLibroCuadra()
+
+    def test_borrar_pendiente_anula(self):
+        self.factura().delete()
+        self.assertEqual(self.saldos('por_cobrar'), (0, 0))
+
+    def test_recaudado_descuenta_reembolsos(self):
+        self.cambiar(self.factura('10.00'), 'confirmado')
+        self.cambiar(self.factura('4.00'), 'confirmado', 'cancelado')
+        self.factura('7.00')
+        confirmadas = Factura.objects.filter(estado_pago='confirmado').aggregate(total=Sum('monto_total'))['total']
+        self.assertEqual(contabilidad.recaudado('rifa', self.rifa.pk), confirmadas)
+        self.assertEqual(contabilidad.recaudado('rifa'), Decimal('10.00'))
+
+
+# ---------------------
+# CANCELACIONES MASIVAS
+# ---------------------
+class CancelacionTests(TestCase):
+    """Cortes a mitad de fase o entre fases y reanudación"""
+
+    def setUp(self):
+        organizador = CustomUser.objects.create_user(username='org', email='org@example.com', password='clave-segura-1')
+        self.rifa = Rifa.objects.create(titulo='Rifa', descripcion='Rifa de prueba', premio='Moto', organizador=organizador,
+                                        estado='activa', precio_ticket=Decimal('5.00'), total_tickets=100,
+                                        tickets_disponibles=100, fecha_fin=timezone.now() + timedelta(days=30))
+        rifa_ct = ContentType.objects.get_for_model(Rifa)
+        self.compradores = []
+        for i, estado in enumerate(('confirmado', 'confirmado', 'confirmado', 'pendiente')):
+            usuario = CustomUser.objects.create_user(username=f'c{i}', email=f'c{i}@example.com', password='clave-segura-1')
+            factura = Factura.objects.create(usuario=usuario, content_type=rifa_ct, object_id=self.rifa.pk,
+                                             monto_total=Decimal('10.00'))
+            if estado == 'confirmado':
+                factura.estado_pago = estado
+                factura.save()
+            for _ in range(2):
+                Ticket.objects.create(rifa=self.rifa, usuario=usuario, factura=factura, precio_pagado=Decimal('5.00'))
+            self.compradores.append(usuario)
+        self.cancelacion = cancelaciones.iniciar_cancelacion(self.rifa, 'Prueba')
+
+    def assertAplicadaUnaVez(self):
+        cancelacion = CancelacionMasiva.objects.get(pk=self.cancelacion.pk)
+        self.assertEqual((cancelacion.estado, cancelacion.fase), ('completada', 'fin'))
+        self.assertEqual(cancelacion.facturas_procesadas, 4)
+        self.assertEqual(cancelacion.reembolsos_creados, 3)
+        self.assertEqual(cancelacion.monto_reembolsado, Decimal('30.00'))
+        self.assertEqual(cancelacion.usuarios_notificados, 4)
+        self.assertEqual(Reembolso.objects.filter(cancelacion=cancelacion).count(), 3)
+        self.assertFalse(Factura.objects.exclude(estado_pago='cancelado').exists())
+        self.assertFalse(Ticket.objects.filter(rifa=self.rifa, activo=True).exists())
+        self.assertEqual(Ticket.objects.filter(rifa=self.rifa).count(), 8)
+        # Lo cobrado se devolvió una sola vez y la deuda pendiente se anuló
+        self.assertEqual(contabilidad.saldo('rifa', self.rifa.pk), 0)
+        self.assertEqual(contabilidad.saldo('rifa', self.rifa.pk, 'por_cobrar'), 0)
+        for usuario in self.compradores:
+            self.assertEqual(NotificacionMejorada.objects.filter(usuario=usuario, tipo='rifa').count(), 1)
+
+    def test_reanuda_tras_fallo_a_mitad_de_fase(self):
+        # El primer lote de facturas se confirma y el segundo cae a mitad
+        lotes = iter([contabilidad.registrar_cancelacion_lote, None])
+
+        def registrar_o_caer(*args):
+            siguiente = next(lotes)
+            if siguiente is None:
+                raise RuntimeError('caída')
+            return siguiente(*args)
+
+        with mock.patch.object(contabilidad, 'registrar_cancelacion_lote', side_effect=registrar_o_caer):
+            with self.assertRaises(RuntimeError):
+                cancelaciones.procesar_cancelacion(self.cancelacion, lote=1)
+        cancelacion = CancelacionMasiva.objects.get(pk=self.cancelacion.pk)
+        self.assertEqual((cancelacion.estado, cancelacion.fase, cancelacion.facturas_procesadas), ('fallida', 'facturas', 1))
+        self.assertEqual(Reembolso.objects.count(), 1)
+
+        cancelaciones.procesar_cancelacion(cancelacion, lote=1)
+        self.assertAplicadaUnaVez()
+
+    def test_reanuda_entre_fases_y_repetir_no_cambia_nada(self):
+        # Facturas completas y un lote de tickets, y el worker se detiene
+        while CancelacionMasiva.objects.get(pk=self.cancelacion.pk).fase == 'facturas':
+            cancelaciones._procesar_lote(self.cancelacion.pk, 3)
+        cancelaciones._procesar_lote(self.cancelacion.pk, 3)
+        self.assertEqual(Ticket.objects.filter(rifa=self.rifa, activo=False).count(), 3)
+
+        cancelaciones.procesar_cancelacion(self.cancelacion, lote=3)
+        self.assertAplicadaUnaVez()
+        cancelaciones.procesar_cancelacion(self.cancelacion, lote=3)
+        self.assertAplicadaUnaVez()
+
+
+    def test_san_reanuda_entre_cupos_y_participaciones(self):
+        san = San.objects.create(nombre='San', organizador=self.compradores[0], estado='activo',
+                                 precio_cuota=Decimal('10.00'), numero_cuotas=2, total_participantes=5)
+        semana = 0
+        for usuario in self.compradores[:3]:
+            participacion = ParticipacionSan.objects.create(san=san, usuario=usuario, orden_cobro=semana // 2 + 1)
+            for _ in range(2):
+                semana += 1
+                Cupo.objects.create(san=san, participacion=participacion, numero_semana=semana, estado='asignado',
+                                    monto_cuota=Decimal('10.00'))
+        cancelacion = cancelaciones.iniciar_cancelacion(san, 'Prueba')
+        while CancelacionMasiva.objects.get(pk=cancelacion.pk).fase != 'participaciones':
+            cancelaciones._procesar_lote(cancelacion.pk, 4)
+        cancelaciones._procesar_lote(cancelacion.pk, 2)
+
+        cancelaciones.procesar_cancelacion(cancelacion, lote=2)
+        cancelacion.refresh_from_db()
+        self.assertEqual((cancelacion.estado, cancelacion.usuarios_notificados), ('completada', 3))
+        self.assertEqual(Cupo.objects.filter(san=san, estado='cancelado').count(), 6)
+        self.assertFalse(ParticipacionSan.objects.filter(san=san, activa=True).exists())
+        self.assertEqual(NotificacionMejorada.objects.filter(tipo='san').count(), 3)
+
+# ---------------------
+# SINCRONIZACIÓN
+# ---------------------
+class SincronizacionTests(TestCase):
+    def setUp(self):
+        _reiniciar_limites()
+        self.usuario = CustomUser.objects.create_user(username='rosa', email='rosa@example.com', password='clave-segura-1')
+        self.client.force_login(self.usuario)
+
+    def rifa(self, titulo='Rifa'):
+        return Rifa.objects.create(titulo=titulo, descripcion='Rifa de prueba', premio='Moto', organizador=self.usuario,
+                                   estado='activa', precio_ticket=Decimal('5.00'), total_tickets=100,
+                                   tickets_disponibles=100, fecha_fin=timezone.now() + timedelta(days=30))
+
+    def confirmada(self, titulo='Rifa'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.rifa(titulo)
+
+    def envejecer(self):
+        """Deja atrás el MARGEN de todos los registros escritos"""
+        RegistroCambio.objects.update(fecha=F('fecha') - timedelta(seconds=sincronizacion.MARGEN + 1))
+
+    def cambios(self, desde=None, **params):
+        if desde is not None:
+            params['desde'] = desde
+        return self.client.get(reverse('api_cambios'), params).json()
+
+    def rifas(self, respuesta):
+        rifas = respuesta['cambios'].get('rifas', {})
+        return [r['id'] for r in rifas.get('creados', []) + rifas.get('actualizados', [])]
+
+    def test_registro_al_confirmar_y_nada_si_se_revierte(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.rifa()
+            self.assertFalse(RegistroCambio.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(RegistroCambio.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.rifa()
+                raise RuntimeError
+        self.assertEqual(RegistroCambio.objects.count(), 1)
+
+    def test_cursor_espera_el_margen(self):
+        token = self.cambios()['token']
+        rifa = self.confirmada()
+        # Dentro del MARGEN no se entrega y el token no avanza
+        respuesta = self.cambios(token)
+        self.assertEqual((respuesta['token'], respuesta['cambios']), (token, {}))
+        self.assertEqual(self.cambios()['token'], token)
+
+        self.envejecer()
+        respuesta = self.cambios(token)
+        self.assertEqual(self.rifas(respuesta), [rifa.pk])
+        token = respuesta['token']
+
+        otra = self.confirmada('Otra')
+        self.assertEqual(self.rifas(self.cambios(token)), [])
+        self.envejecer()
+        self.assertEqual(self.rifas(self.cambios(token)), [otra.pk])
+
+    def test_confirmada_despues_no_se_pierde(self):
+        # La transacción de "lenta" empieza antes pero confirma después que la de "rapida"
+        with self.captureOnCommitCallbacks() as al_confirmar_lenta:
+            lenta = self.rifa('Lenta')
+        rapida = self.confirmada('Rápida')
+        self.envejecer()
+        respuesta = self.cambios(0)
+        self.assertEqual(self.rifas(respuesta), [rapida.pk])
+
+        for callback in al_confirmar_lenta:
+            callback()
+        self.envejecer()
+        self.assertEqual(self.rifas(self.cambios(respuesta['token'])), [lenta.pk])
+
+    def test_lotes_sin_perder_ni_repetir(self):
+        ids = [self.confirmada(f'Rifa {i}').pk for i in range(5)]
+        self.envejecer()
+        vistos, token, hay_mas = [], 0, True
+        while hay_mas:
+            respuesta = self.cambios(token, limite=2)
+            vistos += self.rifas(respuesta)
+            token, hay_mas = respuesta['token'], respuesta['hay_mas']
+        self.assertEqual(sorted(vistos), ids)
+
+
+# ---------------------
+# WEBHOOKS DE PASARELAS
+# ---------------------
+@override_settings(PASARELAS_PAGO={'paypal': {'URL': 'http://pasarela', 'SECRETO': 'secreto-paypal'},
+                                   'stripe': {'URL': 'http://pasarela', 'SECRETO': ''}})
+class WebhooksTests(TestCase):
+    def setUp(self):
+        self.usuario = CustomUser.objects.create_user(username='eva', email='eva@example.com', password='clave-segura-1')
+        rifa = Rifa.objects.create(titulo='Rifa', descripcion='Rifa de prueba', premio='Moto', organizador=self.usuario,
+                                   estado='activa', precio_ticket=Decimal('5.00'), total_tickets=100,
+                                   tickets_disponibles=100, fecha_fin=timezone.now() + timedelta(days=30))
+        self.factura = Factura.objects.create(usuario=self.usuario, content_type=ContentType.objects.get_for_model(Rifa),
+                                              object_id=rifa.pk, monto_total=Decimal('10.00'))
+        self.pago = PagoSimulado.objects.create(usuario=self.usuario, factura=self.factura, metodo_pago='paypal',
+                                                monto=Decimal('10.00'))
+
+    def evento(self, pasarela='paypal', **datos):
+        payload = {'id': f'evt_{WebhookPago.objects.count()}', 'tipo': webhooks.EVENTO_APROBADO,
+                   'codigo': self.pago.codigo_transaccion, 'monto': '10.00', **datos}
+        WebhookPago.objects.create(pasarela=pasarela, evento_id=payload['id'], tipo=payload['tipo'], payload=payload)
+
+    def estado_pago(self):
+        return PagoSimulado.objects.values_list('estado', flat=True).get(pk=self.pago.pk)
+
+    def test_aprobado(self):
+        self.evento()
+        self.assertEqual(webhooks.aplicar_lote(), {'aplicado': 1})
+        self.assertEqual(self.estado_pago(), 'exitoso')
+        self.assertEqual(Factura.objects.get(pk=self.factura.pk).estado_pago, 'confirmado')
+
+    def test_ignora_evento_de_otra_pasarela_o_con_otro_monto(self):
+        self.evento(pasarela='stripe')
+        self.evento(monto='0.01')
+        self.evento(monto=None)
+        self.assertEqual(webhooks.aplicar_lote(), {'ignorado': 3})
+        self.assertEqual(self.estado_pago(), 'pendiente')
+
+    def test_firma(self):
+        cuerpo = b'{"id": "evt_1", "tipo": "cobro.aprobado"}'
+        firma = pasarelas.firmar('secreto-paypal', cuerpo)
+        enviar = lambda pasarela, firma: self.client.post(  # noqa: E731
+            reverse('webhook_pasarela', args=[pasarela]), cuerpo, content_type='application/json', HTTP_X_FIRMA=firma)
+        self.assertEqual(enviar('paypal', firma).status_code, 200)
+        self.assertEqual(enviar('paypal', 'otra').status_code, 401)
+        # Sin secreto solo con PASARELAS_SIN_FIRMA, aunque DEBUG esté activo
+        with override_settings(DEBUG=True):
+            self.assertEqual(enviar('stripe', '').status_code, 401)
+        with override_settings(PASARELAS_SIN_FIRMA=True):
+            self.assertEqual(enviar('stripe', '').status_code, 200)
+
+
+# ---------------------
+# PAGOS FALLIDOS
+# ---------------------
+FALLIDO = {'estado': pasarelas.COBRO_FALLIDO, 'referencia': None, 'latencia_ms': 0, 'error': 'Fondos insuficientes'}
+
+
+@override_settings(PASARELAS_PAGO={'paypal': {'URL': 'http://127.0.0.1:9/paypal'}})
+class PagoFallidoTests(TestCase):
+    def setUp(self):
+        _reiniciar_limites()
+        self.usuario = CustomUser.objects.create_user(username='sol', email='sol@example.com', password='clave-segura-1')
+        self.rifa = Rifa.objects.create(titulo='Rifa', descripcion='Rifa de prueba', premio='Moto', organizador=self.usuario,
+                                        estado='activa', precio_ticket=Decimal('5.00'), total_tickets=100,
+                                        tickets_disponibles=100, fecha_fin=timezone.now() + timedelta(days=30))
+        self.client.force_login(self.usuario)
+
+    def comprar(self, resultado):
+        with mock.patch.object(pasarelas, 'cobrar', return_value=resultado):
+            self.client.post(reverse('comprar_ticket_rifa', args=[self.rifa.pk]), {'cantidad': 3, 'metodo_pago': 'paypal'})
+        return Factura.objects.get(usuario=self.usuario)
+
+    def assertLiberada(self, factura):
+        self.assertEqual(Factura.objects.get(pk=factura.pk).estado_pago, 'rechazado')
+        self.assertFalse(Ticket.objects.filter(factura=factura, activo=True).exists())
+        self.assertEqual(Rifa.objects.get(pk=self.rifa.pk).tickets_disponibles, 100)
+        self.assertFalse(contabilidad._deuda_abierta(factura.pk))
+
+    def test_checkout_libera_tickets(self):
+        factura = self.comprar(FALLIDO)
+        self.assertEqual(PagoSimulado.objects.get(factura=factura).estado, 'fallido')
+        self.assertLiberada(factura)
+
+    def test_worker_libera_tickets_una_sola_vez(self):
+        # La pasarela no responde en el checkout: el pago queda para el worker
+        factura = self.comprar({**FALLIDO, 'estado': pasarelas.COBRO_NO_DISPONIBLE})
+        self.assertEqual(Rifa.objects.get(pk=self.rifa.pk).tickets_disponibles, 97)
+        pago = PagoSimulado.objects.select_related('factura').get(factura=factura)
+        self.assertEqual(pago.estado, 'pendiente')
+
+        with mock.patch.object(pasarelas, 'cobrar_lote', return_value=[FALLIDO]):
+            pasarelas.procesar_pagos([pago])
+        self.assertEqual(PagoSimulado.objects.get(pk=pago.pk).estado, 'fallido')
+        self.assertLiberada(factura)
+
+        # Un segundo resultado del mismo pago no devuelve los tickets otra vez
+        PagoSimulado.objects.select_related('factura').get(pk=pago.pk).aplicar_resultado(FALLIDO)
+        self.assertLiberada(factura)
+
+    def test_checkout_san_deshace_inscripcion(self):
+        san = San.objects.create(nombre='San', organizador=self.usuario, estado='activo', precio_cuota=Decimal('10.00'),
+                                 numero_cuotas=2, total_participantes=5)
+        with mock.patch.object(pasarelas, 'cobrar', return_value=FALLIDO):
+            self.client.post(reverse('inscribirse_san', args=[san.pk]), {'metodo_pago': 'paypal', 'acepto_terminos': '1'})
+        self.assertEqual(Factura.objects.get(usuario=self.usuario).estado_pago, 'rechazado')
+        self.assertFalse(ParticipacionSan.objects.filter(san=san).exists())
+        self.assertEqual(San.objects.get(pk=san.pk).participantes_actuales, 0)
+
+
+class IdempotenciaTests(TestCase):
+    """Reintentos contra la pasarela simulada, que respeta Idempotency-Key"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bucle = asyncio.new_event_loop()
+        threading.Thread(target=cls.bucle.run_forever, daemon=True).start()
+        cls.app = pasarela_stub.crear_app(latencia_ms=300, variacion_ms=0, tasa_rechazo=0)
+
+        async def iniciar():
+            runner = web.AppRunner(cls.app)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', 0).start()
+            return runner
+
+        cls.runner = asyncio.run_coroutine_threadsafe(iniciar(), cls.bucle).result()
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.runner.cleanup(), cls.bucle).result()
+        cls.bucle.call_soon_threadsafe(cls.bucle.stop)
+        super().tearDownClass()
+
+    def setUp(self):
+        pasarelas._pasarelas.clear()
+        self.addCleanup(pasarelas._pasarelas.clear)
+        usuario = CustomUser.objects.create_user(username='ivan', email='ivan@example.com', password='clave-segura-1')
+        rifa = Rifa.objects.create(titulo='Rifa', descripcion='Rifa de prueba', premio='Moto', organizador=usuario,
+                                   estado='activa', precio_ticket=Decimal('5.00'), total_tickets=100,
+                                   tickets_disponibles=100, fecha_fin=timezone.now() + timedelta(days=30))
+        factura = Factura.objects.create(usuario=usuario, content_type=ContentType.objects.get_for_model(Rifa),
+                                         object_id=rifa.pk, monto_total=Decimal('10.00'))
+        self.pago = PagoSimulado.objects.create(usuario=usuario, factura=factura, metodo_pago='paypal', monto=Decimal('10.00'))
+
+    def procesar(self):
+        pago = PagoSimulado.objects.select_related('factura').get(pk=self.pago.pk)
+        return pasarelas.procesar_pagos([pago])[0]
+
+    def test_reintento_tras_timeout_cobra_una_vez(self):
+        puerto = self.runner.addresses[0][1]
+        configuracion = {'paypal': {'URL': f'http://127.0.0.1:{puerto}/paypal', 'TIMEOUT': 0.1}}
+        with override_settings(PASARELAS_PAGO=configuracion), \
+                mock.patch.object(pasarela_stub, '_procesar', wraps=pasarela_stub._procesar) as cobros:
+            # El cliente deja de esperar, pero la pasarela termina el cobro
+            self.assertEqual(self.procesar()['estado'], pasarelas.COBRO_NO_DISPONIBLE)
+            time.sleep(0.4)
+            self.assertEqual(self.procesar()['estado'], pasarelas.COBRO_EXITOSO)
+        self.assertEqual(cobros.call_count, 1)
+        self.assertEqual(PagoSimulado.objects.get(pk=self.pago.pk).estado, 'exitoso')
+        self.assertEqual(Factura.objects.get(pk=self.pago.factura_id).estado_pago, 'confirmado')
@@ -22,6 +22,7 @@ urlpatterns = [
     path('perfil/', views.user_profile, name='user_profile'),
     path('perfil/editar/', views.perfil_usuario, name='perfil_usuario'),
     path('perfil/cambiar-foto/', views.cambiar_foto_perfil, name='cambiar_foto_perfil'),
+    path('perfil/analitica/', views.analitica_organizador, name='analitica_organizador'),
     path('notificaciones/', views.lista_notificaciones, name='lista_notificaciones'),
 
     # ---------------------
@@ -75,6 +76,7 @@ urlpatterns = [
     # VISTAS DE PAGOS
     # ---------------------
     path('cuotas/<int:cupo_id>/pagar/', views.pagar_cuota_san, name='pagar_cuota_san'),
+    path('webhooks/pagos/<str:pasarela>/', views.webhook_pasarela, name='webhook_pasarela'),
 
     # ---------------------
     # VISTAS DE ADMINISTRACIÓN
@@ -87,10 +89,12 @@ urlpatterns = [
     path('dashboard/sanes/crear/', views.crear_san, name='crear_san'),
     path('dashboard/notificaciones/enviar/', views.enviar_notificacion_global, name='enviar_notificacion_global'),
     path('dashboard/reportes/finanzas/', views.reporte_finanzas, name='reporte_finanzas'),
+    path('dashboard/reportes/cohortes/', views.reporte_cohortes, name='reporte_cohortes'),
     path('dashboard/sanes/<int:san_id>/asignar-turnos/', views.asignar_turnos_san, name='asignar_turnos_san'),
     path('dashboard/pagos/<int:factura_id>/confirmar/', views.confirmar_pago, name='confirmar_pago'),
     path('dashboard/pagos/<int:factura_id>/rechazar/', views.rechazar_pago, name='rechazar_pago'),
     path('dashboard/reportes/rifas/pdf/', views.exportar_reporte_rifas_pdf, name='exportar_reporte_rifas_pdf'),
+    path('dashboard/reportes/<str:tipo>/pdf/', views.exportar_reporte_pdf, name='exportar_reporte_pdf'),
     
     # URLs adicionales para admin views
     path('dashboard/users/', views.AdminUserListView.as_view(), name='admin_user_list'),
@@ -106,6 +110,8 @@ urlpatterns = [
     # URLs para logs del sistema
     path('dashboard/logs/', views.admin_logs, name='admin_logs'),
     path('dashboard/logs/exportar/', views.exportar_logs, name='exportar_logs'),
+    path('dashboard/reportes/<int:reporte_id>/descargar/', views.descargar_reporte, name='descargar_reporte'),
+    path('dashboard/reportes/<int:reporte_id>/estado/', views.estado_reporte, name='estado_reporte'),
 
     # ---------------------
     # VISTAS DE COMENTARIOS
@@ -33,10 +33,12 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
-from django.db.models import Sum, Q, Count
+from django.db.models import DateTimeField, Q, Sum
 from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse, FileResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
 from django.urls import reverse, reverse_lazy
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
@@ -48,12 +50,15 @@ from decimal import Decimal
 import uuid
 import random
 import csv
+import json
+from urllib.parse import urlencode
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework import status
+from rest_framework.pagination import CursorPagination
 
 from .forms import (
     CustomUserCreationForm, CustomLoginForm, RifaForm, SanForm, 
@@ -63,18 +68,22 @@ from .forms import (
 from .models import (
     CustomUser, Factura, Rifa, Ticket, San, ParticipacionSan, 
     Cupo, Comment, SystemLog, PagoSimulado, NotificacionMejorada,
-    Notificacion, Reporte, HistorialAccion, SorteoRifa, TurnoSan, Mensaje
+    Notificacion, Reporte, HistorialAccion, SorteoRifa, TurnoSan, Mensaje,
+    WebhookPago, UsuarioConLogs
 )
 from .serializers import (
-    RifaSerializer, SanSerializer, TicketSerializer, FacturaSerializer,
+    RifaSerializer, RifaDetailSerializer, SanSerializer, TicketSerializer, FacturaSerializer,
     ParticipacionSanSerializer, CupoSerializer
 )
 from .backends import EmailOrUsernameModelBackend
+from .pasarelas import es_pago_electronico, verificar_firma
+from . import analitica, busqueda, cohortes, condicional, contabilidad, exportaciones, finanzas, reportes_pdf, limites, metricas, pantallas, portada, sincronizacion
 
 # Importaciones adicionales para vistas específicas
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.views import PasswordResetView
 from django.views.decorators.http import require_POST
+from django.views.decorators.csrf import csrf_exempt
 import io
 from reportlab.pdfgen import canvas
 
@@ -188,7 +197,7 @@ def login_view(request):
     """
     if request.method == 'POST':
         # Procesar formulario de login
-        form = CustomLoginForm(request.POST)
+        form = CustomLoginForm(request.POST, request=request)
         if form.is_valid():
             email = form.cleaned_data['email']
             password = form.cleaned_data['password']
@@ -225,22 +234,8 @@ def logout_view(request):
 # ---------------------
 def home(request):
     """Vista principal del sistema"""
-    # Obtener rifas y sanes activos
-    rifas_activas = Rifa.objects.filter(estado='activa').order_by('-created_at')[:6]
-    sanes_activos = San.objects.filter(estado='activo').order_by('-created_at')[:6]
-    
-    # Estadísticas generales
-    total_rifas = Rifa.objects.count()
-    total_sanes = San.objects.count()
-    total_usuarios = CustomUser.objects.count()
-    
-    context = {
-        'rifas_activas': rifas_activas,
-        'sanes_activos': sanes_activos,
-        'total_rifas': total_rifas,
-        'total_sanes': total_sanes,
-        'total_usuarios': total_usuarios,
-    }
+    # Rifas y sanes activos y estadísticas generales, desde la caché de la portada
+    context = portada.contexto()
     
     return render(request, 'home.html', context)
 
@@ -257,20 +252,17 @@ class RifaListView(ListView):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # El organizador solo se lee al renderizar tarjetas que no están en caché
+        queryset = super().get_queryset().select_related('organizador')
         # Filtrar por estado si se especifica
         estado = self.request.GET.get('estado')
         if estado:
             queryset = queryset.filter(estado=estado)
         
-        # Búsqueda por título
+        # Búsqueda por título, premio y descripción (por relevancia)
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(titulo__icontains=search) | 
-                Q(descripcion__icontains=search) |
-                Q(premio__icontains=search)
-            )
+            queryset = busqueda.filtrar(queryset, search)
         
         return queryset
     
@@ -280,8 +272,9 @@ class RifaListView(ListView):
         return context
 
 
+@method_decorator(condicional.detalle(Rifa, por_usuario=True), name='get')
 class RifaDetailView(DetailView):
-    """Detalle de una rifa específica"""
+    """Detalle de una rifa específica; responde 304 si la rifa no cambió"""
     model = Rifa
     template_name = 'raffle/raffle_detail.html'
     context_object_name = 'rifa'
@@ -349,6 +342,7 @@ class RifaUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
 
 @login_required
+@limites.limitar('checkout', '10/m')
 def comprar_ticket_rifa(request, rifa_id):
     """Comprar tickets de una rifa con pasarelas de pago simuladas"""
     rifa = get_object_or_404(Rifa, id=rifa_id)
@@ -379,39 +373,44 @@ def comprar_ticket_rifa(request, rifa_id):
                 monto_total=rifa.precio_ticket * cantidad,
                 estado_pago='pendiente',
                 metodo_pago=metodo_pago,
-                tipo='ticket_rifa',
-                concepto=f'Compra de {cantidad} ticket(s) - {rifa.titulo}',
-                monto=rifa.precio_ticket * cantidad
+                concepto=f'Compra de {cantidad} ticket(s) - {rifa.titulo}'
             )
             
-            # Crear pago simulado
+            # Crear pago simulado; el electrónico nace 'procesando' para que
+            # procesar_pagos no lo cobre a la vez (lo recupera si esta petición muere)
             pago_simulado = PagoSimulado.objects.create(
                 usuario=request.user,
                 factura=factura,
                 monto=factura.monto_total,
                 metodo_pago=metodo_pago,
-                estado='pendiente'
+                estado='procesando' if es_pago_electronico(metodo_pago) else 'pendiente'
             )
             
-            # Crear tickets
+            # Crear tickets; la versión de la rifa sube una vez por compra, después
+            # de rifa.save() (que si no la sobrescribiría con la versión leída)
             tickets_creados = []
-            for i in range(cantidad):
-                ticket = Ticket.objects.create(
-                    rifa=rifa,
-                    usuario=request.user,
-                    precio_pagado=rifa.precio_ticket,
-                    factura=factura
-                )
-                tickets_creados.append(ticket)
-            
-            # Actualizar tickets disponibles
-            rifa.tickets_disponibles -= cantidad
-            rifa.save()
+            with condicional.agrupar():
+                for i in range(cantidad):
+                    ticket = Ticket.objects.create(
+                        rifa=rifa,
+                        usuario=request.user,
+                        precio_pagado=rifa.precio_ticket,
+                        factura=factura
+                    )
+                    tickets_creados.append(ticket)
+                
+                # Actualizar tickets disponibles
+                rifa.tickets_disponibles -= cantidad
+                rifa.save()
             
-            # Procesar pago simulado
-            if metodo_pago in ['paypal', 'stripe', 'nequi']:
-                # Simular procesamiento de pago electrónico
-                if pago_simulado.procesar_pago():
+        # Cobrar a través de la pasarela del método de pago electrónico, con la
+        # compra ya confirmada: la espera a la pasarela no retiene bloqueos
+        if es_pago_electronico(metodo_pago):
+            pago_simulado.procesar_pago()
+
+        with transaction.atomic():
+            if pago_simulado.estado in ('exitoso', 'fallido'):
+                if pago_simulado.estado == 'exitoso':
                     factura.estado_pago = 'confirmado'
                     factura.monto_pagado = factura.monto_total
                     factura.fecha_pago = timezone.now()
@@ -446,15 +445,12 @@ def comprar_ticket_rifa(request, rifa_id):
                     messages.success(request, f'¡Compra exitosa! Se compraron {cantidad} ticket(s) para la rifa "{rifa.titulo}".')
                     return redirect('checkout_raffle', rifa_id=rifa_id)
                 else:
-                    # Pago fallido
+                    # Pago fallido: aplicar_resultado ya rechazó la factura y devolvió los tickets
+                    # (webhooks.liberar_reservas, el mismo camino que usa el worker de pagos)
                     messages.error(request, 'El pago no pudo ser procesado. Por favor, inténtalo de nuevo.')
-                    # Revertir cambios
-                    factura.delete()
-                    rifa.tickets_disponibles += cantidad
-                    rifa.save()
                     return redirect('rifa_detail', pk=rifa_id)
             else:
-                # Pago en efectivo o transferencia - pendiente de confirmación
+                # Pago en efectivo, transferencia o pasarela sin respuesta - pendiente de confirmación
                 messages.success(request, f'Se ha creado tu pedido de {cantidad} ticket(s). El pago está pendiente de confirmación.')
                 
                 # Log del sistema
@@ -491,6 +487,7 @@ def comprar_ticket_rifa(request, rifa_id):
 
 
 @login_required
+@limites.limitar('checkout', '10/m')
 def checkout_raffle(request, rifa_id):
     """Checkout para compra de tickets de rifa con información detallada"""
     rifa = get_object_or_404(Rifa, id=rifa_id)
@@ -540,7 +537,8 @@ class SanListView(ListView):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # El organizador solo se lee al renderizar tarjetas que no están en caché
+        queryset = super().get_queryset().select_related('organizador')
         # Filtrar por estado si se especifica
         estado = self.request.GET.get('estado')
         if estado:
@@ -551,13 +549,10 @@ class SanListView(ListView):
         if tipo:
             queryset = queryset.filter(tipo=tipo)
         
-        # Búsqueda por nombre
+        # Búsqueda por nombre y descripción (por relevancia)
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(nombre__icontains=search) | 
-                Q(descripcion__icontains=search)
-            )
+            queryset = busqueda.filtrar(queryset, search)
         
         return queryset
     
@@ -568,8 +563,9 @@ class SanListView(ListView):
         return context
 
 
+@method_decorator(condicional.detalle(San, por_usuario=True), name='get')
 class SanDetailView(DetailView):
-    """Detalle de un san específico"""
+    """Detalle de un san específico; responde 304 si el san no cambió"""
     model = San
     template_name = 'san/san_detail.html'
     context_object_name = 'san'
@@ -698,18 +694,17 @@ def inscribirse_san(request, san_id):
                 monto_total=san.precio_cuota,
                 estado_pago='pendiente',
                 metodo_pago=metodo_pago,
-                tipo='inscripcion_san',
-                concepto=f'Inscripción al SAN {san.nombre}',
-                monto=san.precio_cuota
+                concepto=f'Inscripción al SAN {san.nombre}'
             )
             
-            # Crear pago simulado
+            # Crear pago simulado; el electrónico nace 'procesando' para que
+            # procesar_pagos no lo cobre a la vez (lo recupera si esta petición muere)
             pago_simulado = PagoSimulado.objects.create(
                 usuario=request.user,
                 factura=factura,
                 monto=san.precio_cuota,
                 metodo_pago=metodo_pago,
-                estado='pendiente'
+                estado='procesando' if es_pago_electronico(metodo_pago) else 'pendiente'
             )
             
             # Actualizar contador de participantes
@@ -739,10 +734,14 @@ def inscribirse_san(request, san_id):
                     monto_cuota=san.precio_cuota
                 )
             
-            # Procesar pago de inscripción
-            if metodo_pago in ['paypal', 'stripe', 'nequi']:
-                # Simular procesamiento de pago electrónico
-                if pago_simulado.procesar_pago():
+        # Cobrar la inscripción a través de la pasarela del método de pago, con la
+        # inscripción ya confirmada: la espera a la pasarela no retiene bloqueos
+        if es_pago_electronico(metodo_pago):
+            pago_simulado.procesar_pago()
+
+        with transaction.atomic():
+            if pago_simulado.estado in ('exitoso', 'fallido'):
+                if pago_simulado.estado == 'exitoso':
                     factura.estado_pago = 'confirmado'
                     factura.monto_pagado = factura.monto_total
                     factura.fecha_pago = timezone.now()
@@ -788,16 +787,12 @@ def inscribirse_san(request, san_id):
                     messages.success(request, f'¡Inscripción exitosa! Te has unido al SAN "{san.nombre}" con el turno #{orden_cobro}.')
                     return redirect('checkout_san', san_id=san_id)
                 else:
-                    # Pago fallido
+                    # Pago fallido: aplicar_resultado ya rechazó la factura y devolvió la plaza en el san
+                    # (webhooks.liberar_reservas, el mismo camino que usa el worker de pagos)
                     messages.error(request, 'El pago no pudo ser procesado. Por favor, inténtalo de nuevo.')
-                    # Revertir cambios
-                    participacion.delete()
-                    factura.delete()
-                    san.participantes_actuales -= 1
-                    san.save()
                     return redirect('san_detail', pk=san_id)
             else:
-                # Pago en efectivo o transferencia - pendiente de confirmación
+                # Pago en efectivo, transferencia o pasarela sin respuesta - pendiente de confirmación
                 messages.success(request, f'Te has inscrito al SAN "{san.nombre}" con el turno #{orden_cobro}. El pago está pendiente de confirmación.')
                 
                 # Log del sistema
@@ -833,6 +828,7 @@ def inscribirse_san(request, san_id):
 
 
 @login_required
+@limites.limitar('checkout', '10/m')
 def checkout_san(request, san_id):
     """Checkout para inscripción en SAN con información detallada"""
     san = get_object_or_404(San, id=san_id)
@@ -981,6 +977,32 @@ def pagar_cuota_san(request, cupo_id):
     return redirect('san_detail', pk=cupo.san.id)
 
 
+# ---------------------
+# WEBHOOKS DE PASARELAS DE PAGO
+# ---------------------
+@csrf_exempt
+@require_POST
+def webhook_pasarela(request, pasarela):
+    """Verifica y guarda un webhook de pasarela; se aplica después por lotes"""
+    if not verificar_firma(pasarela, request.body, request.headers.get('X-Firma')):
+        return JsonResponse({'error': 'Firma inválida'}, status=401)
+
+    try:
+        payload = json.loads(request.body)
+        evento_id = str(payload['id'])
+        tipo = str(payload['tipo'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Evento inválido'}, status=400)
+
+    WebhookPago.objects.create(
+        pasarela=pasarela,
+        evento_id=evento_id[:100],
+        tipo=tipo[:50],
+        payload=payload
+    )
+    return JsonResponse({'recibido': True})
+
+
 # ---------------------
 # VISTAS DE PERFIL DE USUARIO
 # ---------------------
@@ -1038,6 +1060,25 @@ def cambiar_foto_perfil(request):
     return redirect('user_profile')
 
 
+def _organizador_analitica(request, datos):
+    """Organizador de la analítica: el usuario, o el indicado por un administrador"""
+    organizador_id = datos.get('organizador')
+    if organizador_id and (request.user.is_staff or request.user.is_admin()):
+        return get_object_or_404(CustomUser, pk=organizador_id)
+    return request.user
+
+
+@login_required
+def analitica_organizador(request):
+    """Ventas por hora, ritmo, proyección de agotamiento y conversión de un organizador"""
+    organizador = _organizador_analitica(request, request.GET)
+    context = {
+        'organizador': organizador,
+        'analitica': analitica.resumen_organizador(organizador),
+    }
+    return render(request, 'user/analitica.html', context)
+
+
 # ---------------------
 # VISTAS DE ADMINISTRACIÓN
 # ---------------------
@@ -1046,14 +1087,15 @@ def cambiar_foto_perfil(request):
 @user_passes_test(lambda u: u.is_superuser)
 def admin_dashboard(request):
     """Dashboard de administración"""
-    # Estadísticas generales
-    total_usuarios = CustomUser.objects.count()
-    total_rifas = Rifa.objects.count()
-    total_sanes = San.objects.count()
-    total_facturas = Factura.objects.count()
+    # Estadísticas generales (tabla de métricas: una consulta)
+    resumen = metricas.resumen()
+    total_usuarios = resumen.total('usuarios')
+    total_rifas = resumen.total('rifas')
+    total_sanes = resumen.total('sanes')
+    total_facturas = resumen.total('facturas')
     
     # Facturas pendientes
-    facturas_pendientes = Factura.objects.filter(estado_pago='pendiente').order_by('-fecha_emision')
+    facturas_pendientes = Factura.objects.filter(estado_pago='pendiente').select_related('usuario').order_by('-fecha_emision')[:5]
     
     # Últimas actividades
     ultimas_rifas = Rifa.objects.order_by('-created_at')[:5]
@@ -1065,6 +1107,7 @@ def admin_dashboard(request):
         'total_sanes': total_sanes,
         'total_facturas': total_facturas,
         'facturas_pendientes': facturas_pendientes,
+        'total_facturas_pendientes': resumen.total('facturas', 'pendiente'),
         'ultimas_rifas': ultimas_rifas,
         'ultimos_sanes': ultimos_sanes,
     }
@@ -1133,21 +1176,45 @@ def rechazar_pago(request, factura_id):
 # ---------------------
 # VISTAS DE REPORTES
 # ---------------------
+def _reporte_en_pantalla(request, tipo):
+    """Trabajo con los datos del reporte para el periodo y estado de los filtros"""
+    estados = dict(Rifa.ESTADOS_RIFA if tipo == 'rifa' else San.ESTADOS_SAN)
+    estado = request.GET.get('estado')
+    try:
+        return reportes_pdf.obtener_o_solicitar(
+            tipo, request.user, request.GET.get('fecha_desde'), request.GET.get('fecha_hasta'),
+            formato='datos', estado=estado if estado in estados else None,
+        )
+    except ValueError:
+        messages.error(request, 'Las fechas del periodo no son válidas.')
+        return None
+
+
 @login_required
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def reporte_rifas(request):
-    """Reporte de rifas"""
-    rifas = Rifa.objects.all().order_by('-created_at')
+    """
+    Reporte de rifas.
+
+    La tabla la calcula procesar_reportes; mientras tanto la página muestra
+    el avance y peticiones iguales comparten el mismo trabajo.
+    """
+    if request.GET.get('export') == 'pdf':
+        consulta = urlencode({'desde': request.GET.get('fecha_desde', ''), 'hasta': request.GET.get('fecha_hasta', '')})
+        return redirect(f"{reverse('exportar_reporte_pdf', args=['rifa'])}?{consulta}")
+    reporte = _reporte_en_pantalla(request, 'rifa')
     
     # Estadísticas
-    total_rifas = rifas.count()
-    rifas_activas = rifas.filter(estado='activa').count()
-    rifas_finalizadas = rifas.filter(estado='finalizada').count()
-    total_tickets_vendidos = Ticket.objects.count()
+    resumen = metricas.resumen()
+    total_rifas = resumen.total('rifas')
+    rifas_activas = resumen.total('rifas', 'activa')
+    rifas_finalizadas = resumen.total('rifas', 'finalizada')
+    total_tickets_vendidos = resumen.total('tickets')
     
     context = {
-        'rifas': rifas,
+        'reporte': reporte,
+        'informe': reporte.resultado if reporte and reporte.estado == 'listo' else None,
         'total_rifas': total_rifas,
         'rifas_activas': rifas_activas,
         'rifas_finalizadas': rifas_finalizadas,
@@ -1161,17 +1228,22 @@ def reporte_rifas(request):
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def reporte_sanes(request):
-    """Reporte de sanes"""
-    sanes = San.objects.all().order_by('-created_at')
+    """Reporte de sanes; la tabla se calcula en segundo plano como en reporte_rifas"""
+    if request.GET.get('export') == 'pdf':
+        consulta = urlencode({'desde': request.GET.get('fecha_desde', ''), 'hasta': request.GET.get('fecha_hasta', '')})
+        return redirect(f"{reverse('exportar_reporte_pdf', args=['san'])}?{consulta}")
+    reporte = _reporte_en_pantalla(request, 'san')
     
     # Estadísticas
-    total_sanes = sanes.count()
-    sanes_activos = sanes.filter(estado='activo').count()
-    sanes_finalizados = sanes.filter(estado='finalizado').count()
-    total_participantes = ParticipacionSan.objects.count()
+    resumen = metricas.resumen()
+    total_sanes = resumen.total('sanes')
+    sanes_activos = resumen.total('sanes', 'activo')
+    sanes_finalizados = resumen.total('sanes', 'finalizado')
+    total_participantes = resumen.total('participaciones')
     
     context = {
-        'sanes': sanes,
+        'reporte': reporte,
+        'informe': reporte.resultado if reporte and reporte.estado == 'listo' else None,
         'total_sanes': total_sanes,
         'sanes_activos': sanes_activos,
         'sanes_finalizados': sanes_finalizados,
@@ -1184,42 +1256,230 @@ def reporte_sanes(request):
 # ---------------------
 # VISTAS API (REST Framework)
 # ---------------------
+class PaginacionCursorAPI(CursorPagination):
+    """
+    Paginación por cursor de los listados de la API.
+
+    ``orden`` elige uno de ``ordenes`` (el primero por defecto); el ``id``
+    final desempata para que el cursor sea estable.
+    """
+    page_size = 20
+    page_size_query_param = 'limite'
+    max_page_size = 100
+
+    def __init__(self, ordenes):
+        self.ordenes = ordenes
+        self.ordering = ordenes[0]
+
+    def get_ordering(self, request, queryset, view):
+        orden = request.query_params.get('orden')
+        campo = orden if orden in self.ordenes else self.ordering
+        return (campo, '-id' if campo.startswith('-') else 'id')
+
+
+def _decimal_param(valor):
+    try:
+        numero = Decimal(valor) if valor else None
+    except ArithmeticError:
+        return None
+    # NaN e Infinity son Decimal válidos pero el ORM no los acepta
+    return numero if numero is not None and numero.is_finite() else None
+
+
+def _fecha_param(valor):
+    try:
+        return parse_date(valor or '')
+    except ValueError:
+        return None
+
+
+def _listado_api(request, queryset, serializer_class, campo_precio, relaciones):
+    """
+    Listado paginado por cursor con filtros, orden y campos parciales.
+
+    Parámetros: estado (uno o varios separados por coma), desde y hasta
+    (fecha de inicio), precio_min, precio_max, orden, fields (campos
+    separados por coma), limite y cursor. Los filtros inválidos se ignoran.
+    """
+    params = request.query_params
+    estados = [e for e in params.get('estado', '').split(',') if e]
+    if estados:
+        queryset = queryset.filter(estado__in=estados)
+    desde = _fecha_param(params.get('desde'))
+    hasta = _fecha_param(params.get('hasta'))
+    if hasta:
+        hasta += timedelta(days=1)
+    if isinstance(queryset.model._meta.get_field('fecha_inicio'), DateTimeField):
+        # Límites como datetimes locales para que el filtro use el índice de la columna
+        desde = desde and timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+        hasta = hasta and timezone.make_aware(datetime.combine(hasta, datetime.min.time()))
+    if desde:
+        queryset = queryset.filter(fecha_inicio__gte=desde)
+    if hasta:
+        queryset = queryset.filter(fecha_inicio__lt=hasta)
+    precio_min = _decimal_param(params.get('precio_min'))
+    precio_max = _decimal_param(params.get('precio_max'))
+    if precio_min is not None:
+        queryset = queryset.filter(**{f'{campo_precio}__gte': precio_min})
+    if precio_max is not None:
+        queryset = queryset.filter(**{f'{campo_precio}__lte': precio_max})
+
+    campos = [c for c in params.get('fields', '').split(',') if c] or None
+    relaciones = [r for r in relaciones if campos is None or r in campos]
+    if relaciones:
+        queryset = queryset.select_related(*relaciones)
+
+    paginacion = PaginacionCursorAPI([
+        '-created_at', 'created_at', 'fecha_fin', '-fecha_fin', campo_precio, f'-{campo_precio}'
+    ])
+    pagina = paginacion.paginate_queryset(queryset, request)
+    serializer = serializer_class(pagina, many=True, campos=campos)
+    return paginacion.get_paginated_response(serializer.data)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional.listado(Rifa, metricas.USUARIOS_PUBLICOS)
 def api_rifa_list(request):
-    """API: Lista de rifas"""
-    rifas = Rifa.objects.all()
-    serializer = RifaSerializer(rifas, many=True)
-    return Response(serializer.data)
+    """API: Lista de rifas, paginada por cursor (ver ``_listado_api``)"""
+    return _listado_api(request, Rifa.objects.all(), RifaSerializer, 'precio_ticket', ['organizador', 'ganador'])
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional.detalle(Rifa)
 def api_rifa_detail(request, pk):
-    """API: Detalle de rifa"""
-    rifa = get_object_or_404(Rifa, pk=pk)
-    serializer = RifaSerializer(rifa)
+    """
+    API: Detalle de rifa (con ETag y Last-Modified).
+
+    Con ``?tickets=1`` incluye los tickets en columnas y sus compradores.
+    """
+    rifa = get_object_or_404(Rifa.objects.select_related('organizador', 'ganador'), pk=pk)
+    if request.query_params.get('tickets'):
+        serializer = RifaDetailSerializer(rifa)
+    else:
+        serializer = RifaSerializer(rifa)
     return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional.listado(San, metricas.USUARIOS_PUBLICOS)
 def api_san_list(request):
-    """API: Lista de sanes"""
-    sanes = San.objects.all()
-    serializer = SanSerializer(sanes, many=True)
-    return Response(serializer.data)
+    """API: Lista de sanes, paginada por cursor (ver ``_listado_api``)"""
+    return _listado_api(request, San.objects.all(), SanSerializer, 'precio_cuota', ['organizador'])
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional.detalle(San)
 def api_san_detail(request, pk):
-    """API: Detalle de san"""
+    """API: Detalle de san (con ETag y Last-Modified)"""
     san = get_object_or_404(San, pk=pk)
     serializer = SanSerializer(san)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_reporte_finanzas(request):
+    """
+    API: Serie financiera y una página del detalle.
+
+    Parámetros: fecha_desde, fecha_hasta, agrupacion (dia|semana|mes),
+    tipo (general|rifas|sanes), metodo y antes_de (cursor del detalle).
+    """
+    parametros = finanzas.parametros_finanzas(request.query_params)
+    serie = finanzas.serie(parametros)
+    filas, siguiente = finanzas.pagina_detalle(parametros, request.query_params.get('antes_de'))
+    return Response({
+        'parametros': parametros,
+        'totales': finanzas.totales(serie),
+        'serie': serie,
+        'detalle': [dict(zip(finanzas.COLUMNAS_DETALLE, fila)) for fila in filas],
+        'siguiente': siguiente,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_analitica_organizador(request):
+    """
+    API: Analítica de ventas del organizador autenticado.
+
+    Los administradores pueden consultar otro organizador con ``organizador``.
+    """
+    organizador = _organizador_analitica(request, request.query_params)
+    return Response({'organizador': organizador.id, **analitica.resumen_organizador(organizador)})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@throttle_classes([limites.throttle('busqueda', '120/m', por='ip')])
+def api_buscar(request):
+    """
+    API: Búsqueda de rifas y sanes por relevancia, con sugerencias para autocompletar.
+
+    Parámetros: q, tipo (rifa|san) y limite (máximo 20). La usan el
+    buscador web y la app móvil.
+    """
+    texto = request.query_params.get('q', '')[:200]
+    tipo = request.query_params.get('tipo')
+    tipo = tipo if tipo in busqueda.CAMPOS else None
+    try:
+        limite = max(1, min(int(request.query_params.get('limite', 10)), 20))
+    except ValueError:
+        limite = 10
+    return Response({
+        'q': texto,
+        'resultados': busqueda.buscar(texto, tipo, limite),
+        'sugerencias': busqueda.sugerencias(texto, tipo),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([limites.throttle('sincronizacion', '60/m')])
+def api_inicio(request):
+    """
+    API: Datos de las pantallas de inicio y perfil de la app en una respuesta.
+
+    Parámetros: secciones (separadas por coma; todas por defecto) y
+    versiones ('seccion.version,...' de una respuesta anterior); solo se
+    envían las secciones que cambiaron.
+    """
+    secciones = [s for s in request.query_params.get('secciones', '').split(',') if s] or None
+    conocidas = pantallas.leer_versiones(request.query_params.get('versiones'))
+    return Response(pantallas.datos(request.user, secciones, conocidas))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([limites.throttle('sincronizacion', '60/m')])
+def api_cambios(request):
+    """
+    API: Cambios de rifas, sanes y datos del usuario desde un token de sincronización.
+
+    Parámetros: desde (token de la respuesta anterior) y limite (máximo
+    500). Sin ``desde`` solo devuelve el token actual, que el cliente guarda
+    antes de cargar las listas completas; con un token demasiado antiguo
+    responde 410 y el cliente debe recargar todo.
+    """
+    try:
+        desde = int(request.query_params['desde'])
+    except KeyError:
+        return Response({'token': sincronizacion.token_actual(), 'hay_mas': False, 'cambios': {}})
+    except ValueError:
+        return Response({'error': 'Token inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    if not sincronizacion.vigente(desde):
+        return Response({'error': 'Token vencido, recarga los datos'}, status=status.HTTP_410_GONE)
+    try:
+        limite = max(1, min(int(request.query_params.get('limite', sincronizacion.LOTE)), sincronizacion.LOTE))
+    except ValueError:
+        limite = sincronizacion.LOTE
+    return Response(sincronizacion.cambios(request.user, desde, limite))
+
+
 # ---------------------
 # VISTAS DE ERROR
 # ---------------------
@@ -1506,14 +1766,85 @@ def crear_san(request):
 
 @admin_required
 def reporte_finanzas(request):
-    """Generar reporte de facturas y pagos"""
-    facturas = Factura.objects.all()
-    total_facturado = facturas.aggregate(Sum('monto_total'))['monto_total__sum'] or 0
-    total_pagado = facturas.filter(estado_pago='confirmado').aggregate(Sum('monto_total'))['monto_total__sum'] or 0
-    return render(request, 'admin/reportes/finanzas.html', {
-        'facturas': facturas,
-        'total_facturado': total_facturado,
-        'total_pagado': total_pagado,
+    """
+    Reporte financiero por día, semana o mes, con el detalle paginado por ID.
+
+    Con ?export=csv o ?export=excel se descarga el detalle en flujo y con
+    ?export=pdf se pasa al informe PDF del mismo periodo.
+    """
+    parametros = finanzas.parametros_finanzas(request.GET)
+    exportar = request.GET.get('export')
+    if exportar == 'pdf':
+        consulta = urlencode({'desde': parametros['fecha_desde'], 'hasta': parametros['fecha_hasta']})
+        return redirect(f"{reverse('exportar_reporte_pdf', args=['finanzas'])}?{consulta}")
+    if exportar in ('csv', 'excel'):
+        formato = 'xlsx' if exportar == 'excel' else 'csv'
+        response = StreamingHttpResponse(
+            finanzas.exportar(parametros, formato),
+            content_type=(
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                if formato == 'xlsx' else 'text/csv; charset=utf-8'
+            ),
+        )
+        response['Content-Disposition'] = f'attachment; filename="{finanzas.nombre_archivo(parametros, formato)}"'
+        return response
+
+    serie = finanzas.serie(parametros)
+    total = finanzas.totales(serie)
+    por_tipo = finanzas.totales(serie, 'tipo')
+    ingresos_rifas = por_tipo.get('rifa', {}).get('cobrado', 0)
+    ingresos_sanes = por_tipo.get('san', {}).get('cobrado', 0)
+    transacciones, siguiente = finanzas.pagina_detalle(parametros, request.GET.get('antes_de'))
+
+    return render(request, 'admin/reportes/financiero.html', {
+        'parametros': parametros,
+        'agrupaciones': [('dia', 'Día'), ('semana', 'Semana'), ('mes', 'Mes')],
+        'metodos_pago': Factura.METODOS_PAGO,
+        'periodos': finanzas.por_periodo(serie),
+        'por_metodo': [
+            (dict(Factura.METODOS_PAGO).get(metodo, metodo), fila)
+            for metodo, fila in sorted(finanzas.totales(serie, 'metodo_pago').items())
+        ],
+        'totales': total,
+        'ingresos_totales': total['cobrado'],
+        'ingresos_rifas': ingresos_rifas,
+        'ingresos_sanes': ingresos_sanes,
+        'porcentaje_rifas': round(ingresos_rifas * 100 / total['cobrado']) if total['cobrado'] else 0,
+        'porcentaje_sanes': round(ingresos_sanes * 100 / total['cobrado']) if total['cobrado'] else 0,
+        'transacciones': transacciones,
+        'filtros': urlencode(parametros),
+        'siguiente': siguiente,
+        'es_primera_pagina': not request.GET.get('antes_de'),
+    })
+
+
+@admin_required
+def reporte_cohortes(request):
+    """
+    Retención por cohorte de registro (semana o mes).
+
+    Las matrices las calcula procesar_reportes y se reutilizan varias horas;
+    mientras se calculan la página muestra el avance.
+    """
+    parametros = cohortes.parametros_cohortes(request.GET)
+    reporte = cohortes.obtener_o_solicitar(request.user, parametros)
+    metrica = request.GET.get('metrica')
+    metrica = metrica if metrica in cohortes.METRICAS else 'recompra'
+    resultado = reporte.resultado if reporte.estado == 'listo' else None
+    filas = []
+    if resultado:
+        filas = [
+            (cohorte, celdas)
+            for cohorte, celdas in zip(resultado['cohortes'], resultado['metricas'][metrica])
+        ]
+    return render(request, 'admin/reportes/cohortes.html', {
+        'parametros': parametros,
+        'periodos': cohortes.PERIODOS.items(),
+        'metricas': cohortes.METRICAS.items(),
+        'metrica': metrica,
+        'reporte': reporte,
+        'filas': filas,
+        'desfases': range(parametros['periodos']),
     })
 
 def admin_required(view_func):
@@ -1567,22 +1898,35 @@ def enviar_notificacion_global(request):
     return render(request, 'admin/notificaciones/enviar.html')
 
 
+@admin_required
+def exportar_reporte_pdf(request, tipo):
+    """
+    Exportar un reporte (rifas, sanes, facturas o finanzas) a PDF.
+
+    El PDF lo genera procesar_reportes en segundo plano; si ya existe uno
+    vigente para el mismo periodo se descarga directamente.
+    """
+    if tipo not in reportes_pdf.INFORMES:
+        messages.error(request, 'Tipo de reporte no válido.')
+        return redirect('admin_reportes')
+    try:
+        reporte = reportes_pdf.obtener_o_solicitar(
+            tipo, request.user, request.GET.get('desde'), request.GET.get('hasta')
+        )
+    except ValueError:
+        messages.error(request, 'Las fechas del periodo no son válidas.')
+        return redirect('admin_reportes')
+    
+    if reporte.estado == 'listo':
+        return redirect('descargar_reporte', reporte_id=reporte.id)
+    messages.info(request, f'El reporte "{reporte.descripcion}" se está generando; aparecerá en la lista al terminar.')
+    return redirect('admin_reportes')
+
+
 @admin_required
 def exportar_reporte_rifas_pdf(request):
     """Exportar reporte de rifas a PDF"""
-    rifas = Rifa.objects.all()
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer)
-    p.setFont("Helvetica", 12)
-    p.drawString(100, 800, "Reporte de Rifas")
-    y = 760
-    for rifa in rifas:
-        p.drawString(100, y, f"{rifa.titulo} - Estado: {rifa.estado} - Tickets vendidos: {rifa.tickets.count()}")
-        y -= 20
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return FileResponse(buffer, as_attachment=True, filename="reporte_rifas.pdf")
+    return exportar_reporte_pdf(request, 'rifa')
 
 
 @admin_required
@@ -1603,31 +1947,68 @@ def asignar_turnos_san(request, san_id):
     return render(request, 'admin/sanes/asignar_turnos.html', {'san': san, 'participaciones': participaciones})
 
 def exportar_logs(request):
-    """Exportar logs del sistema a CSV"""
+    """
+    Exportar logs del sistema a CSV, con los filtros de admin_logs.
+
+    El CSV se envía en streaming por lotes, así que la memoria no crece con
+    el número de filas. Con ?gzip=1 se comprime y con ?segundo_plano=1 se
+    genera un archivo con procesar_reportes y se devuelve su enlace.
+    """
     if not request.user.is_superuser:
         messages.error(request, 'No tienes permisos para acceder a esta función.')
         return redirect('admin_dashboard')
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="logs_sistema.csv"'
+    parametros = exportaciones.parametros_logs(request.GET)
+    comprimir = request.GET.get('gzip') == '1'
     
-    writer = csv.writer(response)
-    writer.writerow(['Usuario', 'Acción', 'Nivel', 'Descripción', 'IP', 'Fecha'])
-    
-    logs = SystemLog.objects.all().order_by('-fecha_creacion')
-    for log in logs:
-        writer.writerow([
-            log.usuario.username if log.usuario else 'Sistema',
-            log.get_tipo_accion_display(),
-            log.get_nivel_display(),
-            log.descripcion,
-            log.ip_address,
-            log.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S')
-        ])
+    if request.GET.get('segundo_plano') == '1':
+        reporte = exportaciones.solicitar_exportacion_logs(request.user, parametros, comprimir)
+        enlace = reverse('descargar_reporte', args=[reporte.id])
+        messages.success(
+            request,
+            f'La exportación se está generando. Podrás descargarla en {request.build_absolute_uri(enlace)}'
+        )
+        return redirect(f"{reverse('admin_logs')}?{urlencode(parametros)}")
     
+    response = StreamingHttpResponse(
+        exportaciones.csv_logs(parametros, comprimir),
+        content_type='application/gzip' if comprimir else 'text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exportaciones.nombre_archivo_logs(comprimir)}"'
     return response
 
 
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+def descargar_reporte(request, reporte_id):
+    """Descarga el archivo de un reporte generado en segundo plano"""
+    reporte = get_object_or_404(Reporte, id=reporte_id)
+    if reporte.estado != 'listo' or not reporte.archivo:
+        if reporte.estado == 'error':
+            messages.error(request, f'El reporte falló: {reporte.error}')
+        else:
+            messages.info(request, 'El reporte todavía se está generando. Inténtalo de nuevo en unos minutos.')
+        return redirect('admin_logs' if reporte.tipo == 'logs' else 'admin_reportes')
+    return FileResponse(reporte.archivo.open('rb'), as_attachment=True,
+                        filename=reporte.archivo.name.rsplit('/', 1)[-1])
+
+
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+def estado_reporte(request, reporte_id):
+    """Estado y avance de un reporte en segundo plano, para el panel"""
+    reporte = get_object_or_404(Reporte, id=reporte_id)
+    return JsonResponse({
+        'id': reporte.id,
+        'estado': reporte.estado,
+        'estado_display': reporte.get_estado_display(),
+        'progreso': reporte.progreso,
+        'filas': reporte.filas,
+        'error': reporte.error,
+        'descarga': reverse('descargar_reporte', args=[reporte.id]) if reporte.archivo else None,
+    })
+
+
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def cambiar_estado_factura(request, factura_id):
@@ -1662,59 +2043,50 @@ def cambiar_estado_factura(request, factura_id):
 @login_required
 @user_passes_test(lambda u: u.is_superuser)
 def admin_logs(request):
-    """Vista para mostrar logs del sistema (admin)"""
-    # Filtros
-    action_type = request.GET.get('action_type')
-    level = request.GET.get('level')
-    user_id = request.GET.get('user')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    # Query base
-    logs = SystemLog.objects.all().select_related('usuario').order_by('-fecha_creacion')
-    
-    # Aplicar filtros
-    if action_type:
-        logs = logs.filter(tipo_accion=action_type)
-    if level:
-        logs = logs.filter(nivel=level)
-    if user_id:
-        logs = logs.filter(usuario_id=user_id)
-    if date_from:
-        logs = logs.filter(fecha_creacion__gte=date_from)
-    if date_to:
-        logs = logs.filter(fecha_creacion__lte=date_to)
-    
-    # Paginación
-    paginator = Paginator(logs, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    """
+    Vista para mostrar logs del sistema (admin).
+
+    Se pagina por cursor sobre (fecha_creacion, id) en vez de OFFSET, el
+    total es aproximado y las ventanas de hoy/semana/mes salen de la tabla
+    de métricas diarias, así que la página no se vuelve más lenta con los logs.
+    """
+    # Filtros (compartidos con exportar_logs)
+    parametros = exportaciones.parametros_logs(request.GET)
+    logs = exportaciones.filtrar_logs(parametros, SystemLog.objects.select_related('usuario'))
+    
+    # Paginación por cursor
+    page_obj = exportaciones.pagina_logs(
+        logs,
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        ultima=request.GET.get('ultima') == '1',
+    )
+    exportaciones.precargar_objetos(page_obj)
     
     # Estadísticas
-    total_logs = SystemLog.objects.count()
-    today_logs = SystemLog.objects.filter(fecha_creacion__date=timezone.now().date()).count()
-    week_logs = SystemLog.objects.filter(fecha_creacion__gte=timezone.now() - timedelta(days=7)).count()
-    month_logs = SystemLog.objects.filter(fecha_creacion__gte=timezone.now() - timedelta(days=30)).count()
+    resumen = metricas.resumen()
+    total_logs, total_es_tope = exportaciones.conteo_logs(parametros, resumen)
     
-    # Usuarios para filtro
-    users = CustomUser.objects.filter(logs__isnull=False).distinct()
+    # Usuarios para filtro (tabla mantenida, sin DISTINCT sobre los logs)
+    usuarios = CustomUser.objects.filter(
+        id__in=UsuarioConLogs.objects.values('usuario_id')
+    ).only('id', 'username').order_by('username')
     
+    filtros = urlencode(parametros)
     context = {
         'page_obj': page_obj,
-        'total_logs': total_logs,
-        'today_logs': today_logs,
-        'week_logs': week_logs,
-        'month_logs': month_logs,
-        'users': users,
+        'stats': {
+            'total_logs': total_logs,
+            'total_es_tope': total_es_tope,
+            'logs_hoy': resumen.hoy('logs'),
+            'logs_semana': resumen.semana('logs'),
+            'logs_mes': resumen.mes('logs'),
+        },
+        'usuarios': usuarios,
         'tipos_accion': SystemLog.TIPOS_ACCION,
         'niveles': SystemLog.NIVELES,
-        'filters': {
-            'action_type': action_type,
-            'level': level,
-            'user': user_id,
-            'date_from': date_from,
-            'date_to': date_to,
-        }
+        'filtros': parametros,
+        'enlace_filtros': filtros,
     }
     
     return render(request, 'admin/logs.html', context)
@@ -1825,8 +2197,9 @@ class AdminUserListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_usuarios'] = CustomUser.objects.count()
-        context['usuarios_activos'] = CustomUser.objects.filter(is_active=True).count()
+        resumen = metricas.resumen()
+        context['total_usuarios'] = resumen.total('usuarios')
+        context['usuarios_activos'] = resumen.total('usuarios', 'activo')
         return context
 
 
@@ -1879,18 +2252,16 @@ class AdminRifaListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(nombre__icontains=search) |
-                Q(organizador__username__icontains=search)
-            )
+            queryset = busqueda.filtrar(queryset, search, Q(organizador__username__istartswith=search.strip()))
         
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_rifas'] = Rifa.objects.count()
-        context['rifas_activas'] = Rifa.objects.filter(estado='activa').count()
-        context['rifas_finalizadas'] = Rifa.objects.filter(estado='finalizada').count()
+        resumen = metricas.resumen()
+        context['total_rifas'] = resumen.total('rifas')
+        context['rifas_activas'] = resumen.total('rifas', 'activa')
+        context['rifas_finalizadas'] = resumen.total('rifas', 'finalizada')
         return context
 
 
@@ -1914,18 +2285,16 @@ class AdminSanListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(nombre__icontains=search) |
-                Q(organizador__username__icontains=search)
-            )
+            queryset = busqueda.filtrar(queryset, search, Q(organizador__username__istartswith=search.strip()))
         
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_sanes'] = San.objects.count()
-        context['sanes_activos'] = San.objects.filter(estado='activo').count()
-        context['sanes_finalizados'] = San.objects.filter(estado='finalizado').count()
+        resumen = metricas.resumen()
+        context['total_sanes'] = resumen.total('sanes')
+        context['sanes_activos'] = resumen.total('sanes', 'activo')
+        context['sanes_finalizados'] = resumen.total('sanes', 'finalizado')
         return context
 
 
@@ -1949,7 +2318,7 @@ class AdminFacturaListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         
         tipo = self.request.GET.get('tipo')
         if tipo:
-            queryset = queryset.filter(tipo=tipo)
+            queryset = queryset.filter(content_type=Factura.content_type_de_tipo(tipo))
         
         search = self.request.GET.get('search')
         if search:
@@ -1962,12 +2331,11 @@ class AdminFacturaListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_facturas'] = Factura.objects.count()
-        context['facturas_pendientes'] = Factura.objects.filter(estado_pago='pendiente').count()
-        context['facturas_pagadas'] = Factura.objects.filter(estado_pago='confirmado').count()
-        context['total_recaudado'] = Factura.objects.filter(estado_pago='confirmado').aggregate(
-            total=Sum('monto_total')
-        )['total'] or 0
+        resumen = metricas.resumen()
+        context['total_facturas'] = resumen.total('facturas')
+        context['facturas_pendientes'] = resumen.total('facturas', 'pendiente')
+        context['facturas_pagadas'] = resumen.total('facturas', 'confirmado')
+        context['total_recaudado'] = resumen.monto('facturas', 'confirmado')
         return context
 
 
@@ -1982,41 +2350,36 @@ class AdminReporteView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Estadísticas generales
-        context['total_usuarios'] = CustomUser.objects.count()
-        context['total_rifas'] = Rifa.objects.count()
-        context['total_sanes'] = San.objects.count()
-        context['total_facturas'] = Factura.objects.count()
+        resumen = metricas.resumen()
+        context['total_usuarios'] = resumen.total('usuarios')
+        context['total_rifas'] = resumen.total('rifas')
+        context['total_sanes'] = resumen.total('sanes')
+        context['total_facturas'] = resumen.total('facturas')
         
         # Estadísticas específicas
-        context['usuarios_activos'] = CustomUser.objects.filter(is_active=True).count()
-        context['rifas_finalizadas'] = Rifa.objects.filter(estado='finalizada').count()
-        context['sanes_finalizados'] = San.objects.filter(estado='finalizado').count()
+        context['usuarios_activos'] = resumen.total('usuarios', 'activo')
+        context['rifas_finalizadas'] = resumen.total('rifas', 'finalizada')
+        context['sanes_finalizados'] = resumen.total('sanes', 'finalizado')
         
         # Estadísticas financieras
-        context['total_recaudado'] = Factura.objects.filter(estado_pago='confirmado').aggregate(
-            total=Sum('monto_total')
-        )['total'] or 0
-        
-        context['total_pendiente'] = Factura.objects.filter(estado_pago='pendiente').aggregate(
-            total=Sum('monto_total')
-        )['total'] or 0
-        
-        # Estadísticas específicas por tipo
-        context['total_recaudado_rifas'] = Factura.objects.filter(
-            estado_pago='confirmado',
-            content_type__model='rifa'
-        ).aggregate(total=Sum('monto_total'))['total'] or 0
+        context['total_recaudado_rifas'] = contabilidad.recaudado('rifa')
+        context['total_recaudado_sanes'] = contabilidad.recaudado('san')
+        context['total_recaudado'] = (
+            context['total_recaudado_rifas'] + context['total_recaudado_sanes'] +
+            contabilidad.recaudado('plataforma')
+        )
         
-        context['total_recaudado_sanes'] = Factura.objects.filter(
-            estado_pago='confirmado',
-            content_type__model='san'
-        ).aggregate(total=Sum('monto_total'))['total'] or 0
+        context['total_pendiente'] = resumen.monto('facturas', 'pendiente')
         
         # Actividad reciente
         context['rifas_recientes'] = Rifa.objects.all().order_by('-created_at')[:5]
         context['sanes_recientes'] = San.objects.all().order_by('-created_at')[:5]
         context['usuarios_recientes'] = CustomUser.objects.all().order_by('-date_joined')[:5]
         
+        # Reportes generados en segundo plano, con su avance
+        context['tipos_reporte_pdf'] = [(tipo, dict(Reporte.TIPO_REPORTE)[tipo]) for tipo in reportes_pdf.INFORMES]
+        context['reportes_generados'] = Reporte.objects.select_related('administrador').defer('resultado')[:10]
+        
         return context
 
 
@@ -2064,8 +2427,9 @@ def historial_pagos_san(request, san_id):
     turnos_pendientes = turnos.filter(estado='pendiente').count()
     
     # Estadísticas de pagos
-    total_pagado = pagos.filter(estado='exitoso').aggregate(total=Sum('monto'))['total'] or 0
-    total_pendiente = pagos.filter(estado='pendiente').aggregate(total=Sum('monto'))['total'] or 0
+    # Totales del libro mayor: inscripciones y cuotas cobradas, menos reembolsos
+    total_pagado = contabilidad.recaudado('san', san.id)
+    total_pendiente = contabilidad.saldo('san', san.id, 'por_cobrar')
     total_esperado = san.precio_total
     total_pendiente_cupos = cupos.filter(estado='asignado').aggregate(total=Sum('monto_cuota'))['total'] or 0
     
@@ -2130,21 +2494,17 @@ def adelantar_cuota_san(request, participacion_id):
             # Crear factura para el pago adelantado
             factura = Factura.objects.create(
                 usuario=request.user,
-                monto=cuota.monto_cuota,
-                tipo='cuota_san',
-                estado='pendiente',
-                descripcion=f'Pago adelantado - Cuota {cuota.numero_semana} del San {participacion.san.nombre}'
-            )
-            
-            # Crear orden
-            orden = Orden.objects.create(
-                usuario=request.user,
-                factura=factura,
+                content_type=ContentType.objects.get_for_model(Cupo),
+                object_id=cuota.id,
                 monto_total=cuota.monto_cuota,
-                estado='pendiente'
+                estado_pago='pendiente',
+                concepto=f'Pago adelantado - Cuota {cuota.numero_semana} del San {participacion.san.nombre}'
             )
             
-            messages.success(request, f'Se ha creado una orden para adelantar la cuota {cuota.numero_semana}.')
+            cuota.factura = factura
+            cuota.save()
+            
+            messages.success(request, f'Se ha creado una factura para adelantar la cuota {cuota.numero_semana}.')
             return redirect('factura_detail', pk=factura.id)
         else:
             messages.error(request, 'No hay cuotas pendientes para adelantar.')
@@ -2159,36 +2519,19 @@ def factura_pagar(request, factura_id):
     
     if request.method == 'POST':
         # Procesar pago
-        factura.estado = 'pagada'
-        factura.fecha_pago = timezone.now()
-        factura.save()
+        factura.confirmar_pago(factura.monto_total)
         
         # Si es una factura de cuota, marcar la cuota como pagada
         if factura.tipo == 'cuota_san':
-            try:
-                orden = factura.orden_set.first()
-                if orden:
-                    # Buscar la cuota correspondiente
-                    cupo = Cupo.objects.filter(
-                        participacion__usuario=request.user,
-                        monto_cuota=factura.monto,
-                        estado='asignado'
-                    ).first()
-                    
-                    if cupo:
-                        cupo.estado = 'pagado'
-                        cupo.fecha_pago = timezone.now()
-                        cupo.save()
-                        
-                        # Crear registro de pago
-                        Pago.objects.create(
-                            cupo=cupo,
-                            monto=factura.monto,
-                            fecha_pago=timezone.now(),
-                            metodo_pago='transferencia'
-                        )
-            except Exception as e:
-                messages.warning(request, f'Factura pagada pero hubo un problema al actualizar la cuota: {str(e)}')
+            cupo = Cupo.objects.filter(
+                id=factura.object_id,
+                participacion__usuario=request.user,
+                estado='asignado'
+            ).select_related('participacion').first()
+            
+            if cupo:
+                cupo.registrar_pago(factura)
+                cupo.participacion.registrar_pago_cuota()
         
         messages.success(request, 'Factura pagada exitosamente.')
         return redirect('factura_list')
@@ -2206,6 +2549,7 @@ def factura_pagar(request, factura_id):
 # ---------------------
 
 @login_required
+@limites.limitar('comentarios', '5/m')
 def agregar_comentario(request, content_type_id, object_id):
     """Vista para agregar comentarios"""
     if request.method == 'POST':
@@ -2280,6 +2624,7 @@ def marcar_todas_leidas(request):
 
 
 @login_required
+@limites.limitar('notificaciones', '30/m', metodos=None)
 def obtener_notificaciones_ajax(request):
     """Vista AJAX para obtener notificaciones"""
     notificaciones = Notificacion.objects.filter(
@@ -2393,10 +2738,11 @@ def gestionar_turnos_san(request, san_id):
             return redirect('gestionar_turnos_san', san_id=san.id)
     
     # Calcular estadísticas
-    total_turnos = turnos.count()
-    turnos_cumplidos = turnos.filter(estado='cumplido').count()
-    turnos_activos = turnos.filter(estado='activo').count()
-    turnos_pendientes = turnos.filter(estado='pendiente').count()
+    estadisticas = metricas.por_segmento(turnos, 'estado')
+    total_turnos = estadisticas.total()
+    turnos_cumplidos = estadisticas.total('cumplido')
+    turnos_activos = estadisticas.total('activo')
+    turnos_pendientes = estadisticas.total('pendiente')
     
     # Calcular monto acumulado
     monto_acumulado = turnos_cumplidos * san.precio_cuota
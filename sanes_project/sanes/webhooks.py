@@ -0,0 +1,351 @@
+# sanes/webhooks.py
+"""
+Aplicación por lotes de los webhooks de pasarelas de pago.
+
+El endpoint solo verifica la firma y guarda cada evento en ``WebhookPago``.
+Aquí se aplican en lotes: se descartan duplicados por ID de evento y se
+actualizan pagos, facturas, tickets y cupos con actualizaciones por
+conjuntos, creando las notificaciones de cada pago en una sola inserción.
+Los asientos contables de cada factura se registran en la misma transacción.
+
+Formato del evento::
+
+    {"id": "evt_...", "tipo": "cobro.aprobado" | "cobro.rechazado",
+     "codigo": "<codigo_transaccion>", "monto": "25.00", "referencia": "...", "motivo": "..."}
+
+Un evento solo se aplica a un pago de la misma pasarela que lo firmó, y una
+aprobación solo si ``monto`` coincide con el del pago.
+"""
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import analitica, condicional, contabilidad, metricas, sincronizacion
+from .models import (
+    WebhookPago, PagoSimulado, Factura, Ticket, Cupo, ParticipacionSan,
+    Rifa, San, NotificacionMejorada, SystemLog, UsuarioConLogs
+)
+
+
+EVENTO_APROBADO = 'cobro.aprobado'
+EVENTO_RECHAZADO = 'cobro.rechazado'
+TIPOS_EVENTO = (EVENTO_APROBADO, EVENTO_RECHAZADO)
+
+ESTADOS_FINALES_PAGO = ('exitoso', 'fallido', 'cancelado')
+
+
+# ---------------------
+# UTILIDADES
+# ---------------------
+def _incrementar(modelo, campo, conteo, **extra):
+    """
+    Suma ``conteo[id]`` al campo de cada fila.
+
+    Agrupa los IDs por incremento para hacer una UPDATE por valor distinto
+    (normalmente una sola) en vez de una por fila.
+    """
+    por_incremento = defaultdict(list)
+    for objeto_id, cantidad in conteo.items():
+        por_incremento[cantidad].append(objeto_id)
+    for cantidad, ids in por_incremento.items():
+        sincronizacion.registrar(modelo.objects.filter(id__in=ids))
+        modelo.objects.filter(id__in=ids).update(**{campo: F(campo) + cantidad}, **extra)
+    if conteo:
+        metricas.invalidar(modelo)
+
+
+def _monto_evento(datos):
+    """Monto del payload como Decimal, o None si falta o no es válido"""
+    try:
+        monto = Decimal(str(datos.get('monto')))
+    except (InvalidOperation, ValueError):
+        return None
+    return monto if monto.is_finite() else None
+
+
+def _marcar_eventos(resultados, ahora):
+    """Guarda el resultado de cada evento agrupando por (estado, detalle)"""
+    por_resultado = defaultdict(list)
+    for evento_id, estado, detalle in resultados:
+        por_resultado[(estado, detalle)].append(evento_id)
+    for (estado, detalle), ids in por_resultado.items():
+        WebhookPago.objects.filter(id__in=ids).update(
+            estado=estado, detalle=detalle[:255], fecha_procesamiento=ahora
+        )
+
+
+# ---------------------
+# APLICACIÓN DE EVENTOS
+# ---------------------
+def _aplicar_aprobados(aprobados, ahora):
+    """Confirma pagos y facturas y marca como pagados tickets y cupos"""
+    hoy = date.today()
+    for pago, evento in aprobados:
+        pago.estado = 'exitoso'
+        pago.fecha_procesamiento = ahora
+        pago.referencia_externa = evento.payload.get('referencia')
+        pago.fecha_actualizacion = ahora
+    PagoSimulado.objects.bulk_update(
+        [p for p, _ in aprobados], ['estado', 'fecha_procesamiento', 'referencia_externa', 'fecha_actualizacion']
+    )
+
+    facturas = [pago.factura for pago, _ in aprobados]
+    factura_ids = [f.id for f in facturas]
+    pendientes = Factura.objects.filter(id__in=factura_ids).exclude(estado_pago='confirmado')
+    sincronizacion.registrar(pendientes)
+    pendientes.update(
+        estado_pago='confirmado', monto_pagado=F('monto_total'), fecha_pago=ahora, fecha_actualizacion=ahora
+    )
+    anteriores, montos = Counter(), Counter()
+    confirmadas = []
+    for factura in facturas:
+        if factura.estado_pago != 'confirmado':
+            anteriores[factura.estado_pago] += 1
+            montos[factura.estado_pago] += factura.monto_total
+            factura.estado_pago = 'confirmado'
+            contabilidad.registrar_pago_factura(factura)
+            confirmadas.append(factura)
+    metricas.mover('facturas', anteriores, 'confirmado', montos)
+    analitica.registrar_pagos(confirmadas, ahora)
+    activados = Ticket.objects.filter(factura_id__in=factura_ids, activo=False)
+    condicional.tocar(Rifa, activados.values('rifa_id'))
+    metricas.actualizar(activados, activo=True)
+
+    # Cuotas de san pagadas con la factura
+    cupos = Cupo.objects.filter(factura_id__in=factura_ids).exclude(estado='pagado')
+    cuotas = Counter(cupos.exclude(participacion=None).values_list('participacion_id', flat=True))
+    sincronizacion.registrar(cupos)
+    cupos.update(estado='pagado', fecha_pago=hoy, fecha_actualizacion=ahora)
+
+    # Inscripciones a sanes: se paga el primer cupo de la participación
+    san_ct = ContentType.objects.get_for_model(San)
+    inscripciones = Q()
+    for factura in facturas:
+        if factura.content_type_id == san_ct.id:
+            inscripciones |= Q(usuario_id=factura.usuario_id, san_id=factura.object_id)
+    if inscripciones:
+        participaciones = ParticipacionSan.objects.filter(inscripciones).values_list('id', flat=True)
+        primeros = Cupo.objects.filter(participacion_id__in=participaciones, numero_semana=1).exclude(estado='pagado')
+        cuotas.update(primeros.values_list('participacion_id', flat=True))
+        sincronizacion.registrar(primeros)
+        primeros.update(estado='pagado', fecha_pago=hoy, fecha_actualizacion=ahora)
+
+    _incrementar(ParticipacionSan, 'cuotas_pagadas', cuotas, fecha_ultima_cuota=hoy)
+    metricas.invalidar(Cupo, ParticipacionSan)
+
+
+def _aplicar_rechazados(rechazados, ahora):
+    """Rechaza pagos y facturas y libera los tickets y cupos reservados"""
+    for pago, _ in rechazados:
+        pago.estado = 'fallido'
+        pago.fecha_procesamiento = ahora
+        pago.fecha_actualizacion = ahora
+    PagoSimulado.objects.bulk_update([p for p, _ in rechazados], ['estado', 'fecha_procesamiento', 'fecha_actualizacion'])
+    liberar_reservas([pago.factura for pago, _ in rechazados], ahora)
+
+
+def liberar_reservas(facturas, ahora=None):
+    """
+    Rechaza las facturas pendientes de pagos fallidos y libera lo que reservaban.
+
+    Los tickets vuelven a la rifa y se deshacen las inscripciones a sanes sin
+    cuotas pagadas. Es el mismo camino para los webhooks de rechazo, el worker
+    de pagos y el checkout. Las facturas que ya no están pendientes (pagadas
+    por otra vía o ya rechazadas) no se tocan, así que repetir la llamada no
+    libera dos veces.
+
+    Returns:
+        Número de facturas rechazadas
+    """
+    ahora = ahora or timezone.now()
+    facturas = {factura.id: factura for factura in facturas}
+    with transaction.atomic():
+        factura_ids = list(
+            Factura.objects.select_for_update()
+            .filter(id__in=facturas, estado_pago='pendiente')
+            .values_list('id', flat=True)
+        )
+        if not factura_ids:
+            return 0
+        pendientes = Factura.objects.filter(id__in=factura_ids)
+        sincronizacion.registrar(pendientes)
+        pendientes.update(estado_pago='rechazado', fecha_actualizacion=ahora)
+        monto = Decimal('0')
+        for factura_id in factura_ids:
+            factura = facturas[factura_id]
+            monto += factura.monto_total
+            factura.estado_pago = factura._estado_pago_original = 'rechazado'
+            contabilidad.registrar_anulacion_factura(factura)
+        metricas.mover('facturas', Counter(pendiente=len(factura_ids)), 'rechazado', Counter(pendiente=monto))
+
+        # Devolver los tickets a la rifa
+        tickets = Ticket.objects.filter(factura_id__in=factura_ids, activo=True)
+        liberados = Counter(tickets.exclude(rifa=None).values_list('rifa_id', flat=True))
+        metricas.actualizar(tickets, activo=False)
+        _incrementar(Rifa, 'tickets_disponibles', liberados, **metricas.con_auto_now(Rifa, version=F('version') + 1))
+
+        # Deshacer inscripciones a sanes
+        san_ct = ContentType.objects.get_for_model(San)
+        inscripciones = Q()
+        for factura_id in factura_ids:
+            factura = facturas[factura_id]
+            if factura.content_type_id == san_ct.id:
+                inscripciones |= Q(usuario_id=factura.usuario_id, san_id=factura.object_id, cuotas_pagadas=0)
+        if inscripciones:
+            participaciones = ParticipacionSan.objects.filter(inscripciones)
+            por_san = Counter(participaciones.values_list('san_id', flat=True))
+            metricas.borrar(participaciones)
+            _incrementar(San, 'participantes_actuales', {san_id: -n for san_id, n in por_san.items()},
+                         **metricas.con_auto_now(San, version=F('version') + 1))
+    return len(factura_ids)
+
+
+def _notificar(aprobados, rechazados):
+    """Crea en una sola inserción las notificaciones y logs de los pagos"""
+    factura_ct = ContentType.objects.get_for_model(Factura)
+    notificaciones = []
+    logs = []
+    for pagos, exitoso in ((aprobados, True), (rechazados, False)):
+        for pago, evento in pagos:
+            if exitoso:
+                titulo = 'Pago Confirmado'
+                mensaje = f'Tu pago de {pago.monto} {pago.moneda} para la factura {pago.factura.codigo} fue confirmado.'
+            else:
+                titulo = 'Pago Rechazado'
+                mensaje = (f'Tu pago de {pago.monto} {pago.moneda} para la factura {pago.factura.codigo} '
+                           f'fue rechazado: {evento.payload.get("motivo") or "sin motivo"}.')
+            notificaciones.append(NotificacionMejorada(
+                usuario_id=pago.usuario_id,
+                tipo='pago',
+                titulo=titulo,
+                mensaje=mensaje,
+                canal='interno',
+                prioridad='normal' if exitoso else 'alta',
+                content_type=factura_ct,
+                object_id=pago.factura_id,
+            ))
+            logs.append(SystemLog(
+                usuario_id=pago.usuario_id,
+                tipo_accion='pagar',
+                descripcion=f'Webhook {evento.pasarela}: pago {pago.codigo_transaccion} {"confirmado" if exitoso else "rechazado"}',
+                nivel='success' if exitoso else 'error',
+                content_type=factura_ct,
+                object_id=pago.factura_id,
+                datos_adicionales={'evento_id': evento.evento_id, 'webhook_id': evento.id},
+            ))
+    inicio = timezone.now()
+    NotificacionMejorada.objects.bulk_create(notificaciones)
+    metricas.invalidar(NotificacionMejorada)
+    sincronizacion.registrar(
+        NotificacionMejorada.objects.filter(
+            content_type=factura_ct, object_id__in=[p.factura_id for p, _ in aprobados + rechazados],
+            fecha_creacion__gte=inicio,
+        ),
+        'crear',
+    )
+    SystemLog.objects.bulk_create(logs)
+    UsuarioConLogs.registrar(log.usuario_id for log in logs)
+    metricas.registrar([('logs', '', len(logs), 0)])
+
+
+def aplicar_lote(tamano=500):
+    """
+    Aplica un lote de webhooks pendientes.
+
+    Los eventos se reclaman con SKIP LOCKED para que varios workers puedan
+    trabajar a la vez, y los pagos afectados se bloquean antes de decidir,
+    así dos copias del mismo evento en lotes distintos no se aplican dos veces.
+
+    Returns:
+        Counter con el número de eventos por estado resultante
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        eventos = list(
+            WebhookPago.objects.select_for_update(skip_locked=True)
+            .filter(estado='pendiente')
+            .order_by('id')[:tamano]
+        )
+        if not eventos:
+            return Counter()
+
+        resultados = []
+
+        # Duplicados: el mismo evento ya aplicado antes o repetido en el lote
+        vistos = set(
+            WebhookPago.objects.filter(
+                estado='aplicado', evento_id__in={e.evento_id for e in eventos}
+            ).values_list('pasarela', 'evento_id')
+        )
+        unicos = []
+        for evento in eventos:
+            clave = (evento.pasarela, evento.evento_id)
+            if clave in vistos:
+                resultados.append((evento.id, 'duplicado', ''))
+            else:
+                vistos.add(clave)
+                unicos.append(evento)
+
+        codigos = {e.payload.get('codigo') for e in unicos if isinstance(e.payload, dict)}
+        pagos = {
+            pago.codigo_transaccion: pago
+            for pago in PagoSimulado.objects.select_for_update()
+            .select_related('factura')
+            .filter(codigo_transaccion__in=codigos)
+        }
+
+        aprobados = []
+        rechazados = []
+        for evento in unicos:
+            datos = evento.payload if isinstance(evento.payload, dict) else {}
+            pago = pagos.get(datos.get('codigo'))
+            if evento.tipo not in TIPOS_EVENTO:
+                resultados.append((evento.id, 'ignorado', f'Tipo de evento no soportado: {evento.tipo}'))
+            elif pago is None:
+                resultados.append((evento.id, 'ignorado', f'Pago desconocido: {datos.get("codigo")}'))
+            elif pago.metodo_pago != evento.pasarela:
+                # La firma solo prueba qué pasarela envió el evento
+                resultados.append((evento.id, 'ignorado', f'El pago {pago.codigo_transaccion} es de {pago.metodo_pago}'))
+            elif evento.tipo == EVENTO_APROBADO and _monto_evento(datos) != pago.monto:
+                resultados.append((evento.id, 'ignorado', f'Monto {datos.get("monto")} distinto del pago ({pago.monto})'))
+            elif pago.estado in ESTADOS_FINALES_PAGO:
+                resultados.append((evento.id, 'aplicado', f'Sin cambios: pago ya {pago.estado}'))
+            else:
+                # El estado en memoria evita aplicar dos eventos del mismo pago en el lote
+                pago.estado = 'exitoso' if evento.tipo == EVENTO_APROBADO else 'fallido'
+                (aprobados if evento.tipo == EVENTO_APROBADO else rechazados).append((pago, evento))
+                resultados.append((evento.id, 'aplicado', ''))
+
+        if aprobados:
+            _aplicar_aprobados(aprobados, ahora)
+        if rechazados:
+            _aplicar_rechazados(rechazados, ahora)
+        _notificar(aprobados, rechazados)
+        _marcar_eventos(resultados, ahora)
+
+    return Counter(estado for _, estado, _ in resultados)
+
+
+def reprocesar(desde=None, hasta=None, pasarela=None, estados=None):
+    """
+    Vuelve a dejar pendientes los eventos de la bandeja para aplicarlos otra vez.
+
+    Los pagos que ya están en un estado final no se tocan, así que repetir
+    eventos ya aplicados es inofensivo; sirve para recuperar eventos
+    ignorados o mal aplicados tras corregir un error.
+    """
+    eventos = WebhookPago.objects.all()
+    if desde:
+        eventos = eventos.filter(fecha_recepcion__gte=desde)
+    if hasta:
+        eventos = eventos.filter(fecha_recepcion__lt=hasta)
+    if pasarela:
+        eventos = eventos.filter(pasarela=pasarela)
+    if estados:
+        eventos = eventos.filter(estado__in=estados)
+    return eventos.update(estado='pendiente', detalle='', fecha_procesamiento=None)
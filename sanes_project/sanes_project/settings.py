@@ -91,11 +91,36 @@ SOCIALACCOUNT_PROVIDERS = {
     }
 }
 
+# ================================
+# 💳 Pasarelas de pago
+# ================================
+# Por defecto todas apuntan a la pasarela simulada:
+#   python manage.py pasarela_stub
+PASARELA_STUB_URL = config("PASARELA_STUB_URL", default="http://127.0.0.1:8765")
+
+PASARELAS_PAGO = {
+    nombre: {
+        "URL": config(f"PASARELA_{nombre.upper()}_URL", default=f"{PASARELA_STUB_URL}/{nombre}"),
+        "SECRETO": config(f"PASARELA_{nombre.upper()}_SECRETO", default=""),
+        "TIMEOUT": config(f"PASARELA_{nombre.upper()}_TIMEOUT", default=3.0, cast=float),
+        "MAX_CONEXIONES": 100,
+        "UMBRAL_FALLOS": 5,
+        "REAPERTURA": 30,
+    }
+    for nombre in ("paypal", "stripe", "nequi")
+}
+# Aceptar webhooks sin firma de las pasarelas sin SECRETO (solo con la pasarela simulada)
+PASARELAS_SIN_FIRMA = config("PASARELAS_SIN_FIRMA", default=False, cast=bool)
+
 # ================================
 # ⚙️ Middleware
 # ================================
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Estáticos con hash, Cache-Control immutable y variantes .gz/.br
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # gzip/brotli para HTML y JSON (ver sanes/compresion.py)
+    "sanes.compresion.CompresionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -141,6 +166,23 @@ DATABASES = {
     }
 }
 
+# ================================
+# ⚡ Caché
+# ================================
+# Compartida por todos los workers: límites de peticiones, versiones de tabla
+# (invalidación de portada, ETags de listados y pantallas) y tarjetas. Con la
+# caché local por proceso cada worker contaría sus propios límites y no vería
+# las invalidaciones de los demás. La tabla se crea una vez con
+# "python manage.py createcachetable"; CACHE_BACKEND/CACHE_LOCATION permiten
+# usar otro backend compartido (Redis, Memcached).
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": config("CACHE_LOCATION", default="sanes_cache"),
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    }
+}
+
 # ================================
 # 🔐 Validación de contraseñas
 # ================================
@@ -167,6 +209,13 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic genera nombres con hash (manifest) y sus variantes .gz y .br;
+# WhiteNoise sirve los archivos con hash con caché de un año e immutable
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "sanes" / "media"
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Benchmark de la cancelación masiva de una rifa con reembolsos.
+Ejecutar desde sanes_project/: python scripts/bench_cancelaciones.py [--tickets 50000]
+
+Crea una rifa con N tickets (una factura por ticket, ~70% pagadas) repartidos
+entre varios usuarios y mide:
+
+  * antes:   cancelar fila por fila, con varias consultas por factura; se
+             mide sobre una muestra y se extrapola.
+  * después: el trabajo por lotes de sanes.cancelaciones, simulando una caída
+             a mitad de la fase de facturas para comprobar que se reanuda sin
+             duplicar reembolsos ni notificaciones.
+
+Usa la base de datos de DJANGO_SETTINGS_MODULE y borra todo lo que crea.
+"""
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.contenttypes.models import ContentType  # noqa: E402
+from django.db.models import Count  # noqa: E402
+
+from sanes import cancelaciones  # noqa: E402
+from sanes.models import (  # noqa: E402
+    CustomUser, Rifa, Ticket, Factura, Reembolso, CancelacionMasiva, NotificacionMejorada
+)
+
+PREFIJO = 'bench-cancel'
+PRECIO = Decimal('10.00')
+
+
+def crear_datos(tickets, usuarios):
+    organizador = CustomUser.objects.create(username=f'{PREFIJO}-org', email=f'{PREFIJO}-org@example.com')
+    CustomUser.objects.bulk_create([
+        CustomUser(username=f'{PREFIJO}-{i}', email=f'{PREFIJO}-{i}@example.com') for i in range(usuarios)
+    ], batch_size=1000)
+    ids_usuarios = list(
+        CustomUser.objects.filter(username__startswith=f'{PREFIJO}-').exclude(id=organizador.id)
+        .order_by('id').values_list('id', flat=True)
+    )
+
+    rifa = Rifa.objects.create(titulo=f'{PREFIJO} rifa', organizador=organizador, estado='activa',
+                               precio_ticket=PRECIO, total_tickets=tickets, tickets_disponibles=0)
+    rifa_ct = ContentType.objects.get_for_model(Rifa)
+
+    Factura.objects.bulk_create([
+        Factura(
+            codigo=f'BC-{rifa.id}-{i:07d}', usuario_id=ids_usuarios[i % len(ids_usuarios)],
+            content_type=rifa_ct, object_id=rifa.id, concepto='Ticket', monto_total=PRECIO,
+            monto_pagado=PRECIO if i % 10 < 7 else 0, estado_pago='confirmado' if i % 10 < 7 else 'pendiente',
+        ) for i in range(tickets)
+    ], batch_size=2000)
+    facturas = list(Factura.objects.filter(content_type=rifa_ct, object_id=rifa.id).order_by('id').values_list('id', 'usuario_id'))
+    Ticket.objects.bulk_create([
+        Ticket(codigo=f'BT-{rifa.id}-{i:07d}', numero=i + 1, rifa=rifa, usuario_id=usuario_id,
+               precio_pagado=PRECIO, factura_id=factura_id)
+        for i, (factura_id, usuario_id) in enumerate(facturas)
+    ], batch_size=2000)
+    return organizador, rifa
+
+
+def limpiar(organizador, rifa):
+    rifa_ct = ContentType.objects.get_for_model(Rifa)
+    CancelacionMasiva.objects.filter(content_type=rifa_ct, object_id=rifa.id).delete()
+    NotificacionMejorada.objects.filter(content_type=rifa_ct, object_id=rifa.id).delete()
+    Factura.objects.filter(content_type=rifa_ct, object_id=rifa.id).delete()
+    rifa.delete()
+    CustomUser.objects.filter(username__startswith=f'{PREFIJO}-').delete()
+    organizador.delete()
+
+
+def cancelar_fila_por_fila(rifa, muestra):
+    """
+    Lo que haría un bucle ingenuo: varias consultas por fila.
+
+    La factura se actualiza con un UPDATE por fila en vez de save() para no
+    dejar asientos contables del benchmark en la base de datos.
+    """
+    inicio = time.perf_counter()
+    facturas = Factura.objects.filter(
+        content_type=ContentType.objects.get_for_model(Rifa), object_id=rifa.id,
+        estado_pago__in=('pendiente', 'confirmado'),
+    ).order_by('id')[:muestra]
+    for factura in facturas:
+        if factura.estado_pago == 'confirmado':
+            Reembolso.objects.create(factura=factura, usuario_id=factura.usuario_id, monto=factura.monto_total)
+        Factura.objects.filter(pk=factura.pk).update(estado_pago='cancelado')
+        for ticket in factura.tickets.all():
+            ticket.activo = False
+            ticket.save()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=50000)
+    parser.add_argument('--usuarios', type=int, default=5000)
+    parser.add_argument('--lote', type=int, default=1000)
+    parser.add_argument('--muestra', type=int, default=1000, help='Filas medidas con el método fila por fila')
+    args = parser.parse_args()
+
+    print(f'Creando {args.tickets} tickets para {args.usuarios} usuarios...')
+    organizador, rifa = crear_datos(args.tickets, args.usuarios)
+    try:
+        # Antes: fila por fila sobre una muestra (se deshace para no contaminar la medida)
+        duracion = cancelar_fila_por_fila(rifa, args.muestra)
+        por_fila = duracion / args.muestra
+        Reembolso.objects.filter(factura__object_id=rifa.id, cancelacion=None).delete()
+        Factura.objects.filter(codigo__startswith=f'BC-{rifa.id}-').update(estado_pago='confirmado')
+        Factura.objects.filter(codigo__startswith=f'BC-{rifa.id}-', monto_pagado=0).update(estado_pago='pendiente')
+        Ticket.objects.filter(rifa=rifa).update(activo=True)
+        print(f'Fila por fila: {por_fila * 1000:.2f} ms/factura, estimado {por_fila * args.tickets:.1f}s '
+              f'para {args.tickets} tickets')
+
+        # Después: trabajo por lotes con una caída simulada a mitad de las facturas
+        cancelacion = cancelaciones.iniciar_cancelacion(rifa, 'Benchmark')
+        inicio = time.perf_counter()
+        lotes_antes_de_caer = max(1, args.tickets // args.lote // 2)
+        for _ in range(lotes_antes_de_caer):
+            cancelaciones._procesar_lote(cancelacion.id, args.lote)
+        cancelacion.refresh_from_db()
+        print(f'Caída simulada en fase {cancelacion.fase}, último ID {cancelacion.ultimo_id}, '
+              f'{cancelacion.facturas_procesadas} facturas procesadas')
+        cancelacion = cancelaciones.procesar_cancelacion(cancelacion, lote=args.lote)
+        duracion = time.perf_counter() - inicio
+        print(f'Por lotes:     {duracion:.1f}s en total ({duracion / args.tickets * 1000:.3f} ms/ticket, '
+              f'{por_fila * args.tickets / duracion:.0f}x)')
+
+        # Comprobaciones
+        reembolsos = Reembolso.objects.filter(cancelacion=cancelacion)
+        notificaciones = NotificacionMejorada.objects.filter(
+            content_type=cancelacion.content_type, object_id=rifa.id
+        ).values('usuario_id').annotate(n=Count('id'))
+        duplicadas = sum(1 for fila in notificaciones if fila['n'] > 1)
+        print(f'Estado: {cancelacion.estado}; facturas {cancelacion.facturas_procesadas}, '
+              f'reembolsos {reembolsos.count()} ({cancelacion.monto_reembolsado}), '
+              f'usuarios notificados {cancelacion.usuarios_notificados}, notificaciones duplicadas {duplicadas}, '
+              f'tickets activos {Ticket.objects.filter(rifa=rifa, activo=True).count()}')
+    finally:
+        limpiar(organizador, rifa)
+
+
+if __name__ == '__main__':
+    main()
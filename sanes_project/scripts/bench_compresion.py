@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Bytes transferidos por las páginas principales y la API, con y sin compresión.
+Ejecutar desde sanes_project/: python scripts/bench_compresion.py [--repeticiones 20]
+
+Para cada URL pide la respuesta sin compresión (Accept-Encoding: identity),
+con gzip y con brotli (CompresionMiddleware) y muestra tamaños y el tiempo
+que añade comprimir. Después ejecuta collectstatic en un directorio temporal
+y resume los estáticos: nombres con hash, variantes .gz/.br y las cabeceras
+con que WhiteNoise sirve un archivo con hash.
+
+Usa los datos que haya en la base de datos de DJANGO_SETTINGS_MODULE; solo
+crea (y borra) un usuario para las páginas que piden sesión.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.staticfiles.storage import staticfiles_storage  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+
+from sanes.models import CustomUser, Rifa, San  # noqa: E402
+
+PREFIJO = 'bench-compresion'
+CODIFICACIONES = [('sin comprimir', 'identity'), ('gzip', 'gzip'), ('brotli', 'br, gzip')]
+
+
+def urls():
+    rifa = Rifa.objects.order_by('-id').values_list('id', flat=True).first()
+    san = San.objects.order_by('-id').values_list('id', flat=True).first()
+    paginas = [('portada', '/'), ('listado de rifas', '/rifas/'), ('listado de sanes', '/sanes/')]
+    if rifa:
+        paginas.append(('detalle de rifa', f'/rifas/{rifa}/'))
+    if san:
+        paginas.append(('detalle de san', f'/sanes/{san}/'))
+    paginas += [('API rifas', '/api/rifas/'), ('API sanes', '/api/sanes/'), ('API inicio', '/api/inicio/')]
+    if rifa:
+        paginas.append(('API rifa + tickets', f'/api/rifas/{rifa}/?tickets=1'))
+    return paginas
+
+
+def medir(cliente, url, aceptadas, repeticiones):
+    """(bytes del cuerpo, codificación, ms por petición)"""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        respuesta = cliente.get(url, HTTP_ACCEPT_ENCODING=aceptadas)
+    duracion = (time.perf_counter() - inicio) / repeticiones * 1000
+    return len(respuesta.content), respuesta.get('Content-Encoding', '-'), duracion
+
+
+def respuestas(repeticiones):
+    usuario = CustomUser.objects.create(username=f'{PREFIJO}-usuario', email=f'{PREFIJO}@example.com')
+    cliente = Client(HTTP_HOST='localhost')
+    cliente.force_login(usuario)
+    totales = {nombre: 0 for nombre, _ in CODIFICACIONES}
+    try:
+        print(f"{'':<22}" + ''.join(f'{nombre:>26}' for nombre, _ in CODIFICACIONES))
+        for nombre, url in urls():
+            cliente.get(url)
+            fila = f'{nombre:<22}'
+            base = None
+            for codificacion, aceptadas in CODIFICACIONES:
+                tamano, usada, duracion = medir(cliente, url, aceptadas, repeticiones)
+                base = base or tamano
+                totales[codificacion] += tamano
+                fila += f'{tamano / 1024:8.1f} KiB {usada:>5} {duracion:6.2f} ms'
+            print(f'{fila}   ({base / tamano:.1f}x)')
+    finally:
+        usuario.delete()
+    base = totales['sin comprimir']
+    print('Total: ' + ', '.join(f'{nombre} {total / 1024:.1f} KiB ({base / total:.1f}x)' for nombre, total in totales.items()))
+
+
+def estaticos():
+    with tempfile.TemporaryDirectory() as destino, override_settings(STATIC_ROOT=destino, DEBUG=False):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        manifiesto = staticfiles_storage.hashed_files
+        comprimibles = [Path(destino, n) for n in manifiesto.values() if Path(destino, f'{n}.gz').exists()]
+        print(f'\nEstáticos: {len(manifiesto)} archivos con hash, {len(comprimibles)} con variantes .gz/.br')
+        for sufijo in ('', '.gz', '.br'):
+            total = sum(Path(f'{ruta}{sufijo}').stat().st_size for ruta in comprimibles if Path(f'{ruta}{sufijo}').exists())
+            print(f'  comprimibles{sufijo or " (original)":<14} {total / 1024:8.1f} KiB')
+        for original, hasheado in sorted(manifiesto.items()):
+            if not original.startswith(('admin/', 'rest_framework/')):
+                print(f'  {original} -> {hasheado}')
+
+        # Un archivo con hash servido por WhiteNoise (el middleware lee STATIC_ROOT al crearse)
+        nombre = next((n for n in sorted(manifiesto) if n.startswith('sanes/') and n.endswith('.css')), None)
+        if nombre:
+            url = staticfiles_storage.url(nombre)
+            respuesta = Client(HTTP_HOST='localhost').get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+            print(f'\n{url}: {respuesta.status_code}, Content-Encoding {respuesta.get("Content-Encoding", "-")}, '
+                  f'Cache-Control "{respuesta.get("Cache-Control")}"')
+            respuesta.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+    respuestas(args.repeticiones)
+    estaticos()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Benchmark de las estadísticas por estado (cuotas, turnos, facturas de un
+usuario): una consulta por estado contra metricas.por_segmento.
+Ejecutar desde sanes_project/: python scripts/bench_estadisticas.py [--filas 1000 20000]
+
+Para cada tamaño inserta N facturas de un usuario y mide consultas y
+milisegundos por carga de las estadísticas:
+
+  * antes:  count() por estado + count() total + aggregate(Sum) por estado,
+            como hacía gestionar_turnos_san.
+  * frío:   por_segmento sin caché (un GROUP BY).
+  * caché:  por_segmento con la entrada vigente (sin consultas).
+
+Usa la base de datos de DJANGO_SETTINGS_MODULE y borra lo que crea.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+
+from sanes import metricas  # noqa: E402
+from sanes.models import CustomUser, Factura  # noqa: E402
+
+MARCA = 'bench-estadisticas'
+ESTADOS = ['pendiente', 'confirmado', 'rechazado', 'cancelado']
+
+
+def antes(queryset):
+    resultado = {'total': queryset.count()}
+    for estado in ESTADOS:
+        filtradas = queryset.filter(estado_pago=estado)
+        resultado[estado] = filtradas.count()
+        resultado[f'monto_{estado}'] = filtradas.aggregate(total=Sum('monto_total'))['total'] or 0
+    return resultado
+
+
+def despues(queryset):
+    estadisticas = metricas.por_segmento(queryset, 'estado_pago', 'monto_total')
+    resultado = {'total': estadisticas.total()}
+    for estado in ESTADOS:
+        resultado[estado] = estadisticas.total(estado)
+        resultado[f'monto_{estado}'] = estadisticas.monto(estado)
+    return resultado
+
+
+def medir(funcion, repeticiones, preparar=None):
+    """(consultas por llamada, ms por llamada)"""
+    consultas = [0]
+
+    def contar(execute, sql, params, many, context):
+        consultas[0] += 1
+        return execute(sql, params, many, context)
+
+    total = 0.0
+    with connection.execute_wrapper(contar):
+        for _ in range(repeticiones):
+            if preparar:
+                preparar()
+            inicio = time.perf_counter()
+            funcion()
+            total += time.perf_counter() - inicio
+    return consultas[0] / repeticiones, total / repeticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 20000])
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    usuario = CustomUser.objects.create(username=MARCA, email=f'{MARCA}@example.com')
+    queryset = Factura.objects.filter(usuario=usuario)
+    print(f"{'filas':>8} {'antes':>18} {'frío':>18} {'caché':>18}")
+    print(f"{'':>8} {'consultas    ms':>18} {'consultas    ms':>18} {'consultas    ms':>18}")
+    print('=' * 66)
+    try:
+        random.seed(0)
+        insertadas = 0
+        for filas in sorted(args.filas):
+            Factura.objects.bulk_create([
+                Factura(codigo=f'BE-{i}', usuario=usuario, concepto=MARCA,
+                        monto_total=Decimal(random.randint(5, 200)), estado_pago=random.choice(ESTADOS))
+                for i in range(insertadas, filas)
+            ], batch_size=5000)
+            insertadas = filas
+            # bulk_create no emite post_save: se invalida como en las rutas por conjuntos
+            metricas.invalidar(Factura)
+            assert antes(queryset) == despues(queryset)
+
+            columnas = [
+                medir(lambda: antes(queryset), args.repeticiones),
+                medir(lambda: despues(queryset), args.repeticiones, preparar=cache.clear),
+                medir(lambda: despues(queryset), args.repeticiones),
+            ]
+            print(f'{filas:>8} ' + ' '.join(f'{n:>9.0f} {ms:>8.2f}' for n, ms in columnas))
+    finally:
+        queryset.delete()
+        usuario.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Benchmark de la exportación de logs a CSV: memoria pico y consultas.
+Ejecutar desde sanes_project/: python scripts/bench_exportar_logs.py [--filas 20000 100000]
+
+Para cada tamaño inserta N logs y compara:
+
+  * antes:   SystemLog.objects.all() con log.usuario por fila y el CSV
+             completo dentro de un HttpResponse.
+  * después: sanes.exportaciones.csv_logs, en lotes por ID y en streaming
+             (se consume el generador como lo haría StreamingHttpResponse).
+
+Usa la base de datos de DJANGO_SETTINGS_MODULE y borra los logs que crea.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+
+from sanes import exportaciones  # noqa: E402
+from sanes.models import CustomUser, SystemLog  # noqa: E402
+
+MARCA = 'bench-exportar-logs'
+
+
+def exportar_antes():
+    response = HttpResponse(content_type='text/csv')
+    writer = csv.writer(response)
+    writer.writerow(exportaciones.COLUMNAS_LOGS)
+    for log in SystemLog.objects.all().order_by('-fecha_creacion'):
+        writer.writerow([
+            log.usuario.username if log.usuario else 'Sistema',
+            log.get_tipo_accion_display(), log.get_nivel_display(), log.descripcion,
+            log.ip_address, log.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S'),
+        ])
+    return len(response.content)
+
+
+def exportar_despues(comprimir=False):
+    return sum(len(bloque) for bloque in exportaciones.csv_logs({}, comprimir))
+
+
+def medir(funcion, *args):
+    consultas = 0
+
+    def contar(execute, sql, params, many, context):
+        nonlocal consultas
+        consultas += 1
+        return execute(sql, params, many, context)
+
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    with connection.execute_wrapper(contar):
+        tamano = funcion(*args)
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracion, pico / 1024 / 1024, consultas, tamano / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, nargs='+', default=[20000, 100000])
+    args = parser.parse_args()
+
+    usuarios = list(CustomUser.objects.values_list('id', flat=True)[:50]) or [None]
+    existentes = SystemLog.objects.count()
+    print(f"{'filas':>8} {'método':<16} {'tiempo (s)':>10} {'memoria pico (MB)':>18} {'consultas':>10} {'archivo (MB)':>13}")
+    print('=' * 80)
+    try:
+        creados = 0
+        for filas in sorted(args.filas):
+            faltan = filas - existentes - creados
+            if faltan > 0:
+                SystemLog.objects.bulk_create([
+                    SystemLog(usuario_id=usuarios[i % len(usuarios)], tipo_accion='otro', nivel='info',
+                              descripcion=f'{MARCA} evento {i} con una descripción de longitud típica',
+                              ip_address='10.0.0.1')
+                    for i in range(faltan)
+                ], batch_size=5000)
+                creados += faltan
+            total = existentes + creados
+            for nombre, funcion, extra in (('antes', exportar_antes, ()),
+                                           ('después', exportar_despues, ()),
+                                           ('después (gzip)', exportar_despues, (True,))):
+                duracion, pico, consultas, tamano = medir(funcion, *extra)
+                print(f'{total:>8} {nombre:<16} {duracion:>10.2f} {pico:>18.1f} {consultas:>10} {tamano:>13.1f}')
+    finally:
+        SystemLog.objects.filter(descripcion__startswith=f'{MARCA} ').delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark de las consultas de facturas antes y después de consolidar columnas.
+Ejecutar desde sanes_project/: python scripts/bench_facturas.py [--filas 200000]
+
+Crea en SQLite (en memoria) la tabla antigua, con monto/estado/tipo/rifa/san
+duplicando a monto_total/estado_pago/content_type, y la tabla consolidada con
+los índices compuestos. Antes, como cada vista escribía un subconjunto
+distinto de columnas, las consultas tenían que mirar las dos variantes.
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+ESQUEMA_ANTES = """
+CREATE TABLE factura (
+    id INTEGER PRIMARY KEY, codigo VARCHAR(20) UNIQUE, usuario_id INTEGER NOT NULL,
+    content_type_id INTEGER NULL, object_id INTEGER NULL, concepto VARCHAR(255),
+    monto DECIMAL NOT NULL, tipo VARCHAR(20) NOT NULL, estado VARCHAR(20) NOT NULL,
+    fecha_emision DATETIME NOT NULL, fecha_vencimiento DATETIME NULL,
+    monto_total DECIMAL NOT NULL, monto_pagado DECIMAL NOT NULL,
+    estado_pago VARCHAR(20) NOT NULL, metodo_pago VARCHAR(20) NULL,
+    comprobante_pago VARCHAR(100) NULL, notas TEXT NULL, fecha_pago DATETIME NULL,
+    rifa_id INTEGER NULL, san_id INTEGER NULL, archivo VARCHAR(100) NULL
+);
+CREATE INDEX factura_usuario ON factura (usuario_id);
+CREATE INDEX factura_content_type ON factura (content_type_id);
+CREATE INDEX factura_rifa ON factura (rifa_id);
+CREATE INDEX factura_san ON factura (san_id);
+"""
+
+ESQUEMA_DESPUES = """
+CREATE TABLE factura (
+    id INTEGER PRIMARY KEY, codigo VARCHAR(20) UNIQUE, usuario_id INTEGER NOT NULL,
+    content_type_id INTEGER NULL, object_id INTEGER NULL, concepto VARCHAR(255),
+    fecha_emision DATETIME NOT NULL, fecha_vencimiento DATETIME NULL,
+    monto_total DECIMAL NOT NULL, monto_pagado DECIMAL NOT NULL,
+    estado_pago VARCHAR(20) NOT NULL, metodo_pago VARCHAR(20) NULL,
+    comprobante_pago VARCHAR(100) NULL, notas TEXT NULL, fecha_pago DATETIME NULL,
+    archivo VARCHAR(100) NULL
+);
+CREATE INDEX factura_usuario ON factura (usuario_id);
+CREATE INDEX factura_content_type ON factura (content_type_id);
+CREATE INDEX factura_usuario_estado_idx ON factura (usuario_id, estado_pago, fecha_emision);
+CREATE INDEX factura_objeto_estado_idx ON factura (content_type_id, object_id, estado_pago);
+"""
+
+RIFA_CT, SAN_CT = 10, 11
+
+# (nombre, consulta antes, consulta después)
+CONSULTAS = [
+    (
+        'Facturas pendientes del usuario (lista)',
+        "SELECT * FROM factura WHERE usuario_id = :usuario "
+        "AND (estado_pago = 'pendiente' AND estado = 'pendiente') "
+        "ORDER BY fecha_emision DESC LIMIT 20",
+        "SELECT * FROM factura WHERE usuario_id = :usuario AND estado_pago = 'pendiente' "
+        "ORDER BY fecha_emision DESC LIMIT 20",
+    ),
+    (
+        'Total gastado por el usuario',
+        "SELECT SUM(CASE WHEN monto_total > 0 THEN monto_total ELSE monto END) FROM factura "
+        "WHERE usuario_id = :usuario AND (estado_pago = 'confirmado' OR estado = 'pagada')",
+        "SELECT SUM(monto_total) FROM factura WHERE usuario_id = :usuario AND estado_pago = 'confirmado'",
+    ),
+    (
+        'Facturas confirmadas de una rifa',
+        "SELECT id, monto_total FROM factura "
+        "WHERE ((content_type_id = :rifa_ct AND object_id = :rifa) OR rifa_id = :rifa) "
+        "AND (estado_pago = 'confirmado' OR estado = 'pagada')",
+        "SELECT id, monto_total FROM factura "
+        "WHERE content_type_id = :rifa_ct AND object_id = :rifa AND estado_pago = 'confirmado'",
+    ),
+    (
+        'Historial de pagos de un san',
+        "SELECT * FROM factura WHERE (content_type_id = :san_ct AND object_id = :san) OR san_id = :san "
+        "ORDER BY fecha_emision DESC",
+        "SELECT * FROM factura WHERE content_type_id = :san_ct AND object_id = :san "
+        "ORDER BY fecha_emision DESC",
+    ),
+]
+
+
+def poblar(conexion, filas, antes, semilla=42):
+    random.seed(semilla)
+    inicio = datetime(2024, 1, 1)
+    estados = [('pendiente', 'pendiente'), ('confirmado', 'pagada'), ('rechazado', 'pendiente'), ('cancelado', 'cancelada')]
+    datos = []
+    for i in range(1, filas + 1):
+        usuario = random.randint(1, filas // 20 or 1)
+        es_rifa = random.random() < 0.6
+        objeto = random.randint(1, 500)
+        estado_pago, estado = random.choices(estados, weights=[3, 6, 1, 1])[0]
+        monto = round(random.uniform(5, 200), 2)
+        fecha = (inicio + timedelta(minutes=i)).isoformat(' ')
+        fila = {
+            'id': i, 'codigo': f'FACT-{i:08d}', 'usuario_id': usuario,
+            'content_type_id': RIFA_CT if es_rifa else SAN_CT, 'object_id': objeto,
+            'concepto': 'Compra', 'fecha_emision': fecha, 'monto_total': monto,
+            'monto_pagado': monto if estado_pago == 'confirmado' else 0, 'estado_pago': estado_pago,
+            'metodo_pago': 'efectivo',
+        }
+        if antes:
+            fila.update({
+                'monto': monto, 'tipo': 'ticket_rifa' if es_rifa else 'inscripcion_san', 'estado': estado,
+                'rifa_id': objeto if es_rifa else None, 'san_id': None if es_rifa else objeto,
+            })
+        datos.append(fila)
+
+    columnas = list(datos[0].keys())
+    conexion.executemany(
+        f"INSERT INTO factura ({', '.join(columnas)}) VALUES ({', '.join(':' + c for c in columnas)})",
+        datos,
+    )
+    conexion.commit()
+    conexion.execute('ANALYZE')
+
+
+def medir(conexion, sql, repeticiones):
+    parametros_base = {'rifa_ct': RIFA_CT, 'san_ct': SAN_CT}
+    random.seed(7)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        parametros = dict(parametros_base, usuario=random.randint(1, 1000), rifa=random.randint(1, 500),
+                          san=random.randint(1, 500))
+        conexion.execute(sql, parametros).fetchall()
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def plan(conexion, sql):
+    filas = conexion.execute(
+        'EXPLAIN QUERY PLAN ' + sql, {'usuario': 1, 'rifa': 1, 'san': 1, 'rifa_ct': RIFA_CT, 'san_ct': SAN_CT}
+    ).fetchall()
+    return '; '.join(f[-1] for f in filas)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, default=200000)
+    parser.add_argument('--repeticiones', type=int, default=300)
+    args = parser.parse_args()
+
+    conexiones = {}
+    for nombre, esquema, antes in (('antes', ESQUEMA_ANTES, True), ('después', ESQUEMA_DESPUES, False)):
+        conexion = sqlite3.connect(':memory:')
+        conexion.executescript(esquema)
+        poblar(conexion, args.filas, antes)
+        tamano = conexion.execute('SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()').fetchone()[0]
+        print(f'Tabla {nombre:<8} {args.filas} filas, {tamano / 1024 / 1024:.1f} MB')
+        conexiones[nombre] = conexion
+
+    print()
+    print(f"{'Consulta':<42} {'antes (ms)':>11} {'después (ms)':>13} {'mejora':>8}")
+    print('=' * 78)
+    for nombre, sql_antes, sql_despues in CONSULTAS:
+        antes = medir(conexiones['antes'], sql_antes, args.repeticiones)
+        despues = medir(conexiones['después'], sql_despues, args.repeticiones)
+        print(f'{nombre:<42} {antes:>11.3f} {despues:>13.3f} {antes / despues:>7.1f}x')
+        print(f'    antes:   {plan(conexiones["antes"], sql_antes)}')
+        print(f'    después: {plan(conexiones["después"], sql_despues)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Benchmark de las estadísticas de los dashboards: conteos sobre las tablas
+contra la tabla de métricas diarias.
+Ejecutar desde sanes_project/: python scripts/bench_metricas.py [--filas 10000 100000]
+
+Para cada tamaño inserta N facturas y N logs repartidos en un año y mide:
+
+  * antes:   los count()/Sum() que hacían admin_dashboard, AdminReporteView,
+             reporte_rifas, reporte_sanes, reporte_finanzas,
+             AdminFacturaListView y admin_logs en cada visita.
+  * después: sanes.metricas.resumen(), que sirve a todos esos dashboards.
+
+Usa la base de datos de DJANGO_SETTINGS_MODULE y borra lo que crea.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db.models import Sum  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from sanes import metricas  # noqa: E402
+from sanes.models import CustomUser, Rifa, San, Ticket, ParticipacionSan, Factura, SystemLog  # noqa: E402
+
+MARCA = 'bench-metricas'
+
+
+def estadisticas_antes():
+    ahora = timezone.now()
+    confirmadas = Factura.objects.filter(estado_pago='confirmado')
+    return [
+        CustomUser.objects.count(),
+        CustomUser.objects.filter(is_active=True).count(),
+        Rifa.objects.count(),
+        Rifa.objects.filter(estado='activa').count(),
+        Rifa.objects.filter(estado='finalizada').count(),
+        San.objects.count(),
+        San.objects.filter(estado='activo').count(),
+        San.objects.filter(estado='finalizado').count(),
+        Ticket.objects.count(),
+        ParticipacionSan.objects.count(),
+        Factura.objects.count(),
+        Factura.objects.filter(estado_pago='pendiente').count(),
+        confirmadas.count(),
+        confirmadas.aggregate(total=Sum('monto_total'))['total'],
+        Factura.objects.aggregate(total=Sum('monto_total'))['total'],
+        Factura.objects.filter(estado_pago='pendiente').aggregate(total=Sum('monto_total'))['total'],
+        SystemLog.objects.count(),
+        SystemLog.objects.filter(fecha_creacion__date=ahora.date()).count(),
+        SystemLog.objects.filter(fecha_creacion__gte=ahora - timedelta(days=7)).count(),
+        SystemLog.objects.filter(fecha_creacion__gte=ahora - timedelta(days=30)).count(),
+    ]
+
+
+def estadisticas_despues():
+    resumen = metricas.resumen()
+    return [resumen.total('usuarios'), resumen.total('facturas', 'confirmado'), resumen.monto('facturas'),
+            resumen.hoy('logs'), resumen.semana('logs')]
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def insertar(cantidad, usuario_id):
+    random.seed(cantidad)
+    ahora = timezone.now()
+    Factura.objects.bulk_create([
+        Factura(codigo=f'BM-{cantidad}-{i}', usuario_id=usuario_id, concepto=MARCA,
+                monto_total=Decimal(random.randint(5, 200)),
+                estado_pago=random.choice(['pendiente', 'confirmado', 'confirmado', 'rechazado']))
+        for i in range(cantidad)
+    ], batch_size=5000)
+    logs = SystemLog.objects.bulk_create([
+        SystemLog(usuario_id=usuario_id, tipo_accion='otro', descripcion=MARCA) for _ in range(cantidad)
+    ], batch_size=5000)
+    # Repartir en el último año (auto_now_add no deja fijar la fecha al crear)
+    for mes in range(12):
+        ids = [log.id for log in logs[mes::12]]
+        SystemLog.objects.filter(id__in=ids).update(fecha_creacion=ahora - timedelta(days=30 * mes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    usuario = CustomUser.objects.create(username=MARCA, email=f'{MARCA}@example.com')
+    print(f"{'filas':>8} {'antes (ms)':>11} {'después (ms)':>13} {'filas métricas':>15}")
+    print('=' * 52)
+    try:
+        insertadas = 0
+        for filas in sorted(args.filas):
+            insertar(filas - insertadas, usuario.id)
+            insertadas = filas
+            metricas.reconstruir()
+            antes = medir(estadisticas_antes, args.repeticiones)
+            despues = medir(estadisticas_despues, args.repeticiones)
+            print(f'{filas:>8} {antes:>11.2f} {despues:>13.2f} {metricas.MetricaDiaria.objects.count():>15}')
+    finally:
+        Factura.objects.filter(concepto=MARCA).delete()
+        SystemLog.objects.filter(descripcion=MARCA).delete()
+        usuario.delete()
+        metricas.reconstruir()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Benchmark de throughput de la capa de pasarelas contra la pasarela simulada.
+Ejecutar desde sanes_project/: python scripts/bench_pasarelas.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+from sanes.pasarela_stub import crear_app
+from sanes.pasarelas import PasarelaHTTP, cobrar_lote_async
+
+
+async def levantar_stub(puerto, **config):
+    """Levanta la pasarela simulada en el loop actual"""
+    runner = web.AppRunner(crear_app(**config))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', puerto).start()
+    return runner
+
+
+def solicitudes(pasarela, cantidad):
+    return [
+        (pasarela, {
+            'codigo': f'BENCH-{uuid.uuid4().hex[:12].upper()}',
+            'monto': '10.00',
+            'moneda': 'USD',
+            'metodo': pasarela.nombre,
+        })
+        for _ in range(cantidad)
+    ]
+
+
+async def escenario(nombre, pasarela, cantidad, concurrencia):
+    """Ejecuta un lote de cobros y muestra throughput y resultados"""
+    inicio = time.monotonic()
+    resultados = await cobrar_lote_async(solicitudes(pasarela, cantidad), concurrencia=concurrencia)
+    duracion = time.monotonic() - inicio
+
+    resumen = {}
+    for resultado in resultados:
+        resumen[resultado['estado']] = resumen.get(resultado['estado'], 0) + 1
+    latencias = sorted(r['latencia_ms'] for r in resultados if r['latencia_ms'])
+    p95 = latencias[int(len(latencias) * 0.95) - 1] if latencias else 0
+
+    print(f"{nombre:<45} {cantidad:>6} cobros  {duracion:>7.2f}s  "
+          f"{cantidad / duracion:>8.0f} cobros/s  p95 {p95:>5} ms  {resumen}")
+
+
+async def main():
+    print("🚀 BENCHMARK DE PASARELAS DE PAGO")
+    print("=" * 110)
+
+    # Pasarela normal: 150ms de latencia media, 10% de rechazos
+    stub = await levantar_stub(8801, latencia_ms=150, variacion_ms=50, tasa_rechazo=0.1)
+    url = 'http://127.0.0.1:8801/stub'
+
+    await escenario('Secuencial (concurrencia 1)',
+                    PasarelaHTTP('stub', url, max_conexiones=1), 50, 1)
+    for concurrencia in (10, 100, 500):
+        await escenario(f'Concurrente (concurrencia {concurrencia})',
+                        PasarelaHTTP('stub', url, max_conexiones=concurrencia),
+                        concurrencia * 10, concurrencia)
+    await stub.cleanup()
+
+    # Pasarela lenta: 5s de latencia contra un timeout de 1s
+    stub = await levantar_stub(8802, latencia_ms=5000, variacion_ms=0, tasa_rechazo=0.0)
+    url = 'http://127.0.0.1:8802/lenta'
+
+    await escenario('Pasarela lenta sin circuit breaker',
+                    PasarelaHTTP('lenta', url, timeout=1.0, umbral_fallos=10 ** 9), 500, 100)
+    await escenario('Pasarela lenta con circuit breaker (umbral 5)',
+                    PasarelaHTTP('lenta', url, timeout=1.0, umbral_fallos=5), 500, 100)
+    await stub.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
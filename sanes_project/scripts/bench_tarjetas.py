@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmark del renderizado de los listados de rifas y sanes y de la portada.
+Ejecutar desde sanes_project/: python scripts/bench_tarjetas.py [--rifas 24] [--repeticiones 50]
+
+Crea rifas y sanes activos y mide cada página (12 tarjetas en los listados,
+6 + 6 en la portada) de tres formas:
+
+  * antes:     cada tarjeta se renderiza en cada petición (sin caché de
+               fragmentos, como las plantillas con el bucle en línea).
+  * en frío:   caché de fragmentos vacía: se renderiza y se guarda todo.
+  * después:   caché caliente; una sola lectura de caché por página.
+
+También comprueba que vender un ticket invalida solo la tarjeta de su rifa.
+Usa la base de datos de DJANGO_SETTINGS_MODULE y borra todo lo que crea.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from sanes import fragmentos  # noqa: E402
+from sanes.models import CustomUser, Rifa, San, Ticket  # noqa: E402
+
+PREFIJO = 'bench-tarjetas'
+PAGINAS = [('listado de rifas', '/rifas/?estado=activa'), ('listado de sanes', '/sanes/?estado=activo'), ('portada', '/')]
+
+
+def crear_datos(rifas, sanes):
+    organizador = CustomUser.objects.create(username=f'{PREFIJO}-org', email=f'{PREFIJO}-org@example.com',
+                                            first_name='Org', last_name='Bench')
+    fin = timezone.now() + timedelta(days=30)
+    for i in range(rifas):
+        Rifa.objects.create(titulo=f'{PREFIJO} rifa {i}', descripcion='Rifa de prueba ' * 10, premio='Moto',
+                            organizador=organizador, estado='activa', precio_ticket=Decimal('5.00'),
+                            total_tickets=100, tickets_disponibles=100 - i, fecha_fin=fin)
+    for i in range(sanes):
+        San.objects.create(nombre=f'{PREFIJO} san {i}', descripcion='San de prueba ' * 10, organizador=organizador,
+                           estado='activo', precio_cuota=Decimal('10.00'), total_participantes=10,
+                           fecha_inicio=timezone.localdate(), fecha_fin=timezone.localdate() + timedelta(days=70))
+    return organizador
+
+
+def limpiar(organizador):
+    Rifa.objects.filter(organizador=organizador).delete()
+    San.objects.filter(organizador=organizador).delete()
+    organizador.delete()
+
+
+def medir(cliente, url, repeticiones, vaciar=False):
+    """(ms por petición, consultas, lecturas de caché) de una página"""
+    lecturas = []
+    get_many = cache.get_many
+
+    def contar(claves, *args, **kwargs):
+        lecturas.append(len(claves))
+        return get_many(claves, *args, **kwargs)
+
+    total = 0.0
+    with mock.patch.object(cache, 'get_many', contar):
+        for _ in range(repeticiones):
+            if vaciar:
+                cache.clear()
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                respuesta = cliente.get(url)
+                total += time.perf_counter() - inicio
+            assert respuesta.status_code == 200, respuesta.status_code
+    return total / repeticiones * 1000, len(consultas), len(lecturas) // repeticiones
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rifas', type=int, default=24)
+    parser.add_argument('--sanes', type=int, default=24)
+    parser.add_argument('--repeticiones', type=int, default=50)
+    args = parser.parse_args()
+
+    organizador = crear_datos(args.rifas, args.sanes)
+    cliente = Client(HTTP_HOST='localhost')
+    sin_cache = lambda plantilla, objetos: fragmentos.renderizar(plantilla, objetos)  # noqa: E731
+    try:
+        print(f"{'':<18}{'antes':>22}{'en frío':>22}{'después':>30}")
+        for nombre, url in PAGINAS:
+            cliente.get(url)
+            with mock.patch.object(fragmentos, 'tarjetas', sin_cache):
+                antes = medir(cliente, url, args.repeticiones)
+            frio = medir(cliente, url, args.repeticiones, vaciar=True)
+            despues = medir(cliente, url, args.repeticiones)
+            print(f'{nombre:<18}{antes[0]:9.2f} ms {antes[1]:3d} cons.'
+                  f'{frio[0]:9.2f} ms {frio[1]:3d} cons.'
+                  f'{despues[0]:9.2f} ms {despues[1]:3d} cons. {despues[2]} get_many'
+                  f'   ({antes[0] / despues[0]:.1f}x)')
+
+        # Vender un ticket cambia la versión de una sola rifa
+        rifa = Rifa.objects.filter(organizador=organizador).order_by('-created_at').first()
+        rifas = list(Rifa.objects.filter(organizador=organizador).order_by('-created_at')[:12])
+        antes = {r.pk: fragmentos.clave('raffle/_tarjeta_rifa.html', r) for r in rifas}
+        Ticket.objects.create(codigo=f'BT-{rifa.pk}', numero=1, rifa=rifa, usuario=organizador,
+                              precio_pagado=Decimal('5.00'))
+        rifas = list(Rifa.objects.filter(organizador=organizador).order_by('-created_at')[:12])
+        cambiadas = [r.pk for r in rifas if fragmentos.clave('raffle/_tarjeta_rifa.html', r) != antes[r.pk]]
+        print(f'Tarjetas invalidadas al vender un ticket: {cambiadas} (rifa {rifa.pk})')
+    finally:
+        limpiar(organizador)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Benchmark del detalle de una rifa con sus tickets en la API.
+Ejecutar desde sanes_project/: python scripts/bench_tickets_api.py [--tickets 10000]
+
+Crea una rifa con N tickets repartidos entre varios usuarios y compara:
+
+  * antes:   TicketSerializer por ticket (con la rifa, su organizador y el
+             comprador anidados en cada uno).
+  * después: RifaDetailSerializer con los tickets en columnas y los
+             compradores una sola vez (TicketColumnasSerializer).
+
+Mide tiempo de serialización, consultas y tamaño del JSON. Usa la base de
+datos de DJANGO_SETTINGS_MODULE y borra todo lo que crea.
+"""
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from sanes.models import CustomUser, Rifa, Ticket  # noqa: E402
+from sanes.serializers import RifaDetailSerializer, RifaSerializer, TicketSerializer  # noqa: E402
+
+PREFIJO = 'bench-tickets'
+PRECIO = Decimal('5.00')
+
+
+def crear_datos(tickets, usuarios):
+    organizador = CustomUser.objects.create(username=f'{PREFIJO}-org', email=f'{PREFIJO}-org@example.com')
+    CustomUser.objects.bulk_create([
+        CustomUser(username=f'{PREFIJO}-{i}', email=f'{PREFIJO}-{i}@example.com') for i in range(usuarios)
+    ], batch_size=1000)
+    ids_usuarios = list(
+        CustomUser.objects.filter(username__startswith=f'{PREFIJO}-').exclude(id=organizador.id)
+        .order_by('id').values_list('id', flat=True)
+    )
+    rifa = Rifa.objects.create(titulo=f'{PREFIJO} rifa', organizador=organizador, estado='activa',
+                               precio_ticket=PRECIO, total_tickets=tickets, tickets_disponibles=0)
+    Ticket.objects.bulk_create([
+        Ticket(codigo=f'BK-{rifa.id}-{i:07d}', numero=i + 1, rifa=rifa, usuario_id=ids_usuarios[i % len(ids_usuarios)],
+               precio_pagado=PRECIO, activo=i % 10 < 8)
+        for i in range(tickets)
+    ], batch_size=2000)
+    return organizador, rifa
+
+
+def limpiar(organizador, rifa):
+    rifa.delete()
+    CustomUser.objects.filter(username__startswith=f'{PREFIJO}-').delete()
+    organizador.delete()
+
+
+def medir(nombre, serializar):
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as consultas:
+        inicio = time.perf_counter()
+        contenido = JSONRenderer().render(serializar())
+        duracion = time.perf_counter() - inicio
+    print(f'{nombre:<10} {duracion * 1000:9.1f} ms {len(consultas):6d} consultas {len(contenido) / 1024:10.1f} KiB')
+    return duracion, len(contenido)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=10000)
+    parser.add_argument('--usuarios', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'Creando {args.tickets} tickets para {args.usuarios} usuarios...')
+    organizador, rifa = crear_datos(args.tickets, args.usuarios)
+    try:
+        antes = medir('Anidado', lambda: {
+            **RifaSerializer(rifa).data,
+            'tickets': TicketSerializer(rifa.tickets.all().order_by('numero'), many=True).data,
+        })
+        despues = medir('Columnas', lambda: RifaDetailSerializer(
+            Rifa.objects.select_related('organizador', 'ganador').get(pk=rifa.pk)
+        ).data)
+        print(f'Tiempo {antes[0] / despues[0]:.0f}x menor, JSON {antes[1] / despues[1]:.0f}x más pequeño')
+    finally:
+        limpiar(organizador, rifa)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Genera carga de webhooks firmados contra el endpoint de pasarelas.
+Ejecutar desde sanes_project/:
+
+    python scripts/enviar_webhooks.py --cantidad 5000 --concurrencia 100
+    python scripts/enviar_webhooks.py --pendientes   # usa pagos pendientes reales
+
+Con --pendientes se configura Django para leer los códigos de los pagos
+pendientes de la pasarela; si no, se envían códigos aleatorios (el consumidor
+los marcará como ignorados, útil para medir solo la ingesta).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+
+from sanes.pasarelas import firmar
+
+
+def codigos_pendientes(pasarela, cantidad):
+    """(código de transacción, monto) de los pagos pendientes de la pasarela"""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sanes_project.settings')
+    django.setup()
+    from sanes.models import PagoSimulado
+
+    return list(
+        PagoSimulado.objects.filter(metodo_pago=pasarela, estado__in=('pendiente', 'procesando'))
+        .order_by('id')
+        .values_list('codigo_transaccion', 'monto')[:cantidad]
+    )
+
+
+def generar_eventos(codigos, cantidad, tasa_rechazo, tasa_duplicados):
+    """Genera los eventos; una parte se repite con el mismo ID como hacen las pasarelas"""
+    eventos = []
+    for indice in range(cantidad):
+        codigo, monto = codigos[indice % len(codigos)] if codigos else (f'SIM-{uuid.uuid4().hex[:12].upper()}', '10.00')
+        if random.random() < tasa_rechazo:
+            evento = {'tipo': 'cobro.rechazado', 'motivo': 'Fondos insuficientes'}
+        else:
+            evento = {'tipo': 'cobro.aprobado', 'referencia': f'REF-{uuid.uuid4().hex[:12].upper()}'}
+        evento.update({'id': f'evt_{uuid.uuid4().hex}', 'codigo': codigo, 'monto': str(monto)})
+        eventos.append(evento)
+
+    duplicados = [dict(e) for e in random.sample(eventos, int(len(eventos) * tasa_duplicados))]
+    eventos.extend(duplicados)
+    random.shuffle(eventos)
+    return eventos
+
+
+async def enviar(url, secreto, eventos, concurrencia):
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+    estados = {}
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrencia)) as sesion:
+        async def enviar_evento(evento):
+            cuerpo = json.dumps(evento).encode()
+            headers = {'Content-Type': 'application/json'}
+            if secreto:
+                headers['X-Firma'] = firmar(secreto, cuerpo)
+            async with semaforo:
+                inicio = time.monotonic()
+                try:
+                    async with sesion.post(url, data=cuerpo, headers=headers) as respuesta:
+                        await respuesta.read()
+                        clave = respuesta.status
+                except aiohttp.ClientError as exc:
+                    clave = type(exc).__name__
+                latencias.append((time.monotonic() - inicio) * 1000)
+                estados[clave] = estados.get(clave, 0) + 1
+
+        await asyncio.gather(*(enviar_evento(e) for e in eventos))
+    return sorted(latencias), estados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='URL base del sitio')
+    parser.add_argument('--pasarela', default='paypal')
+    parser.add_argument('--secreto', default=os.environ.get('PASARELA_SECRETO', ''))
+    parser.add_argument('--cantidad', type=int, default=1000, help='Eventos distintos a enviar')
+    parser.add_argument('--concurrencia', type=int, default=50)
+    parser.add_argument('--rechazos', type=float, default=0.1, help='Fracción de cobros rechazados')
+    parser.add_argument('--duplicados', type=float, default=0.1, help='Fracción de eventos reenviados')
+    parser.add_argument('--pendientes', action='store_true', help='Usar pagos pendientes de la base de datos')
+    args = parser.parse_args()
+
+    codigos = codigos_pendientes(args.pasarela, args.cantidad) if args.pendientes else []
+    if args.pendientes and not codigos:
+        sys.exit(f'No hay pagos pendientes de {args.pasarela}')
+
+    eventos = generar_eventos(codigos, len(codigos) or args.cantidad, args.rechazos, args.duplicados)
+    url = f"{args.url.rstrip('/')}/webhooks/pagos/{args.pasarela}/"
+
+    inicio = time.monotonic()
+    latencias, estados = asyncio.run(enviar(url, args.secreto, eventos, args.concurrencia))
+    duracion = time.monotonic() - inicio
+
+    p50 = latencias[len(latencias) // 2]
+    p95 = latencias[int(len(latencias) * 0.95) - 1]
+    print(f'{len(eventos)} webhooks en {duracion:.2f}s ({len(eventos) / duracion:.0f}/s) '
+          f'p50 {p50:.1f} ms  p95 {p95:.1f} ms  respuestas {estados}')
+
+
+if __name__ == '__main__':
+    main()